@@ -67,6 +67,7 @@ class AppSettings(BaseSettings):
     log_level: str = Field(default="INFO", description="日志级别")
     max_conversation_history: int = Field(default=50, description="最大对话历史记录数")
     cache_ttl: int = Field(default=3600, description="缓存过期时间(秒)")
+    weather_cache_ttl: int = Field(default=600, description="天气查询结果缓存时间(秒)")
     
     @validator('log_level')
     def validate_log_level(cls, v):
@@ -76,7 +77,7 @@ class AppSettings(BaseSettings):
             raise ValueError(f"日志级别必须是以下之一: {valid_levels}")
         return v.upper()
     
-    @validator('max_conversation_history', 'cache_ttl')
+    @validator('max_conversation_history', 'cache_ttl', 'weather_cache_ttl')
     def validate_positive_int(cls, v):
         """验证正整数"""
         if v <= 0:
@@ -118,6 +119,14 @@ class Settings:
         """获取城市数据文件路径"""
         return os.path.join(os.path.dirname(os.path.dirname(__file__)), "China-City-List-latest.csv")
     
+    def get_city_excel_path(self) -> str:
+        """获取高德城市代码表路径"""
+        return os.path.join(os.path.dirname(os.path.dirname(__file__)), "AMap_adcode_citycode.xlsx")
+    
+    def get_city_index_path(self) -> str:
+        """获取城市索引缓存文件路径（运行时生成，不纳入版本控制）"""
+        return os.path.join(os.path.dirname(os.path.dirname(__file__)), ".cache", "AMap_adcode_citycode.json")
+    
     def validate_all(self) -> bool:
         """验证所有配置"""
         try:
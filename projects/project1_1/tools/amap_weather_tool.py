@@ -5,43 +5,30 @@
 
 import requests
 import json
-from typing import Dict, Any, Optional
+import threading
+import time
+from typing import Dict, Any, Optional, Tuple
 
 from config.settings import settings
 from core.logger import app_logger
+from tools.city_index import get_city_index
 
 
 class AmapWeatherTool:
     """简化的高德地图天气查询工具"""
     
+    # 实况天气缓存：adcode -> (过期时间, 高德返回的实况数据)，所有实例共享
+    _weather_cache: Dict[str, Tuple[float, Dict[str, Any]]] = {}
+    _weather_cache_lock = threading.Lock()
+    
     def __init__(self):
         """初始化天气工具"""
         self.api_key = settings.api.amap_api_key
         self.base_url = "https://restapi.amap.com/v3/weather/weatherInfo"
+        self.cache_ttl = settings.app.weather_cache_ttl
         
-        # 常见城市的adcode映射
-        self.city_adcodes = {
-            "北京": "110000",
-            "上海": "310000", 
-            "广州": "440100",
-            "深圳": "440300",
-            "杭州": "330100",
-            "南京": "320100",
-            "武汉": "420100",
-            "成都": "510100",
-            "西安": "610100",
-            "重庆": "500000",
-            "天津": "120000",
-            "苏州": "320500",
-            "郑州": "410100",
-            "长沙": "430100",
-            "东莞": "441900",
-            "青岛": "370200",
-            "沈阳": "210100",
-            "宁波": "330200",
-            "昆明": "530100",
-            "佛山": "440600"
-        }
+        # 预构建的城市索引（全局只加载一次）
+        self.city_index = get_city_index()
         
         app_logger.info("高德天气工具初始化完成")
     
@@ -64,6 +51,15 @@ class AmapWeatherTool:
                     "error": f"未找到城市 '{city_name}' 的信息"
                 }
             
+            # 同一地区在缓存时间内直接返回缓存的实况数据
+            weather_info = self._get_cached_weather(adcode)
+            if weather_info is not None:
+                app_logger.info(f"命中天气缓存: {city_name} ({adcode})")
+                return {
+                    "success": True,
+                    "data": self._format_weather_info(weather_info, city_name)
+                }
+            
             # 调用天气API
             params = {
                 "key": self.api_key,
@@ -78,6 +74,7 @@ class AmapWeatherTool:
             
             if data.get("status") == "1" and data.get("lives"):
                 weather_info = data["lives"][0]
+                self._put_cached_weather(adcode, weather_info)
                 formatted_data = self._format_weather_info(weather_info, city_name)
                 
                 app_logger.info(f"成功获取 {city_name} 的天气信息")
@@ -113,25 +110,27 @@ class AmapWeatherTool:
             }
     
     def _get_city_adcode(self, city_name: str) -> Optional[str]:
-        """获取城市的adcode"""
-        city_name = city_name.strip()
-        
-        # 直接匹配
-        if city_name in self.city_adcodes:
-            return self.city_adcodes[city_name]
-        
-        # 去掉"市"后缀再匹配
-        if city_name.endswith("市"):
-            city_name_without_suffix = city_name[:-1]
-            if city_name_without_suffix in self.city_adcodes:
-                return self.city_adcodes[city_name_without_suffix]
-        
-        # 模糊匹配
-        for city, adcode in self.city_adcodes.items():
-            if city_name in city or city in city_name:
-                return adcode
-        
-        return None
+        """获取城市的adcode（精确匹配 -> 别名匹配 -> 包含匹配 -> 子串匹配）"""
+        return self.city_index.get_adcode(city_name)
+    
+    def _get_cached_weather(self, adcode: str) -> Optional[Dict[str, Any]]:
+        """读取未过期的天气缓存"""
+        with self._weather_cache_lock:
+            entry = self._weather_cache.get(adcode)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                del self._weather_cache[adcode]
+                return None
+            return entry[1]
+    
+    def _put_cached_weather(self, adcode: str, weather_info: Dict[str, Any]):
+        """写入天气缓存，同时清理已过期的条目"""
+        now = time.monotonic()
+        with self._weather_cache_lock:
+            for expired in [k for k, (expires, _) in self._weather_cache.items() if expires < now]:
+                del self._weather_cache[expired]
+            self._weather_cache[adcode] = (now + self.cache_ttl, weather_info)
     
     def _format_weather_info(self, weather_info: Dict[str, Any], city_name: str) -> str:
         """格式化天气信息"""
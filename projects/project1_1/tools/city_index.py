@@ -0,0 +1,303 @@
+"""
+城市名称查询索引
+由高德地图城市代码表(AMap_adcode_citycode.xlsx)构建，城市名称和adcode缓存为JSON文件，
+运行时直接加载，不再解析Excel；代码表更新后缓存自动失效
+
+查询顺序:
+1. 规范化名称的精确匹配（哈希表）
+2. 去掉行政区划后缀的别名匹配，如 "杭州" -> "杭州市"、"朝阳" -> "朝阳市"
+3. 查询文本中包含城市名，如 "北京今天天气" -> "北京"（Aho-Corasick自动机，取最长匹配）
+4. 查询文本是城市名的一部分，如 "呼和浩" -> "呼和浩特市"（n-gram倒排索引）
+"""
+
+import json
+import os
+import threading
+import unicodedata
+from collections import deque
+from typing import Dict, List, Optional, Tuple
+
+from config.settings import settings
+from core.logger import app_logger
+
+# 缓存文件格式版本，结构变化时递增，旧文件会被重新构建
+INDEX_VERSION = 2
+
+# 行政区划后缀，按长度降序匹配
+ADMIN_SUFFIXES = sorted([
+    "特别行政区", "维吾尔自治区", "壮族自治区", "回族自治区", "自治区",
+    "自治州", "自治县", "自治旗", "地区", "林区", "新区",
+    "省", "市", "区", "县", "盟", "旗",
+], key=len, reverse=True)
+
+# 别名至少保留的字数，避免 "东区" 之类去掉后缀后只剩一个字
+MIN_ALIAS_LENGTH = 2
+
+
+def normalize_city_name(name: str) -> str:
+    """全角转半角、去掉空白，英文统一小写"""
+    return "".join(unicodedata.normalize("NFKC", str(name)).split()).lower()
+
+
+def strip_admin_suffix(name: str) -> str:
+    """去掉行政区划后缀，剩余部分过短时返回原名"""
+    for suffix in ADMIN_SUFFIXES:
+        if name.endswith(suffix) and len(name) - len(suffix) >= MIN_ALIAS_LENGTH:
+            return name[:-len(suffix)]
+    return name
+
+
+def _admin_level(adcode: str) -> int:
+    """行政级别：0省级，1地市级，2区县级"""
+    if adcode.endswith("0000"):
+        return 0
+    if adcode.endswith("00"):
+        return 1
+    return 2
+
+
+class CityIndex:
+    """
+    城市名称 -> adcode 查询索引
+
+    同名地区（如多个 "朝阳区"）按行政级别从高到低、adcode从小到大取第一个
+    """
+
+    def __init__(self, names: List[str], adcodes: List[str]):
+        """
+        Args:
+            names: 城市原名列表
+            adcodes: 与names一一对应的adcode
+        """
+        self.names = names
+        self.adcodes = adcodes
+
+        # 同名时的优先级：行政级别高的优先，其次adcode小的优先
+        order = sorted(range(len(names)), key=lambda i: (_admin_level(adcodes[i]), adcodes[i]))
+
+        self.exact: Dict[str, int] = {}
+        self.aliases: Dict[str, int] = {}
+        for i in order:
+            key = normalize_city_name(names[i])
+            self.exact.setdefault(key, i)
+            alias = strip_admin_suffix(key)
+            if alias != key:
+                self.aliases.setdefault(alias, i)
+
+        self._build_automaton()
+        self._build_ngrams()
+
+    # ---------- 构建 ----------
+
+    def _build_automaton(self):
+        """用全部名称和别名构建Aho-Corasick自动机，输出为(关键词长度, 条目下标)"""
+        keywords = {**self.aliases, **self.exact}
+        self.goto: List[Dict[str, int]] = [{}]
+        self.fail: List[int] = [0]
+        self.output: List[List[Tuple[int, int]]] = [[]]
+
+        for word, entry in keywords.items():
+            state = 0
+            for ch in word:
+                nxt = self.goto[state].get(ch)
+                if nxt is None:
+                    nxt = len(self.goto)
+                    self.goto[state][ch] = nxt
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.output.append([])
+                state = nxt
+            self.output[state].append((len(word), entry))
+
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in self.goto[state].items():
+                queue.append(nxt)
+                f = self.fail[state]
+                while f and ch not in self.goto[f]:
+                    f = self.fail[f]
+                self.fail[nxt] = self.goto[f].get(ch, 0)
+                self.output[nxt] = self.output[nxt] + self.output[self.fail[nxt]]
+
+    def _build_ngrams(self):
+        """双字倒排索引：bigram -> 包含它的条目下标（按优先级排序）"""
+        order = sorted(range(len(self.names)), key=lambda i: (_admin_level(self.adcodes[i]), self.adcodes[i]))
+        self.ngrams: Dict[str, List[int]] = {}
+        for i in order:
+            name = normalize_city_name(self.names[i])
+            grams = {name[j:j + 2] for j in range(len(name) - 1)}
+            for gram in grams:
+                self.ngrams.setdefault(gram, []).append(i)
+
+    # ---------- 查询 ----------
+
+    def _scan(self, text: str) -> Optional[int]:
+        """在文本中查找包含的城市名，取最长匹配，同样长时取行政级别更细的"""
+        best = None
+        state = 0
+        for ch in text:
+            while state and ch not in self.goto[state]:
+                state = self.fail[state]
+            state = self.goto[state].get(ch, 0)
+            for length, entry in self.output[state]:
+                key = (length, _admin_level(self.adcodes[entry]))
+                if best is None or key > best[0]:
+                    best = (key, entry)
+        return best[1] if best else None
+
+    def _substring(self, text: str) -> Optional[int]:
+        """查找包含该文本（至少两个字）的城市名，候选集由bigram倒排链求交得到"""
+        grams = {text[j:j + 2] for j in range(len(text) - 1)}
+        postings = [self.ngrams.get(gram) for gram in grams]
+        if not postings or any(p is None for p in postings):
+            return None
+        postings.sort(key=len)
+        candidates = set(postings[0]).intersection(*postings[1:])
+        # 最短的倒排链已按优先级排序，按它的顺序取第一个真正包含文本的条目
+        for entry in postings[0]:
+            if entry in candidates and text in normalize_city_name(self.names[entry]):
+                return entry
+        return None
+
+    def lookup(self, city_name: str) -> Optional[Tuple[str, str]]:
+        """
+        查询城市
+
+        Returns:
+            (城市原名, adcode)，未找到时返回None
+        """
+        text = normalize_city_name(city_name)
+        if not text:
+            return None
+
+        entry = self.exact.get(text)
+        if entry is None:
+            entry = self.aliases.get(text)
+        if entry is None:
+            entry = self.aliases.get(strip_admin_suffix(text))
+        if entry is None and len(text) < MIN_ALIAS_LENGTH:
+            # 单个字（如 "市"）几乎能匹配任意城市，不做模糊匹配
+            return None
+        if entry is None:
+            entry = self._scan(text)
+        if entry is None:
+            entry = self._substring(text)
+        if entry is None:
+            return None
+        return self.names[entry], self.adcodes[entry]
+
+    def get_adcode(self, city_name: str) -> Optional[str]:
+        result = self.lookup(city_name)
+        return result[1] if result else None
+
+    # ---------- 构建与序列化 ----------
+
+    @classmethod
+    def from_excel(cls, path: str) -> "CityIndex":
+        """从高德城市代码表构建索引（只在构建索引文件时使用）"""
+        from openpyxl import load_workbook
+
+        workbook = load_workbook(path, read_only=True)
+        names, adcodes = [], []
+        try:
+            rows = workbook.active.iter_rows(min_row=2, values_only=True)
+            for name, adcode, *_ in rows:
+                if not name or adcode is None:
+                    continue
+                adcode = str(adcode).strip()
+                # 跳过 "中国" 这一行
+                if adcode == "100000":
+                    continue
+                names.append(str(name).strip())
+                adcodes.append(adcode)
+        finally:
+            workbook.close()
+        return cls(names, adcodes)
+
+    def save(self, path: str, source: Optional[Dict[str, int]] = None):
+        """
+        把城市名称和adcode缓存为JSON文件，先写临时文件再替换，避免读到半个文件
+
+        只保存原始数据，查询结构加载时重新构建（耗时远小于解析Excel）
+
+        Args:
+            source: 代码表文件的大小和修改时间，加载时用于判断缓存是否过期
+        """
+        payload = {
+            "version": INDEX_VERSION,
+            "source": source,
+            "names": self.names,
+            "adcodes": self.adcodes,
+        }
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(payload, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str, source: Optional[Dict[str, int]] = None) -> "CityIndex":
+        with open(path, "r", encoding="utf-8") as f:
+            payload = json.load(f)
+        if payload.get("version") != INDEX_VERSION:
+            raise ValueError(f"城市索引版本不匹配: {payload.get('version')}")
+        if source is not None and payload.get("source") != source:
+            raise ValueError("城市代码表已更新")
+        return cls(payload["names"], payload["adcodes"])
+
+
+def _source_signature(path: str) -> Optional[Dict[str, int]]:
+    """代码表文件的大小和修改时间，文件不存在时返回None"""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+_city_index: Optional[CityIndex] = None
+_city_index_lock = threading.Lock()
+
+
+def get_city_index() -> CityIndex:
+    """
+    获取全局城市索引
+
+    优先加载缓存文件；文件不存在、版本不匹配或代码表已更新时，从Excel构建并写入缓存
+    """
+    global _city_index
+    if _city_index is not None:
+        return _city_index
+
+    with _city_index_lock:
+        if _city_index is not None:
+            return _city_index
+
+        index_path = settings.get_city_index_path()
+        excel_path = settings.get_city_excel_path()
+        source = _source_signature(excel_path)
+        if os.path.exists(index_path):
+            try:
+                _city_index = CityIndex.load(index_path, source)
+                app_logger.info(f"城市索引加载完成，共 {len(_city_index.names)} 个地区")
+                return _city_index
+            except Exception as e:
+                app_logger.warning(f"城市索引加载失败，将重新构建: {str(e)}")
+
+        _city_index = CityIndex.from_excel(excel_path)
+        try:
+            _city_index.save(index_path, source)
+            app_logger.info(f"城市索引构建完成，共 {len(_city_index.names)} 个地区，已保存到 {index_path}")
+        except OSError as e:
+            app_logger.warning(f"城市索引保存失败: {str(e)}")
+        return _city_index
+
+
+if __name__ == "__main__":
+    excel_path = settings.get_city_excel_path()
+    index = CityIndex.from_excel(excel_path)
+    index.save(settings.get_city_index_path(), _source_signature(excel_path))
+    print(f"✅ 城市索引已生成: {settings.get_city_index_path()}（{len(index.names)} 个地区）")
@@ -192,17 +192,8 @@ async def get_order_info_async(order_id: str) -> str:
 
 def get_order_info(order_id: str) -> str:
     """获取订单信息的工具函数（同步包装器）"""
-    try:
-        # 尝试获取当前运行的事件循环
-        loop = asyncio.get_running_loop()
-        # 如果已经在事件循环中，使用 run_in_executor
-        import concurrent.futures
-        with concurrent.futures.ThreadPoolExecutor() as executor:
-            future = executor.submit(asyncio.run, get_order_info_async(order_id))
-            return future.result()
-    except RuntimeError:
-        # 如果没有运行的事件循环，直接运行
-        return asyncio.run(get_order_info_async(order_id))
+    # 提交到API客户端的共享事件循环，与其他智能体的请求共用限流和请求合并
+    return api_client.run_sync(get_order_info_async(order_id))
 
 
 def get_logistics_info(order_id: str) -> str:
@@ -211,44 +202,38 @@ def get_logistics_info(order_id: str) -> str:
     display.log_interaction(f"开始查询物流: {order_id}", level="start")
     
     try:
-        # 在同步环境中运行异步函数
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        try:
-            logistics_info = loop.run_until_complete(api_client.get_logistics_info(order_id))
-            
-            # 检查是否有错误
-            if "error" in logistics_info:
-                error_msg = f"很抱歉，订单 {order_id} 的物流信息不存在。可能是订单尚未发货或订单号不正确，请联系客服获取帮助。"
-                display.log_interaction(f"物流信息不存在: {order_id}", level="error")
-                logger.warning(f"❌ 物流信息不存在: {order_id}")
-                return error_msg
-            
-            # 格式化物流轨迹
-            tracking_history = ""
-            if logistics_info.get('tracking_history'):
-                tracking_history = "\n物流轨迹:\n"
-                for record in logistics_info['tracking_history']:
-                    tracking_history += f"  {record.get('time', 'N/A')} - {record.get('location', 'N/A')}: {record.get('status', 'N/A')}\n"
-            
-            result = f"""物流查询结果：
+        # 提交到API客户端的共享事件循环，与其他智能体的请求共用限流和请求合并
+        logistics_info = api_client.run_sync(api_client.get_logistics_info(order_id))
+        
+        # 检查是否有错误
+        if "error" in logistics_info:
+            error_msg = f"很抱歉，订单 {order_id} 的物流信息不存在。可能是订单尚未发货或订单号不正确，请联系客服获取帮助。"
+            display.log_interaction(f"物流信息不存在: {order_id}", level="error")
+            logger.warning(f"❌ 物流信息不存在: {order_id}")
+            return error_msg
+        
+        # 格式化物流轨迹
+        tracking_history = ""
+        if logistics_info.get('tracking_history'):
+            tracking_history = "\n物流轨迹:\n"
+            for record in logistics_info['tracking_history']:
+                tracking_history += f"  {record.get('time', 'N/A')} - {record.get('location', 'N/A')}: {record.get('status', 'N/A')}\n"
+        
+        result = f"""物流查询结果：
                 物流单号: {logistics_info.get('tracking_number', '暂未分配')}
                 物流状态: {logistics_info.get('status', 'N/A')}
                 当前位置: {logistics_info.get('current_location', 'N/A')}
                 承运商: {logistics_info.get('carrier', 'N/A')}
                 预计送达: {logistics_info.get('estimated_delivery', '未确定')}{tracking_history}"""
-            
-            # 添加详细的物流结果日志
-            logger.info(f"🚚 物流查询成功 - 订单ID: {order_id}")
-            logger.info(f"📋 物流详情 - 单号: {logistics_info.get('tracking_number')}, 状态: {logistics_info.get('status')}")
-            logger.info(f"📍 位置信息 - 当前位置: {logistics_info.get('current_location')}, 承运商: {logistics_info.get('carrier')}")
-            logger.info(f"⏰ 预计送达: {logistics_info.get('estimated_delivery', '未确定')}")
-                            
-            display.log_interaction(f"物流查询成功: {order_id}", level="result")
-            return result
-            
-        finally:
-            loop.close()
+        
+        # 添加详细的物流结果日志
+        logger.info(f"🚚 物流查询成功 - 订单ID: {order_id}")
+        logger.info(f"📋 物流详情 - 单号: {logistics_info.get('tracking_number')}, 状态: {logistics_info.get('status')}")
+        logger.info(f"📍 位置信息 - 当前位置: {logistics_info.get('current_location')}, 承运商: {logistics_info.get('carrier')}")
+        logger.info(f"⏰ 预计送达: {logistics_info.get('estimated_delivery', '未确定')}")
+                        
+        display.log_interaction(f"物流查询成功: {order_id}", level="result")
+        return result
             
     except Exception as e:
         error_msg = f"物流查询系统暂时不可用，请稍后重试或联系客服。错误信息: {str(e)}"
@@ -36,6 +36,10 @@ class Settings(BaseSettings):
     MOCK_LOGISTICS_DELAY: float = 0.8  # 模拟物流查询延迟
     MOCK_ERROR_RATE: float = 0.1  # 模拟错误率
     
+    # API客户端配置
+    API_MAX_CONCURRENCY: int = 8  # 同时进行的请求数上限
+    API_CACHE_TTL: float = 5.0  # 响应缓存时间（秒），0表示不缓存
+    
     # 智能体配置
     AGENT_MEMORY_ENABLED: bool = True  # 启用智能体记忆
     AGENT_VERBOSE: bool = True  # 显示详细智能体交互
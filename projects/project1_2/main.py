@@ -166,13 +166,10 @@ async def run_query_test(query: str, order_id: str = "ORD001"):
     # 创建API客户端
     client = APIClient()
     
-    # 测试订单查询
-    console.print(Panel("[bold blue]测试订单查询API[/bold blue]", border_style="blue"))
-    order_info = await client.get_order_status(order_id)
-    
-    # 测试物流查询
-    console.print(Panel("[bold blue]测试物流查询API[/bold blue]", border_style="blue"))
-    logistics_info = await client.get_logistics_info(order_id)
+    # 并发查询订单和物流
+    console.print(Panel(f"[bold blue]正在查询订单和物流[/bold blue]: {order_id}", border_style="blue"))
+    details = await client.get_order_details(order_id)
+    order_info, logistics_info = details["order"], details["logistics"]
     
     # 展示查询成功的结果
     display_query_results(order_info, logistics_info)
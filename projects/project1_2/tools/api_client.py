@@ -1,151 +1,292 @@
 """
 API客户端工具
 用于调用FastAPI模拟服务的接口
+
+- 同一订单的订单信息和物流信息并发查询，批量接口对订单ID去重后并发查询
+- 并发请求数由信号量限制
+- 短TTL响应缓存，并发查询同一订单时合并为一次请求
+- 客户端只负责数据获取和日志，界面展示由调用方负责
+- 同步调用方（AutoGen工具函数）通过run_sync把请求提交到同一个后台事件循环，
+  信号量、进行中请求的合并和HTTP连接池在所有智能体之间共享
 """
 import asyncio
-import json
 import logging
-from typing import Dict, Any, Optional
-from utils.retry import create_retry_decorator, RetryableHTTPClient
+import threading
+import time
+import weakref
+from typing import Dict, Any, List, Iterable, Optional, Tuple
+from utils.retry import RetryableHTTPClient
+from config.settings import settings
 import httpx
-from rich.console import Console
-from rich.panel import Panel
 
 logger = logging.getLogger(__name__)
-console = Console()
+
+# 查询类型 -> (接口路径模板, 资源名称)
+ENDPOINTS = {
+    "order": ("/api/orders/{order_id}", "订单"),
+    "logistics": ("/api/logistics/{order_id}", "物流"),
+}
+
 
 class APIClient:
     """
     API客户端类
     负责与FastAPI模拟服务通信
     """
-    
-    def __init__(self, base_url: str = "http://127.0.0.1:8000"):
+
+    def __init__(
+        self,
+        base_url: str = "http://127.0.0.1:8000",
+        max_concurrency: int = None,
+        cache_ttl: float = None
+    ):
+        """
+        Args:
+            base_url: 服务地址
+            max_concurrency: 同一事件循环内同时进行的请求数上限
+            cache_ttl: 响应缓存时间（秒），0表示不缓存
+        """
         self.base_url = base_url
         self.client = RetryableHTTPClient(
             base_url=base_url,
             timeout=30.0
         )
-    
-    @create_retry_decorator(max_attempts=3, min_wait=1.0, max_wait=10.0)
+        self.max_concurrency = max_concurrency or settings.API_MAX_CONCURRENCY
+        self.cache_ttl = settings.API_CACHE_TTL if cache_ttl is None else cache_ttl
+
+        # (查询类型, 订单ID) -> (过期时间, 结果)；工具函数可能在不同线程的事件循环中调用，用线程锁保护
+        self._cache: Dict[Tuple[str, str], Tuple[float, Dict[str, Any]]] = {}
+        self._cache_lock = threading.Lock()
+        # 信号量和进行中的请求绑定在事件循环上，按事件循环分别维护
+        self._loop_states = weakref.WeakKeyDictionary()
+        # 供同步调用方使用的后台事件循环，第一次调用run_sync时启动
+        self._background_loop: Optional[asyncio.AbstractEventLoop] = None
+        self._background_lock = threading.Lock()
+        self.stats = {"requests": 0, "cache_hits": 0, "coalesced": 0}
+
+    def _loop_state(self) -> Dict[str, Any]:
+        loop = asyncio.get_running_loop()
+        state = self._loop_states.get(loop)
+        if state is None:
+            state = {"semaphore": asyncio.Semaphore(self.max_concurrency), "inflight": {}}
+            self._loop_states[loop] = state
+        return state
+
+    def _get_background_loop(self) -> asyncio.AbstractEventLoop:
+        with self._background_lock:
+            if self._background_loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="api-client-loop", daemon=True).start()
+                self._background_loop = loop
+            return self._background_loop
+
+    def run_sync(self, coro, timeout: float = None):
+        """
+        在后台事件循环中执行协程并阻塞等待结果
+
+        每个工具调用各自asyncio.run时，信号量和进行中的请求只在该次调用内有效，
+        统一提交到一个事件循环才能跨智能体限流和合并请求
+        """
+        loop = self._get_background_loop()
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            coro.close()
+            raise RuntimeError("不能在API客户端的后台事件循环中同步等待请求")
+        return asyncio.run_coroutine_threadsafe(coro, loop).result(timeout)
+
+    def _cache_get(self, key: Tuple[str, str]) -> Optional[Dict[str, Any]]:
+        with self._cache_lock:
+            entry = self._cache.get(key)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                del self._cache[key]
+                return None
+            return entry[1]
+
+    def _cache_put(self, key: Tuple[str, str], result: Dict[str, Any]):
+        # 只缓存成功结果和“不存在”，服务暂时不可用等错误不缓存
+        if self.cache_ttl <= 0 or result.get("status") in ("service_unavailable", "query_failed", "exception"):
+            return
+        with self._cache_lock:
+            now = time.monotonic()
+            # 顺便清理过期条目，避免缓存随订单数增长
+            if len(self._cache) >= 1024:
+                for expired in [k for k, (expires, _) in self._cache.items() if expires < now]:
+                    del self._cache[expired]
+            self._cache[key] = (now + self.cache_ttl, result)
+
+    def invalidate(self, order_id: str = None):
+        """清理缓存，order_id为空时全部清理"""
+        with self._cache_lock:
+            if order_id is None:
+                self._cache.clear()
+                return
+            for kind in ENDPOINTS:
+                self._cache.pop((kind, order_id), None)
+
+    async def _fetch(self, kind: str, order_id: str) -> Dict[str, Any]:
+        """发起一次请求，HTTP错误转换为带error字段的结果（重试由RetryableHTTPClient完成）"""
+        path, name = ENDPOINTS[kind]
+        async with self._loop_state()["semaphore"]:
+            self.stats["requests"] += 1
+            try:
+                logger.info(f"🔍 查询{name}信息: {order_id}")
+                response = await self.client.get(path.format(order_id=order_id))
+                data = response.json()
+                logger.info(f"✅ {name}查询成功: {order_id}")
+                return data
+
+            except httpx.HTTPStatusError as e:
+                if e.response.status_code == 404:
+                    logger.warning(f"❌ {name}信息不存在: {order_id}")
+                    if kind == "order":
+                        return {"error": f"订单 {order_id} 不存在"}
+                    return {"error": f"订单 {order_id} 的物流信息不存在"}
+                elif e.response.status_code == 500:
+                    logger.warning(f"⚠️ {name}服务暂时不可用: {order_id} -> HTTP {e.response.status_code}")
+                    return {"error": f"{name}服务暂时不可用，请稍后再试", "order_id": order_id, "status": "service_unavailable"}
+                else:
+                    logger.error(f"❌ {name}查询失败: {order_id} -> HTTP {e.response.status_code}")
+                    return {"error": f"{name}查询失败: HTTP {e.response.status_code}", "order_id": order_id, "status": "query_failed"}
+            except Exception as e:
+                logger.error(f"❌ {name}查询异常: {order_id} -> {str(e)}")
+                return {"error": f"{name}查询异常: {str(e)}", "order_id": order_id, "status": "exception"}
+
+    async def _get(self, kind: str, order_id: str) -> Dict[str, Any]:
+        """先查缓存，再合并进行中的相同请求，最后才真正发起请求"""
+        key = (kind, order_id)
+        cached = self._cache_get(key)
+        if cached is not None:
+            self.stats["cache_hits"] += 1
+            return cached
+
+        inflight = self._loop_state()["inflight"]
+        task = inflight.get(key)
+        if task is not None:
+            self.stats["coalesced"] += 1
+            # shield：某个调用方被取消时不影响其他等待同一请求的调用方
+            return await asyncio.shield(task)
+
+        task = asyncio.ensure_future(self._fetch(kind, order_id))
+        inflight[key] = task
+
+        def on_done(done_task: asyncio.Future):
+            inflight.pop(key, None)
+            if not done_task.cancelled():
+                self._cache_put(key, done_task.result())
+
+        task.add_done_callback(on_done)
+        return await asyncio.shield(task)
+
     async def get_order_status(self, order_id: str) -> Dict[str, Any]:
         """
         获取订单状态信息
         Agent A 使用此方法查询订单状态
-        
+
         Args:
             order_id: 订单ID
-            
+
         Returns:
             订单状态信息字典
         """
-        try:
-            logger.info(f"🔍 查询订单状态: {order_id}")
-            console.print(Panel(f"[bold blue]正在查询订单[/bold blue]: {order_id}", border_style="blue"))
-            
-            response = await self.client.get(f"/api/orders/{order_id}")
-            order_data = response.json()
-            
-            logger.info(f"✅ 订单查询成功: {order_id} -> {order_data['status']}")
-            console.print(Panel(f"[bold green]订单查询成功[/bold green]: {order_id}", border_style="green"))
-            return order_data
-            
-        except httpx.HTTPStatusError as e:
-            if e.response.status_code == 404:
-                logger.warning(f"❌ 订单不存在: {order_id}")
-                console.print(Panel(f"[bold yellow]订单不存在[/bold yellow]: {order_id}", border_style="yellow"))
-                return {"error": f"订单 {order_id} 不存在"}
-            elif e.response.status_code == 500:
-                logger.warning(f"⚠️ 订单服务暂时不可用: {order_id} -> HTTP {e.response.status_code}")
-                console.print(Panel(f"[bold yellow]订单服务暂时不可用[/bold yellow]: {order_id} -> HTTP {e.response.status_code}", border_style="yellow"))
-                return {"error": f"订单服务暂时不可用，请稍后再试", "order_id": order_id, "status": "service_unavailable"}
-            else:
-                logger.error(f"❌ 订单查询失败: {order_id} -> HTTP {e.response.status_code}")
-                console.print(Panel(f"[bold red]订单查询失败[/bold red]: {order_id} -> HTTP {e.response.status_code}", border_style="red"))
-                return {"error": f"订单查询失败: HTTP {e.response.status_code}", "order_id": order_id, "status": "query_failed"}
-        except Exception as e:
-            logger.error(f"❌ 订单查询异常: {order_id} -> {str(e)}")
-            console.print(Panel(f"[bold red]订单查询异常[/bold red]: {order_id} -> {str(e)}", border_style="red"))
-            return {"error": f"订单查询异常: {str(e)}", "order_id": order_id, "status": "exception"}
-    
-    @create_retry_decorator(max_attempts=3, min_wait=1.0, max_wait=10.0)
+        return await self._get("order", order_id)
+
     async def get_logistics_info(self, order_id: str) -> Dict[str, Any]:
         """
         获取物流信息
         Agent B 使用此方法查询物流信息
-        
+
         Args:
             order_id: 订单ID
-            
+
         Returns:
             物流信息字典
         """
-        try:
-            logger.info(f"🚚 查询物流信息: {order_id}")
-            console.print(Panel(f"[bold blue]正在查询物流[/bold blue]: {order_id}", border_style="blue"))
-            
-            response = await self.client.get(f"/api/logistics/{order_id}")
-            logistics_data = response.json()
-            
-            logger.info(f"✅ 物流查询成功: {order_id}")
-            console.print(Panel(f"[bold green]物流查询成功[/bold green]: {order_id}", border_style="green"))
-            return logistics_data
-            
-        except httpx.HTTPStatusError as e:
-            if e.response.status_code == 404:
-                logger.warning(f"❌ 物流信息不存在: {order_id}")
-                console.print(Panel(f"[bold yellow]物流信息不存在[/bold yellow]: {order_id}", border_style="yellow"))
-                return {"error": f"订单 {order_id} 的物流信息不存在"}
-            elif e.response.status_code == 500:
-                logger.warning(f"⚠️ 物流服务暂时不可用: {order_id} -> HTTP {e.response.status_code}")
-                console.print(Panel(f"[bold yellow]物流服务暂时不可用[/bold yellow]: {order_id} -> HTTP {e.response.status_code}", border_style="yellow"))
-                return {"error": f"物流服务暂时不可用，请稍后再试", "order_id": order_id, "status": "service_unavailable"}
-            else:
-                logger.error(f"❌ 物流查询失败: {order_id} -> HTTP {e.response.status_code}")
-                console.print(Panel(f"[bold red]物流查询失败[/bold red]: {order_id} -> HTTP {e.response.status_code}", border_style="red"))
-                return {"error": f"物流查询失败: HTTP {e.response.status_code}", "order_id": order_id, "status": "query_failed"}
-        except Exception as e:
-            logger.error(f"❌ 物流查询异常: {order_id} -> {str(e)}")
-            console.print(Panel(f"[bold red]物流查询异常[/bold red]: {order_id} -> {str(e)}", border_style="red"))
-            return {"error": f"物流查询异常: {str(e)}", "order_id": order_id, "status": "exception"}
-    
+        return await self._get("logistics", order_id)
+
+    async def get_order_details(self, order_id: str) -> Dict[str, Dict[str, Any]]:
+        """
+        并发获取订单信息和物流信息
+
+        Returns:
+            {"order": 订单信息, "logistics": 物流信息}
+        """
+        order_info, logistics_info = await asyncio.gather(
+            self.get_order_status(order_id),
+            self.get_logistics_info(order_id)
+        )
+        return {"order": order_info, "logistics": logistics_info}
+
+    async def batch_get_order_details(
+        self,
+        order_ids: Iterable[str],
+        include_logistics: bool = True
+    ) -> Dict[str, Dict[str, Dict[str, Any]]]:
+        """
+        批量获取订单信息（和物流信息），订单ID去重后并发查询
+
+        Args:
+            order_ids: 订单ID列表
+            include_logistics: 是否同时查询物流信息
+
+        Returns:
+            订单ID -> {"order": 订单信息, "logistics": 物流信息}
+        """
+        unique_ids: List[str] = list(dict.fromkeys(order_ids))
+        kinds = ["order", "logistics"] if include_logistics else ["order"]
+        keys = [(kind, order_id) for order_id in unique_ids for kind in kinds]
+
+        start = time.perf_counter()
+        results = await asyncio.gather(*(self._get(kind, order_id) for kind, order_id in keys))
+        logger.info(f"📦 批量查询完成: {len(unique_ids)} 个订单, {len(keys)} 次查询, "
+                    f"耗时 {time.perf_counter() - start:.2f}s")
+
+        details: Dict[str, Dict[str, Dict[str, Any]]] = {order_id: {} for order_id in unique_ids}
+        for (kind, order_id), result in zip(keys, results):
+            details[order_id][kind] = result
+        return details
+
     async def health_check(self) -> bool:
         """
         健康检查
-        
+
         Returns:
             服务是否健康
         """
         try:
             logger.info("🔍 执行健康检查")
-            
+
             response = await self.client.get("/health")
             health_data = response.json()
-            
+
             is_healthy = health_data.get("status") == "healthy"
             if is_healthy:
                 logger.info("✅ 服务健康检查通过")
             else:
                 logger.warning("⚠️  服务健康检查失败")
             return is_healthy
-            
+
         except Exception as e:
             logger.error(f"❌ 健康检查失败: {str(e)}")
             return False
-    
+
     async def close(self):
         """关闭客户端连接"""
         await self.client.close()
         logger.info("API客户端关闭")
-    
+
     async def __aenter__(self):
         """异步上下文管理器进入"""
         return self
-    
+
     async def __aexit__(self, exc_type, exc_val, exc_tb):
         """异步上下文管理器退出"""
         await self.close()
 
 
 # 全局API客户端实例
-api_client = APIClient()
\ No newline at end of file
+api_client = APIClient()
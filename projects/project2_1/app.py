@@ -1,11 +1,10 @@
 import os
-import json
-import torch
 import logging
+from typing import List
 from fastapi import FastAPI, HTTPException
 from pydantic import BaseModel
-from transformers import AutoModelForSequenceClassification, AutoTokenizer
-from peft import PeftModel
+
+from intent_inference import MicroBatcher, OnnxIntentPredictor, QueueFullError, TorchIntentPredictor
 
 # 配置日志
 logging.basicConfig(level=logging.INFO)
@@ -19,12 +18,24 @@ app = FastAPI(
 
 # 模型配置
 MODEL_PATH = "./qwen3-intent-lora"
-LABEL_MAPPING_PATH = os.path.join(MODEL_PATH, "label_mapping.json")
 BASE_MODEL_NAME = "Qwen/Qwen3-8B"
+# 合并后的模型（merge_model.py 输出），存在时优先使用
+MERGED_MODEL_PATH = os.getenv("MERGED_MODEL_PATH", "./qwen3-intent-merged")
+# ONNX int8 模型目录（export_onnx.py 输出）
+ONNX_MODEL_DIR = os.getenv("ONNX_MODEL_DIR", "./qwen3-intent-onnx")
+# 推理后端: torch / onnx
+INTENT_BACKEND = os.getenv("INTENT_BACKEND", "torch")
+
+# 微批处理配置
+MAX_BATCH_SIZE = int(os.getenv("MAX_BATCH_SIZE", "32"))
+MAX_WAIT_MS = float(os.getenv("MAX_WAIT_MS", "5"))
+MAX_QUEUE_SIZE = int(os.getenv("MAX_QUEUE_SIZE", "1024"))
+# 单个 /predict_batch 请求的最大文本数
+MAX_BATCH_TEXTS = 256
 
 # 全局变量
-model = None
-tokenizer = None
+predictor = None
+batcher = None
 id2label = None
 
 class IntentRequest(BaseModel):
@@ -44,59 +55,71 @@ class IntentResponse(BaseModel):
     intent: str
     confidence: float
 
+class BatchIntentRequest(BaseModel):
+    """批量意图识别请求模型"""
+    texts: List[str]
+
+    class Config:
+        schema_extra = {
+            "example": {
+                "texts": ["我要退票", "帮我查一下明天去上海的航班"]
+            }
+        }
+
+class BatchIntentResponse(BaseModel):
+    """批量意图识别响应模型"""
+    results: List[IntentResponse]
+    count: int
+
 def load_model_and_tokenizer():
     """
     加载模型和分词器
     """
-    global model, tokenizer, id2label
-    
+    global predictor, id2label
+
     try:
-        logger.info("开始加载模型和分词器...")
-        
-        # 检查模型文件是否存在
-        if not os.path.exists(MODEL_PATH):
-            raise FileNotFoundError(f"模型路径不存在: {MODEL_PATH}")
-        
-        if not os.path.exists(LABEL_MAPPING_PATH):
-            raise FileNotFoundError(f"标签映射文件不存在: {LABEL_MAPPING_PATH}")
-        
-        # 加载标签映射
-        with open(LABEL_MAPPING_PATH, 'r', encoding='utf-8') as f:
-            label_mapping = json.load(f)
-        id2label = label_mapping["id2label"]
+        logger.info(f"开始加载模型和分词器... (后端: {INTENT_BACKEND})")
+
+        if INTENT_BACKEND == "onnx":
+            if not os.path.exists(ONNX_MODEL_DIR):
+                raise FileNotFoundError(f"ONNX模型路径不存在: {ONNX_MODEL_DIR}，请先运行 export_onnx.py")
+            predictor = OnnxIntentPredictor(ONNX_MODEL_DIR)
+        elif INTENT_BACKEND == "torch":
+            if os.path.exists(MERGED_MODEL_PATH):
+                predictor = TorchIntentPredictor(MERGED_MODEL_PATH)
+            elif os.path.exists(MODEL_PATH):
+                predictor = TorchIntentPredictor(MODEL_PATH, base_model_name=BASE_MODEL_NAME)
+            else:
+                raise FileNotFoundError(f"模型路径不存在: {MERGED_MODEL_PATH} / {MODEL_PATH}")
+        else:
+            raise ValueError(f"不支持的推理后端: {INTENT_BACKEND}")
+
+        id2label = predictor.id2label
         logger.info(f"加载标签映射完成，共 {len(id2label)} 个类别")
-        
-        # 加载分词器
-        tokenizer = AutoTokenizer.from_pretrained(BASE_MODEL_NAME, trust_remote_code=True)
-        if tokenizer.pad_token is None:
-            tokenizer.pad_token = tokenizer.eos_token
-        logger.info("分词器加载完成")
-        
-        # 加载基础模型
-        base_model = AutoModelForSequenceClassification.from_pretrained(
-            BASE_MODEL_NAME,
-            num_labels=len(id2label),
-            trust_remote_code=True,
-            device_map="auto",
-            torch_dtype=torch.float16
-        )
-        logger.info("基础模型加载完成")
-        
-        # 加载LoRA适配器
-        model = PeftModel.from_pretrained(base_model, MODEL_PATH)
-        model.eval()
-        logger.info("LoRA适配器加载完成")
-        
         logger.info("模型和分词器加载成功!")
-        
+
     except Exception as e:
         logger.error(f"模型加载失败: {str(e)}")
         raise
 
 @app.on_event("startup")
 async def startup_event():
-    """应用启动时加载模型"""
+    """应用启动时加载模型并启动微批处理"""
+    global batcher
     load_model_and_tokenizer()
+    batcher = MicroBatcher(
+        predictor.predict,
+        max_batch_size=MAX_BATCH_SIZE,
+        max_wait_ms=MAX_WAIT_MS,
+        max_queue_size=MAX_QUEUE_SIZE
+    )
+    batcher.start()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """应用关闭时停止微批处理"""
+    if batcher is not None:
+        await batcher.stop()
 
 @app.get("/")
 async def root():
@@ -106,19 +129,22 @@ async def root():
         "version": "1.0.0",
         "endpoints": {
             "predict": "POST /predict - 意图识别",
-            "health": "GET /health - 健康检查"
+            "predict_batch": "POST /predict_batch - 批量意图识别",
+            "health": "GET /health - 健康检查",
+            "stats": "GET /stats - 微批处理统计"
         }
     }
 
 @app.get("/health")
 async def health_check():
     """健康检查端点"""
-    if model is None or tokenizer is None or id2label is None:
+    if batcher is None or id2label is None:
         raise HTTPException(status_code=503, detail="模型未加载")
     
     return {
         "status": "healthy",
         "model_loaded": True,
+        "backend": predictor.backend,
         "num_labels": len(id2label),
         "available_intents": list(id2label.values())
     }
@@ -136,7 +162,7 @@ async def predict_intent(request: IntentRequest):
     """
     try:
         # 检查模型是否已加载
-        if model is None or tokenizer is None or id2label is None:
+        if batcher is None or id2label is None:
             raise HTTPException(status_code=503, detail="模型未加载，请稍后重试")
         
         # 输入验证
@@ -146,30 +172,8 @@ async def predict_intent(request: IntentRequest):
         text = request.text.strip()
         logger.info(f"处理意图识别请求: {text}")
         
-        # 文本预处理
-        inputs = tokenizer(
-            text,
-            return_tensors="pt",
-            truncation=True,
-            max_length=128,
-            padding=True
-        )
-        
-        # 将输入移动到模型设备
-        inputs = {k: v.to(model.device) for k, v in inputs.items()}
-        
-        # 模型推理
-        with torch.no_grad():
-            outputs = model(**inputs)
-            logits = outputs.logits
-            
-            # 获取预测结果
-            probabilities = torch.softmax(logits, dim=1)
-            predicted_class_id = torch.argmax(logits, dim=1).item()
-            confidence = float(probabilities[0][predicted_class_id].cpu())
-        
-        # 获取预测的意图
-        predicted_intent = id2label[str(predicted_class_id)]
+        # 与并发请求合并为一个批次推理
+        predicted_intent, confidence = await batcher.predict(text)
         
         logger.info(f"预测结果: {predicted_intent}, 置信度: {confidence:.4f}")
         
@@ -183,10 +187,67 @@ async def predict_intent(request: IntentRequest):
     except HTTPException:
         # 重新抛出HTTP异常
         raise
+    except QueueFullError as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         logger.error(f"预测过程中出现错误: {str(e)}")
         raise HTTPException(status_code=500, detail=f"预测失败: {str(e)}")
 
+@app.post("/predict_batch", response_model=BatchIntentResponse)
+async def predict_intent_batch(request: BatchIntentRequest):
+    """
+    批量意图识别端点
+    
+    Args:
+        request: 包含多条待识别文本的请求
+        
+    Returns:
+        BatchIntentResponse: 按输入顺序返回每条文本的意图和置信度
+    """
+    try:
+        if batcher is None or id2label is None:
+            raise HTTPException(status_code=503, detail="模型未加载，请稍后重试")
+        
+        if not request.texts:
+            raise HTTPException(status_code=400, detail="texts不能为空")
+        if len(request.texts) > MAX_BATCH_TEXTS:
+            raise HTTPException(status_code=400, detail=f"单次最多 {MAX_BATCH_TEXTS} 条文本")
+        texts = [text.strip() if text else "" for text in request.texts]
+        if not all(texts):
+            raise HTTPException(status_code=400, detail="输入文本不能为空")
+        
+        logger.info(f"处理批量意图识别请求: {len(texts)} 条")
+        predictions = await batcher.predict_many(texts)
+        
+        return BatchIntentResponse(
+            results=[
+                IntentResponse(text=text, intent=intent, confidence=confidence)
+                for text, (intent, confidence) in zip(texts, predictions)
+            ],
+            count=len(texts)
+        )
+    
+    except HTTPException:
+        raise
+    except QueueFullError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except Exception as e:
+        logger.error(f"批量预测过程中出现错误: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"预测失败: {str(e)}")
+
+@app.get("/stats")
+async def get_stats():
+    """微批处理统计：请求数、批次数、平均批大小、队列长度"""
+    if batcher is None:
+        raise HTTPException(status_code=503, detail="模型未加载")
+    
+    return {
+        "backend": predictor.backend,
+        "max_batch_size": MAX_BATCH_SIZE,
+        "max_wait_ms": MAX_WAIT_MS,
+        **batcher.stats()
+    }
+
 @app.get("/intents")
 async def get_available_intents():
     """获取所有可用的意图类别"""
@@ -209,7 +270,10 @@ if __name__ == "__main__":
     print("  - GET  /          : API信息")
     print("  - GET  /health    : 健康检查")
     print("  - POST /predict   : 意图识别")
+    print("  - POST /predict_batch : 批量意图识别")
     print("  - GET  /intents   : 获取可用意图")
+    print("  - GET  /stats     : 微批处理统计")
+    print(f"推理后端: {INTENT_BACKEND}, 微批: max_batch_size={MAX_BATCH_SIZE}, max_wait={MAX_WAIT_MS}ms")
     print("示例请求: POST /predict")
     print('  {"text": "我要退票"}')
     print("=" * 50)
@@ -219,4 +283,4 @@ if __name__ == "__main__":
         host="0.0.0.0", 
         port=8000,
         log_level="info"
-    )
\ No newline at end of file
+    )
\ No newline at end of file
@@ -0,0 +1,125 @@
+import json
+import time
+import logging
+import argparse
+import statistics
+from typing import Dict, List
+
+from intent_inference import OnnxIntentPredictor, TorchIntentPredictor
+
+# 配置日志
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+
+def load_dataset(path: str) -> List[Dict[str, str]]:
+    """读取 jsonl 数据集，每行包含 text 和 intent"""
+    samples = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                samples.append(json.loads(line))
+    return samples
+
+
+def benchmark(predictor, texts: List[str], labels: List[str], batch_size: int, warmup: int) -> Dict:
+    """
+    测量单条延迟、批量吞吐量和准确率
+
+    Returns:
+        dict: 延迟(ms)、吞吐量(条/秒)、准确率、预测结果
+    """
+    for text in texts[:warmup]:
+        predictor.predict([text])
+
+    # 单条请求延迟（对应 /predict 逐条推理）
+    latencies = []
+    for text in texts:
+        start = time.perf_counter()
+        predictor.predict([text])
+        latencies.append((time.perf_counter() - start) * 1000)
+    latencies.sort()
+
+    # 批量吞吐量（对应微批处理 / /predict_batch）
+    predictions = []
+    start = time.perf_counter()
+    for i in range(0, len(texts), batch_size):
+        predictions.extend(intent for intent, _ in predictor.predict(texts[i:i + batch_size]))
+    batch_seconds = time.perf_counter() - start
+
+    accuracy = sum(p == l for p, l in zip(predictions, labels)) / len(labels)
+    return {
+        "latency_p50_ms": latencies[len(latencies) // 2],
+        "latency_p95_ms": latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))],
+        "latency_mean_ms": statistics.mean(latencies),
+        "single_throughput": len(texts) / (sum(latencies) / 1000),
+        "batch_throughput": len(texts) / batch_seconds,
+        "accuracy": accuracy,
+        "predictions": predictions,
+    }
+
+
+def main():
+    """
+    主函数，对比 PyTorch 和 ONNX int8 推理
+    """
+    parser = argparse.ArgumentParser(
+        description="对比PyTorch与ONNX int8意图识别推理的延迟、吞吐量和准确率",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+示例用法:
+  python benchmark_inference.py
+  python benchmark_inference.py --torch_model ./qwen3-intent-merged --onnx_dir ./qwen3-intent-onnx --batch_size 32
+        """
+    )
+    parser.add_argument("--data", type=str, default="data/intent_data.jsonl", help="评测数据")
+    parser.add_argument("--torch_model", type=str, default="./qwen3-intent-merged",
+                        help="合并后的模型目录，设为空字符串跳过PyTorch")
+    parser.add_argument("--onnx_dir", type=str, default="./qwen3-intent-onnx",
+                        help="ONNX模型目录，设为空字符串跳过ONNX")
+    parser.add_argument("--batch_size", type=int, default=16, help="吞吐量测试的批大小")
+    parser.add_argument("--warmup", type=int, default=5, help="预热请求数")
+    args = parser.parse_args()
+
+    samples = load_dataset(args.data)
+    texts = [s["text"] for s in samples]
+    labels = [s["intent"] for s in samples]
+    logger.info(f"加载评测数据 {len(samples)} 条")
+
+    results = {}
+    if args.torch_model:
+        results["PyTorch"] = benchmark(TorchIntentPredictor(args.torch_model), texts, labels,
+                                       args.batch_size, args.warmup)
+    if args.onnx_dir:
+        results["ONNX int8"] = benchmark(OnnxIntentPredictor(args.onnx_dir), texts, labels,
+                                         args.batch_size, args.warmup)
+    if not results:
+        print("❌ 未指定任何模型")
+        return 1
+
+    print("\n" + "=" * 90)
+    print(f"{'后端':<12}{'p50(ms)':>10}{'p95(ms)':>10}{'单条(条/s)':>14}"
+          f"{f'批量bs={args.batch_size}(条/s)':>22}{'准确率':>10}")
+    print("-" * 90)
+    for name, r in results.items():
+        print(f"{name:<12}{r['latency_p50_ms']:>10.2f}{r['latency_p95_ms']:>10.2f}"
+              f"{r['single_throughput']:>14.1f}{r['batch_throughput']:>22.1f}{r['accuracy']:>10.2%}")
+    print("=" * 90)
+
+    if len(results) == 2:
+        torch_result, onnx_result = results["PyTorch"], results["ONNX int8"]
+        agreement = sum(
+            a == b for a, b in zip(torch_result["predictions"], onnx_result["predictions"])
+        ) / len(texts)
+        print(f"预测一致率: {agreement:.2%}")
+        print(f"单条延迟加速比(p50): {torch_result['latency_p50_ms'] / onnx_result['latency_p50_ms']:.2f}x")
+        print(f"批量吞吐加速比: {onnx_result['batch_throughput'] / torch_result['batch_throughput']:.2f}x")
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
@@ -0,0 +1,173 @@
+import os
+import json
+import shutil
+import inspect
+import logging
+import argparse
+
+import torch
+from transformers import AutoModelForSequenceClassification
+
+from intent_inference import MAX_LENGTH, load_label_mapping, load_tokenizer
+
+# 配置日志
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+# 超过该大小的模型使用外部数据格式保存权重（protobuf单文件上限2GB）
+EXTERNAL_DATA_THRESHOLD = 2 * 1024 ** 3
+
+
+class LogitsOnlyWrapper(torch.nn.Module):
+    """只输出 logits，固定 ONNX 图的输入输出"""
+
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def forward(self, input_ids, attention_mask):
+        return self.model(input_ids=input_ids, attention_mask=attention_mask, use_cache=False).logits
+
+
+def export_fp32(model_path: str, fp32_dir: str, opset: int) -> str:
+    """
+    把合并后的模型导出为 FP32 ONNX 模型
+
+    Args:
+        model_path: 合并后的模型目录（merge_model.py 的输出）
+        fp32_dir: FP32 模型目录（大模型的权重以外部数据文件保存在同一目录）
+        opset: ONNX opset版本
+
+    Returns:
+        str: FP32 模型路径
+    """
+    tokenizer = load_tokenizer(model_path)
+    # CPU量化需要FP32权重
+    model = AutoModelForSequenceClassification.from_pretrained(
+        model_path,
+        trust_remote_code=True,
+        torch_dtype=torch.float32
+    )
+    model.config.pad_token_id = tokenizer.pad_token_id
+    model.config.use_cache = False
+    model.eval()
+
+    num_bytes = sum(p.numel() * p.element_size() for p in model.parameters())
+    logger.info(f"模型加载完成，参数量 {sum(p.numel() for p in model.parameters()) / 1e6:.1f}M，"
+                f"FP32大小 {num_bytes / 1024 ** 3:.2f}GB")
+
+    # 用两条长度不同的样本导出，保证 batch 和 sequence 两个维度都是动态的
+    sample = tokenizer(["我要退票", "帮我查一下明天去上海的航班"], return_tensors="pt",
+                       padding=True, truncation=True, max_length=MAX_LENGTH)
+
+    os.makedirs(fp32_dir, exist_ok=True)
+    fp32_path = os.path.join(fp32_dir, "model.onnx")
+    export_kwargs = dict(
+        input_names=["input_ids", "attention_mask"],
+        output_names=["logits"],
+        dynamic_axes={
+            "input_ids": {0: "batch", 1: "sequence"},
+            "attention_mask": {0: "batch", 1: "sequence"},
+            "logits": {0: "batch"},
+        },
+        opset_version=opset,
+        do_constant_folding=True,
+    )
+    # 新版 PyTorch 默认使用 dynamo 导出，这里固定使用基于 TorchScript 的导出以支持 dynamic_axes
+    if "dynamo" in inspect.signature(torch.onnx.export).parameters:
+        export_kwargs["dynamo"] = False
+
+    logger.info("正在导出ONNX模型...")
+    with torch.no_grad():
+        torch.onnx.export(
+            LogitsOnlyWrapper(model),
+            (sample["input_ids"], sample["attention_mask"]),
+            fp32_path,
+            **export_kwargs
+        )
+    logger.info(f"FP32模型导出完成: {fp32_path}")
+    return fp32_path
+
+
+def quantize_int8(fp32_path: str, int8_path: str):
+    """动态 int8 量化：权重离线量化为 int8，激活在推理时动态量化"""
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    fp32_dir = os.path.dirname(fp32_path)
+    size = sum(os.path.getsize(os.path.join(fp32_dir, f)) for f in os.listdir(fp32_dir))
+    logger.info("正在进行动态int8量化...")
+    quantize_dynamic(
+        fp32_path,
+        int8_path,
+        weight_type=QuantType.QInt8,
+        per_channel=True,
+        use_external_data_format=size > EXTERNAL_DATA_THRESHOLD
+    )
+    logger.info(f"int8模型量化完成: {int8_path}")
+
+
+def main():
+    """
+    主函数，导出合并后的模型并进行int8量化
+    """
+    parser = argparse.ArgumentParser(
+        description="导出意图识别模型为ONNX并进行动态int8量化",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+示例用法:
+  python export_onnx.py
+  python export_onnx.py --model_path ./qwen3-intent-merged --output_dir ./qwen3-intent-onnx
+        """
+    )
+    parser.add_argument("--model_path", type=str, default="./qwen3-intent-merged",
+                        help="合并后的模型目录 (默认: ./qwen3-intent-merged)")
+    parser.add_argument("--output_dir", type=str, default="./qwen3-intent-onnx",
+                        help="ONNX模型输出目录 (默认: ./qwen3-intent-onnx)")
+    parser.add_argument("--opset", type=int, default=17, help="ONNX opset版本 (默认: 17)")
+    parser.add_argument("--keep_fp32", action="store_true", help="保留FP32 ONNX模型（输出目录下的fp32/）")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.model_path):
+        print(f"\n❌ 模型路径不存在: {args.model_path}，请先运行 merge_model.py")
+        return 1
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    try:
+        id2label = load_label_mapping(args.model_path)
+        shutil.copy(os.path.join(args.model_path, "label_mapping.json"),
+                    os.path.join(args.output_dir, "label_mapping.json"))
+
+        load_tokenizer(args.model_path).save_pretrained(args.output_dir)
+
+        fp32_dir = os.path.join(args.output_dir, "fp32")
+        fp32_path = export_fp32(args.model_path, fp32_dir, args.opset)
+        int8_path = os.path.join(args.output_dir, "model.int8.onnx")
+        quantize_int8(fp32_path, int8_path)
+
+        if not args.keep_fp32:
+            shutil.rmtree(fp32_dir)
+
+        with open(os.path.join(args.output_dir, "export_info.json"), 'w', encoding='utf-8') as f:
+            json.dump({
+                "source_model": args.model_path,
+                "num_labels": len(id2label),
+                "opset": args.opset,
+                "quantization": "dynamic_int8",
+                "model_file": "model.int8.onnx"
+            }, f, ensure_ascii=False, indent=2)
+    except Exception as e:
+        logger.error(f"导出失败: {str(e)}")
+        print(f"\n❌ 导出失败: {str(e)}")
+        return 1
+
+    print("\n✅ ONNX导出和int8量化完成！")
+    print(f"📁 模型保存在: {args.output_dir}")
+    print("🚀 使用 INTENT_BACKEND=onnx python app.py 启动ONNX推理服务")
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
@@ -0,0 +1,288 @@
+import os
+import json
+import time
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+MAX_LENGTH = 128
+
+# 预测结果：(意图, 置信度)
+Prediction = Tuple[str, float]
+
+
+def load_label_mapping(model_dir: str) -> Dict[str, str]:
+    """
+    加载 id2label 映射
+
+    Args:
+        model_dir: 包含 label_mapping.json 的目录
+
+    Returns:
+        dict: 类别ID(字符串) -> 意图名称
+    """
+    label_mapping_path = os.path.join(model_dir, "label_mapping.json")
+    if not os.path.exists(label_mapping_path):
+        raise FileNotFoundError(f"标签映射文件不存在: {label_mapping_path}")
+    with open(label_mapping_path, 'r', encoding='utf-8') as f:
+        label_mapping = json.load(f)
+    return {str(k): v for k, v in label_mapping["id2label"].items()}
+
+
+def load_tokenizer(tokenizer_path: str):
+    """加载分词器，批量推理统一右侧填充"""
+    from transformers import AutoTokenizer
+
+    tokenizer = AutoTokenizer.from_pretrained(tokenizer_path, trust_remote_code=True)
+    if tokenizer.pad_token is None:
+        tokenizer.pad_token = tokenizer.eos_token
+    tokenizer.padding_side = "right"
+    return tokenizer
+
+
+def softmax(logits: np.ndarray) -> np.ndarray:
+    logits = logits - logits.max(axis=-1, keepdims=True)
+    exp = np.exp(logits)
+    return exp / exp.sum(axis=-1, keepdims=True)
+
+
+class TorchIntentPredictor:
+    """
+    PyTorch 推理
+
+    优先加载合并后的模型目录；只有 LoRA 适配器时加载基础模型 + 适配器
+    """
+
+    backend = "torch"
+
+    def __init__(self, model_path: str, base_model_name: Optional[str] = None):
+        """
+        Args:
+            model_path: 合并后的模型目录，或 LoRA 适配器目录
+            base_model_name: model_path 为 LoRA 适配器时使用的基础模型
+        """
+        import torch
+        from transformers import AutoModelForSequenceClassification
+
+        self.torch = torch
+        self.id2label = load_label_mapping(model_path)
+        is_adapter = os.path.exists(os.path.join(model_path, "adapter_config.json"))
+        dtype = torch.float16 if torch.cuda.is_available() else torch.float32
+
+        if is_adapter:
+            from peft import PeftModel
+
+            if not base_model_name:
+                raise ValueError("加载LoRA适配器需要指定基础模型")
+            self.tokenizer = load_tokenizer(base_model_name)
+            base_model = AutoModelForSequenceClassification.from_pretrained(
+                base_model_name,
+                num_labels=len(self.id2label),
+                trust_remote_code=True,
+                device_map="auto",
+                torch_dtype=dtype
+            )
+            self.model = PeftModel.from_pretrained(base_model, model_path)
+        else:
+            self.tokenizer = load_tokenizer(model_path)
+            self.model = AutoModelForSequenceClassification.from_pretrained(
+                model_path,
+                trust_remote_code=True,
+                device_map="auto" if torch.cuda.is_available() else None,
+                torch_dtype=dtype
+            )
+
+        # 批量输入含填充时，模型依赖 pad_token_id 找到每条样本的最后一个有效token
+        self.model.config.pad_token_id = self.tokenizer.pad_token_id
+        self.model.eval()
+        self.device = next(self.model.parameters()).device
+        logger.info(f"PyTorch模型加载完成: {model_path} ({'LoRA适配器' if is_adapter else '合并模型'}, {self.device})")
+
+    def predict(self, texts: List[str]) -> List[Prediction]:
+        """批量预测"""
+        inputs = self.tokenizer(
+            texts,
+            return_tensors="pt",
+            truncation=True,
+            max_length=MAX_LENGTH,
+            padding=True
+        )
+        inputs = {k: v.to(self.device) for k, v in inputs.items()}
+        with self.torch.no_grad():
+            logits = self.model(**inputs).logits.float().cpu().numpy()
+        probabilities = softmax(logits)
+        predicted = probabilities.argmax(axis=-1)
+        return [
+            (self.id2label[str(int(class_id))], float(probabilities[i, class_id]))
+            for i, class_id in enumerate(predicted)
+        ]
+
+
+class OnnxIntentPredictor:
+    """
+    ONNX Runtime 推理（CPU）
+
+    模型目录由 export_onnx.py 生成，包含 onnx 模型、分词器和 label_mapping.json
+    """
+
+    backend = "onnx"
+
+    def __init__(self, model_dir: str, model_file: str = "model.int8.onnx", num_threads: int = 0):
+        """
+        Args:
+            model_dir: 导出目录
+            model_file: 模型文件名，默认使用 int8 量化模型
+            num_threads: 算子内并行线程数，0 表示由 ONNX Runtime 决定
+        """
+        import onnxruntime as ort
+
+        self.id2label = load_label_mapping(model_dir)
+        self.tokenizer = load_tokenizer(model_dir)
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+        model_path = os.path.join(model_dir, model_file)
+        self.session = ort.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+        self.input_names = {i.name for i in self.session.get_inputs()}
+        logger.info(f"ONNX模型加载完成: {model_path}")
+
+    def predict(self, texts: List[str]) -> List[Prediction]:
+        """批量预测"""
+        inputs = self.tokenizer(
+            texts,
+            return_tensors="np",
+            truncation=True,
+            max_length=MAX_LENGTH,
+            padding=True
+        )
+        feeds = {k: v.astype(np.int64) for k, v in inputs.items() if k in self.input_names}
+        logits = self.session.run(["logits"], feeds)[0]
+        probabilities = softmax(logits.astype(np.float32))
+        predicted = probabilities.argmax(axis=-1)
+        return [
+            (self.id2label[str(int(class_id))], float(probabilities[i, class_id]))
+            for i, class_id in enumerate(predicted)
+        ]
+
+
+class QueueFullError(Exception):
+    """微批处理队列已满"""
+
+
+class MicroBatcher:
+    """
+    微批处理器
+
+    并发到达的请求进入队列，后台任务取出第一个请求后最多等待 max_wait_ms，
+    凑满 max_batch_size 条后在单独的推理线程中执行一次批量前向，不阻塞事件循环
+    """
+
+    def __init__(self, predict_fn: Callable[[List[str]], List[Prediction]],
+                 max_batch_size: int = 32, max_wait_ms: float = 5.0, max_queue_size: int = 1024):
+        self.predict_fn = predict_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.max_queue_size = max_queue_size
+        # 模型同一时间只执行一个批次，算子内部仍可多线程
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="intent-infer")
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._stats = {
+            "requests": 0, "batches": 0, "batched_requests": 0,
+            "rejected": 0, "errors": 0, "inference_seconds": 0.0
+        }
+
+    def start(self):
+        """在事件循环中启动后台批处理任务"""
+        self._queue = asyncio.Queue(maxsize=self.max_queue_size)
+        self._worker = asyncio.get_running_loop().create_task(self._run())
+        logger.info(f"微批处理已启动: max_batch_size={self.max_batch_size}, max_wait={self.max_wait * 1000:.1f}ms")
+
+    async def stop(self):
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+        self._executor.shutdown(wait=False)
+
+    def _enqueue(self, text: str) -> asyncio.Future:
+        future = asyncio.get_running_loop().create_future()
+        try:
+            self._queue.put_nowait((text, future))
+        except asyncio.QueueFull:
+            self._stats["rejected"] += 1
+            raise QueueFullError("推理队列已满，请稍后重试")
+        self._stats["requests"] += 1
+        return future
+
+    async def predict(self, text: str) -> Prediction:
+        """预测单条文本"""
+        return await self._enqueue(text)
+
+    async def predict_many(self, texts: List[str]) -> List[Prediction]:
+        """预测多条文本，与其他并发请求一起组批"""
+        if len(texts) > self.max_queue_size - self._queue.qsize():
+            self._stats["rejected"] += len(texts)
+            raise QueueFullError("推理队列已满，请稍后重试")
+        futures = [self._enqueue(text) for text in texts]
+        return list(await asyncio.gather(*futures))
+
+    async def _collect(self) -> List[Tuple[str, asyncio.Future]]:
+        loop = asyncio.get_running_loop()
+        batch = [await self._queue.get()]
+        deadline = loop.time() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            # 队列中已有的请求直接取走，不再等待
+            if not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+                continue
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        # 客户端已断开的请求不再推理
+        return [(text, future) for text, future in batch if not future.cancelled()]
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect()
+            if not batch:
+                continue
+            texts = [text for text, _ in batch]
+            start = time.perf_counter()
+            try:
+                predictions = await loop.run_in_executor(self._executor, self.predict_fn, texts)
+            except Exception as e:
+                logger.error(f"批量推理失败({len(batch)}条): {str(e)}")
+                self._stats["errors"] += len(batch)
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            self._stats["batches"] += 1
+            self._stats["batched_requests"] += len(batch)
+            self._stats["inference_seconds"] += time.perf_counter() - start
+            for (_, future), prediction in zip(batch, predictions):
+                if not future.done():
+                    future.set_result(prediction)
+
+    def stats(self) -> Dict[str, float]:
+        stats = dict(self._stats)
+        stats["queue_size"] = self._queue.qsize() if self._queue is not None else 0
+        stats["avg_batch_size"] = round(stats["batched_requests"] / stats["batches"], 2) if stats["batches"] else 0.0
+        stats["inference_seconds"] = round(stats["inference_seconds"], 3)
+        return stats
@@ -1,4 +1,6 @@
 from fastapi import FastAPI, HTTPException
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import iterate_in_threadpool, run_in_threadpool
 from pydantic import BaseModel
 import torch
 from transformers import AutoTokenizer, AutoModelForCausalLM
@@ -6,8 +8,11 @@ import uvicorn
 import os
 import logging
 from typing import Optional
+import json
 import time
 
+from batch_generator import BatchGenerator, QueueFullError, QueueTimeoutError
+
 # 配置日志
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -15,15 +20,19 @@ logger = logging.getLogger(__name__)
 # 请求和响应模型
 class QuestionRequest(BaseModel):
     question: str
-    max_length: Optional[int] = 256
+    max_length: Optional[int] = 256          # 最大生成token数
     temperature: Optional[float] = 0.7
     top_p: Optional[float] = 0.9
+    queue_timeout: Optional[float] = 30.0    # 排队超过该时间（秒）仍未开始生成则返回503
 
 class AnswerResponse(BaseModel):
     answer: str
     question: str
     processing_time: float
     model_info: str
+    generated_tokens: int = 0
+    queue_time: float = 0.0
+    batch_size: int = 1
 
 class HealthResponse(BaseModel):
     status: str
@@ -41,6 +50,16 @@ model = None
 tokenizer = None
 device = None
 model_path = None
+generator: Optional[BatchGenerator] = None
+
+# 批处理配置，可通过命令行参数修改
+generator_config = {
+    "max_batch_size": 8,
+    "max_wait_ms": 20.0,
+    "max_queue_size": 256,
+}
+# 单个请求允许的最大生成token数
+MAX_NEW_TOKENS_LIMIT = 1024
 
 def load_model(model_path: str):
     """
@@ -49,7 +68,7 @@ def load_model(model_path: str):
     Args:
         model_path: 模型路径
     """
-    global model, tokenizer, device
+    global model, tokenizer, device, generator
     
     try:
         logger.info(f"开始加载模型: {model_path}")
@@ -77,6 +96,14 @@ def load_model(model_path: str):
             trust_remote_code=True
         )
         
+        model.eval()
+        
+        # 启动批量生成线程，替换旧模型时先停止旧线程
+        if generator is not None:
+            generator.stop()
+        generator = BatchGenerator(model, tokenizer, **generator_config)
+        generator.start()
+        
         logger.info("模型加载完成")
         return True
         
@@ -84,56 +111,24 @@ def load_model(model_path: str):
         logger.error(f"模型加载失败: {str(e)}")
         return False
 
-def generate_answer(question: str, max_length: int = 256, temperature: float = 0.7, top_p: float = 0.9) -> str:
-    """
-    生成问题的答案
-    
-    Args:
-        question: 输入问题
-        max_length: 最大生成长度
-        temperature: 温度参数
-        top_p: top_p参数
-        
-    Returns:
-        生成的答案
-    """
-    if model is None or tokenizer is None:
+def validate_request(request: QuestionRequest):
+    """校验请求参数"""
+    if generator is None:
         raise HTTPException(status_code=500, detail="模型未加载")
-    
-    try:
-        # 构建输入提示
-        prompt = f"<|im_start|>system\n你是一个专业的医疗助手，请根据医学知识准确回答用户的健康相关问题。<|im_end|>\n<|im_start|>user\n{question}<|im_end|>\n<|im_start|>assistant\n"
-        
-        # 编码输入
-        inputs = tokenizer(prompt, return_tensors="pt", truncation=True, max_length=512)
-        inputs = {k: v.to(model.device) for k, v in inputs.items()}
-        
-        # 生成答案
-        with torch.no_grad():
-            outputs = model.generate(
-                **inputs,
-                max_new_tokens=max_length,
-                temperature=temperature,
-                do_sample=True,
-                top_p=top_p,
-                pad_token_id=tokenizer.pad_token_id,
-                eos_token_id=tokenizer.eos_token_id
-            )
-        
-        # 解码输出
-        generated_text = tokenizer.decode(outputs[0], skip_special_tokens=True)
-        
-        # 提取助手回答部分
-        if "<|im_start|>assistant\n" in generated_text:
-            answer = generated_text.split("<|im_start|>assistant\n")[-1].strip()
-        else:
-            answer = generated_text[len(prompt):].strip()
-        
-        return answer
-        
-    except Exception as e:
-        logger.error(f"生成答案时出错: {str(e)}")
-        raise HTTPException(status_code=500, detail=f"生成答案失败: {str(e)}")
+    if not request.question.strip():
+        raise HTTPException(status_code=400, detail="问题不能为空")
+    if not 1 <= request.max_length <= MAX_NEW_TOKENS_LIMIT:
+        raise HTTPException(status_code=400, detail=f"max_length必须在1-{MAX_NEW_TOKENS_LIMIT}之间")
+    if request.queue_timeout <= 0:
+        raise HTTPException(status_code=400, detail="queue_timeout必须大于0")
+
+def generation_kwargs(request: QuestionRequest) -> dict:
+    return dict(
+        max_new_tokens=request.max_length,
+        temperature=request.temperature,
+        top_p=request.top_p,
+        queue_timeout=request.queue_timeout
+    )
 
 @app.get("/", response_model=dict)
 async def root():
@@ -144,6 +139,8 @@ async def root():
         "endpoints": {
             "health": "/health",
             "ask": "/ask",
+            "ask_stream": "/ask_stream",
+            "stats": "/stats",
             "docs": "/docs"
         }
     }
@@ -168,32 +165,84 @@ async def ask_question(request: QuestionRequest):
     Returns:
         答案响应
     """
-    if not request.question.strip():
-        raise HTTPException(status_code=400, detail="问题不能为空")
+    validate_request(request)
     
     start_time = time.time()
     
     try:
-        # 生成答案
-        answer = generate_answer(
-            question=request.question,
-            max_length=request.max_length,
-            temperature=request.temperature,
-            top_p=request.top_p
-        )
+        # 请求进入批处理队列，由后台线程与其他并发请求合并生成
+        result = await generator.generate(request.question, **generation_kwargs(request))
         
         processing_time = time.time() - start_time
         
         return AnswerResponse(
-            answer=answer,
+            answer=result["answer"],
             question=request.question,
             processing_time=processing_time,
-            model_info=model_path or "unknown"
+            model_info=model_path or "unknown",
+            generated_tokens=result["generated_tokens"],
+            queue_time=result["queue_time"],
+            batch_size=result["batch_size"]
         )
         
+    except (QueueFullError, QueueTimeoutError) as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         logger.error(f"处理问题时出错: {str(e)}")
-        raise HTTPException(status_code=500, detail=str(e))
+        raise HTTPException(status_code=500, detail=f"生成答案失败: {str(e)}")
+
+@app.post("/ask_stream")
+async def ask_question_stream(request: QuestionRequest):
+    """
+    流式问答接口（Server-Sent Events）
+    
+    每生成一段文本推送一条 data: {"text": ...}，结束时推送统计信息和 data: [DONE]
+    """
+    validate_request(request)
+    
+    try:
+        stream_request = generator.stream(request.question, **generation_kwargs(request))
+    except QueueFullError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    
+    start_time = time.time()
+    
+    def sse(payload: dict) -> str:
+        return f"data: {json.dumps(payload, ensure_ascii=False)}\n\n"
+    
+    async def event_stream():
+        # TextIteratorStreamer 是阻塞迭代器，放到线程池中迭代
+        try:
+            async for text in iterate_in_threadpool(iter(stream_request.streamer)):
+                if text:
+                    yield sse({"text": text})
+        except Exception as e:
+            yield sse({"error": f"生成答案失败: {str(e)}"})
+            return
+        
+        # 流结束后等待后台线程写入最终结果
+        await run_in_threadpool(stream_request.done.wait, 5.0)
+        if stream_request.error is not None:
+            yield sse({"error": str(stream_request.error)})
+        else:
+            result = stream_request.result or {}
+            yield sse({
+                "done": True,
+                "generated_tokens": result.get("generated_tokens", 0),
+                "queue_time": result.get("queue_time", 0.0),
+                "batch_size": result.get("batch_size", 1),
+                "processing_time": time.time() - start_time
+            })
+        yield "data: [DONE]\n\n"
+    
+    return StreamingResponse(event_stream(), media_type="text/event-stream")
+
+@app.get("/stats")
+async def get_stats():
+    """批量生成统计：队列长度、平均批大小、吞吐量等"""
+    if generator is None:
+        raise HTTPException(status_code=500, detail="模型未加载")
+    return generator.stats()
 
 @app.post("/reload_model")
 async def reload_model(new_model_path: str):
@@ -251,6 +300,12 @@ def main():
                        help="服务器端口")
     parser.add_argument("--reload", action="store_true", 
                        help="开发模式，自动重载")
+    parser.add_argument("--max_batch_size", type=int, default=8,
+                       help="每批最多合并的请求数")
+    parser.add_argument("--max_wait_ms", type=float, default=20.0,
+                       help="组批时等待后续请求的最长时间（毫秒）")
+    parser.add_argument("--max_queue_size", type=int, default=256,
+                       help="排队请求数上限，超出时返回503")
     
     args = parser.parse_args()
     
@@ -262,6 +317,11 @@ def main():
     # 加载模型
     global model_path
     model_path = args.model_path
+    generator_config.update(
+        max_batch_size=args.max_batch_size,
+        max_wait_ms=args.max_wait_ms,
+        max_queue_size=args.max_queue_size
+    )
     
     success = load_model(args.model_path)
     if not success:
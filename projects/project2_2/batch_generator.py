@@ -0,0 +1,379 @@
+"""
+批量生成服务
+把并发到达的问答请求放入队列，由后台线程合并成批（左侧填充）调用 model.generate，
+支持每个请求单独的最大生成长度、排队超时，以及基于 TextIteratorStreamer 的流式输出
+"""
+
+import asyncio
+import logging
+import queue
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+import torch
+from transformers import StoppingCriteria, StoppingCriteriaList, TextIteratorStreamer
+from transformers.generation.streamers import BaseStreamer
+
+logger = logging.getLogger(__name__)
+
+SYSTEM_PROMPT = "你是一个专业的医疗助手，请根据医学知识准确回答用户的健康相关问题。"
+
+
+def build_prompt(question: str) -> str:
+    """构建Qwen对话格式的输入提示"""
+    return (
+        f"<|im_start|>system\n{SYSTEM_PROMPT}<|im_end|>\n"
+        f"<|im_start|>user\n{question}<|im_end|>\n"
+        f"<|im_start|>assistant\n"
+    )
+
+
+class QueueFullError(Exception):
+    """请求队列已满"""
+
+
+class QueueTimeoutError(Exception):
+    """请求排队超时"""
+
+
+@dataclass
+class GenerationRequest:
+    """一个待生成的请求"""
+    prompt: str
+    max_new_tokens: int
+    temperature: float
+    top_p: float
+    deadline: float                                   # 必须在此时刻（monotonic）之前开始生成
+    streamer: Optional[TextIteratorStreamer] = None   # 流式请求的输出
+    future: Optional[asyncio.Future] = None           # 非流式请求的结果
+    loop: Optional[asyncio.AbstractEventLoop] = None
+    enqueued_at: float = field(default_factory=time.monotonic)
+    done: threading.Event = field(default_factory=threading.Event)
+    result: Optional[Dict[str, Any]] = None
+    error: Optional[Exception] = None
+
+    @property
+    def sampling_key(self):
+        """只有采样参数相同的请求才能合并到同一批"""
+        if self.temperature <= 0:
+            return (False, 0.0, 1.0)
+        return (True, round(self.temperature, 4), round(self.top_p, 4))
+
+    @property
+    def cancelled(self) -> bool:
+        return self.future is not None and self.future.cancelled()
+
+
+class _RowLimitCriteria(StoppingCriteria):
+    """批内每个请求都达到自己的最大长度或生成了结束符时停止"""
+
+    def __init__(self, prompt_length: int, limits: List[int], eos_token_ids: List[int]):
+        self.prompt_length = prompt_length
+        self.limits = torch.tensor(limits)
+        self.eos_token_ids = torch.tensor(eos_token_ids)
+        self.finished = torch.zeros(len(limits), dtype=torch.bool)
+
+    def __call__(self, input_ids: torch.LongTensor, scores, **kwargs) -> bool:
+        last_tokens = input_ids[:, -1].cpu()
+        generated = input_ids.shape[1] - self.prompt_length
+        self.finished |= torch.isin(last_tokens, self.eos_token_ids) | (generated >= self.limits)
+        return bool(self.finished.all())
+
+
+class _BatchStreamer(BaseStreamer):
+    """把批量生成的每一步输出分发给各请求自己的 TextIteratorStreamer"""
+
+    def __init__(self, streamers: List[Optional[TextIteratorStreamer]], limits: List[int], eos_token_ids: List[int]):
+        self.streamers = streamers
+        self.limits = limits
+        self.eos_token_ids = set(eos_token_ids)
+        self.counts = [0] * len(streamers)
+        self.finished = [s is None for s in streamers]
+        self._prompt_skipped = False
+
+    def _finish(self, i: int):
+        self.finished[i] = True
+        self.streamers[i].end()
+
+    def put(self, value):
+        # 第一次调用传入的是（左侧填充后的）提示部分
+        if not self._prompt_skipped:
+            self._prompt_skipped = True
+            return
+        for i, streamer in enumerate(self.streamers):
+            if self.finished[i]:
+                continue
+            token = int(value[i])
+            if token in self.eos_token_ids:
+                self._finish(i)
+                continue
+            streamer.put(value[i:i + 1])
+            self.counts[i] += 1
+            if self.counts[i] >= self.limits[i]:
+                self._finish(i)
+
+    def end(self):
+        for i in range(len(self.streamers)):
+            if not self.finished[i]:
+                self._finish(i)
+
+
+class BatchGenerator:
+    """
+    连续批处理生成器
+
+    - submit 把请求放入有界队列，队列满时抛出 QueueFullError
+    - 后台线程取出第一个请求后，最多再等待 max_wait_ms 收集采样参数相同的请求组成一批
+    - 排队超过 queue_timeout 仍未开始生成的请求以 QueueTimeoutError 结束
+    """
+
+    def __init__(self, model, tokenizer, max_batch_size: int = 8, max_wait_ms: float = 20.0,
+                 max_queue_size: int = 256, max_input_length: int = 512):
+        self.model = model
+        self.tokenizer = tokenizer
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.max_input_length = max_input_length
+
+        # 批量生成需要左侧填充，保证所有序列的最后一个位置对齐
+        self.tokenizer.padding_side = "left"
+        if self.tokenizer.pad_token is None:
+            self.tokenizer.pad_token = self.tokenizer.eos_token
+        eos = self.tokenizer.eos_token_id
+        self.eos_token_ids = list(eos) if isinstance(eos, (list, tuple)) else [eos]
+
+        self._queue: "queue.Queue[GenerationRequest]" = queue.Queue(maxsize=max_queue_size)
+        # 采样参数与当前批次不同的请求，留到下一批优先处理
+        self._deferred: deque = deque()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+        self._stats = {
+            "requests": 0, "batches": 0, "batched_requests": 0, "generated_tokens": 0,
+            "rejected": 0, "queue_timeouts": 0, "errors": 0, "generate_seconds": 0.0,
+        }
+
+    # ---------- 生命周期 ----------
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="batch-generator", daemon=True)
+        self._thread.start()
+        logger.info(f"批量生成线程已启动: max_batch_size={self.max_batch_size}, "
+                    f"max_wait={self.max_wait * 1000:.0f}ms")
+
+    def stop(self, timeout: float = 30.0):
+        """停止后台线程，队列中未处理的请求以错误结束"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        while True:
+            request = self._next_request(block=False)
+            if request is None:
+                break
+            self._fail(request, RuntimeError("服务正在关闭"))
+
+    # ---------- 提交请求 ----------
+
+    def _make_request(self, question: str, max_new_tokens: int, temperature: float,
+                      top_p: float, queue_timeout: float) -> GenerationRequest:
+        return GenerationRequest(
+            prompt=build_prompt(question),
+            max_new_tokens=max_new_tokens,
+            temperature=temperature,
+            top_p=top_p,
+            deadline=time.monotonic() + queue_timeout,
+        )
+
+    def submit(self, request: GenerationRequest):
+        try:
+            self._queue.put_nowait(request)
+        except queue.Full:
+            self._stats["rejected"] += 1
+            raise QueueFullError("请求队列已满，请稍后重试")
+        self._stats["requests"] += 1
+
+    async def generate(self, question: str, max_new_tokens: int = 256, temperature: float = 0.7,
+                       top_p: float = 0.9, queue_timeout: float = 30.0) -> Dict[str, Any]:
+        """提交请求并等待生成完成"""
+        request = self._make_request(question, max_new_tokens, temperature, top_p, queue_timeout)
+        request.loop = asyncio.get_running_loop()
+        request.future = request.loop.create_future()
+        self.submit(request)
+        return await request.future
+
+    def stream(self, question: str, max_new_tokens: int = 256, temperature: float = 0.7,
+               top_p: float = 0.9, queue_timeout: float = 30.0,
+               stream_timeout: Optional[float] = 300.0) -> GenerationRequest:
+        """
+        提交流式请求，返回的 request.streamer 可逐段迭代生成的文本；
+        迭代结束后 request.error 非空表示生成失败
+        """
+        request = self._make_request(question, max_new_tokens, temperature, top_p, queue_timeout)
+        request.streamer = TextIteratorStreamer(self.tokenizer, timeout=stream_timeout, skip_special_tokens=True)
+        self.submit(request)
+        return request
+
+    def stats(self) -> Dict[str, Any]:
+        stats = dict(self._stats)
+        stats["queue_size"] = self._queue.qsize() + len(self._deferred)
+        stats["avg_batch_size"] = round(stats["batched_requests"] / stats["batches"], 2) if stats["batches"] else 0.0
+        stats["tokens_per_second"] = (
+            round(stats["generated_tokens"] / stats["generate_seconds"], 2) if stats["generate_seconds"] else 0.0
+        )
+        stats["generate_seconds"] = round(stats["generate_seconds"], 2)
+        return stats
+
+    # ---------- 结果回传 ----------
+
+    def _complete(self, request: GenerationRequest, result: Dict[str, Any]):
+        request.result = result
+        request.done.set()
+        if request.future is not None:
+            request.loop.call_soon_threadsafe(self._set_future, request.future, result, None)
+
+    def _fail(self, request: GenerationRequest, error: Exception):
+        request.error = error
+        request.done.set()
+        if request.streamer is not None:
+            request.streamer.end()
+        if request.future is not None:
+            request.loop.call_soon_threadsafe(self._set_future, request.future, None, error)
+
+    @staticmethod
+    def _set_future(future: asyncio.Future, result, error):
+        if future.done():
+            return
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    # ---------- 后台线程 ----------
+
+    def _next_request(self, block: bool = True, timeout: float = None) -> Optional[GenerationRequest]:
+        if self._deferred:
+            return self._deferred.popleft()
+        try:
+            return self._queue.get(block=block, timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def _accept(self, request: GenerationRequest) -> bool:
+        """丢弃已取消和排队超时的请求"""
+        if request.cancelled:
+            return False
+        if time.monotonic() > request.deadline:
+            self._stats["queue_timeouts"] += 1
+            self._fail(request, QueueTimeoutError("请求排队超时"))
+            return False
+        return True
+
+    def _collect_batch(self) -> List[GenerationRequest]:
+        first = self._next_request(timeout=0.1)
+        if first is None or not self._accept(first):
+            return []
+        batch = [first]
+        key = first.sampling_key
+
+        # 先从上一轮留下的请求中挑选，再在等待窗口内从队列收集
+        for request in [r for r in self._deferred if r.sampling_key == key][:self.max_batch_size - 1]:
+            self._deferred.remove(request)
+            if self._accept(request):
+                batch.append(request)
+
+        deadline = time.monotonic() + self.max_wait
+        deferred = []
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                request = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if not self._accept(request):
+                continue
+            if request.sampling_key == key:
+                batch.append(request)
+            else:
+                deferred.append(request)
+        self._deferred.extend(deferred)
+        return batch
+
+    def _run(self):
+        while not self._stop.is_set():
+            batch = self._collect_batch()
+            if not batch:
+                continue
+            try:
+                self._run_batch(batch)
+            except Exception as e:
+                logger.error(f"批量生成失败({len(batch)}个请求): {str(e)}")
+                self._stats["errors"] += len(batch)
+                for request in batch:
+                    if not request.done.is_set():
+                        self._fail(request, e)
+
+    def _run_batch(self, batch: List[GenerationRequest]):
+        start = time.monotonic()
+        inputs = self.tokenizer(
+            [r.prompt for r in batch],
+            return_tensors="pt",
+            padding=True,
+            truncation=True,
+            max_length=self.max_input_length,
+        )
+        inputs = {k: v.to(self.model.device) for k, v in inputs.items()}
+        prompt_length = inputs["input_ids"].shape[1]
+        limits = [r.max_new_tokens for r in batch]
+
+        gen_kwargs = dict(
+            max_new_tokens=max(limits),
+            pad_token_id=self.tokenizer.pad_token_id,
+            eos_token_id=self.eos_token_ids,
+            stopping_criteria=StoppingCriteriaList([_RowLimitCriteria(prompt_length, limits, self.eos_token_ids)]),
+        )
+        do_sample, temperature, top_p = batch[0].sampling_key
+        if do_sample:
+            gen_kwargs.update(do_sample=True, temperature=temperature, top_p=top_p)
+        else:
+            gen_kwargs.update(do_sample=False)
+
+        streamer = None
+        if any(r.streamer is not None for r in batch):
+            streamer = _BatchStreamer([r.streamer for r in batch], limits, self.eos_token_ids)
+            gen_kwargs["streamer"] = streamer
+
+        try:
+            with torch.no_grad():
+                outputs = self.model.generate(**inputs, **gen_kwargs)
+        finally:
+            if streamer is not None:
+                streamer.end()
+
+        elapsed = time.monotonic() - start
+        generated = outputs[:, prompt_length:].cpu()
+        eos_ids = torch.tensor(self.eos_token_ids)
+        total_tokens = 0
+        for i, request in enumerate(batch):
+            tokens = generated[i, :limits[i]]
+            eos_positions = torch.isin(tokens, eos_ids).nonzero()
+            if len(eos_positions):
+                tokens = tokens[:int(eos_positions[0])]
+            total_tokens += len(tokens)
+            self._complete(request, {
+                "answer": self.tokenizer.decode(tokens, skip_special_tokens=True).strip(),
+                "generated_tokens": len(tokens),
+                "queue_time": start - request.enqueued_at,
+                "generate_time": elapsed,
+                "batch_size": len(batch),
+            })
+
+        self._stats["batches"] += 1
+        self._stats["batched_requests"] += len(batch)
+        self._stats["generated_tokens"] += total_tokens
+        self._stats["generate_seconds"] += elapsed
+        logger.info(f"批量生成完成: {len(batch)} 个请求, {total_tokens} tokens, 耗时 {elapsed:.2f}s")
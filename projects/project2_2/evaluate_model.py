@@ -1,15 +1,91 @@
 import os
 import json
+import time
 import torch
+import multiprocessing as mp
 from datasets import load_dataset
 from transformers import AutoTokenizer, AutoModelForCausalLM
 from sklearn.metrics import accuracy_score, precision_recall_fscore_support
 import numpy as np
 from rouge_score import rouge_scorer
-from bert_score import score as bert_score
+from bert_score import BERTScorer
 import argparse
 from tqdm import tqdm
 
+from batch_generator import build_prompt
+
+
+def read_jsonl(path: str) -> list:
+    """读取jsonl文件，忽略中断写入导致的不完整末行"""
+    records = []
+    if not os.path.exists(path):
+        return records
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                records.append(json.loads(line))
+            except json.JSONDecodeError:
+                continue
+    return records
+
+
+def write_jsonl(path: str, records: list):
+    """整体重写jsonl文件（先写临时文件再替换）"""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        for record in records:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+    os.replace(tmp_path, path)
+
+
+def metrics_worker(task_queue, scores_path: str, lang: str = "zh"):
+    """
+    指标计算进程：逐批接收生成结果，计算每条样本的ROUGE和BERTScore并追加写入scores_path
+
+    与生成并行执行，收到None时退出
+    """
+    scorer = rouge_scorer.RougeScorer(['rouge1', 'rouge2', 'rougeL'], use_stemmer=True)
+    bert_scorer = None
+    bert_failed = False
+
+    with open(scores_path, 'a', encoding='utf-8') as f:
+        while True:
+            batch = task_queue.get()
+            if batch is None:
+                break
+
+            records = []
+            for item in batch:
+                scores = scorer.score(item['reference'], item['prediction'])
+                records.append({
+                    'idx': item['idx'],
+                    'rouge1': scores['rouge1'].fmeasure,
+                    'rouge2': scores['rouge2'].fmeasure,
+                    'rougeL': scores['rougeL'].fmeasure,
+                    'bert_precision': None,
+                    'bert_recall': None,
+                    'bert_f1': None
+                })
+
+            # BERT模型只加载一次；加载或计算失败时该批BERTScore记为空，不影响ROUGE
+            if not bert_failed:
+                try:
+                    if bert_scorer is None:
+                        bert_scorer = BERTScorer(lang=lang)
+                    P, R, F1 = bert_scorer.score(
+                        [item['prediction'] for item in batch],
+                        [item['reference'] for item in batch]
+                    )
+                    for record, p, r, f1 in zip(records, P.tolist(), R.tolist(), F1.tolist()):
+                        record.update(bert_precision=p, bert_recall=r, bert_f1=f1)
+                except Exception as e:
+                    print(f"BERTScore计算失败: {e}")
+                    bert_failed = bert_scorer is None
+
+            for record in records:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            f.flush()
+
 class MedicalQAEvaluator:
     def __init__(self, model_path: str, tokenizer_path: str = None, device: str = "auto"):
         """
@@ -26,9 +102,6 @@ class MedicalQAEvaluator:
         
         # 加载模型和分词器
         self.load_model()
-        
-        # 初始化评估指标
-        self.rouge_scorer = rouge_scorer.RougeScorer(['rouge1', 'rouge2', 'rougeL'], use_stemmer=True)
     
     def load_model(self):
         """加载模型和分词器"""
@@ -48,6 +121,8 @@ class MedicalQAEvaluator:
         
         if self.tokenizer.pad_token is None:
             self.tokenizer.pad_token = self.tokenizer.eos_token
+        # 批量生成需要左侧填充，保证每条提示的最后一个token紧邻生成位置
+        self.tokenizer.padding_side = "left"
         
         print("模型加载完成")
     
@@ -57,23 +132,36 @@ class MedicalQAEvaluator:
         
         Args:
             question: 输入问题
-            max_length: 最大生成长度
+            max_length: 输入提示的最大长度
             
         Returns:
             生成的答案
         """
-        # 构建输入提示
-        prompt = f"<|im_start|>system\n你是一个专业的医疗助手，请根据医学知识准确回答用户的健康相关问题。<|im_end|>\n<|im_start|>user\n{question}<|im_end|>\n<|im_start|>assistant\n"
+        return self.generate_batch([question], max_length=max_length)[0]
+    
+    def generate_batch(self, questions: list, max_length: int = 512, max_new_tokens: int = 256) -> list:
+        """
+        批量生成答案（左侧填充）
+        
+        Args:
+            questions: 问题列表
+            max_length: 输入提示的最大长度
+            max_new_tokens: 最大生成长度
+            
+        Returns:
+            与questions一一对应的答案列表
+        """
+        prompts = [build_prompt(question) for question in questions]
         
         # 编码输入
-        inputs = self.tokenizer(prompt, return_tensors="pt", truncation=True, max_length=max_length)
+        inputs = self.tokenizer(prompts, return_tensors="pt", padding=True, truncation=True, max_length=max_length)
         inputs = {k: v.to(self.model.device) for k, v in inputs.items()}
         
         # 生成答案
         with torch.no_grad():
             outputs = self.model.generate(
                 **inputs,
-                max_new_tokens=256,
+                max_new_tokens=max_new_tokens,
                 temperature=0.7,
                 do_sample=True,
                 top_p=0.9,
@@ -81,79 +169,45 @@ class MedicalQAEvaluator:
                 eos_token_id=self.tokenizer.eos_token_id
             )
         
-        # 解码输出
-        generated_text = self.tokenizer.decode(outputs[0], skip_special_tokens=True)
-        
-        # 提取助手回答部分
-        if "<|im_start|>assistant\n" in generated_text:
-            answer = generated_text.split("<|im_start|>assistant\n")[-1].strip()
-        else:
-            answer = generated_text[len(prompt):].strip()
-        
-        return answer
+        # 只解码新生成的部分
+        generated = outputs[:, inputs['input_ids'].shape[1]:]
+        return [text.strip() for text in self.tokenizer.batch_decode(generated, skip_special_tokens=True)]
     
-    def evaluate_rouge_scores(self, predictions: list, references: list) -> dict:
+    def aggregate_scores(self, scores: list) -> tuple:
         """
-        计算ROUGE分数
+        汇总每条样本的指标
         
         Args:
-            predictions: 预测答案列表
-            references: 参考答案列表
+            scores: metrics_worker 输出的逐条指标
             
         Returns:
-            ROUGE分数字典
-        """
-        rouge_scores = {'rouge1': [], 'rouge2': [], 'rougeL': []}
-        
-        for pred, ref in zip(predictions, references):
-            scores = self.rouge_scorer.score(ref, pred)
-            rouge_scores['rouge1'].append(scores['rouge1'].fmeasure)
-            rouge_scores['rouge2'].append(scores['rouge2'].fmeasure)
-            rouge_scores['rougeL'].append(scores['rougeL'].fmeasure)
-        
-        # 计算平均分数
-        avg_scores = {
-            'rouge1': np.mean(rouge_scores['rouge1']),
-            'rouge2': np.mean(rouge_scores['rouge2']),
-            'rougeL': np.mean(rouge_scores['rougeL'])
-        }
-        
-        return avg_scores
-    
-    def evaluate_bert_score(self, predictions: list, references: list) -> dict:
+            (ROUGE分数字典, BERTScore结果字典)
         """
-        计算BERTScore
+        def mean(key):
+            values = [s[key] for s in scores if s.get(key) is not None]
+            return float(np.mean(values)) if values else 0.0
         
-        Args:
-            predictions: 预测答案列表
-            references: 参考答案列表
-            
-        Returns:
-            BERTScore结果字典
-        """
-        try:
-            P, R, F1 = bert_score(predictions, references, lang="zh", verbose=False)
-            
-            return {
-                'bert_precision': P.mean().item(),
-                'bert_recall': R.mean().item(),
-                'bert_f1': F1.mean().item()
-            }
-        except Exception as e:
-            print(f"BERTScore计算失败: {e}")
-            return {
-                'bert_precision': 0.0,
-                'bert_recall': 0.0,
-                'bert_f1': 0.0
-            }
+        rouge_scores = {key: mean(key) for key in ('rouge1', 'rouge2', 'rougeL')}
+        bert_scores = {key: mean(key) for key in ('bert_precision', 'bert_recall', 'bert_f1')}
+        return rouge_scores, bert_scores
     
-    def evaluate_dataset(self, data_path: str, sample_size: int = None) -> dict:
+    def evaluate_dataset(self, data_path: str, sample_size: int = None, batch_size: int = 8,
+                         max_new_tokens: int = 256, checkpoint_path: str = "evaluation_predictions.jsonl",
+                         resume: bool = True) -> dict:
         """
         评估整个数据集
         
+        按提示长度排序后分批生成，每批结果立即追加到 checkpoint_path；
+        指标在独立进程中与生成并行计算，写入 checkpoint_path 对应的 .scores.jsonl。
+        中断后重新运行会跳过已生成和已打分的样本。
+        
         Args:
             data_path: 数据集路径
             sample_size: 采样大小，None表示使用全部数据
+            batch_size: 生成批大小
+            max_new_tokens: 最大生成长度
+            checkpoint_path: 预测结果检查点（jsonl）
+            resume: 是否从检查点继续
             
         Returns:
             评估结果字典
@@ -168,39 +222,112 @@ class MedicalQAEvaluator:
         
         print(f"评估样本数: {len(dataset)}")
         
-        # 生成预测答案
-        predictions = []
-        references = []
+        questions = dataset['question']
+        references = dataset['answer']
+        
+        scores_path = os.path.splitext(checkpoint_path)[0] + ".scores.jsonl"
+        checkpoint_dir = os.path.dirname(checkpoint_path)
+        if checkpoint_dir:
+            os.makedirs(checkpoint_dir, exist_ok=True)
+        if not resume:
+            for path in (checkpoint_path, scores_path):
+                if os.path.exists(path):
+                    os.remove(path)
+        
+        # 恢复已完成的样本（问题不一致的记录视为其他数据集的结果，忽略）
+        predictions = {}
+        for record in read_jsonl(checkpoint_path):
+            idx = record.get('idx')
+            if isinstance(idx, int) and idx < len(dataset) and record.get('question') == questions[idx]:
+                predictions[idx] = record['prediction']
+        scores = {record['idx']: record for record in read_jsonl(scores_path) if record.get('idx') in predictions}
+        if predictions:
+            print(f"从检查点恢复: 已生成 {len(predictions)} 条，已打分 {len(scores)} 条")
+            # 去掉中断时写了一半的行，之后的记录才能正常追加
+            write_jsonl(checkpoint_path, [
+                {'idx': idx, 'question': questions[idx], 'prediction': prediction}
+                for idx, prediction in predictions.items()
+            ])
+            write_jsonl(scores_path, list(scores.values()))
+        
+        # 启动指标计算进程（spawn 避免子进程继承 CUDA 上下文）
+        context = mp.get_context("spawn")
+        task_queue = context.Queue()
+        worker = context.Process(target=metrics_worker, args=(task_queue, scores_path), daemon=True)
+        worker.start()
+        
+        # 已生成但尚未打分的样本先补算
+        unscored = [
+            {'idx': idx, 'prediction': prediction, 'reference': references[idx]}
+            for idx, prediction in predictions.items() if idx not in scores
+        ]
+        for i in range(0, len(unscored), batch_size):
+            task_queue.put(unscored[i:i + batch_size])
+        
+        # 按提示长度从长到短排序，同一批内填充最少；最长的批先跑，显存不足能尽早暴露
+        pending = [i for i in range(len(dataset)) if i not in predictions]
+        prompt_lengths = {
+            i: len(ids) for i, ids in zip(
+                pending,
+                self.tokenizer([build_prompt(questions[i]) for i in pending], truncation=True, max_length=512)['input_ids']
+            )
+        } if pending else {}
+        pending.sort(key=lambda i: prompt_lengths[i], reverse=True)
         
         print("生成预测答案...")
-        for example in tqdm(dataset):
-            question = example['question']
-            reference = example['answer']
-            
-            prediction = self.generate_answer(question)
-            
-            predictions.append(prediction)
-            references.append(reference)
+        start_time = time.time()
+        generated = 0
+        try:
+            with open(checkpoint_path, 'a', encoding='utf-8') as f, \
+                    tqdm(total=len(dataset), initial=len(predictions), unit="样本") as pbar:
+                for i in range(0, len(pending), batch_size):
+                    batch_ids = pending[i:i + batch_size]
+                    answers = self.generate_batch([questions[idx] for idx in batch_ids], max_new_tokens=max_new_tokens)
+                    
+                    batch = []
+                    for idx, answer in zip(batch_ids, answers):
+                        predictions[idx] = answer
+                        f.write(json.dumps({'idx': idx, 'question': questions[idx], 'prediction': answer},
+                                           ensure_ascii=False) + "\n")
+                        batch.append({'idx': idx, 'prediction': answer, 'reference': references[idx]})
+                    f.flush()
+                    task_queue.put(batch)
+                    
+                    generated += len(batch_ids)
+                    elapsed = time.time() - start_time
+                    pbar.update(len(batch_ids))
+                    pbar.set_postfix({'样本/秒': f"{generated / elapsed:.2f}"})
+            generation_seconds = time.time() - start_time
+        finally:
+            # 等待指标进程处理完队列中的剩余批次
+            task_queue.put(None)
+            print("等待指标计算完成...")
+            worker.join()
+        
+        if generated:
+            print(f"本次生成 {generated} 条，用时 {generation_seconds:.1f}s，{generated / generation_seconds:.2f} 样本/秒")
+        if worker.exitcode != 0:
+            print(f"警告: 指标计算进程异常退出 (exitcode={worker.exitcode})，重新运行可补算缺失的指标")
         
         # 计算评估指标
-        print("计算评估指标...")
-        
-        # ROUGE分数
-        rouge_scores = self.evaluate_rouge_scores(predictions, references)
-        
-        # BERTScore
-        bert_scores = self.evaluate_bert_score(predictions, references)
+        scores = {record['idx']: record for record in read_jsonl(scores_path) if record.get('idx') in predictions}
+        rouge_scores, bert_scores = self.aggregate_scores(list(scores.values()))
         
         # 答案长度统计
-        pred_lengths = [len(pred.split()) for pred in predictions]
+        ordered_predictions = [predictions[i] for i in range(len(dataset))]
+        pred_lengths = [len(pred.split()) for pred in ordered_predictions]
         ref_lengths = [len(ref.split()) for ref in references]
         
         results = {
             'dataset_info': {
                 'data_path': data_path,
                 'sample_size': len(dataset),
+                'scored_samples': len(scores),
                 'avg_pred_length': np.mean(pred_lengths),
-                'avg_ref_length': np.mean(ref_lengths)
+                'avg_ref_length': np.mean(ref_lengths),
+                'generation_seconds': generation_seconds,
+                'samples_per_second': generated / generation_seconds if generated else 0.0,
+                'checkpoint_path': checkpoint_path
             },
             'rouge_scores': rouge_scores,
             'bert_scores': bert_scores,
@@ -208,11 +335,11 @@ class MedicalQAEvaluator:
         }
         
         # 保存一些示例
-        for i in range(min(5, len(predictions))):
+        for i in range(min(5, len(ordered_predictions))):
             results['examples'].append({
-                'question': dataset[i]['question'],
+                'question': questions[i],
                 'reference': references[i],
-                'prediction': predictions[i]
+                'prediction': ordered_predictions[i]
             })
         
         return results
@@ -225,7 +352,9 @@ class MedicalQAEvaluator:
             results: 评估结果
             output_path: 输出路径
         """
-        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+        output_dir = os.path.dirname(output_path)
+        if output_dir:
+            os.makedirs(output_dir, exist_ok=True)
         
         with open(output_path, 'w', encoding='utf-8') as f:
             json.dump(results, f, indent=2, ensure_ascii=False)
@@ -246,7 +375,8 @@ class MedicalQAEvaluator:
         # 数据集信息
         dataset_info = results['dataset_info']
         print(f"数据集: {dataset_info['data_path']}")
-        print(f"样本数: {dataset_info['sample_size']}")
+        print(f"样本数: {dataset_info['sample_size']} (已打分 {dataset_info['scored_samples']})")
+        print(f"生成速度: {dataset_info['samples_per_second']:.2f} 样本/秒")
         print(f"平均预测长度: {dataset_info['avg_pred_length']:.2f} 词")
         print(f"平均参考长度: {dataset_info['avg_ref_length']:.2f} 词")
         
@@ -284,6 +414,14 @@ def main():
                        help="评估样本数量")
     parser.add_argument("--device", type=str, default="auto", 
                        help="设备类型")
+    parser.add_argument("--batch_size", type=int, default=8, 
+                       help="生成批大小")
+    parser.add_argument("--max_new_tokens", type=int, default=256, 
+                       help="最大生成长度")
+    parser.add_argument("--checkpoint_path", type=str, default=None, 
+                       help="预测结果检查点路径，默认与结果文件同名的 .predictions.jsonl")
+    parser.add_argument("--no_resume", action="store_true", 
+                       help="忽略已有检查点，从头评估")
     
     args = parser.parse_args()
     
@@ -304,9 +442,14 @@ def main():
     )
     
     # 执行评估
+    checkpoint_path = args.checkpoint_path or os.path.splitext(args.output_path)[0] + ".predictions.jsonl"
     results = evaluator.evaluate_dataset(
         data_path=args.data_path,
-        sample_size=args.sample_size
+        sample_size=args.sample_size,
+        batch_size=args.batch_size,
+        max_new_tokens=args.max_new_tokens,
+        checkpoint_path=checkpoint_path,
+        resume=not args.no_resume
     )
     
     # 打印结果
@@ -0,0 +1,158 @@
+"""
+API服务压测脚本
+并发向 /ask 或 /ask_stream 发送问题，统计吞吐量（tokens/s）和延迟分位数
+
+用法:
+    python load_test.py --url http://localhost:8000 --concurrency 8 --requests 64
+    python load_test.py --stream --concurrency 8 --requests 64
+"""
+
+import argparse
+import json
+import random
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+
+DEFAULT_QUESTIONS = [
+    "什么是高血压？",
+    "糖尿病患者饮食需要注意什么？",
+    "感冒和流感有什么区别？",
+    "长期失眠应该怎么办？",
+    "儿童发烧多少度需要就医？",
+    "胃溃疡的常见症状有哪些？",
+    "如何预防骨质疏松？",
+    "过敏性鼻炎可以根治吗？",
+]
+
+
+def load_questions(path: str) -> List[str]:
+    """从jsonl文件读取问题，文件不存在时使用内置问题"""
+    if not path:
+        return DEFAULT_QUESTIONS
+    questions = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                questions.append(json.loads(line)["question"])
+    return questions or DEFAULT_QUESTIONS
+
+
+def percentile(values: List[float], p: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def post_json(url: str, payload: Dict, timeout: float):
+    request = urllib.request.Request(
+        url,
+        data=json.dumps(payload, ensure_ascii=False).encode("utf-8"),
+        headers={"Content-Type": "application/json"},
+        method="POST",
+    )
+    return urllib.request.urlopen(request, timeout=timeout)
+
+
+def ask(base_url: str, payload: Dict, timeout: float) -> Dict:
+    """非流式请求，返回延迟和生成token数"""
+    start = time.perf_counter()
+    with post_json(f"{base_url}/ask", payload, timeout) as response:
+        data = json.loads(response.read().decode("utf-8"))
+    latency = time.perf_counter() - start
+    return {"latency": latency, "ttft": latency, "tokens": data.get("generated_tokens", 0),
+            "batch_size": data.get("batch_size", 1)}
+
+
+def ask_stream(base_url: str, payload: Dict, timeout: float) -> Dict:
+    """流式请求，额外记录首段文本到达时间（TTFT）"""
+    start = time.perf_counter()
+    ttft = None
+    tokens = 0
+    batch_size = 1
+    with post_json(f"{base_url}/ask_stream", payload, timeout) as response:
+        for raw in response:
+            line = raw.decode("utf-8").strip()
+            if not line.startswith("data:"):
+                continue
+            data = line[len("data:"):].strip()
+            if data == "[DONE]":
+                break
+            event = json.loads(data)
+            if "error" in event:
+                raise RuntimeError(event["error"])
+            if "text" in event and ttft is None:
+                ttft = time.perf_counter() - start
+            if event.get("done"):
+                tokens = event.get("generated_tokens", 0)
+                batch_size = event.get("batch_size", 1)
+    latency = time.perf_counter() - start
+    return {"latency": latency, "ttft": ttft if ttft is not None else latency, "tokens": tokens,
+            "batch_size": batch_size}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="医疗QA API压测")
+    parser.add_argument("--url", type=str, default="http://localhost:8000", help="服务地址")
+    parser.add_argument("--concurrency", type=int, default=8, help="并发数")
+    parser.add_argument("--requests", type=int, default=64, help="请求总数")
+    parser.add_argument("--max_length", type=int, default=128, help="每个请求的最大生成token数")
+    parser.add_argument("--temperature", type=float, default=0.7)
+    parser.add_argument("--queue_timeout", type=float, default=60.0, help="服务端排队超时（秒）")
+    parser.add_argument("--timeout", type=float, default=600.0, help="客户端请求超时（秒）")
+    parser.add_argument("--questions", type=str, default=None, help="问题文件（jsonl，含question字段）")
+    parser.add_argument("--stream", action="store_true", help="使用 /ask_stream 流式接口")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rnd = random.Random(args.seed)
+    questions = load_questions(args.questions)
+    payloads = [{
+        "question": rnd.choice(questions),
+        "max_length": args.max_length,
+        "temperature": args.temperature,
+        "queue_timeout": args.queue_timeout,
+    } for _ in range(args.requests)]
+
+    call = ask_stream if args.stream else ask
+    results, errors = [], []
+
+    def run(payload):
+        try:
+            return call(args.url, payload, args.timeout)
+        except (urllib.error.URLError, RuntimeError, OSError, ValueError) as e:
+            return e
+
+    print(f"压测开始: {args.requests} 个请求, 并发 {args.concurrency}, "
+          f"{'流式' if args.stream else '非流式'}, max_length={args.max_length}")
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        for outcome in executor.map(run, payloads):
+            (errors if isinstance(outcome, Exception) else results).append(outcome)
+    wall = time.perf_counter() - start
+
+    latencies = [r["latency"] for r in results]
+    ttfts = [r["ttft"] for r in results]
+    total_tokens = sum(r["tokens"] for r in results)
+
+    print(f"\n总耗时: {wall:.2f}s")
+    print(f"成功: {len(results)}, 失败: {len(errors)}")
+    if errors:
+        print(f"首个错误: {errors[0]}")
+    if not results:
+        return
+    print(f"吞吐量: {len(results) / wall:.2f} req/s, {total_tokens / wall:.2f} tokens/s "
+          f"(共 {total_tokens} tokens)")
+    print(f"平均批大小: {sum(r['batch_size'] for r in results) / len(results):.2f}")
+    print(f"延迟(s): avg={sum(latencies) / len(latencies):.2f} p50={percentile(latencies, 0.5):.2f} "
+          f"p95={percentile(latencies, 0.95):.2f} max={max(latencies):.2f}")
+    if args.stream:
+        print(f"首段延迟TTFT(s): p50={percentile(ttfts, 0.5):.2f} p95={percentile(ttfts, 0.95):.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -11,13 +11,27 @@ DASHSCOPE_EMBEDDING_MODEL = "text-embedding-v3"
 # 向量配置
 FAISS_INDEX_PATH = "./data/faiss_index"
 VECTOR_DIMENSION = 512
+# 增量变更先追加到索引目录下的变更日志，累计达到该条数后整体保存一次索引并清空日志
+INDEX_COMPACT_CHANGES = int(os.getenv("INDEX_COMPACT_CHANGES", "200"))
 
-# FAQ文件
+# FAQ文件（首次启动时导入FAQ数据库）
 FAQ_FILE_PATH = "./FAQ.txt"
+FAQ_DB_PATH = "./data/faq.db"
 
 # 检索配置
 TOP_K = 3
 
+# 查询服务配置
+QUERY_MAX_WORKERS = int(os.getenv("QUERY_MAX_WORKERS", "4"))
+QUERY_MAX_PENDING = int(os.getenv("QUERY_MAX_PENDING", "32"))
+
+# 会话存储配置
+SESSION_BACKEND = os.getenv("SESSION_BACKEND", "sqlite")  # sqlite 或 memory
+SESSION_DB_PATH = "./data/sessions.db"
+SESSION_MAX_SESSIONS = int(os.getenv("SESSION_MAX_SESSIONS", "10000"))
+SESSION_MAX_HISTORY = int(os.getenv("SESSION_MAX_HISTORY", "50"))
+SESSION_TTL_SECONDS = int(os.getenv("SESSION_TTL_SECONDS", str(7 * 24 * 3600)))
+
 
 class Settings:
     """系统配置"""
@@ -25,8 +39,17 @@ class Settings:
     dashscope_embedding_model = DASHSCOPE_EMBEDDING_MODEL
     faiss_index_path = FAISS_INDEX_PATH
     vector_dimension = VECTOR_DIMENSION
+    index_compact_changes = INDEX_COMPACT_CHANGES
     faq_file_path = FAQ_FILE_PATH
+    faq_db_path = FAQ_DB_PATH
     top_k = TOP_K
+    query_max_workers = QUERY_MAX_WORKERS
+    query_max_pending = QUERY_MAX_PENDING
+    session_backend = SESSION_BACKEND
+    session_db_path = SESSION_DB_PATH
+    session_max_sessions = SESSION_MAX_SESSIONS
+    session_max_history = SESSION_MAX_HISTORY
+    session_ttl_seconds = SESSION_TTL_SECONDS
 
 
 settings = Settings()
\ No newline at end of file
@@ -1,16 +1,29 @@
 """
 FAQ数据加载模块
 """
+import json
 import os
 import re
 from typing import List, Dict, Any
 
 from llama_index.core import Document, VectorStoreIndex, StorageContext, load_index_from_storage, Settings
+from llama_index.core.data_structs import IndexDict
+from llama_index.core.indices.utils import embed_nodes
+from llama_index.core.schema import BaseNode
+from llama_index.core.storage.docstore import SimpleDocumentStore
+from llama_index.core.storage.docstore.utils import doc_to_json, json_to_doc
+from llama_index.core.storage.index_store import SimpleIndexStore
+from llama_index.core.storage.kvstore import SimpleKVStore
+from llama_index.core.vector_stores import SimpleVectorStore
+from llama_index.core.vector_stores.simple import SimpleVectorStoreData
 from llama_index.embeddings.dashscope import DashScopeEmbedding
 from llama_index.llms.dashscope import DashScope
 
 from config import settings
 
+# 索引目录下的增量变更日志，每行一次变更（删除的文档ID + 带向量的新节点）
+CHANGE_LOG_NAME = "changes.jsonl"
+
 
 class FAQDataLoader:
     """FAQ数据加载器"""
@@ -48,12 +61,18 @@ class FAQDataLoader:
         
         return faq_items
     
+    @staticmethod
+    def faq_doc_id(faq_id: int) -> str:
+        """FAQ在向量索引中的文档ID，与FAQ ID一一对应，便于增量删除"""
+        return f"faq-{faq_id}"
+    
     def create_documents(self, faq_items: List[Dict[str, Any]]) -> List[Document]:
         """创建文档对象"""
         documents = []
         for item in faq_items:
             content = f"问题: {item['question']}\n答案: {item['answer']}"
             doc = Document(
+                id_=self.faq_doc_id(item['id']),
                 text=content,
                 metadata={
                     'id': item['id'],
@@ -70,18 +89,109 @@ class FAQDataLoader:
         return index
     
     def save_index(self, index: VectorStoreIndex, index_path: str):
-        """保存索引"""
+        """完整保存索引，已并入的增量变更日志随之清空"""
         os.makedirs(index_path, exist_ok=True)
         index.storage_context.persist(persist_dir=index_path)
+        change_log = os.path.join(index_path, CHANGE_LOG_NAME)
+        if os.path.exists(change_log):
+            os.remove(change_log)
     
     def load_index(self, index_path: str = None) -> VectorStoreIndex:
-        """加载索引"""
+        """加载索引，并重放上次完整保存之后的增量变更"""
         if index_path is None:
             index_path = settings.faiss_index_path
         storage_context = StorageContext.from_defaults(persist_dir=index_path)
         index = load_index_from_storage(storage_context)
+        self._replay_changes(index, index_path)
         return index
     
+    def embed_documents(self, documents: List[Document]) -> List[BaseNode]:
+        """切分为节点并批量向量化（按embed_batch_size请求），节点带上向量后写入索引时不会再次向量化"""
+        nodes = Settings.node_parser.get_nodes_from_documents(documents)
+        id_to_embedding = embed_nodes(nodes, Settings.embed_model)
+        for node in nodes:
+            node.embedding = id_to_embedding[node.node_id]
+        return nodes
+    
+    @staticmethod
+    def apply_changes(index: VectorStoreIndex, deleted_doc_ids: List[str], nodes: List[BaseNode],
+                      doc_hashes: Dict[str, str]):
+        """删除文档并写入已向量化的节点，直接作用于索引的向量存储和文档存储"""
+        existing = set(index.ref_doc_info.keys())
+        for doc_id in deleted_doc_ids:
+            if doc_id in existing:
+                index.delete_ref_doc(doc_id, delete_from_docstore=True)
+        if nodes:
+            index.insert_nodes(nodes)
+        for doc_id, doc_hash in doc_hashes.items():
+            index.docstore.set_document_hash(doc_id, doc_hash)
+    
+    def append_changes(self, index_path: str, deleted_doc_ids: List[str], nodes: List[BaseNode],
+                       doc_hashes: Dict[str, str]) -> int:
+        """
+        把一次增量变更追加到变更日志，写入量只与变更大小有关
+        
+        Returns:
+            日志中累计的变更条数，调用方据此决定何时完整保存
+        """
+        record = {
+            "delete": list(deleted_doc_ids),
+            "nodes": [doc_to_json(node) for node in nodes],
+            "hashes": doc_hashes,
+        }
+        change_log = os.path.join(index_path, CHANGE_LOG_NAME)
+        with open(change_log, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(record, ensure_ascii=False) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        with open(change_log, 'r', encoding='utf-8') as f:
+            return sum(1 for _ in f)
+    
+    def _replay_changes(self, index: VectorStoreIndex, index_path: str) -> int:
+        change_log = os.path.join(index_path, CHANGE_LOG_NAME)
+        if not os.path.exists(change_log):
+            return 0
+        applied = 0
+        with open(change_log, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # 进程在追加时中断，最后一行不完整，之前的变更仍然有效
+                    break
+                nodes = [json_to_doc(node) for node in record["nodes"]]
+                self.apply_changes(index, record["delete"], nodes, record["hashes"])
+                applied += 1
+        if applied:
+            print(f"已重放 {applied} 条索引增量变更")
+        return applied
+    
+    @staticmethod
+    def snapshot_index(index: VectorStoreIndex) -> VectorStoreIndex:
+        """
+        生成与index共享节点对象的只读快照，供查询服务使用
+        
+        只复制各存储最外层的字典（写时复制），不复制节点和向量本身；之后对index的删除和插入
+        只改动index自己的字典，快照不受影响。同一文档更新时总是先删除再插入，不会原地修改已有条目
+        """
+        storage_context = index.storage_context
+        vector_data = storage_context.vector_store.data
+        vector_store = SimpleVectorStore(data=SimpleVectorStoreData(
+            embedding_dict=dict(vector_data.embedding_dict),
+            text_id_to_ref_doc_id=dict(vector_data.text_id_to_ref_doc_id),
+            metadata_dict=dict(vector_data.metadata_dict) if vector_data.metadata_dict is not None else None,
+        ))
+        docstore = SimpleDocumentStore(SimpleKVStore(
+            {collection: dict(values) for collection, values in storage_context.docstore._kvstore._data.items()}
+        ))
+        index_struct = IndexDict(index_id=index.index_struct.index_id, summary=index.index_struct.summary,
+                                 nodes_dict=dict(index.index_struct.nodes_dict))
+        index_store = SimpleIndexStore()
+        index_store.add_index_struct(index_struct)
+        snapshot_context = StorageContext.from_defaults(docstore=docstore, index_store=index_store,
+                                                        vector_store=vector_store)
+        return VectorStoreIndex(index_struct=index_struct, storage_context=snapshot_context)
+    
     def initialize_faq_system(self, force_rebuild: bool = False) -> VectorStoreIndex:
         """初始化FAQ系统"""
         index_path = settings.faiss_index_path
@@ -0,0 +1,173 @@
+"""
+FAQ存储 - 基于SQLite的FAQ条目存储
+ID由数据库自增生成，删除后不会复用，也不会重新编号
+"""
+import datetime
+import hashlib
+import os
+import sqlite3
+import threading
+from typing import List, Dict, Any, Optional, Tuple
+
+from config import settings
+
+
+def content_hash(question: str, answer: str) -> str:
+    """FAQ内容指纹，用于判断条目是否需要重新向量化"""
+    return hashlib.sha256(f"{question}\n{answer}".encode('utf-8')).hexdigest()
+
+
+class FAQStore:
+    """FAQ条目存储"""
+
+    def __init__(self, db_path: str = None):
+        self.db_path = db_path or settings.faq_db_path
+        os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS faqs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                question TEXT NOT NULL,
+                answer TEXT NOT NULL,
+                content_hash TEXT NOT NULL,
+                updated_at TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_faqs_hash ON faqs(content_hash);
+        """)
+        self._conn.commit()
+
+    @staticmethod
+    def _to_dict(row: sqlite3.Row) -> Dict[str, Any]:
+        return {'id': row['id'], 'question': row['question'], 'answer': row['answer']}
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM faqs").fetchone()[0]
+
+    def list_faqs(self, limit: Optional[int] = None, offset: int = 0) -> List[Dict[str, Any]]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, question, answer FROM faqs ORDER BY id LIMIT ? OFFSET ?",
+                (-1 if limit is None else limit, offset)
+            ).fetchall()
+        return [self._to_dict(row) for row in rows]
+
+    def get(self, faq_id: int) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT id, question, answer FROM faqs WHERE id = ?", (faq_id,)
+            ).fetchone()
+        return self._to_dict(row) if row else None
+
+    def search(self, keyword: str, limit: Optional[int] = None, offset: int = 0) -> List[Dict[str, Any]]:
+        """按关键词模糊搜索问题和答案（不区分大小写）"""
+        pattern = '%' + keyword.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, question, answer FROM faqs "
+                "WHERE question LIKE ? ESCAPE '\\' OR answer LIKE ? ESCAPE '\\' "
+                "ORDER BY id LIMIT ? OFFSET ?",
+                (pattern, pattern, -1 if limit is None else limit, offset)
+            ).fetchall()
+        return [self._to_dict(row) for row in rows]
+
+    def add_many(self, items: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        批量插入，单个事务提交
+
+        items中带id时按该id插入（用于从FAQ.txt迁移），否则自增生成
+        """
+        now = datetime.datetime.now().isoformat()
+        added = []
+        with self._lock, self._conn:
+            for item in items:
+                question = item['question'].strip()
+                answer = item['answer'].strip()
+                cursor = self._conn.execute(
+                    "INSERT INTO faqs (id, question, answer, content_hash, updated_at) VALUES (?, ?, ?, ?, ?)",
+                    (item.get('id'), question, answer, content_hash(question, answer), now)
+                )
+                added.append({'id': cursor.lastrowid, 'question': question, 'answer': answer})
+        return added
+
+    def add(self, question: str, answer: str) -> Dict[str, Any]:
+        return self.add_many([{'question': question, 'answer': answer}])[0]
+
+    def update(self, faq_id: int, question: str = None,
+               answer: str = None) -> Tuple[Optional[Dict[str, Any]], bool]:
+        """
+        更新条目
+
+        Returns:
+            (更新后的条目, 内容是否变化)，条目不存在时为 (None, False)
+        """
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                "SELECT id, question, answer, content_hash FROM faqs WHERE id = ?", (faq_id,)
+            ).fetchone()
+            if row is None:
+                return None, False
+            new_question = question.strip() if question is not None else row['question']
+            new_answer = answer.strip() if answer is not None else row['answer']
+            new_hash = content_hash(new_question, new_answer)
+            if new_hash == row['content_hash']:
+                return self._to_dict(row), False
+            self._conn.execute(
+                "UPDATE faqs SET question = ?, answer = ?, content_hash = ?, updated_at = ? WHERE id = ?",
+                (new_question, new_answer, new_hash, datetime.datetime.now().isoformat(), faq_id)
+            )
+        return {'id': faq_id, 'question': new_question, 'answer': new_answer}, True
+
+    def delete_many(self, faq_ids: List[int]) -> List[int]:
+        """批量删除，返回实际删除的ID"""
+        deleted = []
+        with self._lock, self._conn:
+            for faq_id in faq_ids:
+                if self._conn.execute("DELETE FROM faqs WHERE id = ?", (faq_id,)).rowcount:
+                    deleted.append(faq_id)
+        return deleted
+
+    def delete(self, faq_id: int) -> bool:
+        return bool(self.delete_many([faq_id]))
+
+    def hash_index(self) -> Dict[str, List[int]]:
+        """内容指纹 -> ID列表"""
+        with self._lock:
+            rows = self._conn.execute("SELECT id, content_hash FROM faqs ORDER BY id").fetchall()
+        index: Dict[str, List[int]] = {}
+        for row in rows:
+            index.setdefault(row['content_hash'], []).append(row['id'])
+        return index
+
+    def statistics(self) -> Dict[str, Any]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT COUNT(*) AS total, AVG(LENGTH(question)) AS avg_q, "
+                "AVG(LENGTH(answer)) AS avg_a, MAX(updated_at) AS last_updated FROM faqs"
+            ).fetchone()
+        return {
+            'total_faqs': row['total'],
+            'avg_question_length': row['avg_q'] or 0,
+            'avg_answer_length': row['avg_a'] or 0,
+            'last_updated': row['last_updated'] or ""
+        }
+
+    def backup_to(self, path: str):
+        """使用SQLite在线备份接口复制数据库"""
+        dest = sqlite3.connect(path)
+        try:
+            with self._lock:
+                self._conn.backup(dest)
+        finally:
+            dest.close()
+
+    def restore_from(self, path: str):
+        """从备份数据库恢复"""
+        src = sqlite3.connect(path)
+        try:
+            with self._lock:
+                src.backup(self._conn)
+        finally:
+            src.close()
@@ -4,6 +4,8 @@
 """
 import os
 import json
+import logging
+import threading
 import shutil
 import datetime
 from typing import List, Dict, Any, Optional, Tuple
@@ -12,17 +14,33 @@ import pandas as pd
 import re
 
 from data_loader import FAQDataLoader
+from faq_store import FAQStore, content_hash
 from config import settings
 
+logger = logging.getLogger(__name__)
+
+
+class IndexUpdateError(RuntimeError):
+    """FAQ已写入数据库，但向量索引未能同步更新"""
+
 
 class KnowledgeBaseManager:
     """知识库管理器"""
     
-    def __init__(self, faq_file_path: str = None, index_path: str = None):
+    def __init__(self, faq_file_path: str = None, index_path: str = None, db_path: str = None):
         """初始化知识库管理器"""
         self.faq_file_path = faq_file_path or settings.faq_file_path
         self.index_path = index_path or settings.faiss_index_path
         self.data_loader = FAQDataLoader()
+        # FAQ条目存储在SQLite中，FAQ.txt只作为初始数据和导出格式
+        self.store = FAQStore(db_path)
+        self._import_faq_file()
+        # self._working 是常驻内存的可写索引，增删改只作用于它；
+        # self.index 是每次变更后发布的写时复制快照，供常驻查询服务替换使用
+        self._working = None
+        self.index = None
+        self._index_lock = threading.RLock()
+        self._index_dirty = False
         
         # 版本管理相关路径
         self.backup_dir = "./data/backups"
@@ -64,112 +82,186 @@ class KnowledgeBaseManager:
         return f"{major}.{minor}.{patch + 1}"
     
     # FAQ条目的增删改查功能
-    def get_all_faqs(self) -> List[Dict[str, Any]]:
-        """获取所有FAQ条目"""
-        if not os.path.exists(self.faq_file_path):
-            return []
-        return self.data_loader.parse_faq_file(self.faq_file_path)
+    def get_all_faqs(self, limit: Optional[int] = None, offset: int = 0) -> List[Dict[str, Any]]:
+        """获取所有FAQ条目（按ID排序，支持分页）"""
+        return self.store.list_faqs(limit=limit, offset=offset)
     
     def get_faq_by_id(self, faq_id: int) -> Optional[Dict[str, Any]]:
         """根据ID获取FAQ条目"""
-        faqs = self.get_all_faqs()
-        for faq in faqs:
-            if faq['id'] == faq_id:
-                return faq
-        return None
+        return self.store.get(faq_id)
     
-    def search_faqs(self, keyword: str) -> List[Dict[str, Any]]:
+    def search_faqs(self, keyword: str, limit: Optional[int] = None, offset: int = 0) -> List[Dict[str, Any]]:
         """搜索FAQ条目"""
-        faqs = self.get_all_faqs()
-        results = []
-        keyword_lower = keyword.lower()
-        
-        for faq in faqs:
-            if (keyword_lower in faq['question'].lower() or 
-                keyword_lower in faq['answer'].lower()):
-                results.append(faq)
-        
-        return results
+        return self.store.search(keyword, limit=limit, offset=offset)
     
     def add_faq(self, question: str, answer: str, auto_rebuild: bool = True) -> Dict[str, Any]:
-        """添加新的FAQ条目"""
-        faqs = self.get_all_faqs()
-        
-        # 生成新的ID
-        new_id = max([faq['id'] for faq in faqs], default=0) + 1
-        
-        new_faq = {
-            'id': new_id,
-            'question': question.strip(),
-            'answer': answer.strip()
-        }
-        
-        faqs.append(new_faq)
-        self._save_faqs_to_file(faqs)
+        """添加新的FAQ条目，auto_rebuild为True时只向量化这一条并写入索引"""
+        new_faq = self.store.add(question, answer)
         
         if auto_rebuild:
-            self.rebuild_index()
+            if not self._apply_index_changes(upserts=[new_faq]):
+                raise IndexUpdateError("FAQ已保存，但向量索引更新失败，将在下次变更时自动同步")
+        else:
+            self._index_dirty = True
         
         return new_faq
     
     def update_faq(self, faq_id: int, question: str = None, answer: str = None, 
                    auto_rebuild: bool = True) -> bool:
-        """更新FAQ条目"""
-        faqs = self.get_all_faqs()
+        """更新FAQ条目，内容未变化时不会重新向量化"""
+        faq, changed = self.store.update(faq_id, question=question, answer=answer)
+        if faq is None:
+            return False
         
-        for faq in faqs:
-            if faq['id'] == faq_id:
-                if question is not None:
-                    faq['question'] = question.strip()
-                if answer is not None:
-                    faq['answer'] = answer.strip()
-                
-                self._save_faqs_to_file(faqs)
-                
-                if auto_rebuild:
-                    self.rebuild_index()
-                
-                return True
+        if changed:
+            if auto_rebuild:
+                if not self._apply_index_changes(upserts=[faq]):
+                    raise IndexUpdateError("FAQ已更新，但向量索引更新失败，将在下次变更时自动同步")
+            else:
+                self._index_dirty = True
         
-        return False
+        return True
     
     def delete_faq(self, faq_id: int, auto_rebuild: bool = True) -> bool:
-        """删除FAQ条目"""
-        faqs = self.get_all_faqs()
-        original_count = len(faqs)
+        """删除FAQ条目，其余条目的ID保持不变"""
+        if not self.store.delete(faq_id):
+            return False
         
-        faqs = [faq for faq in faqs if faq['id'] != faq_id]
+        if auto_rebuild:
+            if not self._apply_index_changes(deletes=[faq_id]):
+                raise IndexUpdateError("FAQ已删除，但向量索引更新失败，将在下次变更时自动同步")
+        else:
+            self._index_dirty = True
         
-        if len(faqs) < original_count:
-            # 重新分配ID以保持连续性
-            for i, faq in enumerate(faqs, 1):
-                faq['id'] = i
-            
-            self._save_faqs_to_file(faqs)
-            
-            if auto_rebuild:
-                self.rebuild_index()
-            
+        return True
+    
+    def _import_faq_file(self):
+        """FAQ数据库为空时，从FAQ.txt导入初始数据，保留文件中的顺序作为ID"""
+        if self.store.count() > 0 or not os.path.exists(self.faq_file_path):
+            return
+        faqs = self.data_loader.parse_faq_file(self.faq_file_path)
+        self.store.add_many(faqs)
+        print(f"已从 {self.faq_file_path} 导入 {len(faqs)} 个FAQ条目到 {self.store.db_path}")
+    
+    def _save_faqs_to_file(self, faqs: List[Dict[str, Any]], file_path: str = None):
+        """将FAQ列表保存为 Q:/A: 格式的文本文件"""
+        content = "\n\n".join(f"Q: {faq['question']}\nA: {faq['answer']}" for faq in faqs)
+        
+        with open(file_path or self.faq_file_path, 'w', encoding='utf-8') as f:
+            f.write(content + '\n')
+    
+    # 向量索引维护
+    def _load_working_index(self):
+        """
+        返回常驻内存的可写索引，只在首次使用时从磁盘加载（调用方持有索引锁）
+
+        self.index 已经作为快照交给常驻查询服务，增删改不直接作用于它，
+        否则正在执行的查询会读到修改了一半的docstore；修改完成后重新发布快照
+        """
+        if self._working is None:
+            # 首次加载时索引与数据库可能不一致（例如旧版本按顺序编号的索引），做一次增量同步
+            self._working = self.data_loader.load_index(self.index_path)
+            self._index_dirty = True
+        return self._working
+    
+    def _publish_index(self, index):
+        """发布index的写时复制快照，之后对index的修改不影响正在使用快照的查询（调用方持有索引锁）"""
+        self._working = index
+        self.index = self.data_loader.snapshot_index(index)
+    
+    def _apply_index_changes(self, upserts: List[Dict[str, Any]] = None,
+                             deletes: List[int] = None) -> bool:
+        """
+        增量更新向量索引：变更写入常驻的可写索引并追加到变更日志，然后发布新快照
+        
+        磁盘写入量只与本次变更有关，变更日志累计到 index_compact_changes 条后整体保存一次
+        
+        Args:
+            upserts: 新增或内容变化的FAQ，一次性批量向量化后写入
+            deletes: 已删除的FAQ ID
+        
+        Returns:
+            是否成功；失败时索引标记为待同步，下次变更会按内容指纹整体对齐
+        """
+        upserts = upserts or []
+        deletes = deletes or []
+        try:
+            with self._index_lock:
+                if not os.path.exists(self.index_path):
+                    return self.rebuild_index(force=True)
+                index = self._load_working_index()
+                if self._index_dirty:
+                    return self._sync_index(index)
+                
+                deleted_doc_ids = [self.data_loader.faq_doc_id(faq_id)
+                                   for faq_id in deletes + [faq['id'] for faq in upserts]]
+                documents = self.data_loader.create_documents(upserts)
+                nodes = self.data_loader.embed_documents(documents) if documents else []
+                doc_hashes = {doc.doc_id: doc.hash for doc in documents}
+                
+                self.data_loader.apply_changes(index, deleted_doc_ids, nodes, doc_hashes)
+                pending = self.data_loader.append_changes(self.index_path, deleted_doc_ids, nodes, doc_hashes)
+                if pending >= settings.index_compact_changes:
+                    self.data_loader.save_index(index, self.index_path)
+                self._publish_index(index)
+            print(f"向量索引增量更新完成: 新增/更新 {len(upserts)} 条, 删除 {len(deletes)} 条")
             return True
+        except Exception as e:
+            with self._index_lock:
+                # 可写索引可能只应用了一半，丢弃后从磁盘重新加载并按内容指纹同步
+                self._working = None
+                self._index_dirty = True
+            logger.error("增量更新索引失败: %s", e, exc_info=True)
+            return False
+    
+    def _sync_index(self, index) -> bool:
+        """
+        按文档内容指纹对比数据库与索引，只处理有差异的条目（调用方持有索引锁）
+        
+        Args:
+            index: _load_working_index 返回的可写索引，同步后整体保存并发布快照
+        """
+        documents = self.data_loader.create_documents(self.get_all_faqs())
+        expected = {doc.doc_id: doc for doc in documents}
+        existing = set(index.ref_doc_info.keys())
+        
+        stale = [doc_id for doc_id in existing
+                 if doc_id not in expected or index.docstore.get_document_hash(doc_id) != expected[doc_id].hash]
+        for doc_id in stale:
+            index.delete_ref_doc(doc_id, delete_from_docstore=True)
         
-        return False
-    
-    def _save_faqs_to_file(self, faqs: List[Dict[str, Any]]):
-        """将FAQ列表保存到文件"""
-        content = ""
-        for faq in faqs:
-            content += f"Q: {faq['question']}\n"
-            content += f"A: {faq['answer']}\n\n"
+        stale_set = set(stale)
+        to_insert = [doc for doc_id, doc in expected.items() if doc_id not in existing or doc_id in stale_set]
+        if to_insert:
+            self.data_loader.apply_changes(index, [], self.data_loader.embed_documents(to_insert),
+                                           {doc.doc_id: doc.hash for doc in to_insert})
         
-        with open(self.faq_file_path, 'w', encoding='utf-8') as f:
-            f.write(content.rstrip() + '\n')
+        self.data_loader.save_index(index, self.index_path)
+        self._publish_index(index)
+        self._index_dirty = False
+        print(f"向量索引同步完成: 删除 {len(stale)} 条, 写入 {len(to_insert)} 条")
+        return True
     
     # 动态知识库更新功能
     def rebuild_index(self, force: bool = True) -> bool:
-        """重建向量索引"""
+        """重建向量索引
+        
+        Args:
+            force: True时全量重新向量化；False时只同步与数据库不一致的条目
+        """
         try:
+            if not force and os.path.exists(self.index_path):
+                with self._index_lock:
+                    index = self._load_working_index()
+                    return self._sync_index(index)
+            
             print("正在重建向量索引...")
-            index = self.data_loader.initialize_faq_system(force_rebuild=force)
+            documents = self.data_loader.create_documents(self.get_all_faqs())
+            index = self.data_loader.build_vector_index(documents)
+            with self._index_lock:
+                self.data_loader.save_index(index, self.index_path)
+                self._publish_index(index)
+                self._index_dirty = False
             print("向量索引重建完成")
             return True
         except Exception as e:
@@ -180,36 +272,36 @@ class KnowledgeBaseManager:
                             merge_strategy: str = "append") -> bool:
         """更新知识库
         
+        新增条目作为一个批次向量化；replace模式下内容未变化的条目保留原ID和向量
+        
         Args:
             new_faqs: 新的FAQ列表，格式为[{"question": "...", "answer": "..."}]
             merge_strategy: 合并策略，"append"(追加) 或 "replace"(替换)
         """
         try:
+            new_faqs = [
+                {'question': faq['question'].strip(), 'answer': faq['answer'].strip()}
+                for faq in new_faqs
+            ]
+            deleted_ids = []
             if merge_strategy == "replace":
-                # 替换模式：清空现有FAQ，使用新的FAQ
-                faqs = []
-                for i, faq_data in enumerate(new_faqs, 1):
-                    faqs.append({
-                        'id': i,
-                        'question': faq_data['question'].strip(),
-                        'answer': faq_data['answer'].strip()
-                    })
-            else:
-                # 追加模式：在现有FAQ基础上添加新的FAQ
-                faqs = self.get_all_faqs()
-                current_max_id = max([faq['id'] for faq in faqs], default=0)
-                
-                for i, faq_data in enumerate(new_faqs, 1):
-                    faqs.append({
-                        'id': current_max_id + i,
-                        'question': faq_data['question'].strip(),
-                        'answer': faq_data['answer'].strip()
-                    })
+                # 替换模式：按内容指纹匹配，已存在的条目保留，其余删除
+                existing = self.store.hash_index()
+                to_add = []
+                for faq in new_faqs:
+                    ids = existing.get(content_hash(faq['question'], faq['answer']))
+                    if ids:
+                        ids.pop(0)
+                    else:
+                        to_add.append(faq)
+                deleted_ids = self.store.delete_many([i for ids in existing.values() for i in ids])
+                new_faqs = to_add
             
-            self._save_faqs_to_file(faqs)
-            self.rebuild_index()
+            added = self.store.add_many(new_faqs)
+            if not self._apply_index_changes(upserts=added, deletes=deleted_ids):
+                return False
             
-            print(f"知识库更新完成，共{len(faqs)}个FAQ条目")
+            print(f"知识库更新完成，新增 {len(added)} 条，删除 {len(deleted_ids)} 条，共{self.store.count()}个FAQ条目")
             return True
             
         except Exception as e:
@@ -244,7 +336,7 @@ class KnowledgeBaseManager:
     def export_to_txt(self, output_path: str) -> bool:
         """导出FAQ到TXT文件"""
         try:
-            shutil.copy2(self.faq_file_path, output_path)
+            self._save_faqs_to_file(self.get_all_faqs(), output_path)
             print(f"FAQ已导出到: {output_path}")
             return True
         except Exception as e:
@@ -282,12 +374,7 @@ class KnowledgeBaseManager:
                 print("CSV文件必须包含'question'和'answer'列")
                 return False
             
-            new_faqs = []
-            for _, row in df.iterrows():
-                new_faqs.append({
-                    'question': str(row['question']),
-                    'answer': str(row['answer'])
-                })
+            new_faqs = df[['question', 'answer']].astype(str).to_dict('records')
             
             return self.update_knowledge_base(new_faqs, merge_strategy)
             
@@ -325,10 +412,10 @@ class KnowledgeBaseManager:
             
             os.makedirs(backup_path, exist_ok=True)
             
-            # 备份FAQ文件
-            if os.path.exists(self.faq_file_path):
-                shutil.copy2(self.faq_file_path, 
-                           os.path.join(backup_path, "FAQ.txt"))
+            # 备份FAQ数据库，并导出一份可读的FAQ.txt
+            self.store.backup_to(os.path.join(backup_path, "faq.db"))
+            faqs = self.get_all_faqs()
+            self._save_faqs_to_file(faqs, os.path.join(backup_path, "FAQ.txt"))
             
             # 备份索引文件
             if os.path.exists(self.index_path):
@@ -342,7 +429,7 @@ class KnowledgeBaseManager:
                 "backup_name": backup_name,
                 "timestamp": timestamp,
                 "description": description,
-                "faq_count": len(self.get_all_faqs())
+                "faq_count": len(faqs)
             }
             
             version_info["versions"].append(version_record)
@@ -370,10 +457,15 @@ class KnowledgeBaseManager:
                 print(f"备份不存在: {backup_name}")
                 return False
             
-            # 恢复FAQ文件
+            # 恢复FAQ数据库；旧版本备份只有FAQ.txt，按文件内容重新导入
+            backup_db_path = os.path.join(backup_path, "faq.db")
             backup_faq_path = os.path.join(backup_path, "FAQ.txt")
-            if os.path.exists(backup_faq_path):
-                shutil.copy2(backup_faq_path, self.faq_file_path)
+            if os.path.exists(backup_db_path):
+                self.store.restore_from(backup_db_path)
+            elif os.path.exists(backup_faq_path):
+                faqs = self.data_loader.parse_faq_file(backup_faq_path)
+                self.store.delete_many([faq['id'] for faq in self.get_all_faqs()])
+                self.store.add_many(faqs)
             
             # 恢复索引文件
             backup_index_path = os.path.join(backup_path, "faiss_index")
@@ -382,6 +474,12 @@ class KnowledgeBaseManager:
                     shutil.rmtree(self.index_path)
                 shutil.copytree(backup_index_path, self.index_path)
             
+            # 下次使用时重新加载索引，并与恢复后的数据库同步
+            with self._index_lock:
+                self._working = None
+                self.index = None
+                self._index_dirty = True
+            
             print(f"从备份恢复成功: {backup_name}")
             return True
             
@@ -418,26 +516,9 @@ class KnowledgeBaseManager:
     # 统计和信息功能
     def get_statistics(self) -> Dict[str, Any]:
         """获取知识库统计信息"""
-        faqs = self.get_all_faqs()
-        
-        stats = {
-            "total_faqs": len(faqs),
-            "avg_question_length": 0,
-            "avg_answer_length": 0,
-            "index_exists": os.path.exists(self.index_path),
-            "last_updated": "",
-            "version_info": self._get_version_info()
-        }
-        
-        if faqs:
-            stats["avg_question_length"] = sum(len(faq['question']) for faq in faqs) / len(faqs)
-            stats["avg_answer_length"] = sum(len(faq['answer']) for faq in faqs) / len(faqs)
-        
-        if os.path.exists(self.faq_file_path):
-            stats["last_updated"] = datetime.datetime.fromtimestamp(
-                os.path.getmtime(self.faq_file_path)
-            ).isoformat()
-        
+        stats = self.store.statistics()
+        stats["index_exists"] = os.path.exists(self.index_path)
+        stats["version_info"] = self._get_version_info()
         return stats
     
     def validate_knowledge_base(self) -> Dict[str, Any]:
@@ -445,14 +526,11 @@ class KnowledgeBaseManager:
         issues = []
         warnings = []
         
-        # 检查FAQ文件
-        if not os.path.exists(self.faq_file_path):
-            issues.append("FAQ文件不存在")
+        # 检查FAQ数据
+        faqs = self.get_all_faqs()
+        if not faqs:
+            issues.append("FAQ数据库为空")
         else:
-            faqs = self.get_all_faqs()
-            if not faqs:
-                issues.append("FAQ文件为空")
-            
             # 检查FAQ格式
             for faq in faqs:
                 if not faq.get('question', '').strip():
@@ -0,0 +1,170 @@
+"""
+查询服务 - 常驻内存的向量索引与查询引擎
+索引只在启动和重建后加载一次，查询在有界线程池中执行，重建完成后原子替换
+"""
+import asyncio
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Callable, Dict, Optional
+
+from llama_index.core import VectorStoreIndex
+
+from config import settings
+
+
+@dataclass
+class IndexSnapshot:
+    """一次加载得到的索引及其查询引擎，替换时整体替换"""
+    index: VectorStoreIndex
+    query_engine: Any
+    version: int
+    loaded_at: str
+    load_seconds: float
+
+
+class QueryService:
+    """常驻查询服务"""
+
+    def __init__(self, loader: Callable[[], Optional[VectorStoreIndex]],
+                 max_workers: int = None, max_pending: int = None, latency_window: int = 1000):
+        """
+        Args:
+            loader: 从磁盘加载索引的函数
+            max_workers: 执行查询的线程数
+            max_pending: 同时在执行或排队的查询上限
+            latency_window: 统计延迟分位数时保留的最近查询数
+        """
+        self._loader = loader
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers or settings.query_max_workers,
+            thread_name_prefix="faq-query"
+        )
+        self._max_pending = max_pending or settings.query_max_pending
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._reload_lock: Optional[asyncio.Lock] = None
+        self._snapshot: Optional[IndexSnapshot] = None
+        self._swap_lock = threading.Lock()
+        self._version = 0
+
+        # 指标
+        self._latencies = deque(maxlen=latency_window)
+        self._query_count = 0
+        self._error_count = 0
+        self._in_flight = 0
+
+    @property
+    def ready(self) -> bool:
+        return self._snapshot is not None
+
+    @property
+    def current_index(self) -> Optional[VectorStoreIndex]:
+        snapshot = self._snapshot
+        return snapshot.index if snapshot else None
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        # 信号量和锁需要在事件循环中创建
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self._max_pending)
+        return self._semaphore
+
+    def _get_reload_lock(self) -> asyncio.Lock:
+        if self._reload_lock is None:
+            self._reload_lock = asyncio.Lock()
+        return self._reload_lock
+
+    def swap(self, index: VectorStoreIndex, load_seconds: float = 0.0) -> IndexSnapshot:
+        """用新索引原子替换当前快照，正在执行的查询继续使用旧快照"""
+        query_engine = index.as_query_engine(similarity_top_k=settings.top_k)
+        with self._swap_lock:
+            self._version += 1
+            snapshot = IndexSnapshot(
+                index=index,
+                query_engine=query_engine,
+                version=self._version,
+                loaded_at=datetime.now().isoformat(),
+                load_seconds=load_seconds
+            )
+            self._snapshot = snapshot
+        print(f"索引已切换到版本 {snapshot.version}，加载耗时 {load_seconds:.2f}s")
+        return snapshot
+
+    def load(self) -> bool:
+        """从磁盘加载索引（同步），成功后替换当前快照"""
+        start = time.perf_counter()
+        index = self._loader()
+        if index is None:
+            return False
+        self.swap(index, time.perf_counter() - start)
+        return True
+
+    async def reload(self, build: Callable[[], Optional[VectorStoreIndex]] = None) -> bool:
+        """
+        在默认线程池中构建或加载索引，不占用查询线程，完成后替换
+
+        Args:
+            build: 返回新索引的函数，为空时从磁盘重新加载
+        """
+        loop = asyncio.get_running_loop()
+        # 同一时间只允许一个重建，保证替换顺序与重建顺序一致
+        async with self._get_reload_lock():
+            start = time.perf_counter()
+            index = await loop.run_in_executor(None, build or self._loader)
+            if index is None:
+                return False
+            self.swap(index, time.perf_counter() - start)
+        return True
+
+    async def query(self, question: str):
+        """在有界线程池中执行查询"""
+        snapshot = self._snapshot
+        if snapshot is None:
+            raise RuntimeError("索引未加载")
+
+        loop = asyncio.get_running_loop()
+        async with self._get_semaphore():
+            self._in_flight += 1
+            start = time.perf_counter()
+            try:
+                response = await loop.run_in_executor(self._executor, snapshot.query_engine.query, question)
+            except Exception:
+                self._error_count += 1
+                raise
+            finally:
+                self._in_flight -= 1
+                self._query_count += 1
+                self._latencies.append(time.perf_counter() - start)
+        return response
+
+    def metrics(self) -> Dict[str, Any]:
+        """索引加载与查询延迟指标"""
+        latencies = sorted(self._latencies)
+
+        def percentile(p: float) -> float:
+            if not latencies:
+                return 0.0
+            return latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000
+
+        snapshot = self._snapshot
+        return {
+            "index_ready": snapshot is not None,
+            "index_version": snapshot.version if snapshot else 0,
+            "index_loaded_at": snapshot.loaded_at if snapshot else None,
+            "index_load_seconds": round(snapshot.load_seconds, 4) if snapshot else None,
+            "query_count": self._query_count,
+            "query_error_count": self._error_count,
+            "queries_in_flight": self._in_flight,
+            "query_latency_ms": {
+                "avg": round(sum(latencies) / len(latencies) * 1000, 2) if latencies else 0.0,
+                "p50": round(percentile(0.5), 2),
+                "p95": round(percentile(0.95), 2),
+                "p99": round(percentile(0.99), 2),
+                "window": len(latencies)
+            }
+        }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
@@ -0,0 +1,380 @@
+"""
+会话存储 - 有上限的对话历史存储
+每个会话只保留最近若干轮对话，会话按最近访问时间做LRU淘汰，超过空闲时间自动过期
+支持内存和SQLite两种后端，SQLite后端在服务重启后保留会话
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from collections import OrderedDict, deque
+from datetime import datetime
+from typing import List, Dict, Any, Optional, Tuple
+
+from config import settings
+
+
+def _entry_size(entry: Dict[str, Any]) -> int:
+    """估算一条对话记录占用的字节数（按UTF-8编码的JSON长度计）"""
+    return len(json.dumps(entry, ensure_ascii=False).encode('utf-8'))
+
+
+class SessionStore(ABC):
+    """会话存储接口"""
+
+    def __init__(self, max_sessions: int = None, max_history: int = None, ttl_seconds: int = None):
+        """
+        Args:
+            max_sessions: 最多保留的会话数，超出时淘汰最久未访问的会话
+            max_history: 每个会话最多保留的对话轮数，超出时丢弃最早的记录
+            ttl_seconds: 会话空闲超过该时间后过期，0表示不过期
+        """
+        self.max_sessions = max_sessions or settings.session_max_sessions
+        self.max_history = max_history or settings.session_max_history
+        self.ttl_seconds = settings.session_ttl_seconds if ttl_seconds is None else ttl_seconds
+        self._lock = threading.RLock()
+        self._evicted = 0
+        self._expired = 0
+
+    def _is_expired(self, last_active: float, now: float) -> bool:
+        return self.ttl_seconds > 0 and now - last_active > self.ttl_seconds
+
+    def get_or_create_session_id(self, session_id: Optional[str] = None) -> str:
+        """
+        会话存在时返回原ID，否则生成新ID
+
+        新会话在写入第一条记录时才落地，查询失败的请求不会留下空会话
+        """
+        if session_id and self.exists(session_id):
+            return session_id
+        return str(uuid.uuid4())
+
+    @abstractmethod
+    def exists(self, session_id: str) -> bool:
+        """会话是否存在且未过期"""
+
+    @abstractmethod
+    def append(self, session_id: str, question: str, answer: str, sources: List[Dict[str, Any]]):
+        """追加一轮对话，会话不存在时创建"""
+
+    @abstractmethod
+    def get_history(self, session_id: str, limit: int = 20,
+                    offset: int = 0) -> Optional[Tuple[List[Dict[str, Any]], int]]:
+        """
+        分页获取对话历史（按时间正序）
+
+        Returns:
+            (当前页记录, 总记录数)，会话不存在时返回None
+        """
+
+    @abstractmethod
+    def delete(self, session_id: str) -> bool:
+        """删除会话"""
+
+    @abstractmethod
+    def purge_expired(self) -> int:
+        """清理过期会话，返回清理数量"""
+
+    @abstractmethod
+    def count(self) -> int:
+        """当前会话数"""
+
+    @abstractmethod
+    def memory_bytes(self) -> int:
+        """会话数据占用的内存字节数（估算）"""
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "backend": self.backend,
+            "session_count": self.count(),
+            "memory_bytes": self.memory_bytes(),
+            "max_sessions": self.max_sessions,
+            "max_history_per_session": self.max_history,
+            "ttl_seconds": self.ttl_seconds,
+            "evicted_sessions": self._evicted,
+            "expired_sessions": self._expired
+        }
+
+    def close(self):
+        pass
+
+
+class MemorySessionStore(SessionStore):
+    """内存会话存储，服务重启后会话丢失"""
+
+    backend = "memory"
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        # session_id -> {'history', 'sizes', 'last_active', 'bytes'}，按最近访问时间排序
+        self._sessions: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._bytes = 0
+
+    def _get(self, session_id: str, now: float) -> Optional[Dict[str, Any]]:
+        session = self._sessions.get(session_id)
+        if session is None:
+            return None
+        if self._is_expired(session['last_active'], now):
+            self._remove(session_id)
+            self._expired += 1
+            return None
+        return session
+
+    def _remove(self, session_id: str):
+        session = self._sessions.pop(session_id)
+        self._bytes -= session['bytes']
+
+    def exists(self, session_id: str) -> bool:
+        with self._lock:
+            return self._get(session_id, time.time()) is not None
+
+    def append(self, session_id: str, question: str, answer: str, sources: List[Dict[str, Any]]):
+        entry = {
+            "question": question,
+            "answer": answer,
+            "sources": sources,
+            "timestamp": datetime.now().isoformat()
+        }
+        size = _entry_size(entry)
+        now = time.time()
+        with self._lock:
+            session = self._get(session_id, now)
+            if session is None:
+                session = {'history': deque(), 'sizes': deque(), 'last_active': now, 'bytes': 0}
+                self._sessions[session_id] = session
+            session['history'].append(entry)
+            session['sizes'].append(size)
+            session['bytes'] += size
+            self._bytes += size
+            while len(session['history']) > self.max_history:
+                session['history'].popleft()
+                dropped = session['sizes'].popleft()
+                session['bytes'] -= dropped
+                self._bytes -= dropped
+            session['last_active'] = now
+            self._sessions.move_to_end(session_id)
+
+            while len(self._sessions) > self.max_sessions:
+                self._remove(next(iter(self._sessions)))
+                self._evicted += 1
+
+    def get_history(self, session_id: str, limit: int = 20,
+                    offset: int = 0) -> Optional[Tuple[List[Dict[str, Any]], int]]:
+        now = time.time()
+        with self._lock:
+            session = self._get(session_id, now)
+            if session is None:
+                return None
+            session['last_active'] = now
+            self._sessions.move_to_end(session_id)
+            history = session['history']
+            return list(history)[offset:offset + limit], len(history)
+
+    def delete(self, session_id: str) -> bool:
+        with self._lock:
+            if session_id not in self._sessions:
+                return False
+            self._remove(session_id)
+            return True
+
+    def purge_expired(self) -> int:
+        now = time.time()
+        removed = 0
+        with self._lock:
+            # 按最近访问排序，遇到未过期的会话即可停止
+            while self._sessions:
+                session_id, session = next(iter(self._sessions.items()))
+                if not self._is_expired(session['last_active'], now):
+                    break
+                self._remove(session_id)
+                removed += 1
+            self._expired += removed
+        return removed
+
+    def count(self) -> int:
+        with self._lock:
+            return len(self._sessions)
+
+    def memory_bytes(self) -> int:
+        return self._bytes
+
+
+class SQLiteSessionStore(SessionStore):
+    """SQLite会话存储，会话在服务重启后保留，内存中只保留连接"""
+
+    backend = "sqlite"
+
+    def __init__(self, db_path: str = None, purge_interval: float = 60.0, **kwargs):
+        """
+        Args:
+            db_path: 数据库文件路径
+            purge_interval: 写入时清理过期会话的最小间隔（秒）
+        """
+        super().__init__(**kwargs)
+        self.db_path = db_path or settings.session_db_path
+        self.purge_interval = purge_interval
+        self._last_purge = 0.0
+        os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.executescript("""
+            PRAGMA journal_mode=WAL;
+            PRAGMA foreign_keys=ON;
+            CREATE TABLE IF NOT EXISTS sessions (
+                id TEXT PRIMARY KEY,
+                created_at REAL NOT NULL,
+                last_active REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_sessions_last_active ON sessions(last_active);
+            CREATE TABLE IF NOT EXISTS messages (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                session_id TEXT NOT NULL REFERENCES sessions(id) ON DELETE CASCADE,
+                question TEXT NOT NULL,
+                answer TEXT NOT NULL,
+                sources TEXT NOT NULL,
+                timestamp TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_messages_session ON messages(session_id, id);
+        """)
+        self._conn.commit()
+        # 启动时清理服务停机期间过期的会话
+        self.purge_expired()
+
+    def _cutoff(self, now: float) -> float:
+        return now - self.ttl_seconds if self.ttl_seconds > 0 else float('-inf')
+
+    def exists(self, session_id: str) -> bool:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT 1 FROM sessions WHERE id = ? AND last_active >= ?",
+                (session_id, self._cutoff(time.time()))
+            ).fetchone()
+        return row is not None
+
+    def append(self, session_id: str, question: str, answer: str, sources: List[Dict[str, Any]]):
+        now = time.time()
+        with self._lock:
+            with self._conn:
+                # 已过期的会话不能被续期：先删除旧会话及其历史，再作为新会话写入
+                expired = self._conn.execute(
+                    "DELETE FROM sessions WHERE id = ? AND last_active < ?",
+                    (session_id, self._cutoff(now))
+                ).rowcount
+                self._expired += expired
+                self._conn.execute(
+                    "INSERT INTO sessions (id, created_at, last_active) VALUES (?, ?, ?) "
+                    "ON CONFLICT(id) DO UPDATE SET last_active = excluded.last_active",
+                    (session_id, now, now)
+                )
+                self._conn.execute(
+                    "INSERT INTO messages (session_id, question, answer, sources, timestamp) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (session_id, question, answer, json.dumps(sources, ensure_ascii=False),
+                     datetime.now().isoformat())
+                )
+                # 只保留最近 max_history 条
+                self._conn.execute(
+                    "DELETE FROM messages WHERE session_id = ? AND id <= ("
+                    "SELECT id FROM messages WHERE session_id = ? ORDER BY id DESC LIMIT 1 OFFSET ?)",
+                    (session_id, session_id, self.max_history)
+                )
+                # 淘汰最久未访问的会话
+                overflow = self._conn.execute("SELECT COUNT(*) FROM sessions").fetchone()[0] - self.max_sessions
+                if overflow > 0:
+                    self._conn.execute(
+                        "DELETE FROM sessions WHERE id IN ("
+                        "SELECT id FROM sessions ORDER BY last_active LIMIT ?)",
+                        (overflow,)
+                    )
+                    self._evicted += overflow
+            if now - self._last_purge >= self.purge_interval:
+                self.purge_expired()
+
+    def get_history(self, session_id: str, limit: int = 20,
+                    offset: int = 0) -> Optional[Tuple[List[Dict[str, Any]], int]]:
+        now = time.time()
+        with self._lock, self._conn:
+            updated = self._conn.execute(
+                "UPDATE sessions SET last_active = ? WHERE id = ? AND last_active >= ?",
+                (now, session_id, self._cutoff(now))
+            ).rowcount
+            if not updated:
+                return None
+            total = self._conn.execute(
+                "SELECT COUNT(*) FROM messages WHERE session_id = ?", (session_id,)
+            ).fetchone()[0]
+            rows = self._conn.execute(
+                "SELECT question, answer, sources, timestamp FROM messages "
+                "WHERE session_id = ? ORDER BY id LIMIT ? OFFSET ?",
+                (session_id, limit, offset)
+            ).fetchall()
+        history = [{
+            "question": row['question'],
+            "answer": row['answer'],
+            "sources": json.loads(row['sources']),
+            "timestamp": row['timestamp']
+        } for row in rows]
+        return history, total
+
+    def delete(self, session_id: str) -> bool:
+        with self._lock, self._conn:
+            return bool(self._conn.execute("DELETE FROM sessions WHERE id = ?", (session_id,)).rowcount)
+
+    def purge_expired(self) -> int:
+        now = time.time()
+        with self._lock:
+            self._last_purge = now
+            if self.ttl_seconds <= 0:
+                return 0
+            with self._conn:
+                removed = self._conn.execute(
+                    "DELETE FROM sessions WHERE last_active < ?", (self._cutoff(now),)
+                ).rowcount
+            self._expired += removed
+        return removed
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM sessions WHERE last_active >= ?", (self._cutoff(time.time()),)
+            ).fetchone()[0]
+
+    def memory_bytes(self) -> int:
+        """
+        会话数据在磁盘上，内存占用只有连接的页缓存：
+        估算为 min(页缓存上限, 数据库大小)，cache_size为负数时表示KiB上限
+        """
+        with self._lock:
+            cache_size = self._conn.execute("PRAGMA cache_size").fetchone()[0]
+            page_size = self._conn.execute("PRAGMA page_size").fetchone()[0]
+            page_count = self._conn.execute("PRAGMA page_count").fetchone()[0]
+        limit = -cache_size * 1024 if cache_size < 0 else cache_size * page_size
+        return min(limit, page_count * page_size)
+
+    def disk_bytes(self) -> int:
+        with self._lock:
+            page_count = self._conn.execute("PRAGMA page_count").fetchone()[0]
+            page_size = self._conn.execute("PRAGMA page_size").fetchone()[0]
+        return page_count * page_size
+
+    def metrics(self) -> Dict[str, Any]:
+        metrics = super().metrics()
+        metrics["disk_bytes"] = self.disk_bytes()
+        return metrics
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def create_session_store(backend: str = None, **kwargs) -> SessionStore:
+    """按配置创建会话存储"""
+    backend = (backend or settings.session_backend).lower()
+    if backend == "memory":
+        return MemorySessionStore(**kwargs)
+    if backend == "sqlite":
+        return SQLiteSessionStore(**kwargs)
+    raise ValueError(f"不支持的会话存储后端: {backend}")
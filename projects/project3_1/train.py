@@ -2,7 +2,7 @@
 训练脚本 - 从FAQ.txt加载数据到faiss向量数据库并持久化
 """
 import os
-from data_loader import FAQDataLoader
+from kb_manager import KnowledgeBaseManager
 from config import settings
 
 
@@ -20,11 +20,10 @@ def main():
         print(f"错误：FAQ文件不存在: {settings.faq_file_path}")
         return
     
-    # 创建数据加载器并构建索引
-    data_loader = FAQDataLoader()
-    index = data_loader.initialize_faq_system(force_rebuild=True)
-    
-    if index:
+    # 通过知识库管理器构建索引：首次运行时把FAQ.txt导入FAQ数据库，
+    # 之后以数据库为准，保证索引中的文档ID与FAQ ID一致
+    kb_manager = KnowledgeBaseManager()
+    if kb_manager.rebuild_index(force=True):
         print("索引构建并持久化成功！")
     else:
         print("索引构建失败")
@@ -2,9 +2,9 @@
 FAQ知识库管理系统 Web API
 基于FastAPI实现的RESTful API接口
 """
+import asyncio
 import os
 import json
-import uuid
 from datetime import datetime
 from typing import List, Dict, Any, Optional
 from pathlib import Path
@@ -16,6 +16,8 @@ import uvicorn
 
 from kb_manager import KnowledgeBaseManager
 from data_loader import FAQDataLoader
+from query_service import QueryService
+from session_store import create_session_store
 from config import settings
 
 
@@ -77,32 +79,56 @@ app = FastAPI(
 kb_manager = KnowledgeBaseManager()
 data_loader = FAQDataLoader()
 
-# 会话存储（生产环境建议使用Redis等持久化存储）
-chat_sessions: Dict[str, List[Dict[str, Any]]] = {}
+
+def load_index_from_disk():
+    """从磁盘加载索引，索引不存在时返回None"""
+    if not os.path.exists(settings.faiss_index_path):
+        return None
+    return data_loader.load_index()
+
+
+# 常驻内存的索引和查询引擎，重建后原子替换
+query_service = QueryService(load_index_from_disk)
+
+# 会话存储：每个会话的历史和会话总数都有上限，按LRU/空闲时间淘汰
+# SQLite后端的读写是同步调用，接口中一律通过asyncio.to_thread在线程池执行，不阻塞事件循环
+session_store = create_session_store()
+
+
+@app.on_event("startup")
+async def load_index_on_startup():
+    """启动时加载一次索引"""
+    try:
+        if not await query_service.reload():
+            print("向量索引不存在，请先重建索引")
+    except Exception as e:
+        print(f"启动时加载索引失败: {str(e)}")
+
+
+@app.on_event("shutdown")
+async def shutdown_query_service():
+    query_service.shutdown()
+    session_store.close()
 
 
 # 工具函数
-def get_or_create_session_id(session_id: Optional[str] = None) -> str:
-    """获取或创建会话ID"""
-    if session_id and session_id in chat_sessions:
-        return session_id
+async def run_kb_change(func, *args, **kwargs):
+    """
+    在线程池中执行知识库变更，变更产生了新索引时把它替换为常驻索引
     
-    new_session_id = str(uuid.uuid4())
-    chat_sessions[new_session_id] = []
-    return new_session_id
+    kb_manager每次增量更新或重建都会生成新的索引对象（不修改常驻服务正在使用的索引），
+    因此只需比较变更前后的对象是否相同
+    """
+    outcome = {}
 
+    def build():
+        before = kb_manager.index
+        outcome['result'] = func(*args, **kwargs)
+        index = kb_manager.index
+        return index if index is not None and index is not before else None
 
-def add_to_chat_history(session_id: str, question: str, answer: str, sources: List[Dict[str, Any]]):
-    """添加到聊天历史"""
-    if session_id not in chat_sessions:
-        chat_sessions[session_id] = []
-    
-    chat_sessions[session_id].append({
-        "question": question,
-        "answer": answer,
-        "sources": sources,
-        "timestamp": datetime.now().isoformat()
-    })
+    await query_service.reload(build)
+    return outcome['result']
 
 
 # API路由实现
@@ -113,26 +139,17 @@ async def chat(request: ChatRequest):
     """发送问题获取答案"""
     try:
         # 获取或创建会话ID
-        session_id = get_or_create_session_id(request.session_id)
+        session_id = await asyncio.to_thread(session_store.get_or_create_session_id, request.session_id)
         
-        # 检查索引是否存在
-        if not os.path.exists(settings.faiss_index_path):
+        # 索引常驻内存，只有启动时不存在才尝试加载一次
+        if not query_service.ready and not await query_service.reload():
             raise HTTPException(
                 status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
                 detail="向量索引不存在，请先重建索引"
             )
         
-        # 加载索引并查询
-        index = data_loader.load_index()
-        if index is None:
-            raise HTTPException(
-                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-                detail="索引加载失败"
-            )
-        
-        # 执行查询
-        query_engine = index.as_query_engine(similarity_top_k=settings.top_k)
-        response = query_engine.query(request.question)
+        # 在有界线程池中执行查询，不阻塞事件循环
+        response = await query_service.query(request.question)
         
         # 提取相关来源
         sources = []
@@ -148,7 +165,7 @@ async def chat(request: ChatRequest):
         timestamp = datetime.now().isoformat()
         
         # 添加到聊天历史
-        add_to_chat_history(session_id, request.question, answer, sources)
+        await asyncio.to_thread(session_store.append, session_id, request.question, answer, sources)
         
         return ChatResponse(
             answer=answer,
@@ -157,6 +174,8 @@ async def chat(request: ChatRequest):
             timestamp=timestamp
         )
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -165,27 +184,47 @@ async def chat(request: ChatRequest):
 
 
 @app.get("/api/v1/chat/history")
-async def get_chat_history(session_id: str):
-    """获取对话历史"""
-    if session_id not in chat_sessions:
+async def get_chat_history(session_id: str, limit: int = 20, offset: int = 0):
+    """分页获取对话历史（按时间正序）"""
+    limit = max(1, min(limit, 100))
+    offset = max(0, offset)
+    page = await asyncio.to_thread(session_store.get_history, session_id, limit=limit, offset=offset)
+    if page is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="会话不存在"
         )
     
+    history, total_count = page
     return {
         "session_id": session_id,
-        "history": chat_sessions[session_id],
-        "total_count": len(chat_sessions[session_id])
+        "history": history,
+        "total_count": total_count,
+        "limit": limit,
+        "offset": offset,
+        "has_more": offset + len(history) < total_count
     }
 
 
+@app.delete("/api/v1/chat/history")
+async def delete_chat_history(session_id: str):
+    """删除会话及其对话历史"""
+    if not await asyncio.to_thread(session_store.delete, session_id):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="会话不存在"
+        )
+    
+    return {"message": "会话已删除", "session_id": session_id}
+
+
 # 2. 知识库管理接口
 @app.post("/api/v1/knowledge/faq", response_model=FAQResponse)
 async def add_faq(faq: FAQItem):
     """添加FAQ条目"""
     try:
-        new_faq = kb_manager.add_faq(
+        new_faq = await run_kb_change(
+            kb_manager.add_faq,
             question=faq.question,
             answer=faq.answer,
             auto_rebuild=True
@@ -197,6 +236,8 @@ async def add_faq(faq: FAQItem):
             answer=new_faq['answer']
         )
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -208,7 +249,8 @@ async def add_faq(faq: FAQItem):
 async def update_faq(faq_id: int, request: FAQUpdateRequest):
     """更新FAQ条目"""
     try:
-        success = kb_manager.update_faq(
+        success = await run_kb_change(
+            kb_manager.update_faq,
             faq_id=faq_id,
             question=request.question,
             answer=request.answer,
@@ -248,7 +290,7 @@ async def update_faq(faq_id: int, request: FAQUpdateRequest):
 async def delete_faq(faq_id: int):
     """删除FAQ条目"""
     try:
-        success = kb_manager.delete_faq(faq_id, auto_rebuild=True)
+        success = await run_kb_change(kb_manager.delete_faq, faq_id, auto_rebuild=True)
         
         if not success:
             raise HTTPException(
@@ -271,14 +313,11 @@ async def delete_faq(faq_id: int):
 async def get_faqs(keyword: Optional[str] = None, limit: int = 100, offset: int = 0):
     """查询FAQ列表"""
     try:
+        # 分页在数据库中完成
         if keyword:
-            faqs = kb_manager.search_faqs(keyword)
+            faqs = kb_manager.search_faqs(keyword, limit=limit, offset=offset)
         else:
-            faqs = kb_manager.get_all_faqs()
-        
-        # 分页处理
-        total_count = len(faqs)
-        faqs = faqs[offset:offset + limit]
+            faqs = kb_manager.get_all_faqs(limit=limit, offset=offset)
         
         response_faqs = [
             FAQResponse(
@@ -308,7 +347,8 @@ async def batch_import_faqs(request: BatchImportRequest):
             for faq in request.faqs
         ]
         
-        success = kb_manager.update_knowledge_base(
+        success = await run_kb_change(
+            kb_manager.update_knowledge_base,
             new_faqs=new_faqs,
             merge_strategy=request.merge_strategy
         )
@@ -341,15 +381,17 @@ async def health_check():
     try:
         components = {}
         
-        # 检查FAQ文件
-        if os.path.exists(settings.faq_file_path):
-            components["faq_file"] = "healthy"
+        # 检查FAQ数据库
+        if kb_manager.store.count() > 0:
+            components["faq_store"] = "healthy"
         else:
-            components["faq_file"] = "missing"
+            components["faq_store"] = "empty"
         
         # 检查向量索引
-        if os.path.exists(settings.faiss_index_path):
+        if query_service.ready:
             components["vector_index"] = "healthy"
+        elif os.path.exists(settings.faiss_index_path):
+            components["vector_index"] = "not_loaded"
         else:
             components["vector_index"] = "missing"
         
@@ -389,7 +431,10 @@ async def health_check():
 async def rebuild_index(force: bool = True):
     """重建向量索引"""
     try:
-        success = kb_manager.rebuild_index(force=force)
+        # 重建在后台线程执行，完成后原子替换常驻索引，进行中的查询继续使用旧索引
+        success = await query_service.reload(
+            lambda: kb_manager.index if kb_manager.rebuild_index(force=force) else None
+        )
         
         if not success:
             raise HTTPException(
@@ -412,6 +457,16 @@ async def rebuild_index(force: bool = True):
         )
 
 
+@app.get("/api/v1/system/metrics")
+async def get_metrics():
+    """索引加载、查询延迟与会话存储指标"""
+    return {
+        "timestamp": datetime.now().isoformat(),
+        **query_service.metrics(),
+        "sessions": await asyncio.to_thread(session_store.metrics)
+    }
+
+
 # 异常处理器
 @app.exception_handler(404)
 async def not_found_handler(request, exc):
@@ -15,6 +15,12 @@ from sklearn.metrics.pairwise import cosine_similarity
 import jieba
 import jieba.analyse
 
+from config import VECTOR_STORE_DIR, EMBEDDING_BATCH_SIZE
+from embedding import QwenEmbedding, check_embedding_dimensions
+from vector_index import VectorIndex
+from bm25_index import BM25Index, tokenize
+from graph_query import GraphQueryEngine
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
@@ -54,43 +60,6 @@ class GraphResult:
     confidence: float
     reasoning_path: List[str]
 
-class QwenEmbedding:
-    """通义千问文本嵌入服务"""
-    
-    def __init__(self, model_name="text-embedding-v3"):
-        self.model_name = model_name
-        
-    def encode(self, texts):
-        """编码文本为向量"""
-        if isinstance(texts, str):
-            texts = [texts]
-            
-        try:
-            from dashscope import TextEmbedding
-            
-            response = TextEmbedding.call(
-                model=self.model_name,
-                input=texts
-            )
-            
-            if response.status_code == 200:
-                embeddings = []
-                for output in response.output['embeddings']:
-                    embeddings.append(np.array(output['embedding']))
-                
-                return embeddings[0] if len(embeddings) == 1 else embeddings
-            else:
-                logger.error(f"通义千问embedding调用失败: {response}")
-                # 降级到本地模型
-                fallback_model = SentenceTransformer('all-MiniLM-L6-v2')
-                return fallback_model.encode(texts)
-                
-        except Exception as e:
-            logger.error(f"通义千问embedding异常: {e}")
-            # 降级到本地模型
-            fallback_model = SentenceTransformer('all-MiniLM-L6-v2')
-            return fallback_model.encode(texts)
-
 class ImprovedHybridRAGSystem:
     """
     改进的混合RAG系统
@@ -105,6 +74,12 @@ class ImprovedHybridRAGSystem:
     
     def __init__(self, neo4j_driver, llm_json, llm_text, use_qwen_embedding=True):
         self.driver = neo4j_driver
+        # 图谱查询：全文索引 + 按跳数批量查询 + 实体邻域缓存
+        self.graph_query = GraphQueryEngine(neo4j_driver)
+        try:
+            self.graph_query.ensure_indexes()
+        except Exception as e:
+            logger.error(f"全文索引创建失败: {e}")
         self.llm_json = llm_json  # 结构化输出
         self.llm_text = llm_text  # 文本生成
         
@@ -116,14 +91,12 @@ class ImprovedHybridRAGSystem:
             self.embedding_model = SentenceTransformer('all-MiniLM-L6-v2')
             logger.info("✅ 使用SentenceTransformer模型")
         
-        # 文档存储
+        # 文档存储，documents[i] 对应向量索引的第 i 行
         self.documents: List[Document] = []
+        self.vector_index = VectorIndex()
         
-        # 关键词索引
-        self.keyword_index = {
-            'terms': {},  # term -> [doc_indices]
-            'doc_terms': {}  # doc_id -> [terms]
-        }
+        # 关键词索引：BM25倒排索引，键为文档在 documents 中的下标
+        self.keyword_index = BM25Index()
         
         # 配置参数 - 降低阈值提升召回率
         self.config = {
@@ -139,16 +112,15 @@ class ImprovedHybridRAGSystem:
     def clear_vector_database(self):
         """清理向量数据库，删除所有文档和嵌入"""
         self.documents = []
-        self.keyword_index = {
-            'terms': {},  # term -> [doc_indices]
-            'doc_terms': {}  # doc_id -> [terms]
-        }
+        self.vector_index.clear()
+        self.keyword_index.clear()
         logger.info("✅ 向量数据库已清理")
     
     def clear_graph_database(self):
         """清理图数据库，删除所有节点和关系"""
         with self.driver.session() as session:
             session.run("MATCH (n) DETACH DELETE n")
+        self.graph_query.invalidate()
         logger.info("✅ 图数据库已清理")
     
     def clear_all_databases(self):
@@ -227,6 +199,17 @@ class ImprovedHybridRAGSystem:
     
     def add_documents(self, documents: List[Dict[str, Any]]):
         """添加文档到向量数据库"""
+        if not documents:
+            return
+        
+        # 批量生成向量：一次性提交所有文本，由嵌入服务负责分批、并发和缓存
+        embeddings = self.encode_texts([doc_data['content'] for doc_data in documents])
+        check_embedding_dimensions([doc_data['id'] for doc_data in documents], embeddings,
+                                   self.vector_index.dimension)
+        
+        # 向量一次性写入索引矩阵，不再在文档上保留一份副本
+        self.vector_index.add(np.stack(embeddings))
+        
         for doc_data in documents:
             # 创建文档对象
             doc = Document(
@@ -235,22 +218,22 @@ class ImprovedHybridRAGSystem:
                 metadata=doc_data['metadata']
             )
             
-            # 生成向量
-            doc.embedding = self.embedding_model.encode(doc.content)
-            
             # 提取关键词并建立索引
-            keywords = self.extract_keywords(doc.content)
-            self.keyword_index['doc_terms'][doc.id] = keywords
-            
-            for keyword in keywords:
-                if keyword not in self.keyword_index['terms']:
-                    self.keyword_index['terms'][keyword] = []
-                self.keyword_index['terms'][keyword].append(len(self.documents))
-            
+            self._index_keywords(doc, len(self.documents))
             self.documents.append(doc)
         
         logger.info(f"添加了 {len(documents)} 个文档到检索库")
     
+    def encode_texts(self, texts: List[str]) -> List[np.ndarray]:
+        """批量编码文本，兼容通义千问嵌入和SentenceTransformer"""
+        if hasattr(self.embedding_model, 'encode_batch'):
+            return self.embedding_model.encode_batch(texts)
+        return list(self.embedding_model.encode(texts, batch_size=EMBEDDING_BATCH_SIZE))
+    
+    def _index_keywords(self, doc: Document, doc_index: int):
+        """分词并写入BM25倒排索引"""
+        self.keyword_index.add(doc_index, tokenize(doc.content))
+    
     def vector_search(self, query: str, top_k: int = 10) -> List[RetrievalResult]:
         """
         改进的向量检索：使用更好的相似度计算
@@ -261,65 +244,66 @@ class ImprovedHybridRAGSystem:
         # 查询向量化
         query_embedding = self.embedding_model.encode(query)
         
-        # 计算相似度
-        doc_embeddings = np.array([doc.embedding for doc in self.documents])
-        similarities = cosine_similarity([query_embedding], doc_embeddings)[0]
-        
-        # 使用更低的阈值，提升召回率
-        results = []
-        for i, score in enumerate(similarities):
-            if score > self.config['confidence_threshold']:
-                results.append(RetrievalResult(
-                    document=self.documents[i],
-                    score=float(score),
-                    source='vector'
-                ))
-        
-        # 按分数排序
-        results.sort(key=lambda x: x.score, reverse=True)
+        # 在归一化矩阵上做内积，argpartition选出top_k，并使用更低的阈值提升召回率
+        hits = self.vector_index.search(query_embedding, top_k,
+                                        threshold=self.config['confidence_threshold'])
+        results = [
+            RetrievalResult(document=self.documents[i], score=score, source='vector')
+            for i, score in hits
+        ]
         logger.info(f"向量检索: {len(results)} 个结果")
-        return results[:top_k]
+        return results
+    
+    def save_vector_store(self, directory: str = VECTOR_STORE_DIR):
+        """保存文档和向量矩阵，重启后可直接加载而无需重新生成向量"""
+        os.makedirs(directory, exist_ok=True)
+        self.vector_index.save(os.path.join(directory, 'embeddings.npy'))
+        with open(os.path.join(directory, 'documents.json'), 'w', encoding='utf-8') as f:
+            json.dump([{'id': doc.id, 'content': doc.content, 'metadata': doc.metadata}
+                       for doc in self.documents], f, ensure_ascii=False)
+        logger.info(f"✅ 向量库已保存到 {directory}")
+    
+    def load_vector_store(self, directory: str = VECTOR_STORE_DIR) -> bool:
+        """加载向量库，向量矩阵以内存映射方式打开"""
+        embeddings_path = os.path.join(directory, 'embeddings.npy')
+        documents_path = os.path.join(directory, 'documents.json')
+        if not (os.path.exists(embeddings_path) and os.path.exists(documents_path)):
+            logger.warning(f"向量库不存在: {directory}")
+            return False
+        
+        with open(documents_path, 'r', encoding='utf-8') as f:
+            documents = json.load(f)
+        vector_index = VectorIndex.load(embeddings_path, mmap=True)
+        if len(vector_index) != len(documents):
+            logger.error(f"向量库文件不一致: {len(vector_index)} 个向量, {len(documents)} 个文档")
+            return False
+        
+        self.clear_vector_database()
+        self.vector_index = vector_index
+        for i, doc_data in enumerate(documents):
+            doc = Document(id=doc_data['id'], content=doc_data['content'], metadata=doc_data['metadata'])
+            # 关键词索引只依赖本地分词，直接重建
+            self._index_keywords(doc, i)
+            self.documents.append(doc)
+        
+        logger.info(f"✅ 从 {directory} 加载了 {len(self.documents)} 个文档")
+        return True
     
     def keyword_search(self, query: str, top_k: int = 10) -> List[RetrievalResult]:
         """
-        改进的关键词检索：使用jieba分词和更灵活的匹配
+        关键词检索：jieba分词 + BM25，只遍历查询词的倒排链
         """
         if not self.documents:
             return []
         
-        # 提取查询关键词
-        query_keywords = self.extract_keywords(query)
-        
-        results = []
-        for i, doc in enumerate(self.documents):
-            doc_keywords = self.keyword_index['doc_terms'].get(doc.id, [])
-            
-            # 计算关键词匹配度
-            if query_keywords and doc_keywords:
-                intersection = set(query_keywords).intersection(set(doc_keywords))
-                union = set(query_keywords).union(set(doc_keywords))
-                
-                if intersection:
-                    # Jaccard相似度
-                    jaccard_score = len(intersection) / len(union)
-                    
-                    # 考虑关键词在文档中的重要性
-                    importance_score = len(intersection) / len(query_keywords)
-                    
-                    # 综合分数
-                    final_score = (jaccard_score + importance_score) / 2
-                    
-                    if final_score > self.config['keyword_threshold']:
-                        results.append(RetrievalResult(
-                            document=doc,
-                            score=final_score,
-                            source='keyword'
-                        ))
-        
-        # 按分数排序
-        results.sort(key=lambda x: x.score, reverse=True)
+        hits = self.keyword_index.search(tokenize(query), top_k)
+        results = [
+            RetrievalResult(document=self.documents[i], score=score, source='keyword')
+            for i, score in hits
+            if score > self.config['keyword_threshold']
+        ]
         logger.info(f"关键词检索: {len(results)} 个结果")
-        return results[:top_k]
+        return results
     
     async def extract_entities_from_query(self, query: str) -> List[Entity]:
         """
@@ -367,43 +351,9 @@ class ImprovedHybridRAGSystem:
         
         entity_names = [e.name for e in entities]
         
-        # 构建更灵活的查询，支持模糊匹配
-        cypher_queries = []
-        
-        # 1. 直接关系查询
-        for entity in entity_names:
-            cypher_queries.append(f"""
-                MATCH (a)-[r]->(b)
-                WHERE a.name CONTAINS '{entity}' OR b.name CONTAINS '{entity}'
-                RETURN a.name as source, type(r) as relation, b.name as target, 1.0 as confidence
-            """)
-        
-        # 2. 多跳关系查询（2跳）
-        for entity in entity_names:
-            cypher_queries.append(f"""
-                MATCH (a)-[r1]->(b)-[r2]->(c)
-                WHERE a.name CONTAINS '{entity}' OR c.name CONTAINS '{entity}'
-                RETURN a.name as source, type(r1) + '->' + type(r2) as relation, c.name as target, 0.8 as confidence
-            """)
-        
-        all_relationships = []
-        reasoning_paths = []
-        
-        with self.driver.session() as session:
-            for cypher in cypher_queries:
-                try:
-                    result = session.run(cypher)
-                    for record in result:
-                        relationship = {
-                            'source': record['source'],
-                            'relation': record['relation'],
-                            'target': record['target'],
-                            'confidence': record['confidence']
-                        }
-                        all_relationships.append(relationship)
-                        reasoning_paths.append(f"{record['source']} -> {record['relation']} -> {record['target']}")
-                except Exception as e:
-                    logger.error(f"图谱查询失败: {e}")
+        # 每个跳数一条 UNWIND $entities 参数化查询，命中缓存的实体不再查询
+        neighborhoods = self.graph_query.neighborhoods(entity_names)
+        all_relationships = [rel for name in entity_names for rel in neighborhoods.get(name, [])]
         
         # 去重
         unique_relationships = []
@@ -413,6 +363,7 @@ class ImprovedHybridRAGSystem:
             if key not in seen:
                 seen.add(key)
                 unique_relationships.append(rel)
+        reasoning_paths = [f"{r['source']} -> {r['relation']} -> {r['target']}" for r in unique_relationships]
         
         # 计算整体置信度
         if unique_relationships:
@@ -434,7 +385,7 @@ class ImprovedHybridRAGSystem:
         测试向量相似度计算，用于调试和优化
         """
         query_embedding = self.embedding_model.encode(query)
-        doc_embeddings = [self.embedding_model.encode(doc) for doc in documents]
+        doc_embeddings = self.encode_texts(documents)
         
         similarities = []
         for i, doc_embedding in enumerate(doc_embeddings):
@@ -674,6 +625,7 @@ async def demo_improved():
     print("🔗 提取控股关系并构建知识图谱...")
     relationships = await system.extract_relationships_from_text(raw_text)
     await build_sample_graph_from_relationships(driver, relationships)
+    system.graph_query.invalidate()
     print(f"✅ 成功构建包含 {len(relationships)} 个关系的知识图谱")
     
     # 测试问题
@@ -0,0 +1,111 @@
+"""
+关键词检索性能对比
+在合成语料上比较原先的全量Jaccard扫描与BM25倒排索引的查询延迟
+
+用法:
+    python benchmark_keyword_search.py --docs 100000 --queries 50
+"""
+
+import argparse
+import random
+import statistics
+import time
+from typing import Dict, List, Set
+
+import numpy as np
+
+from bm25_index import BM25Index
+
+
+def build_corpus(num_docs: int, vocab_size: int, doc_length: int, seed: int) -> List[List[str]]:
+    """生成合成语料：词表为随机双字中文词，词频服从Zipf分布"""
+    rng = np.random.default_rng(seed)
+    chars = [chr(c) for c in range(0x4E00, 0x4E00 + 3000)]
+    vocab = list(dict.fromkeys(
+        chars[rng.integers(len(chars))] + chars[rng.integers(len(chars))] for _ in range(vocab_size * 2)
+    ))[:vocab_size]
+    ranks = np.arange(1, len(vocab) + 1)
+    probs = 1.0 / ranks
+    probs /= probs.sum()
+    ids = rng.choice(len(vocab), size=(num_docs, doc_length), p=probs)
+    return [[vocab[i] for i in row] for row in ids]
+
+
+def scan_search(doc_terms: List[Set[str]], query_terms: List[str], top_k: int, threshold: float = 0.1):
+    """原keyword_search的实现：逐文档计算Jaccard与重要性得分"""
+    query_set = set(query_terms)
+    results = []
+    for i, terms in enumerate(doc_terms):
+        intersection = query_set & terms
+        union = query_set | terms
+        jaccard_score = len(intersection) / len(union) if union else 0
+        importance_score = len(intersection) / len(query_set) if query_set else 0
+        final_score = (jaccard_score + importance_score) / 2
+        if final_score > threshold:
+            results.append((i, final_score))
+    results.sort(key=lambda x: x[1], reverse=True)
+    return results[:top_k]
+
+
+def measure(fn, queries) -> Dict[str, float]:
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        fn(query)
+        latencies.append((time.perf_counter() - start) * 1000)
+    latencies.sort()
+    return {
+        'mean_ms': statistics.mean(latencies),
+        'p50_ms': latencies[len(latencies) // 2],
+        'p95_ms': latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="关键词检索延迟对比")
+    parser.add_argument('--docs', type=int, default=100000)
+    parser.add_argument('--queries', type=int, default=50)
+    parser.add_argument('--vocab', type=int, default=20000)
+    parser.add_argument('--doc-length', type=int, default=40)
+    parser.add_argument('--top-k', type=int, default=10)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    print(f"生成合成语料: {args.docs} 个文档, 词表 {args.vocab}, 每篇 {args.doc_length} 词")
+    corpus = build_corpus(args.docs, args.vocab, args.doc_length, args.seed)
+
+    start = time.perf_counter()
+    doc_terms = [set(tokens) for tokens in corpus]
+    scan_build = time.perf_counter() - start
+
+    start = time.perf_counter()
+    index = BM25Index()
+    for i, tokens in enumerate(corpus):
+        index.add(i, tokens)
+    bm25_build = time.perf_counter() - start
+
+    # 查询从语料中抽取3~5个词，模拟用户输入
+    rnd = random.Random(args.seed)
+    queries = [rnd.sample(rnd.choice(corpus), rnd.randint(3, 5)) for _ in range(args.queries)]
+
+    scan_stats = measure(lambda q: scan_search(doc_terms, q, args.top_k), queries)
+    bm25_stats = measure(lambda q: index.search(q, args.top_k), queries)
+
+    # 增量更新：删除再添加1%的文档
+    updates = rnd.sample(range(args.docs), max(1, args.docs // 100))
+    start = time.perf_counter()
+    for i in updates:
+        index.remove(i)
+        index.add(i, corpus[i])
+    update_ms = (time.perf_counter() - start) * 1000 / len(updates)
+
+    print(f"\n构建耗时: 扫描集合 {scan_build:.2f}s, BM25倒排索引 {bm25_build:.2f}s")
+    print(f"{'方法':<12}{'mean(ms)':>12}{'p50(ms)':>12}{'p95(ms)':>12}")
+    for name, stats in (('全量扫描', scan_stats), ('BM25倒排', bm25_stats)):
+        print(f"{name:<12}{stats['mean_ms']:>12.2f}{stats['p50_ms']:>12.2f}{stats['p95_ms']:>12.2f}")
+    print(f"\n加速比(mean): {scan_stats['mean_ms'] / max(bm25_stats['mean_ms'], 1e-9):.1f}x")
+    print(f"增量更新: 平均 {update_ms:.3f} ms/文档")
+
+
+if __name__ == "__main__":
+    main()
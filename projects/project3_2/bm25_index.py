@@ -0,0 +1,130 @@
+"""
+关键词检索模块
+基于倒排索引的BM25稀疏检索，查询只访问查询词的倒排链
+"""
+
+import heapq
+import logging
+import math
+from collections import Counter
+from typing import Dict, Hashable, Iterable, List, Tuple
+
+import jieba
+
+from config import BM25_K1, BM25_B, KEYWORD_MIN_KEYWORD_LENGTH
+
+logger = logging.getLogger(__name__)
+
+
+def tokenize(text: str) -> List[str]:
+    """jieba分词，过滤过短的词和标点"""
+    return [
+        w.lower() for w in jieba.cut(text)
+        if len(w) >= KEYWORD_MIN_KEYWORD_LENGTH and w.isalnum()
+    ]
+
+
+class BM25Index:
+    """
+    可增量更新的BM25倒排索引
+
+    - postings: term -> {doc_key: tf}
+    - 新增、删除文档只修改该文档涉及的倒排链
+    - 查询累加查询词倒排链上的分数，用堆取top-k
+    """
+
+    def __init__(self, k1: float = BM25_K1, b: float = BM25_B):
+        self.k1 = k1
+        self.b = b
+        self.postings: Dict[str, Dict[Hashable, int]] = {}
+        self.doc_lengths: Dict[Hashable, int] = {}
+        self.doc_terms: Dict[Hashable, Counter] = {}
+        self.total_length = 0
+
+    def __len__(self) -> int:
+        return len(self.doc_lengths)
+
+    def __contains__(self, doc_key) -> bool:
+        return doc_key in self.doc_lengths
+
+    @property
+    def avg_doc_length(self) -> float:
+        return self.total_length / len(self.doc_lengths) if self.doc_lengths else 0.0
+
+    def clear(self):
+        self.postings = {}
+        self.doc_lengths = {}
+        self.doc_terms = {}
+        self.total_length = 0
+
+    def add(self, doc_key: Hashable, tokens: Iterable[str]):
+        """添加文档，doc_key已存在时先删除旧内容"""
+        if doc_key in self.doc_lengths:
+            self.remove(doc_key)
+        term_freqs = Counter(tokens)
+        length = sum(term_freqs.values())
+        for term, tf in term_freqs.items():
+            self.postings.setdefault(term, {})[doc_key] = tf
+        self.doc_terms[doc_key] = term_freqs
+        self.doc_lengths[doc_key] = length
+        self.total_length += length
+
+    def remove(self, doc_key: Hashable) -> bool:
+        """删除文档，返回是否存在"""
+        term_freqs = self.doc_terms.pop(doc_key, None)
+        if term_freqs is None:
+            return False
+        for term in term_freqs:
+            posting = self.postings.get(term)
+            if posting is None:
+                continue
+            posting.pop(doc_key, None)
+            if not posting:
+                del self.postings[term]
+        self.total_length -= self.doc_lengths.pop(doc_key)
+        return True
+
+    def idf(self, term: str) -> float:
+        df = len(self.postings.get(term, ()))
+        n = len(self.doc_lengths)
+        return math.log(1 + (n - df + 0.5) / (df + 0.5))
+
+    def search(self, query_tokens: Iterable[str], top_k: int = 10,
+               normalize: bool = True) -> List[Tuple[Hashable, float]]:
+        """
+        BM25检索
+
+        Args:
+            query_tokens: 查询分词结果，重复的词只计一次
+            top_k: 返回结果数量
+            normalize: 是否把分数除以查询的理论上限，归一化到[0, 1)，
+                便于和向量检索分数加权融合
+
+        Returns:
+            [(doc_key, score)]，按分数降序
+        """
+        if not self.doc_lengths or top_k <= 0:
+            return []
+        terms = [t for t in dict.fromkeys(query_tokens) if t in self.postings]
+        if not terms:
+            return []
+
+        k1 = self.k1
+        avgdl = self.avg_doc_length or 1.0
+        # norm = k1 * (1 - b + b * dl / avgdl) = base + scale * dl
+        base = k1 * (1 - self.b)
+        scale = k1 * self.b / avgdl
+        doc_lengths = self.doc_lengths
+        scores: Dict[Hashable, float] = {}
+        get_score = scores.get
+        upper_bound = 0.0
+        for term in terms:
+            weight = self.idf(term) * (k1 + 1)
+            upper_bound += weight
+            for doc_key, tf in self.postings[term].items():
+                scores[doc_key] = get_score(doc_key, 0.0) + weight * tf / (tf + base + scale * doc_lengths[doc_key])
+
+        hits = heapq.nlargest(top_k, scores.items(), key=lambda item: item[1])
+        if normalize and upper_bound > 0:
+            hits = [(doc_key, score / upper_bound) for doc_key, score in hits]
+        return hits
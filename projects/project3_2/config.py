@@ -23,6 +23,16 @@ ERROR_PROPAGATION_THRESHOLD = 0.3
 EMBEDDING_MODEL_NAME = "text-embedding-v3"
 FALLBACK_EMBEDDING_MODEL = 'all-MiniLM-L6-v2'
 EMBEDDING_DIMENSION = 1536
+EMBEDDING_BATCH_SIZE = 10  # text-embedding-v3 单次请求最多10条
+EMBEDDING_MAX_CONCURRENCY = 4
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "./vector_store/embedding_cache.db")
+
+# 向量索引配置
+VECTOR_INDEX_INITIAL_CAPACITY = 1024
+VECTOR_INDEX_FAISS_THRESHOLD = 50000  # 文档数超过该值且安装了faiss时使用HNSW
+VECTOR_INDEX_HNSW_M = 32
+VECTOR_INDEX_HNSW_EF_SEARCH = 64
+VECTOR_STORE_DIR = os.getenv("VECTOR_STORE_DIR", "./vector_store")
 
 # Neo4j配置
 NEO4J_URI = "bolt://localhost:7687"
@@ -44,6 +54,8 @@ RETRIEVAL_GRAPH_WEIGHT = 0.2
 KEYWORD_THRESHOLD = 0.1
 KEYWORD_MAX_KEYWORDS = 10
 KEYWORD_MIN_KEYWORD_LENGTH = 2
+BM25_K1 = 1.5
+BM25_B = 0.75
 
 # 文档配置
 DOCUMENT_MIN_LENGTH = 10
@@ -55,6 +67,11 @@ GRAPH_MAX_DEPTH = 3
 GRAPH_MAX_HOPS = 3
 GRAPH_MIN_CONFIDENCE = 0.2
 GRAPH_MAX_RELATIONSHIPS = 50
+GRAPH_NAME_INDEX = "entity_name_fulltext"
+GRAPH_NAME_INDEX_LABELS = ["Company", "Person"]
+GRAPH_CANDIDATE_LIMIT = 20  # 每个实体最多从全文索引召回的候选节点数
+GRAPH_CACHE_TTL = 300  # 实体邻域缓存时间（秒）
+GRAPH_CACHE_SIZE = 10000
 
 # 答案生成配置
 ANSWER_MAX_TOKENS = 1000
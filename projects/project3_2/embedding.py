@@ -1,47 +1,218 @@
+import hashlib
 import logging
-import numpy as np
 import os
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+import numpy as np
 import dashscope
 from sentence_transformers import SentenceTransformer
 
+from config import (
+    FALLBACK_EMBEDDING_MODEL,
+    EMBEDDING_BATCH_SIZE,
+    EMBEDDING_MAX_CONCURRENCY,
+    EMBEDDING_CACHE_PATH,
+)
+
 logger = logging.getLogger(__name__)
 
 # 设置通义千问API密钥
 dashscope.api_key = os.getenv("DASHSCOPE_API_KEY", "your-api-key-here")
 
+_fallback_models: Dict[str, SentenceTransformer] = {}
+_fallback_lock = threading.Lock()
+
+
+def get_fallback_model(model_name: str = FALLBACK_EMBEDDING_MODEL) -> SentenceTransformer:
+    """本地降级模型只加载一次，之后复用"""
+    model = _fallback_models.get(model_name)
+    if model is None:
+        with _fallback_lock:
+            model = _fallback_models.get(model_name)
+            if model is None:
+                logger.info(f"加载本地降级embedding模型: {model_name}")
+                model = SentenceTransformer(model_name)
+                _fallback_models[model_name] = model
+    return model
+
+
+class EmbeddingCache:
+    """持久化的向量缓存，键为 (模型名, 文本sha256)"""
+
+    def __init__(self, db_path: str = EMBEDDING_CACHE_PATH):
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS embeddings (
+                model TEXT NOT NULL,
+                text_hash TEXT NOT NULL,
+                dim INTEGER NOT NULL,
+                vector BLOB NOT NULL,
+                PRIMARY KEY (model, text_hash)
+            )
+        """)
+        self._conn.commit()
+
+    @staticmethod
+    def text_hash(text: str) -> str:
+        return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+    def get_many(self, model: str, texts: List[str]) -> Dict[str, np.ndarray]:
+        """返回 文本hash -> 向量，未命中的不在结果中"""
+        hashes = list({self.text_hash(t) for t in texts})
+        found = {}
+        with self._lock:
+            # 分批查询，避免超过SQLite的参数个数限制
+            for i in range(0, len(hashes), 500):
+                chunk = hashes[i:i + 500]
+                placeholders = ','.join('?' * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT text_hash, vector FROM embeddings WHERE model = ? AND text_hash IN ({placeholders})",
+                    [model] + chunk
+                ).fetchall()
+                for text_hash, blob in rows:
+                    found[text_hash] = np.frombuffer(blob, dtype=np.float32)
+        return found
+
+    def put_many(self, model: str, items: Dict[str, np.ndarray]):
+        """items: 文本 -> 向量"""
+        if not items:
+            return
+        rows = [
+            (model, self.text_hash(text), int(vec.shape[-1]), np.asarray(vec, dtype=np.float32).tobytes())
+            for text, vec in items.items()
+        ]
+        with self._lock:
+            self._conn.executemany("INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?, ?)", rows)
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
 class QwenEmbedding:
     """通义千问文本嵌入服务"""
-    
-    def __init__(self, model_name="text-embedding-v3"):
+
+    def __init__(self, model_name="text-embedding-v3", batch_size: int = EMBEDDING_BATCH_SIZE,
+                 max_concurrency: int = EMBEDDING_MAX_CONCURRENCY,
+                 cache: Optional[EmbeddingCache] = None, use_cache: bool = True):
         self.model_name = model_name
-        
+        self.batch_size = batch_size
+        self.max_concurrency = max(1, max_concurrency)
+        self.cache = cache if cache is not None else (EmbeddingCache() if use_cache else None)
+        # 最近一次encode_batch中使用降级模型的文本数
+        self.last_fallback_count = 0
+
     def encode(self, texts):
         """编码文本为向量"""
         if isinstance(texts, str):
             texts = [texts]
-            
+        embeddings = self.encode_batch(texts)
+        return embeddings[0] if len(embeddings) == 1 else embeddings
+
+    def encode_batch(self, texts: List[str]) -> List[np.ndarray]:
+        """
+        批量编码文本
+
+        - 先查持久化缓存，只对未命中的文本调用API
+        - 未命中的文本按batch_size分批，最多max_concurrency个请求并发
+        - 某一批调用失败时该批使用本地降级模型，降级结果按降级模型名单独缓存
+
+        Returns:
+            与texts一一对应的向量列表；降级模型的维度可能与主模型不同，调用方需检查
+        """
+        self.last_fallback_count = 0
+        if not texts:
+            return []
+
+        results: Dict[str, np.ndarray] = {}
+        if self.cache is not None:
+            cached = self.cache.get_many(self.model_name, texts)
+            for text in texts:
+                vec = cached.get(EmbeddingCache.text_hash(text))
+                if vec is not None:
+                    results[text] = vec
+
+        pending = list(dict.fromkeys(t for t in texts if t not in results))
+        if pending:
+            batches = [pending[i:i + self.batch_size] for i in range(0, len(pending), self.batch_size)]
+            if len(batches) == 1 or self.max_concurrency == 1:
+                outputs = [self._encode_remote(batch) for batch in batches]
+            else:
+                with ThreadPoolExecutor(max_workers=min(self.max_concurrency, len(batches))) as executor:
+                    outputs = list(executor.map(self._encode_remote, batches))
+
+            for batch, (vectors, model_used) in zip(batches, outputs):
+                batch_results = dict(zip(batch, vectors))
+                results.update(batch_results)
+                if model_used != self.model_name:
+                    self.last_fallback_count += len(batch)
+                if self.cache is not None:
+                    self.cache.put_many(model_used, batch_results)
+
+        logger.info(f"embedding: {len(texts)} 条文本, 缓存命中 {len(texts) - len(pending)} 条, "
+                    f"请求 {len(pending)} 条, 降级 {self.last_fallback_count} 条")
+        return [results[text] for text in texts]
+
+    def _encode_remote(self, texts: List[str]):
+        """调用通义千问接口编码一批文本，返回 (向量列表, 实际使用的模型名)"""
         try:
             from dashscope import TextEmbedding
-            
+
             response = TextEmbedding.call(
                 model=self.model_name,
                 input=texts
             )
-            
+
             if response.status_code == 200:
-                embeddings = []
-                for output in response.output['embeddings']:
-                    embeddings.append(np.array(output['embedding']))
-                
-                return embeddings[0] if len(embeddings) == 1 else embeddings
+                embeddings = [None] * len(texts)
+                for i, output in enumerate(response.output['embeddings']):
+                    embeddings[output.get('text_index', i)] = np.array(output['embedding'], dtype=np.float32)
+                if all(e is not None for e in embeddings):
+                    return embeddings, self.model_name
+                logger.error("通义千问embedding返回结果数量与输入不一致")
             else:
                 logger.error(f"通义千问embedding调用失败: {response}")
-                # 降级到本地模型
-                fallback_model = SentenceTransformer('all-MiniLM-L6-v2')
-                return fallback_model.encode(texts)
-                
+
         except Exception as e:
             logger.error(f"通义千问embedding异常: {e}")
-            # 降级到本地模型
-            fallback_model = SentenceTransformer('all-MiniLM-L6-v2')
-            return fallback_model.encode(texts)
\ No newline at end of file
+
+        # 降级到本地模型
+        fallback_model = get_fallback_model()
+        vectors = fallback_model.encode(texts, batch_size=self.batch_size)
+        return [np.asarray(v, dtype=np.float32) for v in vectors], FALLBACK_EMBEDDING_MODEL
+
+
+def check_embedding_dimensions(doc_ids: List[str], embeddings: List[np.ndarray],
+                               index_dimension: Optional[int] = None):
+    """
+    检查向量维度是否一致
+
+    主模型调用失败时部分批次会降级到本地模型，维度不同的向量不能混入同一个索引，
+    这里报告各维度对应的文档并拒绝写入，而不是静默合并
+    """
+    dims = {}
+    for doc_id, embedding in zip(doc_ids, embeddings):
+        dims.setdefault(int(np.shape(embedding)[-1]), []).append(doc_id)
+    if index_dimension is not None:
+        dims.setdefault(index_dimension, [])
+    if len(dims) > 1:
+        parts = []
+        for dim, ids in dims.items():
+            part = f"{dim}维 {len(ids)} 个新文档"
+            if ids:
+                part += f"(如 {', '.join(ids[:3])})"
+            if dim == index_dimension:
+                part += "，与已入库向量一致"
+            parts.append(part)
+        summary = "; ".join(parts)
+        logger.error(f"向量维度不一致，可能是部分批次降级到了本地模型: {summary}")
+        raise ValueError(f"向量维度不一致: {summary}")
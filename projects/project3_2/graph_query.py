@@ -0,0 +1,154 @@
+"""
+图谱查询模块
+基于全文索引定位实体节点，每个跳数只发一条参数化的 UNWIND 查询，
+并按实体缓存邻域结果
+"""
+
+import logging
+import re
+import threading
+from typing import Dict, List
+
+from cachetools import TTLCache
+
+from config import (
+    GRAPH_NAME_INDEX,
+    GRAPH_NAME_INDEX_LABELS,
+    GRAPH_CANDIDATE_LIMIT,
+    GRAPH_MAX_RELATIONSHIPS,
+    GRAPH_MIN_CONFIDENCE,
+    GRAPH_CACHE_TTL,
+    GRAPH_CACHE_SIZE,
+)
+
+logger = logging.getLogger(__name__)
+
+# Lucene查询语法中的特殊字符
+_LUCENE_SPECIAL = re.compile(r'([+\-&|!(){}\[\]^"~*?:\\/])')
+
+
+def fulltext_phrase(text: str) -> str:
+    """把实体名转成全文索引的短语查询，避免特殊字符被当成查询语法"""
+    return '"' + _LUCENE_SPECIAL.sub(r'\\\1', text) + '"'
+
+
+def hop_confidence(hops: int) -> float:
+    """1跳置信度为1.0，之后每多一跳降低0.2"""
+    return max(GRAPH_MIN_CONFIDENCE, 1.0 - 0.2 * (hops - 1))
+
+
+def _neighborhood_query(hops: int) -> str:
+    # 全文索引只负责召回候选节点，再用CONTAINS保证与原先的子串匹配语义一致；
+    # 以实体节点为起点或终点的路径都返回，每个实体最多返回 $limit 条
+    return f"""
+        UNWIND $entities AS entity
+        CALL db.index.fulltext.queryNodes($index_name, entity.query, {{limit: $candidate_limit}})
+        YIELD node
+        WITH entity, node
+        WHERE node.name CONTAINS entity.name
+        CALL {{
+            WITH node
+            CALL {{
+                WITH node
+                MATCH p = (node)-[*{hops}]->()
+                RETURN p
+                UNION
+                WITH node
+                MATCH p = ()-[*{hops}]->(node)
+                RETURN p
+            }}
+            RETURN p LIMIT $limit
+        }}
+        RETURN entity.name AS entity,
+               nodes(p)[0].name AS source,
+               [r IN relationships(p) | type(r)] AS relations,
+               nodes(p)[-1].name AS target
+    """
+
+
+class GraphQueryEngine:
+    """
+    图谱邻域查询
+
+    - ensure_indexes 在启动时创建 name 的全文索引
+    - neighborhoods 对缓存未命中的实体，每个跳数执行一条 UNWIND $entities 查询
+    - 查询结果逐条流式消费，不整体物化
+    """
+
+    def __init__(self, driver, max_hops: int = 2,
+                 cache_ttl: float = GRAPH_CACHE_TTL, cache_size: int = GRAPH_CACHE_SIZE):
+        self.driver = driver
+        self.max_hops = max_hops
+        self._cache = TTLCache(maxsize=cache_size, ttl=cache_ttl)
+        self._lock = threading.Lock()
+
+    def ensure_indexes(self):
+        """创建 name 属性的全文索引，已存在时忽略"""
+        labels = '|'.join(GRAPH_NAME_INDEX_LABELS)
+        with self.driver.session() as session:
+            session.run(
+                f"CREATE FULLTEXT INDEX {GRAPH_NAME_INDEX} IF NOT EXISTS "
+                f"FOR (n:{labels}) ON EACH [n.name]"
+            ).consume()
+        logger.info(f"✅ 全文索引已就绪: {GRAPH_NAME_INDEX} ({labels})")
+
+    def invalidate(self, entities: List[str] = None):
+        """图谱发生变化后清理缓存，entities为空时全部清理"""
+        with self._lock:
+            if entities is None:
+                self._cache.clear()
+                return
+            for key in [k for k in self._cache.keys() if k[0] in entities]:
+                self._cache.pop(key, None)
+
+    def neighborhoods(self, entity_names: List[str]) -> Dict[str, List[Dict]]:
+        """
+        查询实体的多跳邻域
+
+        Returns:
+            实体名 -> [{'source', 'relation', 'target', 'confidence'}]
+        """
+        entity_names = list(dict.fromkeys(entity_names))
+        results: Dict[str, List[Dict]] = {name: [] for name in entity_names}
+
+        with self.driver.session() as session:
+            for hops in range(1, self.max_hops + 1):
+                missing = []
+                with self._lock:
+                    for name in entity_names:
+                        cached = self._cache.get((name, hops))
+                        if cached is None:
+                            missing.append(name)
+                        else:
+                            results[name].extend(cached)
+                if not missing:
+                    continue
+
+                fetched = {name: [] for name in missing}
+                confidence = hop_confidence(hops)
+                try:
+                    records = session.run(
+                        _neighborhood_query(hops),
+                        entities=[{'name': name, 'query': fulltext_phrase(name)} for name in missing],
+                        index_name=GRAPH_NAME_INDEX,
+                        candidate_limit=GRAPH_CANDIDATE_LIMIT,
+                        limit=GRAPH_MAX_RELATIONSHIPS,
+                    )
+                    for record in records:
+                        fetched[record['entity']].append({
+                            'source': record['source'],
+                            'relation': '->'.join(record['relations']),
+                            'target': record['target'],
+                            'confidence': confidence
+                        })
+                except Exception as e:
+                    logger.error(f"图谱查询失败({hops}跳): {e}")
+                    continue
+
+                with self._lock:
+                    for name, relationships in fetched.items():
+                        self._cache[(name, hops)] = relationships
+                for name, relationships in fetched.items():
+                    results[name].extend(relationships)
+
+        return results
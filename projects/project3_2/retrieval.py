@@ -12,23 +12,57 @@ from config import *
 from models import Document, RetrievalResult, GraphResult
 from embedding import EmbeddingManager
 from graph_reasoning import Neo4jManager
+from bm25_index import BM25Index, tokenize
 
 
 class HybridRetrievalSystem:
     """混合检索系统"""
     
-    def __init__(self, embedding_manager: EmbeddingManager, neo4j_manager: Neo4jManager):
+    def __init__(self, embedding_manager: EmbeddingManager, neo4j_manager: Neo4jManager,
+                 keyword_index: Optional[BM25Index] = None):
         """
         初始化混合检索系统
         
         Args:
             embedding_manager: 嵌入管理器
             neo4j_manager: Neo4j管理器
+            keyword_index: BM25倒排索引，为空时新建
         """
         self.embedding_manager = embedding_manager
         self.neo4j_manager = neo4j_manager
+        self.keyword_index = keyword_index or BM25Index()
+        self.documents: Dict[str, Document] = {}
         self.logger = logging.getLogger(__name__)
     
+    def add_documents(self, documents: List[Document]):
+        """
+        将文档加入关键词倒排索引，已存在的文档id会被覆盖
+        
+        Args:
+            documents: 文档列表
+        """
+        for doc in documents:
+            self.documents[doc.id] = doc
+            self.keyword_index.add(doc.id, tokenize(doc.content))
+        self.logger.info(f"关键词索引新增 {len(documents)} 个文档, 共 {len(self.keyword_index)} 个")
+    
+    def remove_documents(self, doc_ids: List[str]) -> int:
+        """
+        从关键词倒排索引删除文档
+        
+        Args:
+            doc_ids: 文档id列表
+            
+        Returns:
+            实际删除的文档数量
+        """
+        removed = 0
+        for doc_id in doc_ids:
+            if self.keyword_index.remove(doc_id):
+                removed += 1
+            self.documents.pop(doc_id, None)
+        return removed
+    
     def vector_search(self, query: str, top_k: int = RETRIEVAL_TOP_K) -> List[RetrievalResult]:
         """
         向量检索
@@ -60,9 +94,18 @@ class HybridRetrievalSystem:
             检索结果列表
         """
         try:
-            results = self.embedding_manager.keyword_search(query, top_k)
-            # EmbeddingManager已经返回RetrievalResult对象，直接返回
-            return results
+            if len(self.keyword_index) == 0:
+                results = self.embedding_manager.keyword_search(query, top_k)
+                # EmbeddingManager已经返回RetrievalResult对象，直接返回
+                return results
+            
+            # BM25只遍历查询词的倒排链，用堆取top_k
+            hits = self.keyword_index.search(tokenize(query), top_k)
+            return [
+                RetrievalResult(document=self.documents[doc_id], score=score, source='keyword')
+                for doc_id, score in hits
+                if score > KEYWORD_THRESHOLD
+            ]
         except Exception as e:
             self.logger.error(f"关键词检索失败: {e}")
             return []
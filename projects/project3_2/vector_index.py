@@ -0,0 +1,212 @@
+"""
+向量索引模块
+用一块连续的float32矩阵保存所有文档向量，支持原地追加、top-k检索、
+FAISS(HNSW)加速以及基于内存映射.npy文件的持久化
+"""
+
+import logging
+import os
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+try:
+    import faiss
+except ImportError:  # faiss为可选依赖
+    faiss = None
+
+from config import (
+    VECTOR_INDEX_INITIAL_CAPACITY,
+    VECTOR_INDEX_FAISS_THRESHOLD,
+    VECTOR_INDEX_HNSW_M,
+    VECTOR_INDEX_HNSW_EF_SEARCH,
+)
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_vectors(vectors: np.ndarray) -> np.ndarray:
+    """按行做L2归一化，零向量保持不变"""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if vectors.ndim == 1:
+        vectors = vectors.reshape(1, -1)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+class VectorIndex:
+    """
+    文档向量索引
+
+    - 向量在写入时归一化，余弦相似度即为内积
+    - 预分配矩阵，容量不足时按倍数扩容，add只做一次切片赋值
+    - top-k通过argpartition选出，只对k个结果排序
+    - 文档数超过faiss_threshold且安装了faiss时，改用HNSW近似检索
+    """
+
+    def __init__(self, dimension: Optional[int] = None,
+                 initial_capacity: int = VECTOR_INDEX_INITIAL_CAPACITY,
+                 faiss_threshold: Optional[int] = VECTOR_INDEX_FAISS_THRESHOLD):
+        self.dimension = dimension
+        self.initial_capacity = max(1, initial_capacity)
+        self.faiss_threshold = faiss_threshold
+        self._matrix: Optional[np.ndarray] = None
+        self._size = 0
+        self._faiss_index = None
+        self._faiss_size = 0
+        if dimension is not None:
+            self._matrix = np.zeros((self.initial_capacity, dimension), dtype=np.float32)
+
+    def __len__(self) -> int:
+        return self._size
+
+    @property
+    def vectors(self) -> np.ndarray:
+        """当前有效的向量矩阵（只读视图）"""
+        if self._matrix is None:
+            return np.zeros((0, self.dimension or 0), dtype=np.float32)
+        view = self._matrix[:self._size]
+        view.flags.writeable = False
+        return view
+
+    def _ensure_capacity(self, required: int):
+        capacity = 0 if self._matrix is None else self._matrix.shape[0]
+        # 从mmap加载的矩阵是只读的，第一次追加时复制到可写内存
+        writable = self._matrix is not None and self._matrix.flags.writeable \
+            and not isinstance(self._matrix, np.memmap)
+        if required <= capacity and writable:
+            return
+        new_capacity = max(capacity, self.initial_capacity)
+        while new_capacity < required:
+            new_capacity *= 2
+        new_matrix = np.zeros((new_capacity, self.dimension), dtype=np.float32)
+        if self._size:
+            new_matrix[:self._size] = self._matrix[:self._size]
+        self._matrix = new_matrix
+
+    def add(self, vectors) -> List[int]:
+        """
+        追加向量
+
+        Args:
+            vectors: 单个向量或 (n, dim) 矩阵
+
+        Returns:
+            新向量对应的行号列表
+        """
+        vectors = normalize_vectors(vectors)
+        if self.dimension is None:
+            self.dimension = vectors.shape[1]
+        elif vectors.shape[1] != self.dimension:
+            raise ValueError(f"向量维度不一致: 索引为{self.dimension}维, 新向量为{vectors.shape[1]}维")
+
+        start = self._size
+        self._ensure_capacity(start + len(vectors))
+        self._matrix[start:start + len(vectors)] = vectors
+        self._size += len(vectors)
+        return list(range(start, self._size))
+
+    def clear(self):
+        """清空索引，保留维度信息"""
+        self._matrix = None
+        self._size = 0
+        self._faiss_index = None
+        self._faiss_size = 0
+        if self.dimension is not None:
+            self._matrix = np.zeros((self.initial_capacity, self.dimension), dtype=np.float32)
+
+    def _use_faiss(self) -> bool:
+        return faiss is not None and self.faiss_threshold is not None and self._size >= self.faiss_threshold
+
+    def _sync_faiss(self):
+        """HNSW索引只追加新增的向量"""
+        if self._faiss_index is None:
+            self._faiss_index = faiss.IndexHNSWFlat(self.dimension, VECTOR_INDEX_HNSW_M,
+                                                    faiss.METRIC_INNER_PRODUCT)
+            self._faiss_index.hnsw.efSearch = VECTOR_INDEX_HNSW_EF_SEARCH
+            self._faiss_size = 0
+            logger.info(f"向量数达到{self._size}，启用FAISS HNSW索引")
+        if self._faiss_size < self._size:
+            self._faiss_index.add(np.ascontiguousarray(self._matrix[self._faiss_size:self._size]))
+            self._faiss_size = self._size
+
+    def search(self, query_vector, top_k: int = 10,
+               threshold: Optional[float] = None) -> List[Tuple[int, float]]:
+        """
+        检索与查询向量最相似的top_k个向量
+
+        Args:
+            query_vector: 查询向量（不要求已归一化）
+            top_k: 返回结果数量
+            threshold: 相似度阈值，只返回分数大于阈值的结果
+
+        Returns:
+            [(行号, 余弦相似度)]，按分数降序
+        """
+        if self._size == 0 or top_k <= 0:
+            return []
+        query = normalize_vectors(query_vector)
+        if query.shape[1] != self.dimension:
+            raise ValueError(f"查询向量维度不一致: 索引为{self.dimension}维, 查询为{query.shape[1]}维")
+        k = min(top_k, self._size)
+
+        if self._use_faiss():
+            self._sync_faiss()
+            scores, indices = self._faiss_index.search(query, k)
+            hits = [(int(i), float(s)) for i, s in zip(indices[0], scores[0]) if i >= 0]
+        else:
+            scores = self._matrix[:self._size] @ query[0]
+            if k < self._size:
+                candidates = np.argpartition(-scores, k - 1)[:k]
+            else:
+                candidates = np.arange(self._size)
+            candidates = candidates[np.argsort(-scores[candidates])]
+            hits = [(int(i), float(scores[i])) for i in candidates]
+
+        if threshold is not None:
+            hits = [(i, s) for i, s in hits if s > threshold]
+        return hits
+
+    def save(self, path: str):
+        """
+        保存为.npy文件，只写入有效行
+
+        先写入临时文件再原子替换：load(mmap=True)后矩阵是目标文件的内存映射，
+        直接np.save会截断正在被读取的文件
+        """
+        if not path.endswith('.npy'):
+            path += '.npy'  # 与np.save的命名规则保持一致
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        try:
+            with open(tmp_path, 'wb') as f:
+                np.save(f, self.vectors)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        logger.info(f"向量索引已保存: {path} ({self._size}条)")
+
+    @classmethod
+    def load(cls, path: str, mmap: bool = True,
+             initial_capacity: int = VECTOR_INDEX_INITIAL_CAPACITY,
+             faiss_threshold: Optional[int] = VECTOR_INDEX_FAISS_THRESHOLD) -> "VectorIndex":
+        """
+        从.npy文件加载索引
+
+        mmap=True时以只读内存映射方式打开，启动时不需要把整个矩阵读入内存，
+        第一次追加向量时才复制到可写矩阵
+        """
+        matrix = np.load(path, mmap_mode='r' if mmap else None)
+        if matrix.ndim != 2:
+            raise ValueError(f"向量文件格式错误: {path}")
+        index = cls(dimension=None, initial_capacity=initial_capacity, faiss_threshold=faiss_threshold)
+        index.dimension = matrix.shape[1]
+        index._matrix = matrix if mmap else np.ascontiguousarray(matrix, dtype=np.float32)
+        index._size = matrix.shape[0]
+        logger.info(f"向量索引已加载: {path} ({index._size}条, {index.dimension}维)")
+        return index
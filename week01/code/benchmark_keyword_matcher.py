@@ -0,0 +1,88 @@
+"""
+关键词匹配性能对比
+逐个关键词 `keyword in text` 与 Aho-Corasick 匹配器（KeywordMatcher）在关键词规模扩大时的单条消息耗时
+"""
+
+import random
+import time
+
+from medical_intent_recognition import KeywordMatcher, MedicalIntentRecognizer
+
+# 用于生成合成关键词和消息的常用医疗汉字
+CHARS = "头痛疼发热烧咳嗽痰腹胃肚胸闷心呼吸困难气短恶呕吐皮疹红痒过敏关节失眠睡眠血压糖尿病肝肾肺炎感冒流涕鼻塞喉咙耳眼视力模糊麻木乏力出汗"
+FILLER = "我今天昨天有点很一直觉得还是最近两天晚上早上孩子老人，。？"
+SIZES = [100, 1000, 10000, 50000]
+
+
+def synthetic_keywords(n: int, rnd: random.Random) -> list:
+    """生成n个不重复的2-4字关键词，包含识别器中的真实关键词"""
+    recognizer = MedicalIntentRecognizer()
+    keywords = {kw for kws in recognizer.symptom_keywords.values() for kw in kws}
+    keywords.update(recognizer.emergency_keywords)
+    while len(keywords) < n:
+        keywords.add("".join(rnd.choice(CHARS) for _ in range(rnd.randint(2, 4))))
+    return list(keywords)[:n]
+
+
+def synthetic_messages(n: int, keywords: list, rnd: random.Random) -> list:
+    """生成n条20-60字的消息，每条包含若干关键词"""
+    messages = []
+    for _ in range(n):
+        parts = []
+        length = rnd.randint(20, 60)
+        while sum(map(len, parts)) < length:
+            parts.append(rnd.choice(keywords) if rnd.random() < 0.2 else rnd.choice(FILLER))
+        messages.append("".join(parts))
+    return messages
+
+
+def naive_match(keywords: list, text: str) -> set:
+    return {kw for kw in keywords if kw in text}
+
+
+def timed(fn, messages: list) -> float:
+    """返回单条消息平均耗时（微秒）"""
+    start = time.perf_counter()
+    for message in messages:
+        fn(message)
+    return (time.perf_counter() - start) / len(messages) * 1e6
+
+
+def main():
+    rnd = random.Random(42)
+    print("=" * 78)
+    print("关键词匹配性能对比（单条消息平均耗时）")
+    print("=" * 78)
+    print(f"{'关键词数':>10}{'自动机状态数':>14}{'构建(ms)':>12}{'逐个in(μs)':>14}{'AC(μs)':>12}{'AC批量(μs)':>14}")
+    print("-" * 78)
+
+    for size in SIZES:
+        keywords = synthetic_keywords(size, rnd)
+        messages = synthetic_messages(2000, keywords, rnd)
+
+        start = time.perf_counter()
+        matcher = KeywordMatcher()
+        for keyword in keywords:
+            matcher.add(keyword, keyword)
+        matcher.build()
+        build_ms = (time.perf_counter() - start) * 1000
+
+        # 两种方式的匹配结果必须一致
+        for message in messages[:200]:
+            assert matcher.match(message) == naive_match(keywords, message)
+
+        # 逐个in随关键词数线性增长，大规模时只取部分消息计时
+        naive_us = timed(lambda text: naive_match(keywords, text), messages[:max(20, 200000 // size)])
+        ac_us = timed(matcher.match, messages)
+        start = time.perf_counter()
+        matcher.match_batch(messages)
+        batch_us = (time.perf_counter() - start) / len(messages) * 1e6
+
+        print(f"{size:>10}{len(matcher):>14}{build_ms:>12.1f}{naive_us:>14.1f}{ac_us:>12.1f}{batch_us:>14.1f}")
+
+    print("=" * 78)
+    print("AC匹配耗时只与消息长度和命中数有关；逐个in与关键词数成正比")
+
+
+if __name__ == "__main__":
+    main()
@@ -86,6 +86,7 @@ def show_system_architecture():
     architecture = {
         "核心组件": {
             "MedicalIntentRecognizer": "意图识别核心引擎",
+            "KeywordMatcher": "Aho-Corasick关键词匹配器，一次扫描命中全部意图/症状/紧急关键词",
             "PromptTemplateManager": "提示词模板管理器", 
             "MedicalDialogueManager": "对话管理器"
         },
@@ -5,7 +5,8 @@
 
 import json
 import re
-from typing import Dict, List, Tuple, Optional
+from collections import deque
+from typing import Dict, Hashable, Iterable, List, Set, Tuple, Optional
 from dataclasses import dataclass
 from enum import Enum
 
@@ -37,6 +38,100 @@ class MedicalResponse:
     suggestions: List[str]
     follow_up_questions: List[str]
 
+class KeywordMatcher:
+    """
+    Aho-Corasick 多模式匹配器
+    
+    所有关键词编译成一个自动机，一次扫描输入即可找出全部命中（含重叠命中），
+    单条消息的匹配耗时只与输入长度和命中数有关，与关键词总数无关
+    """
+    
+    def __init__(self):
+        self.goto: List[Dict[str, int]] = [{}]
+        self.fail: List[int] = [0]
+        self.output: List[List[int]] = [[]]
+        self.labels: List[Hashable] = []
+        self._label_ids: Dict[Hashable, int] = {}
+        self._built = False
+    
+    def add(self, keyword: str, label: Hashable):
+        """添加关键词，命中时返回label；同一关键词可以对应多个label"""
+        if not keyword:
+            return
+        label_id = self._label_ids.get(label)
+        if label_id is None:
+            label_id = self._label_ids[label] = len(self.labels)
+            self.labels.append(label)
+        state = 0
+        for ch in keyword:
+            nxt = self.goto[state].get(ch)
+            if nxt is None:
+                nxt = len(self.goto)
+                self.goto[state][ch] = nxt
+                self.goto.append({})
+                self.fail.append(0)
+                self.output.append([])
+            state = nxt
+        if label_id not in self.output[state]:
+            self.output[state].append(label_id)
+        self._built = False
+    
+    def build(self) -> "KeywordMatcher":
+        """广度优先构建失败指针，并把失败链上的输出合并到每个状态"""
+        queue = deque(self.goto[0].values())
+        for state in queue:
+            self.fail[state] = 0
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in self.goto[state].items():
+                queue.append(nxt)
+                f = self.fail[state]
+                while f and ch not in self.goto[f]:
+                    f = self.fail[f]
+                self.fail[nxt] = self.goto[f].get(ch, 0)
+                for label_id in self.output[self.fail[nxt]]:
+                    if label_id not in self.output[nxt]:
+                        self.output[nxt].append(label_id)
+        self._built = True
+        return self
+    
+    def find_all(self, text: str) -> List[Tuple[int, Hashable]]:
+        """返回全部命中 (命中结束位置, label)"""
+        if not self._built:
+            self.build()
+        goto, fail, output, labels = self.goto, self.fail, self.output, self.labels
+        hits = []
+        state = 0
+        for i, ch in enumerate(text):
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            for label_id in output[state]:
+                hits.append((i, labels[label_id]))
+        return hits
+    
+    def match(self, text: str) -> Set[Hashable]:
+        """返回命中的label集合"""
+        if not self._built:
+            self.build()
+        goto, fail, output, labels = self.goto, self.fail, self.output, self.labels
+        found = set()
+        state = 0
+        for ch in text:
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            if output[state]:
+                found.update(labels[label_id] for label_id in output[state])
+        return found
+    
+    def match_batch(self, texts: Iterable[str]) -> List[Set[Hashable]]:
+        """批量匹配"""
+        return [self.match(text) for text in texts]
+    
+    def __len__(self) -> int:
+        return len(self.goto) - 1
+
 class MedicalIntentRecognizer:
     """医疗意图识别器"""
     
@@ -44,6 +139,54 @@ class MedicalIntentRecognizer:
         self.symptom_keywords = self._load_symptom_keywords()
         self.department_mapping = self._load_department_mapping()
         self.urgency_rules = self._load_urgency_rules()
+        self.intent_keywords = self._load_intent_keywords()
+        self.emergency_keywords = ["剧烈", "严重", "急性", "突然", "无法忍受"]
+        self.matcher = self.build_matcher()
+    
+    @classmethod
+    def from_config(cls, config_path: str = "medical_config.json") -> "MedicalIntentRecognizer":
+        """从 medical_config.json 加载症状关键词库、科室和紧急程度"""
+        with open(config_path, 'r', encoding='utf-8') as f:
+            config = json.load(f)
+        
+        recognizer = cls.__new__(cls)
+        symptom_library = config["症状关键词库"]
+        recognizer.symptom_keywords = {name: info["关键词"] for name, info in symptom_library.items()}
+        recognizer.department_mapping = {name: info["科室"] for name, info in symptom_library.items()}
+        recognizer.urgency_rules = {
+            name: UrgencyLevel(info["紧急程度"]) for name, info in symptom_library.items()
+        }
+        recognizer.intent_keywords = recognizer._load_intent_keywords()
+        recognizer.emergency_keywords = config["紧急程度评估规则"]["紧急"]["关键词"]
+        recognizer.matcher = recognizer.build_matcher()
+        return recognizer
+    
+    def build_matcher(self) -> KeywordMatcher:
+        """把意图、症状和紧急关键词编译成一个匹配器，修改关键词库后需重新调用"""
+        matcher = KeywordMatcher()
+        for intent, keywords in self.intent_keywords:
+            for keyword in keywords:
+                matcher.add(keyword, ("intent", intent))
+        for symptom, keywords in self.symptom_keywords.items():
+            for keyword in keywords:
+                matcher.add(keyword, ("symptom", symptom))
+        for keyword in self.emergency_keywords:
+            matcher.add(keyword, ("urgency", UrgencyLevel.URGENT))
+        return matcher.build()
+    
+    def scan(self, user_input: str) -> Set[Tuple[str, Hashable]]:
+        """一次扫描返回全部命中的 (类别, 值)"""
+        return self.matcher.match(user_input)
+    
+    def _load_intent_keywords(self) -> List[Tuple[IntentType, List[str]]]:
+        """加载意图关键词，按优先级排列"""
+        return [
+            (IntentType.SYMPTOM_INQUIRY, ["疼", "痛", "不舒服", "症状"]),
+            (IntentType.APPOINTMENT_BOOKING, ["挂号", "预约", "看医生"]),
+            (IntentType.DEPARTMENT_RECOMMENDATION, ["科室", "哪个科"]),
+            (IntentType.EMERGENCY_ASSESSMENT, ["紧急", "急诊", "严重"]),
+            (IntentType.MEDICATION_INQUIRY, ["药", "吃什么药"])
+        ]
         
     def _load_symptom_keywords(self) -> Dict[str, List[str]]:
         """加载症状关键词库"""
@@ -226,17 +369,20 @@ class MedicalDialogueManager:
     def process_user_input(self, user_input: str) -> MedicalResponse:
         """处理用户输入并返回医疗响应"""
         
+        # 一次扫描得到意图、症状和紧急关键词的全部命中
+        hits = self.recognizer.scan(user_input)
+        
         # 1. 意图识别
-        intent = self._classify_intent(user_input)
+        intent = self._classify_intent(user_input, hits)
         
         # 2. 症状提取
-        symptoms = self._extract_symptoms(user_input)
+        symptoms = self._extract_symptoms(user_input, hits)
         
         # 3. 科室推荐
         department = self._recommend_department(symptoms)
         
         # 4. 紧急程度评估
-        urgency = self._assess_urgency(symptoms, user_input)
+        urgency = self._assess_urgency(symptoms, user_input, hits)
         
         # 5. 生成分析和建议
         analysis = self._generate_analysis(symptoms, user_input)
@@ -267,29 +413,43 @@ class MedicalDialogueManager:
             follow_up_questions=follow_up_questions
         )
     
-    def _classify_intent(self, user_input: str) -> IntentType:
+    def classify_batch(self, messages: List[str]) -> List[Dict]:
+        """
+        批量识别意图、症状、科室和紧急程度（不生成分析建议，不记录对话历史）
+        
+        Args:
+            messages: 用户消息列表
+            
+        Returns:
+            与messages一一对应的识别结果
+        """
+        results = []
+        for user_input, hits in zip(messages, self.recognizer.matcher.match_batch(messages)):
+            symptoms = self._extract_symptoms(user_input, hits)
+            results.append({
+                "intent": self._classify_intent(user_input, hits),
+                "symptoms": symptoms,
+                "department": self._recommend_department(symptoms),
+                "urgency": self._assess_urgency(symptoms, user_input, hits)
+            })
+        return results
+    
+    def _classify_intent(self, user_input: str, hits: Optional[Set] = None) -> IntentType:
         """分类用户意图"""
-        # 关键词匹配方式的简化实现
-        if any(keyword in user_input for keyword in ["疼", "痛", "不舒服", "症状"]):
-            return IntentType.SYMPTOM_INQUIRY
-        elif any(keyword in user_input for keyword in ["挂号", "预约", "看医生"]):
-            return IntentType.APPOINTMENT_BOOKING
-        elif any(keyword in user_input for keyword in ["科室", "哪个科"]):
-            return IntentType.DEPARTMENT_RECOMMENDATION
-        elif any(keyword in user_input for keyword in ["紧急", "急诊", "严重"]):
-            return IntentType.EMERGENCY_ASSESSMENT
-        elif any(keyword in user_input for keyword in ["药", "吃什么药"]):
-            return IntentType.MEDICATION_INQUIRY
-        else:
-            return IntentType.SYMPTOM_INQUIRY  # 默认为症状咨询
+        if hits is None:
+            hits = self.recognizer.scan(user_input)
+        # 按优先级取第一个命中的意图
+        for intent, _ in self.recognizer.intent_keywords:
+            if ("intent", intent) in hits:
+                return intent
+        return IntentType.SYMPTOM_INQUIRY  # 默认为症状咨询
     
-    def _extract_symptoms(self, user_input: str) -> List[str]:
+    def _extract_symptoms(self, user_input: str, hits: Optional[Set] = None) -> List[str]:
         """提取症状关键词"""
-        extracted_symptoms = []
-        for symptom, keywords in self.recognizer.symptom_keywords.items():
-            if any(keyword in user_input for keyword in keywords):
-                extracted_symptoms.append(symptom)
-        return extracted_symptoms
+        if hits is None:
+            hits = self.recognizer.scan(user_input)
+        # 保持症状库中的顺序，第一个症状决定推荐科室
+        return [symptom for symptom in self.recognizer.symptom_keywords if ("symptom", symptom) in hits]
     
     def _recommend_department(self, symptoms: List[str]) -> str:
         """推荐科室"""
@@ -300,14 +460,15 @@ class MedicalDialogueManager:
         primary_symptom = symptoms[0]
         return self.recognizer.department_mapping.get(primary_symptom, "内科")
     
-    def _assess_urgency(self, symptoms: List[str], user_input: str) -> UrgencyLevel:
+    def _assess_urgency(self, symptoms: List[str], user_input: str, hits: Optional[Set] = None) -> UrgencyLevel:
         """评估紧急程度"""
         if not symptoms:
             return UrgencyLevel.NORMAL
         
         # 检查紧急关键词
-        emergency_keywords = ["剧烈", "严重", "急性", "突然", "无法忍受"]
-        if any(keyword in user_input for keyword in emergency_keywords):
+        if hits is None:
+            hits = self.recognizer.scan(user_input)
+        if ("urgency", UrgencyLevel.URGENT) in hits:
             return UrgencyLevel.URGENT
         
         # 根据症状评估
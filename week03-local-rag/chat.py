@@ -1,7 +1,8 @@
 # RAG对话系统核心引擎 - 集成检索增强生成技术
 import os
+from functools import lru_cache
 from openai import OpenAI
-from llama_index.core import StorageContext, load_index_from_storage, Settings
+from llama_index.core import Settings
 from llama_index.embeddings.dashscope import (
     DashScopeEmbedding,
     DashScopeTextEmbeddingModels,
@@ -18,6 +19,7 @@ except ImportError:
     # 通过None值标记和条件检查实现功能的优雅降级
 
 from create_kb import *
+from index_registry import INDEX_REGISTRY
 
 # 系统配置常量
 DB_PATH = "VectorStore"  # 向量数据库根路径
@@ -38,6 +40,18 @@ EMBED_MODEL = DashScopeEmbedding(
 # 全局嵌入模型设置 - 确保检索和构建使用相同的向量空间
 Settings.embed_model = EMBED_MODEL
 
+@lru_cache(maxsize=None)
+def get_reranker(top_n: int):
+    """
+    按召回片段数缓存重排序器实例，避免每条消息重复构建客户端
+    """
+    if DashScopeRerank is None:
+        return None
+    return DashScopeRerank(
+        top_n=top_n,               # 重排序后保留的文档数量
+        return_documents=True      # 返回完整文档而非仅ID
+    )
+
 def get_model_response(multi_modal_input, history, model, temperature, max_tokens, history_round, db_name, similarity_threshold, chunk_cnt):
     """
     RAG对话系统核心响应生成器
@@ -58,38 +72,23 @@ def get_model_response(multi_modal_input, history, model, temperature, max_token
     
     # 动态知识库选择策略
     # 优先级：临时上传文件 > 用户选择的知识库
+    if tmp_files:
+        # 实时构建临时知识库 - 支持即时文档问答，已有临时知识库时只向量化新上传的文件
+        create_tmp_kb(tmp_files)
     if os.path.exists(os.path.join("File", TMP_NAME)):
         db_name = TMP_NAME  # 使用临时知识库
-    else:
-        if tmp_files:
-            # 实时构建临时知识库 - 支持即时文档问答
-            create_tmp_kb(tmp_files)
-            db_name = TMP_NAME
     
     print(f"prompt:{prompt},tmp_files:{tmp_files},db_name:{db_name}")
     
     try:
-        # 重排序器初始化 - 采用条件性实例化避免导入错误
-        if DashScopeRerank is not None:
-            dashscope_rerank = DashScopeRerank(
-                top_n=chunk_cnt,           # 重排序后保留的文档数量
-                return_documents=True      # 返回完整文档而非仅ID
-            )
-        else:
-            dashscope_rerank = None
+        # 重排序器获取 - 按召回片段数复用已构建的实例
+        dashscope_rerank = get_reranker(int(chunk_cnt))
         
-        # 向量索引加载 - 从持久化存储恢复索引结构
-        storage_context = StorageContext.from_defaults(
-            persist_dir=os.path.join(DB_PATH, db_name)
-        )
-        index = load_index_from_storage(storage_context)
+        # 检索器获取 - 索引注册表中常驻已加载的索引，只在首次使用或知识库变更后从磁盘加载
+        # 粗排阶段召回更多候选文档（similarity_top_k=20）
+        retriever_engine = INDEX_REGISTRY.get_retriever(db_name, track_usage=db_name != TMP_NAME)
         print("index获取完成")
         
-        # 检索器配置 - 第一阶段粗排检索
-        retriever_engine = index.as_retriever(
-            similarity_top_k=20,  # 粗排阶段召回更多候选文档
-        )
-        
         # 向量相似度检索 - 基于查询向量的语义匹配
         retrieve_chunk = retriever_engine.retrieve(prompt)
         print(f"原始chunk为：{retrieve_chunk}")
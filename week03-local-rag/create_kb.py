@@ -2,16 +2,21 @@
 ######       向量知识库构建系统         #######
 #####################################
 import gradio as gr
+import hashlib
+import json
 import os
 import shutil
+import time
 from llama_index.core import VectorStoreIndex, Settings, SimpleDirectoryReader
 from llama_index.embeddings.dashscope import (
     DashScopeEmbedding,
     DashScopeTextEmbeddingModels,
     DashScopeTextEmbeddingType,
 )
-from llama_index.core.schema import TextNode
+from llama_index.core.schema import TextNode, NodeRelationship, RelatedNodeInfo
 from upload_file import *
+from index_registry import INDEX_REGISTRY
+from kb_storage import load_kb_index, persist_full, persist_delta
 
 # 系统路径配置 - 分层存储架构
 DB_PATH = "VectorStore"                    # 向量数据库存储根目录
@@ -34,10 +39,217 @@ EMBED_MODEL = DashScopeEmbedding(
 
 # 全局嵌入模型设置 - 确保整个系统使用统一的向量化策略
 Settings.embed_model = EMBED_MODEL
+# 知识库清单文件 - 记录知识库由哪些文件构建以及各文件的哈希，用于增量更新
+MANIFEST_NAME = "kb_manifest.json"
+MANIFEST_VERSION = 1
+
 # 刷新知识库
 def refresh_knowledge_base():
     return os.listdir(DB_PATH)
 
+def file_sha256(file_path: str) -> str:
+    """分块计算文件内容哈希，大文件不一次性读入内存"""
+    sha256 = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            sha256.update(block)
+    return sha256.hexdigest()
+
+def load_manifest(db_path: str):
+    """读取知识库清单，不存在或无法解析时返回None"""
+    manifest_path = os.path.join(db_path, MANIFEST_NAME)
+    if not os.path.exists(manifest_path):
+        return None
+    try:
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return manifest if manifest.get("version") == MANIFEST_VERSION else None
+
+def save_manifest(db_path: str, manifest: dict):
+    """原子写入知识库清单，避免中途失败留下半个文件"""
+    manifest_path = os.path.join(db_path, MANIFEST_NAME)
+    tmp_path = manifest_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, manifest_path)
+
+def scan_source_files(source_dirs: dict, kb_type: str) -> dict:
+    """
+    扫描数据源目录，返回 {清单键: 文件路径}
+
+    清单键为"类目名/文件名"，与目录位置无关，类目目录改名前后不会混淆
+    """
+    files = {}
+    for label, folder_path in source_dirs.items():
+        if not os.path.isdir(folder_path):
+            continue
+        for file_name in sorted(os.listdir(folder_path)):
+            file_path = os.path.join(folder_path, file_name)
+            if not os.path.isfile(file_path):
+                continue
+            if kb_type == "structured" and os.path.splitext(file_name)[1].lower() not in TABLE_EXTENSIONS + (".txt",):
+                continue
+            files[f"{label}/{file_name}"] = file_path
+    return files
+
+def insert_unstructured_file(index, file_key: str, file_path: str) -> list:
+    """
+    解析单个非结构化文件并插入索引
+
+    返回：该文件产生的文档ID列表（PDF等格式一个文件可能解析出多个文档）
+    """
+    documents = SimpleDirectoryReader(input_files=[file_path]).load_data()
+    doc_ids = []
+    for i, document in enumerate(documents):
+        # 文档ID由清单键决定，删除或更新文件时按ID从docstore中定位其全部节点
+        document.id_ = f"{file_key}#{i}"
+        index.insert(document)
+        doc_ids.append(document.id_)
+    return doc_ids
+
+def insert_structured_file(index, file_key: str, file_path: str, on_batch=None) -> list:
+    """
+    流式读取单个表格文件，分批构建行节点并插入索引
+
+    参数：
+        on_batch: 每插入一批后的回调，参数为本批行数，用于进度报告
+
+    返回：该文件对应的文档ID列表（所有行节点挂在同一个来源文档下）
+    """
+    file_name = os.path.basename(file_path)
+    for start_row, texts in iter_structured_file(file_path):
+        nodes = []
+        for i, text in enumerate(texts):
+            node = TextNode(
+                text=text,
+                # 元数据保持 - 支持数据溯源和过滤查询
+                metadata={
+                    'source': file_name,      # 源文件名
+                    'file_name': file_name,
+                    'row': start_row + i      # 数据行号（从0开始）
+                }
+            )
+            # 来源关系 - docstore据此记录文件与节点的对应关系，删除文件时一次清理全部行节点
+            node.relationships[NodeRelationship.SOURCE] = RelatedNodeInfo(node_id=file_key)
+            nodes.append(node)
+        index.insert_nodes(nodes)
+        if on_batch is not None:
+            on_batch(len(nodes))
+    return [file_key]
+
+def sync_knowledge_base(db_name: str, kb_type: str, source_dirs: dict, progress=None) -> dict:
+    """
+    按文件增量同步知识库
+
+    核心流程：
+    1. 扫描数据源文件并计算哈希，与知识库清单对比，得到新增、修改、删除的文件
+    2. 删除：按清单中记录的文档ID通过docstore删除该文件的全部节点和向量
+    3. 新增/修改：只对这些文件解析、分块和向量化（修改的文件先删除旧节点）
+    4. 删除的文档ID和新增的节点（含向量）追加到变更日志，最后写入新的清单
+
+    向量化和持久化的成本都与变化的文件数量成正比，而不是与知识库大小成正比
+    （变更日志累计到一定大小后才合并重写一次存储文件，见 kb_storage）。
+    加载已有知识库仍需反序列化整个索引。
+    没有清单的旧知识库无法确定节点来源，会完整重建一次。
+
+    参数：
+        db_name: 知识库名称
+        kb_type: "unstructured" 或 "structured"
+        source_dirs: {类目名: 目录路径}，知识库内容与这些目录保持一致
+        progress: 进度回调，参数为 (完成比例, 描述)
+
+    返回：
+        {"added": 新增文件数, "updated": 修改文件数, "removed": 删除文件数, "unchanged": 未变化文件数}
+    """
+    db_path = os.path.join(DB_PATH, db_name)
+    manifest = load_manifest(db_path) if os.path.isdir(db_path) else None
+    if manifest is not None and manifest.get("type") != kb_type:
+        raise ValueError(f"{db_name}知识库类型不一致，请删除后重新创建")
+
+    current_files = scan_source_files(source_dirs, kb_type)
+    current_hashes = {file_key: file_sha256(file_path) for file_key, file_path in current_files.items()}
+    previous = manifest["files"] if manifest is not None else {}
+
+    added = [key for key in current_hashes if key not in previous]
+    updated = [key for key in current_hashes if key in previous and previous[key]["sha256"] != current_hashes[key]]
+    removed = [key for key in previous if key not in current_hashes]
+    stats = {"added": len(added), "updated": len(updated), "removed": len(removed),
+             "unchanged": len(current_hashes) - len(added) - len(updated)}
+    print(f"{db_name}知识库同步：{stats}")
+
+    if manifest is not None and not (added or updated or removed):
+        return stats
+
+    # 加载已有索引；没有清单的旧知识库或新知识库从空索引开始
+    full = manifest is None
+    if full:
+        if os.path.isdir(db_path):
+            shutil.rmtree(db_path)
+        index = VectorStoreIndex(nodes=[])
+    else:
+        index = load_kb_index(db_path)
+
+    # 删除已移除和已修改文件的旧节点
+    deleted_doc_ids = [doc_id for file_key in removed + updated for doc_id in previous[file_key]["doc_ids"]]
+    for doc_id in deleted_doc_ids:
+        index.delete_ref_doc(doc_id, delete_from_docstore=True)
+
+    # 只向量化新增和修改的文件
+    files = dict(previous)
+    for file_key in removed:
+        del files[file_key]
+    changed = added + updated
+    if kb_type == "structured":
+        total_rows = max(sum(estimate_table_rows(current_files[key]) for key in changed), 1)
+    done = {"files": 0, "rows": 0}
+    start_time = time.time()
+
+    def report(desc):
+        if progress is not None:
+            if kb_type == "structured":
+                progress(min(done["rows"] / total_rows, 1.0), desc=desc)
+            else:
+                progress(done["files"] / max(len(changed), 1), desc=desc)
+        print(desc)
+
+    def on_batch(rows):
+        done["rows"] += rows
+        elapsed = time.time() - start_time
+        speed = done["rows"] / elapsed if elapsed > 0 else 0.0
+        eta = (max(total_rows, done["rows"]) - done["rows"]) / speed if speed > 0 else 0.0
+        report(f"已向量化 {done['rows']}/{max(total_rows, done['rows'])} 行，{speed:.1f} 行/秒，预计剩余 {eta:.0f} 秒")
+
+    for file_key in changed:
+        file_path = current_files[file_key]
+        if kb_type == "structured":
+            doc_ids = insert_structured_file(index, file_key, file_path, on_batch)
+        else:
+            doc_ids = insert_unstructured_file(index, file_key, file_path)
+        files[file_key] = {"sha256": current_hashes[file_key], "doc_ids": doc_ids}
+        done["files"] += 1
+        if kb_type != "structured":
+            report(f"已处理 {done['files']}/{len(changed)} 个文件：{file_key}")
+
+    if full:
+        persist_full(index, db_path)
+    else:
+        persist_delta(index, db_path, deleted_doc_ids,
+                      [doc_id for file_key in changed for doc_id in files[file_key]["doc_ids"]])
+    save_manifest(db_path, {
+        "version": MANIFEST_VERSION,
+        "type": kb_type,
+        "labels": sorted(source_dirs),
+        "files": files,
+    })
+    INDEX_REGISTRY.invalidate(db_name)  # 清除旧索引缓存
+    return stats
+
+def sync_message(db_name: str, stats: dict) -> str:
+    return (f"{db_name}知识库已同步：新增{stats['added']}个文件，更新{stats['updated']}个，"
+            f"删除{stats['removed']}个，未变化{stats['unchanged']}个")
+
 def create_unstructured_db(db_name: str, label_name: list):
     """
     非结构化数据向量知识库构建器
@@ -47,12 +259,15 @@ def create_unstructured_db(db_name: str, label_name: list):
     2. 自动文档解析：利用SimpleDirectoryReader实现多格式文档统一处理
     3. 向量化索引：采用FAISS后端的高性能向量检索引擎
     4. 持久化存储：索引结构序列化到磁盘，支持系统重启后快速加载
+    5. 增量更新：知识库已存在时按文件哈希同步，只向量化新增或修改的文件
     
     设计考虑：
-    - 批量处理优化：一次性处理多个类目，减少重复的向量化计算开销
-    - 内存管理：大文档集合的分批处理，避免内存溢出
-    - 错误恢复：异常情况下的优雅降级和用户反馈
+    - 后台构建：提交到 ingest_jobs 后台任务后立即返回，界面不再阻塞，进度在页面上轮询显示
+    - 并行处理：按文件多进程解析，向量化请求分批并发发送
+    - 断点续建：应用重启后未完成的任务自动恢复
     """
+    from ingest_jobs import INGEST_JOBS
+    
     print(f"知识库名称为：{db_name}，类目名称为：{label_name}")
     
     # 输入验证 - 确保必要参数完整性
@@ -60,43 +275,23 @@ def create_unstructured_db(db_name: str, label_name: list):
         gr.Info("没有选择类目")
     elif len(db_name) == 0:
         gr.Info("没有命名知识库")
-    # 防重复创建检查 - 避免意外覆盖现有知识库
-    elif db_name in os.listdir(DB_PATH):
-        gr.Info("知识库已存在，请换个名字或删除原来知识库再创建")
+    elif INGEST_JOBS.active_job(db_name) is not None:
+        gr.Info(f"{db_name}知识库正在构建中，请等待当前任务完成")
     else:
-        gr.Info("正在创建知识库，请等待知识库创建成功信息显示后前往RAG问答")
-        
-        # 多源文档聚合处理
-        documents = []
-        for label in label_name:
-            label_path = os.path.join(UNSTRUCTURED_FILE_PATH, label)
-            # SimpleDirectoryReader自动识别并解析多种文档格式
-            # 支持PDF、DOCX、TXT等格式的统一处理
-            documents.extend(SimpleDirectoryReader(label_path).load_data())
-        
-        # 向量索引构建 - 核心向量化处理
-        # from_documents方法自动完成：文档分块 -> 向量化 -> 索引构建
-        index = VectorStoreIndex.from_documents(documents)
-        
-        # 持久化存储 - 确保知识库可重复使用
-        db_path = os.path.join(DB_PATH, db_name)
-        if not os.path.exists(db_path):
-            os.mkdir(db_path)
-            # 序列化索引结构到磁盘，包括向量数据和元数据
-            index.storage_context.persist(db_path)
-        elif os.path.exists(db_path):
-            pass  # 路径已存在，跳过创建
-        
-        gr.Info("知识库创建成功，可前往RAG问答进行提问")
+        INGEST_JOBS.submit(db_name, label_name)
+        gr.Info(f"已提交{db_name}知识库后台构建任务，可在下方查看进度")
     
-def create_structured_db(db_name: str, data_table: list):
+def create_structured_db(db_name: str, data_table: list, progress=gr.Progress()):
     """
     结构化数据向量知识库构建器
     
     核心技术创新：
-    1. 细粒度文档分块：将预处理的结构化文本按行分割，每行作为独立检索单元
-    2. 元数据保持：保留原始文档ID和文件名，支持溯源和引用
+    1. 细粒度文档分块：表格的每一行作为独立检索单元
+    2. 元数据保持：保留文件名和行号，支持溯源和引用
     3. 自定义节点构建：使用TextNode而非默认分块策略，确保结构化数据的完整性
+    4. 流式构建：直接从表格分批读取、序列化、向量化并插入索引，
+       不生成中间txt文件，也不一次性持有全部文档和节点
+    5. 增量更新：知识库已存在时按文件哈希同步，只向量化新增或修改的表格
     
     为什么采用自定义节点构建而非from_documents：
     - 结构化数据的语义单元是数据行，而非传统的文本段落
@@ -109,45 +304,34 @@ def create_structured_db(db_name: str, data_table: list):
         gr.Info("没有选择数据表")
     elif len(db_name) == 0:
         gr.Info("没有命名知识库")
-    elif db_name in os.listdir(DB_PATH):
-        gr.Info("知识库已存在，请换个名字或删除原来知识库再创建")
     else:
-        gr.Info("正在创建知识库，请等待知识库创建成功信息显示后前往RAG问答")
-        
-        # 文档加载阶段
-        documents = []
-        for label in data_table:
-            label_path = os.path.join(STRUCTURED_FILE_PATH, label)
-            documents.extend(SimpleDirectoryReader(label_path).load_data())
-        
-        # 自定义节点构建 - 针对结构化数据的特殊处理
-        nodes = []
-        for doc in documents:
-            # 按行分割文档内容 - 每行代表一个完整的数据记录
-            doc_content = doc.get_content().split('\n')
-            for chunk in doc_content:
-                if chunk.strip():  # 跳过空行
-                    # 创建TextNode - LlamaIndex的基础文本节点类型
-                    node = TextNode(text=chunk)
-                    # 元数据保持 - 支持数据溯源和过滤查询
-                    node.metadata = {
-                        'source': doc.get_doc_id(),           # 原始文档标识
-                        'file_name': doc.metadata['file_name'] # 源文件名
-                    }
-                    nodes.append(node)
-        
-        # 从节点构建向量索引 - 跳过默认的文档分块过程
-        # 这种方式确保每个数据行作为独立的检索单元
-        index = VectorStoreIndex(nodes)
-        
-        # 持久化存储
-        db_path = os.path.join(DB_PATH, db_name)
-        if not os.path.exists(db_path):
-            os.mkdir(db_path)
-        index.storage_context.persist(db_path)
-        
-        gr.Info("知识库创建成功，可前往RAG问答进行提问")
+        exists = db_name in os.listdir(DB_PATH)
+        gr.Info("知识库已存在，正在增量更新" if exists else
+                "正在创建知识库，请等待知识库创建成功信息显示后前往RAG问答")
+        try:
+            source_dirs = {label: os.path.join(STRUCTURED_FILE_PATH, label) for label in data_table}
+            stats = sync_knowledge_base(db_name, "structured", source_dirs, progress)
+        except ValueError as e:
+            gr.Info(str(e))
+            return
+        gr.Info(sync_message(db_name, stats) if exists else "知识库创建成功，可前往RAG问答进行提问")
 
+# 按清单中记录的类目重新同步知识库 - 类目中增删文件后使用
+def update_db(db_name: str, progress=gr.Progress()):
+    if db_name is None:
+        return
+    manifest = load_manifest(os.path.join(DB_PATH, db_name))
+    if manifest is None:
+        gr.Info(f"{db_name}知识库没有文件清单，请删除后重新创建")
+        return
+    if manifest["type"] == "unstructured":
+        # 非结构化知识库交给后台任务同步
+        create_unstructured_db(db_name, manifest["labels"])
+        return
+    file_path = STRUCTURED_FILE_PATH
+    source_dirs = {label: os.path.join(file_path, label) for label in manifest["labels"]}
+    stats = sync_knowledge_base(db_name, manifest["type"], source_dirs, progress)
+    gr.Info(sync_message(db_name, stats))
 
 # 删除指定名称知识库
 def delete_db(db_name:str):
@@ -155,35 +339,35 @@ def delete_db(db_name:str):
         folder_path = os.path.join(DB_PATH, db_name)
         if os.path.exists(folder_path):
             shutil.rmtree(folder_path)
+            INDEX_REGISTRY.invalidate(db_name)
             gr.Info(f"已成功删除{db_name}知识库")
             print(f"已成功删除{db_name}知识库")
         else:
             gr.Info(f"{db_name}知识库不存在")
             print(f"{db_name}知识库不存在")
 
-# 实时更新知识库列表
+# 实时更新知识库列表，同时释放已不存在的知识库的索引缓存
 def update_knowledge_base():
-    return gr.update(choices=os.listdir(DB_PATH))
+    db_names = os.listdir(DB_PATH)
+    INDEX_REGISTRY.prune(db_names)
+    return gr.update(choices=db_names)
 
-# 临时文件创建知识库
+# 临时文件创建知识库 - 追加文件时只向量化新上传的文件
 def create_tmp_kb(files):
     if not os.path.exists(os.path.join("File",TMP_NAME)):
         os.mkdir(os.path.join("File",TMP_NAME))
     for file in files:
+        # 同一文件可能随后续消息再次提交，已移入临时目录的跳过
+        if not os.path.exists(file):
+            continue
         file_name = os.path.basename(file)
         shutil.move(file,os.path.join("File",TMP_NAME,file_name))
-    documents = SimpleDirectoryReader(os.path.join("File",TMP_NAME)).load_data()
-    index = VectorStoreIndex.from_documents(
-        documents
-    )
-    db_path = os.path.join(DB_PATH,TMP_NAME)
-    if not os.path.exists(db_path):
-        os.mkdir(db_path)
-    index.storage_context.persist(db_path)
+    sync_knowledge_base(TMP_NAME, "unstructured", {TMP_NAME: os.path.join("File",TMP_NAME)})
 
 # 清除tmp文件夹下内容 
 def clear_tmp():
     if os.path.exists(os.path.join("File",TMP_NAME)):
         shutil.rmtree(os.path.join("File",TMP_NAME))
     if os.path.exists(os.path.join(DB_PATH,TMP_NAME)):
-        shutil.rmtree(os.path.join(DB_PATH,TMP_NAME))
\ No newline at end of file
+        shutil.rmtree(os.path.join(DB_PATH,TMP_NAME))
+    INDEX_REGISTRY.invalidate(TMP_NAME)
\ No newline at end of file
@@ -0,0 +1,181 @@
+#####################################
+######       知识库索引注册表         #######
+#####################################
+import json
+import os
+import threading
+from collections import OrderedDict
+from kb_storage import load_kb_index
+
+# 系统路径配置
+DB_PATH = "VectorStore"          # 向量数据库存储根目录
+USAGE_FILE = "kb_usage.json"     # 知识库使用次数统计，用于启动时预加载（不能放在DB_PATH下，否则会被当作知识库）
+
+# 缓存配置 - 可通过环境变量调整
+INDEX_CACHE_MAX_MB = float(os.getenv("INDEX_CACHE_MAX_MB", "1024"))  # 常驻内存的索引总大小上限
+PRELOAD_KB_COUNT = int(os.getenv("PRELOAD_KB_COUNT", "3"))            # 启动时预加载的常用知识库数量
+RETRIEVE_TOP_K = 20                                                    # 粗排阶段召回的候选文档数量
+
+
+class IndexRegistry:
+    """
+    进程内知识库索引注册表
+
+    为什么需要注册表：
+    - load_kb_index 需要反序列化整个向量存储，几百MB的知识库每次加载耗时数秒
+    - 原先每条消息都重新加载一次，对话延迟主要花在反序列化上
+    - 注册表按知识库缓存已加载的索引和检索器，后续消息直接复用
+
+    缓存策略：
+    1. LRU淘汰：按持久化文件大小估算内存占用，超过上限时淘汰最久未使用的知识库
+    2. 失效检测：每次取用时比对目录下文件的大小和修改时间，知识库被其他进程重建后自动重新加载
+    3. 主动失效：create_kb 创建、删除知识库后调用 invalidate 立即清除缓存
+    4. 并发加载：同一知识库同时只加载一次，其他请求等待加载完成后直接复用
+    """
+
+    def __init__(self, db_path: str = DB_PATH, max_mb: float = INDEX_CACHE_MAX_MB, usage_file: str = USAGE_FILE):
+        self.db_path = db_path
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.usage_file = usage_file
+        self._entries = OrderedDict()   # 知识库名称 -> 缓存项，按最近使用排序
+        self._lock = threading.Lock()
+        self._load_locks = {}           # 知识库名称 -> 加载锁
+        self._usage = self._load_usage()
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+    def _signature(self, db_name: str):
+        """知识库目录的文件签名（文件名、大小、修改时间），目录不存在时返回None"""
+        folder_path = os.path.join(self.db_path, db_name)
+        if not os.path.isdir(folder_path):
+            return None
+        signature = []
+        for entry in sorted(os.scandir(folder_path), key=lambda e: e.name):
+            if entry.is_file():
+                stat = entry.stat()
+                signature.append((entry.name, stat.st_size, stat.st_mtime_ns))
+        return tuple(signature)
+
+    def get_retriever(self, db_name: str, track_usage: bool = True):
+        """
+        获取知识库的检索器，未缓存或已失效时从磁盘加载
+
+        参数:
+            db_name: 知识库名称
+            track_usage: 是否计入使用次数（临时知识库不计入，避免被预加载）
+        """
+        signature = self._signature(db_name)
+        if not signature:
+            self.invalidate(db_name)
+            raise FileNotFoundError(f"{db_name}知识库不存在")
+        if track_usage:
+            self._record_usage(db_name)
+
+        retriever = self._lookup(db_name, signature)
+        if retriever is not None:
+            return retriever
+
+        with self._lock:
+            load_lock = self._load_locks.setdefault(db_name, threading.Lock())
+        with load_lock:
+            # 等待期间其他线程可能已经加载完成
+            retriever = self._lookup(db_name, signature, count_miss=True)
+            if retriever is not None:
+                return retriever
+            print(f"正在加载{db_name}知识库索引")
+            index = load_kb_index(os.path.join(self.db_path, db_name))
+            retriever = index.as_retriever(similarity_top_k=RETRIEVE_TOP_K)
+            # 以持久化文件大小估算内存占用
+            size = sum(file_size for _, file_size, _ in signature)
+            with self._lock:
+                self._entries[db_name] = {"signature": signature, "index": index,
+                                          "retriever": retriever, "size": size}
+                self._entries.move_to_end(db_name)
+                self._evict()
+            print(f"{db_name}知识库索引加载完成，约{size / 1024 / 1024:.1f}MB")
+            return retriever
+
+    def _lookup(self, db_name: str, signature, count_miss: bool = False):
+        with self._lock:
+            entry = self._entries.get(db_name)
+            if entry is not None and entry["signature"] == signature:
+                self._entries.move_to_end(db_name)
+                self._stats["hits"] += 1
+                return entry["retriever"]
+            if entry is not None:
+                # 文件已变化，旧索引作废
+                del self._entries[db_name]
+            if count_miss:
+                self._stats["misses"] += 1
+            return None
+
+    def _evict(self):
+        """按LRU淘汰，至少保留最近使用的一个知识库"""
+        total = sum(entry["size"] for entry in self._entries.values())
+        while total > self.max_bytes and len(self._entries) > 1:
+            db_name, entry = self._entries.popitem(last=False)
+            total -= entry["size"]
+            self._stats["evictions"] += 1
+            print(f"内存超出上限，已释放{db_name}知识库索引")
+
+    def invalidate(self, db_name: str):
+        """清除指定知识库的缓存（知识库被创建、重建或删除后调用）"""
+        with self._lock:
+            if self._entries.pop(db_name, None) is not None:
+                print(f"已清除{db_name}知识库索引缓存")
+
+    def prune(self, existing_names):
+        """清除已不存在的知识库的缓存"""
+        existing_names = set(existing_names)
+        with self._lock:
+            stale = [db_name for db_name in self._entries if db_name not in existing_names]
+        for db_name in stale:
+            self.invalidate(db_name)
+
+    def _load_usage(self) -> dict:
+        if not os.path.exists(self.usage_file):
+            return {}
+        try:
+            with open(self.usage_file, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _record_usage(self, db_name: str):
+        with self._lock:
+            self._usage[db_name] = self._usage.get(db_name, 0) + 1
+            usage = dict(self._usage)
+        try:
+            tmp_path = f"{self.usage_file}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(usage, f, ensure_ascii=False)
+            os.replace(tmp_path, self.usage_file)
+        except OSError as e:
+            print(f"保存知识库使用统计失败：{e}")
+
+    def preload(self, count: int = PRELOAD_KB_COUNT):
+        """按使用次数预加载最常用的知识库"""
+        existing = set(os.listdir(self.db_path)) if os.path.isdir(self.db_path) else set()
+        ranked = sorted((name for name in self._usage if name in existing),
+                        key=lambda name: self._usage[name], reverse=True)
+        for db_name in ranked[:count]:
+            try:
+                self.get_retriever(db_name, track_usage=False)
+            except Exception as e:
+                print(f"预加载{db_name}知识库失败：{e}")
+
+    def start_preload(self, count: int = PRELOAD_KB_COUNT):
+        """在后台线程中预加载，不阻塞服务启动"""
+        if count > 0:
+            threading.Thread(target=self.preload, args=(count,), daemon=True).start()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                **self._stats,
+                "cached": list(self._entries),
+                "cached_mb": round(sum(e["size"] for e in self._entries.values()) / 1024 / 1024, 1),
+            }
+
+
+# 全局注册表 - chat 读取索引，create_kb 在知识库变更时使其失效
+INDEX_REGISTRY = IndexRegistry()
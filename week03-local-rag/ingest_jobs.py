@@ -0,0 +1,272 @@
+#####################################
+######       后台知识库构建任务         #######
+#####################################
+import json
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+import multiprocessing
+from ingest_worker import parse_file
+
+# 任务状态存储目录 - 应用重启后据此恢复未完成的任务（不能放在DB_PATH下，否则会被当作知识库）
+JOB_PATH = "IngestJobs"
+
+# 并行配置 - 可通过环境变量调整
+PARSE_WORKERS = int(os.getenv("INGEST_PARSE_WORKERS", str(max(1, (os.cpu_count() or 2) - 1))))  # 文件解析进程数
+EMBED_BATCH_SIZE = int(os.getenv("INGEST_EMBED_BATCH_SIZE", "10"))    # 每次向量化请求的文本块数量（DashScope单次上限25）
+EMBED_CONCURRENCY = int(os.getenv("INGEST_EMBED_CONCURRENCY", "4"))   # 同时进行的向量化请求数
+EMBED_RETRIES = 3
+
+# 任务状态
+PENDING, RUNNING, DONE, FAILED = "pending", "running", "done", "failed"
+
+
+class IngestJobManager:
+    """
+    后台知识库构建任务管理器
+
+    为什么需要后台任务：
+    - 原先在Gradio回调中顺序解析、向量化全部文件，构建期间界面一直阻塞
+    - 解析只用单核，向量化请求逐个串行发出
+
+    任务流程：
+    1. 对比知识库清单，确定新增、修改、删除的文件（与增量同步一致）
+    2. 删除已移除和已修改文件的旧节点
+    3. 新增和修改的文件按文件分发到进程池并行解析、分块
+    4. 解析完成的文件立即分批向量化，多个批次并发请求，随后插入索引
+    5. 每个文件插入索引后，把它的节点追加到变更日志并更新清单（写入量只与该文件有关），
+       应用重启后未完成的任务从最后一个完成的文件处继续
+
+    进度（已处理文件数、文本块数、速度、预计剩余时间）写入任务状态，供界面轮询
+    """
+
+    def __init__(self, job_path: str = JOB_PATH):
+        self.job_path = job_path
+        os.makedirs(job_path, exist_ok=True)
+        self._lock = threading.Lock()
+        self._jobs = {}                                   # 任务ID -> 任务状态
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ingest-job")  # 任务按提交顺序逐个执行
+        for file_name in sorted(os.listdir(job_path)):
+            if file_name.endswith(".json"):
+                try:
+                    with open(os.path.join(job_path, file_name), "r", encoding="utf-8") as f:
+                        job = json.load(f)
+                    self._jobs[job["id"]] = job
+                except (OSError, ValueError, KeyError):
+                    continue
+
+    def _save(self, job: dict):
+        job["updated_at"] = time.time()
+        path = os.path.join(self.job_path, f"{job['id']}.json")
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(job, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, path)
+
+    def active_job(self, db_name: str):
+        """返回该知识库未完成的任务，没有则返回None"""
+        with self._lock:
+            for job in self._jobs.values():
+                if job["db_name"] == db_name and job["status"] in (PENDING, RUNNING):
+                    return job
+        return None
+
+    def submit(self, db_name: str, labels: list) -> dict:
+        """提交非结构化知识库构建任务，同一知识库同时只允许一个任务"""
+        existing = self.active_job(db_name)
+        if existing is not None:
+            return existing
+        job = {
+            "id": time.strftime("%Y%m%d%H%M%S") + "_" + uuid.uuid4().hex[:6],
+            "db_name": db_name,
+            "labels": list(labels),
+            "status": PENDING,
+            "message": "等待执行",
+            "total_files": 0, "parsed_files": 0, "done_files": 0,
+            "total_nodes": 0, "embedded_nodes": 0,
+            "speed": 0.0, "eta": None,
+            "created_at": time.time(),
+        }
+        with self._lock:
+            self._jobs[job["id"]] = job
+            self._save(job)
+        self._executor.submit(self._run, job["id"])
+        return job
+
+    def resume(self):
+        """应用启动时恢复上次未完成的任务"""
+        with self._lock:
+            pending = [job for job in self._jobs.values() if job["status"] in (PENDING, RUNNING)]
+        for job in sorted(pending, key=lambda job: job["created_at"]):
+            print(f"恢复{job['db_name']}知识库构建任务：{job['id']}")
+            self._executor.submit(self._run, job["id"])
+
+    def _update(self, job: dict, **fields):
+        with self._lock:
+            job.update(fields)
+            self._save(job)
+
+    def _run(self, job_id: str):
+        job = self._jobs[job_id]
+        try:
+            self._update(job, status=RUNNING, message="正在扫描文件", started_at=time.time())
+            self._ingest(job)
+            self._update(job, status=DONE, eta=0)
+        except Exception as e:
+            print(f"{job['db_name']}知识库构建失败：{e}")
+            self._update(job, status=FAILED, message=f"构建失败：{e}")
+
+    def _ingest(self, job: dict):
+        # 延迟导入：create_kb 会加载界面和向量化模型，只在任务线程真正执行时才需要
+        import shutil
+        from llama_index.core import Settings, VectorStoreIndex
+        from llama_index.core.schema import MetadataMode
+        from create_kb import (DB_PATH, UNSTRUCTURED_FILE_PATH, MANIFEST_VERSION, file_sha256,
+                               load_manifest, save_manifest, scan_source_files)
+        from index_registry import INDEX_REGISTRY
+        from kb_storage import load_kb_index, persist_full, persist_delta
+
+        db_name = job["db_name"]
+        db_path = os.path.join(DB_PATH, db_name)
+        source_dirs = {label: os.path.join(UNSTRUCTURED_FILE_PATH, label) for label in job["labels"]}
+
+        manifest = load_manifest(db_path) if os.path.isdir(db_path) else None
+        if manifest is not None and manifest.get("type") != "unstructured":
+            raise ValueError(f"{db_name}知识库类型不一致，请删除后重新创建")
+        current_files = scan_source_files(source_dirs, "unstructured")
+        current_hashes = {file_key: file_sha256(file_path) for file_key, file_path in current_files.items()}
+        previous = manifest["files"] if manifest is not None else {}
+        removed = [key for key in previous if key not in current_hashes]
+        updated = [key for key in current_hashes if key in previous and previous[key]["sha256"] != current_hashes[key]]
+        added = [key for key in current_hashes if key not in previous]
+        changed = added + updated
+
+        # 没有清单的旧知识库无法确定节点来源，完整重建；恢复的任务已有清单，只处理剩余文件
+        full = manifest is None
+        if full:
+            if os.path.isdir(db_path):
+                shutil.rmtree(db_path)
+            index = VectorStoreIndex(nodes=[])
+        else:
+            index = load_kb_index(db_path)
+
+        files = dict(previous)
+        # 上次持久化之后删除的文档ID和插入的文档ID，checkpoint时追加到变更日志（见 kb_storage.persist_delta）
+        pending = {"deleted": [], "inserted": []}
+        for file_key in removed + updated:
+            for doc_id in previous[file_key]["doc_ids"]:
+                index.delete_ref_doc(doc_id, delete_from_docstore=True)
+                pending["deleted"].append(doc_id)
+            del files[file_key]
+
+        def checkpoint():
+            nonlocal full
+            if full:
+                persist_full(index, db_path)
+                full = False
+            else:
+                persist_delta(index, db_path, pending["deleted"], pending["inserted"])
+            pending["deleted"], pending["inserted"] = [], []
+            save_manifest(db_path, {
+                "version": MANIFEST_VERSION,
+                "type": "unstructured",
+                "labels": sorted(source_dirs),
+                "files": files,
+            })
+            INDEX_REGISTRY.invalidate(db_name)
+
+        if removed or updated or full:
+            checkpoint()
+        self._update(job, total_files=len(changed), parsed_files=0, done_files=0,
+                     total_nodes=0, embedded_nodes=0, speed=0.0, eta=None,
+                     message=f"新增{len(added)}个文件，更新{len(updated)}个，删除{len(removed)}个")
+        if not changed:
+            self._update(job, message=job["message"] + "，知识库已是最新")
+            return
+
+        embed_model = Settings.embed_model
+        start_time = time.time()
+        failed_files = []
+
+        def embed_batch(texts):
+            for attempt in range(EMBED_RETRIES):
+                try:
+                    return embed_model.get_text_embedding_batch(texts)
+                except Exception:
+                    if attempt == EMBED_RETRIES - 1:
+                        raise
+                    time.sleep(2 ** attempt)
+
+        # 使用spawn启动解析进程，避免在多线程的Web服务进程中fork；
+        # 子进程只导入 ingest_worker，入口模块 main.py 在子进程中（__mp_main__）跳过界面构建
+        mp_context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=PARSE_WORKERS, mp_context=mp_context) as parse_pool, \
+                ThreadPoolExecutor(max_workers=EMBED_CONCURRENCY) as embed_pool:
+            futures = {parse_pool.submit(parse_file, file_key, current_files[file_key]): file_key
+                       for file_key in changed}
+            for future in as_completed(futures):
+                file_key = futures[future]
+                try:
+                    doc_ids, nodes = future.result()
+                except Exception as e:
+                    # 解析失败的文件不写入清单，下次同步时重试
+                    print(f"解析{file_key}失败：{e}")
+                    failed_files.append(file_key)
+                    self._update(job, parsed_files=job["parsed_files"] + 1, done_files=job["done_files"] + 1)
+                    continue
+                self._update(job, parsed_files=job["parsed_files"] + 1,
+                             total_nodes=job["total_nodes"] + len(nodes))
+
+                # 分批并发向量化，批次结果按顺序写回节点
+                texts = [node.get_content(metadata_mode=MetadataMode.EMBED) for node in nodes]
+                batches = [texts[i:i + EMBED_BATCH_SIZE] for i in range(0, len(texts), EMBED_BATCH_SIZE)]
+                embeddings = []
+                for batch_embeddings in embed_pool.map(embed_batch, batches):
+                    embeddings.extend(batch_embeddings)
+                for node, embedding in zip(nodes, embeddings):
+                    node.embedding = embedding
+                # 节点已带向量，插入时不再调用向量化模型
+                index.insert_nodes(nodes)
+                files[file_key] = {"sha256": current_hashes[file_key], "doc_ids": doc_ids}
+                pending["inserted"].extend(doc_ids)
+
+                # 进度和预计剩余时间：按已解析文件的平均文本块数估算总量
+                done_files = job["done_files"] + 1
+                embedded_nodes = job["embedded_nodes"] + len(nodes)
+                elapsed = time.time() - start_time
+                speed = embedded_nodes / elapsed if elapsed > 0 else 0.0
+                estimated_total = job["total_nodes"] / job["parsed_files"] * len(changed)
+                eta = (estimated_total - embedded_nodes) / speed if speed > 0 else None
+                self._update(job, done_files=done_files, embedded_nodes=embedded_nodes,
+                             speed=round(speed, 1), eta=round(max(eta, 0)) if eta is not None else None,
+                             message=f"已完成{file_key}")
+                # 按文件边界保存进度，只追加本文件的节点，不重写整个索引
+                checkpoint()
+
+        message = f"构建完成：{len(changed) - len(failed_files)}个文件，{job['embedded_nodes']}个文本块"
+        if failed_files:
+            message += f"，{len(failed_files)}个文件解析失败：{'、'.join(failed_files)}"
+        self._update(job, message=message)
+
+    def status_text(self, db_name: str = None) -> str:
+        """最近任务的进度描述，供界面轮询"""
+        with self._lock:
+            jobs = sorted(self._jobs.values(), key=lambda job: job["created_at"], reverse=True)
+        if db_name:
+            jobs = [job for job in jobs if job["db_name"] == db_name]
+        lines = []
+        for job in jobs[:5]:
+            status = {PENDING: "排队中", RUNNING: "构建中", DONE: "已完成", FAILED: "失败"}[job["status"]]
+            line = f"[{status}] {job['db_name']}：文件 {job['done_files']}/{job['total_files']}"
+            if job["status"] == RUNNING:
+                line += f"，文本块 {job['embedded_nodes']}，{job['speed']} 块/秒"
+                if job.get("eta") is not None:
+                    line += f"，预计剩余 {job['eta']} 秒"
+            lines.append(f"{line}（{job['message']}）")
+        return "\n".join(lines) if lines else "暂无构建任务"
+
+
+# 全局任务管理器
+INGEST_JOBS = IngestJobManager()
@@ -0,0 +1,21 @@
+#####################################
+######       知识库构建解析子进程       #######
+#####################################
+# 本模块由解析进程池的子进程导入，只能依赖 llama_index.core，
+# 不能导入 gradio、create_kb、chat 或 ingest_jobs（后者导入时会创建全局任务管理器和线程池）
+
+
+def parse_file(file_key: str, file_path: str) -> tuple:
+    """
+    在子进程中解析单个文件并切分为文本块节点
+
+    返回 (文档ID列表, 节点列表)；文档ID由清单键决定，与 create_kb.insert_unstructured_file 一致，删除或更新文件时按ID定位其全部节点。
+    """
+    from llama_index.core import Settings, SimpleDirectoryReader
+
+    documents = SimpleDirectoryReader(input_files=[file_path]).load_data()
+    for i, document in enumerate(documents):
+        document.id_ = f"{file_key}#{i}"
+    # 与 VectorStoreIndex.insert 默认使用相同的分块器
+    nodes = Settings.node_parser.get_nodes_from_documents(documents)
+    return [document.id_ for document in documents], nodes
@@ -0,0 +1,98 @@
+#####################################
+######       知识库增量持久化         #######
+#####################################
+import json
+import os
+from llama_index.core import StorageContext, load_index_from_storage
+from llama_index.core.storage.docstore.utils import doc_to_json, json_to_doc
+
+# 增量变更日志 - 每行记录一次变更删除的文档ID和新增的节点（含向量）
+CHANGE_LOG_NAME = "kb_changes.jsonl"
+# 变更日志超过向量库文件大小的该比例时合并为一次完整保存，合并的摊还成本与变更量成正比
+COMPACT_RATIO = float(os.getenv("KB_COMPACT_RATIO", "0.5"))
+# 增量合并时重写的存储文件，与 StorageContext.persist 的默认命名一致；图存储和图片向量库保持不变
+DOCSTORE_FILE = "docstore.json"
+INDEX_STORE_FILE = "index_store.json"
+VECTOR_STORE_FILE = "default__vector_store.json"
+
+
+def load_kb_index(db_path: str):
+    """
+    加载知识库索引，并重放上次完整保存之后的增量变更
+
+    回放时节点已带向量，不会调用向量化模型
+    """
+    index = load_index_from_storage(StorageContext.from_defaults(persist_dir=db_path))
+    change_log = os.path.join(db_path, CHANGE_LOG_NAME)
+    if os.path.exists(change_log):
+        with open(change_log, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # 追加时进程中断，最后一行不完整，之前的变更仍然有效
+                    break
+                existing = index.ref_doc_info
+                for doc_id in record["delete"]:
+                    if doc_id in existing:
+                        index.delete_ref_doc(doc_id, delete_from_docstore=True)
+                nodes = [json_to_doc(node) for node in record["nodes"]]
+                if nodes:
+                    index.insert_nodes(nodes)
+    return index
+
+
+def persist_full(index, db_path: str):
+    """完整保存索引的全部存储，并清空已并入的变更日志"""
+    os.makedirs(db_path, exist_ok=True)
+    index.storage_context.persist(db_path)
+    _remove_change_log(db_path)
+
+
+def persist_delta(index, db_path: str, deleted_doc_ids: list, doc_ids: list):
+    """
+    把一次增量变更追加到变更日志，写入量只与本次变更的节点数有关
+
+    参数：
+        deleted_doc_ids: 本次从索引中删除的文档ID
+        doc_ids: 本次插入的文档ID，其节点和向量从内存中的索引读取
+
+    日志累计超过向量库文件的 COMPACT_RATIO 倍时，合并重写文档库、索引结构和向量库
+    """
+    nodes = []
+    for doc_id in doc_ids:
+        ref_doc_info = index.docstore.get_ref_doc_info(doc_id)
+        if ref_doc_info is None:
+            continue
+        for node in index.docstore.get_nodes(ref_doc_info.node_ids):
+            # 文档库中的节点不含向量，向量从向量库中取回，回放时无需重新向量化
+            node.embedding = index.vector_store.get(node.node_id)
+            nodes.append(doc_to_json(node))
+    if not deleted_doc_ids and not nodes:
+        return
+
+    change_log = os.path.join(db_path, CHANGE_LOG_NAME)
+    with open(change_log, "a", encoding="utf-8") as f:
+        f.write(json.dumps({"delete": list(deleted_doc_ids), "nodes": nodes}, ensure_ascii=False) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+
+    vector_store_path = os.path.join(db_path, VECTOR_STORE_FILE)
+    base_size = os.path.getsize(vector_store_path) if os.path.exists(vector_store_path) else 0
+    if os.path.getsize(change_log) > base_size * COMPACT_RATIO:
+        compact(index, db_path)
+
+
+def compact(index, db_path: str):
+    """把内存中的索引写回文档库、索引结构和向量库文件，并清空变更日志"""
+    storage_context = index.storage_context
+    storage_context.docstore.persist(persist_path=os.path.join(db_path, DOCSTORE_FILE))
+    storage_context.index_store.persist(persist_path=os.path.join(db_path, INDEX_STORE_FILE))
+    storage_context.vector_store.persist(persist_path=os.path.join(db_path, VECTOR_STORE_FILE))
+    _remove_change_log(db_path)
+
+
+def _remove_change_log(db_path: str):
+    change_log = os.path.join(db_path, CHANGE_LOG_NAME)
+    if os.path.exists(change_log):
+        os.remove(change_log)
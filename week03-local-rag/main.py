@@ -1,12 +1,19 @@
+# 知识库构建的解析子进程以spawn方式启动，会以 __mp_main__ 的名字重新执行本文件；
+# 子进程只需要 ingest_worker.parse_file，此时跳过界面、向量化模型和构建任务管理器的导入与创建
+PARSE_SUBPROCESS = __name__ == "__mp_main__"
+
 # 导入依赖 - 构建多模态RAG系统的核心组件
-from fastapi import FastAPI
-from fastapi.responses import HTMLResponse
-import gradio as gr
-import os
-from html_string import main_html, plain_html
-from upload_file import *
-from create_kb import *
-from chat import get_model_response
+if not PARSE_SUBPROCESS:
+    from fastapi import FastAPI
+    from fastapi.responses import HTMLResponse
+    import gradio as gr
+    import os
+    from html_string import main_html, plain_html
+    from upload_file import *
+    from create_kb import *
+    from chat import get_model_response
+    from index_registry import INDEX_REGISTRY, PRELOAD_KB_COUNT
+    from ingest_jobs import INGEST_JOBS
 
 def user(user_message, history):
 
@@ -191,25 +198,42 @@ def get_knowledge_base_block():
                 create_knowledge_base_btn_1 = gr.Button("确认创建知识库",variant="primary",scale=1)
         with gr.Row():
             knowledge_base =gr.Dropdown(choices=os.listdir(DB_PATH),label="管理知识库",interactive=True,scale=4)
+            update_db_btn = gr.Button("同步知识库",variant="secondary",scale=1)
             delete_db_btn = gr.Button("删除知识库",variant="stop",scale=1)
+        # 后台构建任务进度 - 定时轮询任务状态
+        ingest_status = gr.Textbox(label="构建任务进度",value=INGEST_JOBS.status_text,interactive=False,lines=5)
+        gr.Timer(2).tick(INGEST_JOBS.status_text,outputs=[ingest_status])
         create_knowledge_base_btn.click(fn=create_unstructured_db,inputs=[knowledge_base_name,data_label_2]).then(update_knowledge_base,outputs=[knowledge_base])
         delete_db_btn.click(delete_db,inputs=[knowledge_base]).then(update_knowledge_base,outputs=[knowledge_base])
+        update_db_btn.click(update_db,inputs=[knowledge_base])
         create_knowledge_base_btn_1.click(fn=create_structured_db,inputs=[knowledge_base_name_1,data_label_3]).then(update_knowledge_base,outputs=[knowledge_base])
         knowledge.load(update_knowledge_base,[],knowledge_base)
         knowledge.load(update_label,[],data_label_2)
         knowledge.load(update_datatable,[],data_label_3)
     return knowledge
 
-app = FastAPI()
-@app.get("/", response_class=HTMLResponse)
-def read_main():
-    html_content = main_html
-    return HTMLResponse(content=html_content)
+def create_app():
+    app = FastAPI()
+    @app.get("/", response_class=HTMLResponse)
+    def read_main():
+        html_content = main_html
+        return HTMLResponse(content=html_content)
+
+    # 后台任务放在服务启动事件中，只在服务真正启动时预加载索引、恢复构建任务
+    @app.on_event("startup")
+    def start_background_tasks():
+        # 后台预加载最常用的知识库索引，首条消息无需等待反序列化
+        INDEX_REGISTRY.start_preload(PRELOAD_KB_COUNT)
+        # 恢复上次未完成的知识库构建任务
+        INGEST_JOBS.resume()
 
+    app = gr.mount_gradio_app(app, get_chat_block(), path="/chat")
+    app = gr.mount_gradio_app(app, get_upload_block(), path="/upload_data")
+    app = gr.mount_gradio_app(app, get_knowledge_base_block(), path="/create_knowledge_base")
+    return app
 
-app = gr.mount_gradio_app(app, get_chat_block(), path="/chat")
-app = gr.mount_gradio_app(app, get_upload_block(), path="/upload_data")
-app = gr.mount_gradio_app(app, get_knowledge_base_block(), path="/create_knowledge_base")
+if not PARSE_SUBPROCESS:
+    app = create_app()
 
 
 if __name__ == "__main__":
@@ -4,6 +4,7 @@
 import gradio as gr
 import os
 import shutil
+from itertools import islice
 import pandas as pd
 
 # 文件存储路径配置 - 采用分层存储架构设计
@@ -11,6 +12,10 @@ import pandas as pd
 STRUCTURED_FILE_PATH = "File/Structured"      # 结构化数据存储路径（CSV/Excel等表格数据）
 UNSTRUCTURED_FILE_PATH = "File/Unstructured"  # 非结构化数据存储路径（PDF/DOC/TXT等文档数据）
 
+# 结构化数据流式处理配置
+TABLE_EXTENSIONS = (".xlsx", ".csv")   # 支持的表格格式
+STRUCTURED_BATCH_ROWS = 500            # 每批读取、序列化的行数，限制单批内存占用
+
 # 目录刷新函数 - 实现动态文件系统监控
 def refresh_label():
     """
@@ -36,6 +41,7 @@ def upload_unstructured_file(files, label_name):
     1. 采用原子性操作确保文件上传的事务完整性
     2. 使用shutil.move而非copy，避免临时文件残留和磁盘空间浪费
     3. 实现文件去重机制，防止重复上传导致的存储冗余
+    4. 类目已存在时追加文件（同名文件覆盖），随后在知识库页面增量同步即可
     
     参数:
         files: Gradio文件对象列表，包含临时文件路径信息
@@ -46,10 +52,8 @@ def upload_unstructured_file(files, label_name):
         gr.Info("请上传文件")
     elif len(label_name) == 0:
         gr.Info("请输入类目名称")
-    # 防重复创建检查 - 避免目录冲突和数据覆盖风险
-    elif label_name in os.listdir(UNSTRUCTURED_FILE_PATH):
-        gr.Info(f"{label_name}类目已存在")
     else:
+        existed = label_name in os.listdir(UNSTRUCTURED_FILE_PATH)
         try:
             # 确保目标目录存在 - 惰性目录创建模式
             if not os.path.exists(os.path.join(UNSTRUCTURED_FILE_PATH, label_name)):
@@ -66,78 +70,178 @@ def upload_unstructured_file(files, label_name):
                 # 2. 确保文件操作的原子性
                 # 3. 减少I/O操作提升性能
                 shutil.move(file_path, destination_file_path)
-            gr.Info(f"文件已上传至{label_name}类目中，请前往创建知识库")
+            if existed:
+                gr.Info(f"文件已追加至{label_name}类目中，请前往知识库页面同步")
+            else:
+                gr.Info(f"文件已上传至{label_name}类目中，请前往创建知识库")
         except Exception as e:
             # 异常处理 - 提供用户友好的错误反馈
             gr.Info(f"请勿重复上传")
 
-# 结构化数据上传与预处理器
+# 结构化数据上传处理器
 def upload_structured_file(files, label_name):
     """
-    结构化数据上传与格式转换核心函数
+    结构化数据上传核心函数
     
     核心设计思想：
-    1. 结构化数据向量化预处理：将表格数据转换为文本格式以适配向量数据库
-    2. 语义保持转换：采用键值对格式保持原始数据的语义结构
-    3. 内存优化：处理完成后立即删除原始文件，避免存储冗余
+    1. 保留原始表格文件：不再逐行转换为中间txt文件，构建知识库时直接从表格流式读取
+    2. 上传时只读取表头做格式校验，大表格上传不再需要逐行遍历
+    3. 数据表已存在时追加文件（同名文件覆盖），随后在知识库页面增量同步即可
     
     技术实现要点：
     - 支持多种表格格式（Excel/CSV）的统一处理
-    - 采用行级序列化策略，每行数据转换为独立的文本块
-    - 使用特殊分隔符【】标记数据边界，便于后续chunk分割
+    - 行级序列化见 serialize_rows，每行数据转换为独立的文本块
+    - 使用特殊分隔符【】标记数据边界
     """
     if files is None:
         gr.Info("请上传文件")
     elif len(label_name) == 0:
         gr.Info("请输入数据表名称")
-    # 防重复创建检查
-    elif label_name in os.listdir(STRUCTURED_FILE_PATH):
-        gr.Info(f"{label_name}数据表已存在")
     else:
+        existed = label_name in os.listdir(STRUCTURED_FILE_PATH)
         try:
             # 确保目标目录存在
             if not os.path.exists(os.path.join(STRUCTURED_FILE_PATH, label_name)):
                 os.mkdir(os.path.join(STRUCTURED_FILE_PATH, label_name))
             
+            uploaded = 0
             for file in files:
                 file_path = file.name
                 file_name = os.path.basename(file_path)
+                if os.path.splitext(file_name)[1].lower() not in TABLE_EXTENSIONS:
+                    gr.Info(f"{file_name}不是支持的表格格式，已跳过")
+                    continue
+                # 格式校验 - 移动前只读取第一批数据，确认文件可以解析，解析失败的文件不进入数据表目录
+                try:
+                    next(iter_table_chunks(file_path), None)
+                except Exception as e:
+                    gr.Info(f"{file_name}解析失败，已跳过：{e}")
+                    continue
                 destination_file_path = os.path.join(STRUCTURED_FILE_PATH, label_name, file_name)
                 shutil.move(file_path, destination_file_path)
-                
-                # 多格式表格数据统一处理 - 策略模式应用
-                if os.path.splitext(destination_file_path)[1] == ".xlsx":
-                    df = pd.read_excel(destination_file_path)
-                elif os.path.splitext(destination_file_path)[1] == ".csv":
-                    df = pd.read_csv(destination_file_path)
-                
-                # 结构化数据文本化转换
-                txt_file_name = os.path.splitext(file_name)[0] + '.txt'
-                columns = df.columns
-                
-                # 行级数据序列化处理
-                with open(os.path.join(STRUCTURED_FILE_PATH, label_name, txt_file_name), "w", encoding='utf-8') as file:
-                    for idx, row in df.iterrows():
-                        file.write("【")  # 数据块起始标记
-                        info = []
-                        # 键值对格式转换 - 保持语义结构
-                        for col in columns:
-                            info.append(f"{col}:{row[col]}")
-                        infos = ",".join(info)
-                        file.write(infos)
-                        # 条件性换行处理 - 避免文件末尾多余换行
-                        if idx != len(df) - 1:
-                            file.write("】\n")
-                        else:
-                            file.write("】")
-                
-                # 原始文件清理 - 避免存储冗余和潜在的数据泄露风险
-                os.remove(destination_file_path)
+                uploaded += 1
             
-            gr.Info(f"文件已上传至{label_name}数据表中，请前往创建知识库")
+            if uploaded == 0:
+                if not existed:
+                    os.rmdir(os.path.join(STRUCTURED_FILE_PATH, label_name))
+            elif existed:
+                gr.Info(f"文件已追加至{label_name}数据表中，请前往知识库页面同步")
+            else:
+                gr.Info(f"文件已上传至{label_name}数据表中，请前往创建知识库")
         except Exception as e:
             gr.Info(f"请勿重复上传")
 
+def serialize_rows(df: pd.DataFrame) -> pd.Series:
+    """
+    表格行的向量化序列化
+    
+    每行转换为"【列名:值,列名:值】"格式的文本，按列整体拼接字符串，
+    避免 df.iterrows() 逐行构造 Series 和逐单元格格式化的开销
+    """
+    if df.empty:
+        return pd.Series([], dtype=object)
+    # 空单元格与原先的逐行转换保持一致，输出为nan
+    values = df.astype(object).where(df.notna(), "nan")
+    text = None
+    for col in df.columns:
+        part = f"{col}:" + values[col].astype(str)
+        text = part if text is None else text + "," + part
+    return "【" + text + "】"
+
+def dedupe_columns(names):
+    """
+    重复列名按 pandas.read_excel 的规则重命名（值、值.1、值.2 ...）
+
+    DataFrame 列名重复时按列取值会报错，序列化结果也需要与 pandas 读取时一致
+    """
+    counts = {}
+    result = []
+    for name in names:
+        count = counts.get(name, 0)
+        while count > 0:
+            counts[name] = count + 1
+            name = f"{name}.{count}"
+            count = counts.get(name, 0)
+        result.append(name)
+        counts[name] = count + 1
+    return result
+
+def iter_table_chunks(file_path: str, batch_rows: int = STRUCTURED_BATCH_ROWS):
+    """
+    分批读取表格文件，每次返回最多 batch_rows 行的DataFrame
+    
+    - CSV：pandas 按 chunksize 分块解析
+    - Excel：openpyxl 只读模式逐行迭代，不把整个工作表载入内存
+    """
+    extension = os.path.splitext(file_path)[1].lower()
+    if extension == ".csv":
+        yield from pd.read_csv(file_path, chunksize=batch_rows)
+    elif extension == ".xlsx":
+        from openpyxl import load_workbook
+        workbook = load_workbook(file_path, read_only=True, data_only=True)
+        try:
+            rows = workbook.worksheets[0].iter_rows(values_only=True)
+            header = next(rows, None)
+            if header is None:
+                return
+            # 空表头与 pandas.read_excel 的命名保持一致
+            columns = dedupe_columns([name if name is not None else f"Unnamed: {i}" for i, name in enumerate(header)])
+            while True:
+                chunk = list(islice(rows, batch_rows))
+                if not chunk:
+                    break
+                yield pd.DataFrame(chunk, columns=columns)
+        finally:
+            workbook.close()
+    else:
+        raise ValueError(f"不支持的表格格式：{file_path}")
+
+def estimate_table_rows(file_path: str) -> int:
+    """
+    估算表格数据行数，用于进度显示（不解析单元格内容）
+    """
+    extension = os.path.splitext(file_path)[1].lower()
+    if extension == ".xlsx":
+        from openpyxl import load_workbook
+        workbook = load_workbook(file_path, read_only=True)
+        try:
+            return max((workbook.worksheets[0].max_row or 1) - 1, 0)
+        finally:
+            workbook.close()
+    # CSV及文本文件按换行数估算
+    lines = 0
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            lines += block.count(b"\n")
+    return lines if extension == ".txt" else max(lines - 1, 0)
+
+def iter_structured_file(file_path: str, batch_rows: int = STRUCTURED_BATCH_ROWS):
+    """
+    流式遍历单个数据表文件的所有行
+    
+    返回：
+        生成器，每次产出 (本批起始行号, 本批行文本列表)
+    
+    兼容旧版本上传生成的txt文件：每个非空行作为一条数据
+    """
+    extension = os.path.splitext(file_path)[1].lower()
+    start_row = 0
+    if extension in TABLE_EXTENSIONS:
+        for df in iter_table_chunks(file_path, batch_rows):
+            texts = serialize_rows(df).tolist()
+            yield start_row, texts
+            start_row += len(texts)
+    elif extension == ".txt":
+        with open(file_path, "r", encoding="utf-8") as f:
+            lines = (line.strip() for line in f)
+            lines = (line for line in lines if line)
+            while True:
+                texts = list(islice(lines, batch_rows))
+                if not texts:
+                    break
+                yield start_row, texts
+                start_row += len(texts)
+
 # UI状态同步函数 - 实现响应式界面更新
 def update_datatable():
     """
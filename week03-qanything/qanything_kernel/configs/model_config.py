@@ -185,6 +185,14 @@ MYSQL_USER_LOCAL = 'root'
 MYSQL_PASSWORD_LOCAL = '123456'
 MYSQL_DATABASE_LOCAL = 'qanything'
 
+# QaLogs 后台批量写入：攒够 QALOG_BATCH_SIZE 条或超过 QALOG_FLUSH_INTERVAL 秒即落库
+# 队列满时请求在线程池中等待队列空位（不阻塞事件循环），超过 QALOG_PUT_TIMEOUT 秒仍无空位才放弃并记录错误
+QALOG_QUEUE_SIZE = 1024
+QALOG_PUT_TIMEOUT = 30  # 单位：秒
+QALOG_BATCH_SIZE = 32
+QALOG_FLUSH_INTERVAL = 2  # 单位：秒
+QALOG_MAX_RETRIES = 3
+
 LOCAL_OCR_SERVICE_URL = "localhost:7001"
 
 LOCAL_PDF_PARSER_SERVICE_URL = "localhost:9009"
@@ -1,17 +1,136 @@
 from qanything_kernel.configs.model_config import (MYSQL_HOST_LOCAL, MYSQL_PORT_LOCAL, MYSQL_USER_LOCAL,
                                                    MYSQL_PASSWORD_LOCAL,
-                                                   MYSQL_DATABASE_LOCAL, KB_SUFFIX, MILVUS_HOST_LOCAL)
+                                                   MYSQL_DATABASE_LOCAL, KB_SUFFIX, MILVUS_HOST_LOCAL,
+                                                   QALOG_QUEUE_SIZE, QALOG_BATCH_SIZE, QALOG_FLUSH_INTERVAL,
+                                                   QALOG_MAX_RETRIES, QALOG_PUT_TIMEOUT)
 from qanything_kernel.utils.custom_log import debug_logger, insert_logger
 import mysql.connector
 from mysql.connector import pooling
 import json
 from typing import List, Optional, Dict
 import uuid
+import asyncio
+import queue
+import threading
+import time
 from datetime import datetime, timedelta
 from collections import defaultdict
 from mysql.connector.errors import Error as MySQLError
 
 
+QALOG_COLUMNS = ("qa_id", "user_id", "bot_id", "kb_ids", "query", "model", "product_source", "time_record",
+                 "history", "condense_question", "prompt", "result", "retrieval_documents", "source_documents")
+
+
+class QaLogWriter:
+    """
+    QaLogs 后台批量写入器
+
+    add_qalog 只负责把行数据放入有界队列，由后台线程攒批后用一条多行 INSERT 落库，
+    避免在请求处理路径上同步写大字段并与检索争抢连接池。
+    队列满时形成背压：put_async 在线程池中等待队列空位，请求协程挂起但不阻塞 Sanic 事件循环，
+    等待超过 put_timeout 仍无空位才放弃该条日志并记录错误。
+    close 之后的 put 直接同步写入，close 时会把队列中剩余的数据全部写完。
+    """
+    _STOP = object()
+
+    def __init__(self, execute_query, max_queue_size=QALOG_QUEUE_SIZE, batch_size=QALOG_BATCH_SIZE,
+                 flush_interval=QALOG_FLUSH_INTERVAL, max_retries=QALOG_MAX_RETRIES, put_timeout=QALOG_PUT_TIMEOUT):
+        self.execute_query = execute_query
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self.put_timeout = put_timeout
+        self.queue = queue.Queue(maxsize=max_queue_size)
+        self.closed = False
+        # 保证 put 与 close 互斥，close 放入 _STOP 之后不会再有数据进入队列
+        self.lock = threading.Lock()
+        self.thread = threading.Thread(target=self._run, name="qalog-writer", daemon=True)
+        self.thread.start()
+
+    def put(self, row, block=True):
+        """放入队列，block为True时最多等待 put_timeout 秒；返回是否已放入队列（或已直接写入）"""
+        deadline = time.monotonic() + self.put_timeout
+        while True:
+            # 只在检查 closed 和入队时持锁，等待期间不持锁，事件循环上的非阻塞 put 不会被卡住
+            with self.lock:
+                if self.closed:
+                    break
+                try:
+                    self.queue.put_nowait(row)
+                    return True
+                except queue.Full:
+                    pass
+            if not block:
+                return False
+            if time.monotonic() >= deadline:
+                debug_logger.error("QaLogs 写入队列已满({})，等待 {}s 仍无空位，放弃 qa_id: {}".format(
+                    self.queue.maxsize, self.put_timeout, row[0]))
+                return False
+            time.sleep(0.05)
+        # 已关闭（如服务退出阶段仍有请求收尾），直接同步写入
+        self._flush([row])
+        return True
+
+    async def put_async(self, row):
+        """在事件循环中调用：队列有空位时直接放入，否则在线程池中等待，不阻塞事件循环"""
+        if self.put(row, block=False):
+            return True
+        return await asyncio.get_running_loop().run_in_executor(None, self.put, row)
+
+    def close(self, timeout=None):
+        with self.lock:
+            if self.closed:
+                return
+            self.closed = True
+        # 后台线程持续消费队列，这里阻塞等待放入 _STOP 不会死锁
+        self.queue.put(self._STOP)
+        self.thread.join(timeout)
+        debug_logger.info("QaLogWriter 已关闭，剩余未写入条数：{}".format(self.queue.qsize()))
+
+    def _run(self):
+        batch = []
+        deadline = time.monotonic() + self.flush_interval
+        while True:
+            try:
+                row = self.queue.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                row = None
+            if row is self._STOP:
+                self._flush(batch)
+                return
+            if row is not None:
+                batch.append(row)
+            if len(batch) >= self.batch_size or (batch and time.monotonic() >= deadline):
+                self._flush(batch)
+                batch = []
+            if time.monotonic() >= deadline:
+                deadline = time.monotonic() + self.flush_interval
+
+    def _flush(self, rows):
+        if not rows:
+            return
+        placeholders = "(" + ", ".join(["%s"] * len(QALOG_COLUMNS)) + ")"
+        insert_query = "INSERT INTO QaLogs ({}) VALUES {}".format(", ".join(QALOG_COLUMNS),
+                                                                 ", ".join([placeholders] * len(rows)))
+        params = [value for row in rows for value in row]
+        for attempt in range(1, self.max_retries + 1):
+            start = time.perf_counter()
+            res = self.execute_query(insert_query, params, commit=True, check=True)
+            if res is not None:
+                debug_logger.info("QaLogWriter 写入 {} 条，耗时 {:.3f}s".format(len(rows), time.perf_counter() - start))
+                return
+            if attempt < self.max_retries:
+                time.sleep(min(2 ** attempt, 10))
+        if len(rows) > 1:
+            # 多行 INSERT 中任意一行出错整批都会失败，逐行重试，只丢弃真正写不进去的行
+            debug_logger.warning("QaLogWriter 批量写入 {} 条失败，改为逐行写入".format(len(rows)))
+            for row in rows:
+                self._flush([row])
+            return
+        debug_logger.error("QaLogWriter 写入失败，丢弃 qa_id: {}".format(rows[0][0]))
+
+
 class KnowledgeBaseManager:
     def __init__(self, pool_size=8):
         host = MYSQL_HOST_LOCAL
@@ -32,6 +151,7 @@ class KnowledgeBaseManager:
         self.free_cnx = pool_size
         self.used_cnx = 0
         self.create_tables_()
+        self.qalog_writer = QaLogWriter(self.execute_query_)
         debug_logger.info("[SUCCESS] 数据库{}连接成功".format(database))
 
     def check_database_(self, host, port, user, password, database_name):
@@ -670,7 +790,7 @@ class KnowledgeBaseManager:
             total_deleted += res
         debug_logger.info(f"delete_faqs count: {total_deleted}")
 
-    def add_qalog(self, user_id, bot_id, kb_ids, query, model, product_source, time_record, history, condense_question,
+    async def add_qalog(self, user_id, bot_id, kb_ids, query, model, product_source, time_record, history, condense_question,
                   prompt, result, retrieval_documents, source_documents):
         debug_logger.info("add_qalog: {}".format(query))
         qa_id = uuid.uuid4().hex
@@ -679,13 +799,14 @@ class KnowledgeBaseManager:
         source_documents = json.dumps(source_documents, ensure_ascii=False)
         history = json.dumps(history, ensure_ascii=False)
         time_record = json.dumps(time_record, ensure_ascii=False)
-        insert_query = (
-            "INSERT INTO QaLogs (qa_id, user_id, bot_id, kb_ids, query, model, product_source, time_record, "
-            "history, condense_question, prompt, result, retrieval_documents, source_documents) "
-            "VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)")
-        self.execute_query_(insert_query, (qa_id, user_id, bot_id, kb_ids, query, model, product_source, time_record,
-                                           history, condense_question, prompt, result, retrieval_documents,
-                                           source_documents), commit=True)
+        # 交给后台线程批量写入，顺序与 QALOG_COLUMNS 一致；队列满时在这里等待
+        await self.qalog_writer.put_async((qa_id, user_id, bot_id, kb_ids, query, model, product_source, time_record,
+                               history, condense_question, prompt, result, retrieval_documents, source_documents))
+        return qa_id
+
+    def close(self):
+        # 服务退出时把尚未落库的 QaLogs 全部写完
+        self.qalog_writer.close()
 
     def get_qalog_by_filter(self, need_info, user_id=None, query=None, bot_id=None, time_range=None, any_kb_id=None, qa_ids=None):
         # 判断哪些条件不是None，构建搜索query
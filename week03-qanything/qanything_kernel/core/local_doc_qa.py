@@ -20,6 +20,7 @@ from qanything_kernel.utils.general_utils import (get_time, clear_string, get_ti
                                                   cosine_similarity, clear_string_is_equal, num_tokens_embed,
                                                   num_tokens_rerank, deduplicate_documents, replace_image_references)
 from qanything_kernel.utils.custom_log import debug_logger, qa_logger, rerank_logger
+from qanything_kernel.utils.prompt_context import ReferenceContextBuilder, strip_figures, strip_headers
 from qanything_kernel.core.chains.condense_q_chain import RewriteQuestionChain
 from qanything_kernel.core.tools.web_search_tool import duckduckgo_search
 import copy
@@ -223,7 +224,8 @@ class LocalDocQA:
     def reprocess_source_documents(self, custom_llm: OpenAILLM, query: str,
                                    source_docs: List[Document],
                                    history: List[str],
-                                   prompt_template: str) -> Tuple[List[Document], int, str]:
+                                   prompt_template: str,
+                                   context_builder: ReferenceContextBuilder = None) -> Tuple[List[Document], int, str]:
         """
         智能处理源文档以适应Token限制 - RAG系统的关键优化环节
         
@@ -244,6 +246,7 @@ class LocalDocQA:
             source_docs: 源文档列表
             history: 对话历史
             prompt_template: prompt模板
+            context_builder: 与generate_prompt共用的上下文构建器，为None时新建
             
         Returns:
             (处理后的文档列表, 可用token数量, token使用说明)
@@ -285,49 +288,20 @@ class LocalDocQA:
         #     return []
         # 从最后一个往前删除，直到长度合适,这样是最优的，因为超长度的情况比较少见
         # 已知箱子容量，装满这个箱子
-        new_source_docs = []
-        total_token_num = 0
-
-        not_repeated_file_ids = []
-        for doc in source_docs:
-            headers_token_num = 0
-            file_id = doc.metadata['file_id']
-            if file_id not in not_repeated_file_ids:
-                not_repeated_file_ids.append(file_id)
-                if 'headers' in doc.metadata:
-                    headers = f"headers={doc.metadata['headers']}"
-                    headers_token_num = custom_llm.num_tokens_from_messages([headers])
-            doc_valid_content = re.sub(r'!\[figure]\(.*?\)', '', doc.page_content)
-            doc_token_num = custom_llm.num_tokens_from_messages([doc_valid_content])
-            doc_token_num += headers_token_num
-            if total_token_num + doc_token_num <= limited_token_nums:
-                new_source_docs.append(doc)
-                total_token_num += doc_token_num
-            else:
-                break
+        # 去图片、分组、统计token在一遍中完成，上下文留给generate_prompt复用
+        if context_builder is None:
+            context_builder = ReferenceContextBuilder()
+        new_source_docs, _, total_token_num = context_builder.fit(source_docs, limited_token_nums,
+                                                                  custom_llm.num_tokens_from_messages)
 
         debug_logger.info(f"new_source_docs token nums: {custom_llm.num_tokens_from_docs(new_source_docs)}")
         return new_source_docs, limited_token_nums, tokens_msg
 
-    def generate_prompt(self, query, source_docs, prompt_template):
+    def generate_prompt(self, query, source_docs, prompt_template, context_builder: ReferenceContextBuilder = None):
         if source_docs:
-            context = ''
-            not_repeated_file_ids = []
-            for doc in source_docs:
-                doc_valid_content = re.sub(r'!\[figure]\(.*?\)', '', doc.page_content)  # 生成prompt时去掉图片
-                file_id = doc.metadata['file_id']
-                if file_id not in not_repeated_file_ids:
-                    if len(not_repeated_file_ids) != 0:
-                        context += '</reference>\n'
-                    not_repeated_file_ids.append(file_id)
-                    if 'headers' in doc.metadata:
-                        headers = f"headers={doc.metadata['headers']}"
-                        context += f"<reference {headers}>[{len(not_repeated_file_ids)}]" + '\n' + doc_valid_content + '\n'
-                    else:
-                        context += f"<reference>[{len(not_repeated_file_ids)}]" + '\n' + doc_valid_content + '\n'
-                else:
-                    context += doc_valid_content + '\n'
-            context += '</reference>\n'
+            if context_builder is None:
+                context_builder = ReferenceContextBuilder()
+            context = context_builder.build(source_docs)  # 生成prompt时去掉图片
 
             # prompt = prompt_template.format(context=context).replace("{{question}}", query)
             prompt = prompt_template.replace("{{context}}", context).replace("{{question}}", query)
@@ -662,7 +636,7 @@ class LocalDocQA:
 
         # rerank之后删除headers，只保留文本内容，用于后续处理
         for doc in source_documents:
-            doc.page_content = re.sub(r'^\[headers]\(.*?\)\n', '', doc.page_content)
+            doc.page_content = strip_headers(doc.page_content)
 
         high_score_faq_documents = [doc for doc in source_documents if
                                     doc.metadata['file_name'].endswith('.faq') and doc.metadata['score'] >= 0.9]
@@ -690,6 +664,7 @@ class LocalDocQA:
         extra_msg = None
         total_images_number = 0
         retrieval_documents = []
+        context_builder = ReferenceContextBuilder()
         if source_documents:
             if custom_prompt:
                 # escaped_custom_prompt = custom_prompt.replace('{', '{{').replace('}', '}}')
@@ -707,7 +682,8 @@ class LocalDocQA:
                                                                                                   query=query,
                                                                                                   source_docs=source_documents,
                                                                                                   history=chat_history,
-                                                                                                  prompt_template=prompt_template)
+                                                                                                  prompt_template=prompt_template,
+                                                                                                  context_builder=context_builder)
 
             if len(retrieval_documents) < len(source_documents):
                 # 重新处理后文档数量减少，说明由于tokens不足而被裁切
@@ -768,7 +744,8 @@ class LocalDocQA:
         acc_resp = ''
         prompt = self.generate_prompt(query=query,
                                       source_docs=source_documents,
-                                      prompt_template=prompt_template)
+                                      prompt_template=prompt_template,
+                                      context_builder=context_builder)
         # debug_logger.info(f"prompt: {prompt}")
         est_prompt_tokens = num_tokens(prompt) + num_tokens(str(chat_history))
         async for answer_result in custom_llm.generatorAnswer(prompt=prompt, history=chat_history, streaming=streaming):
@@ -842,19 +819,21 @@ class LocalDocQA:
         if limit:
             sorted_json_datas = sorted_json_datas[limit[0]: limit[1] + 1]
 
-        completed_content_with_figure = ''
-        completed_content = ''
+        contents_with_figure = []
+        contents = []
         for doc_json in sorted_json_datas:
             doc = Document(page_content=doc_json['kwargs']['page_content'], metadata=doc_json['kwargs']['metadata'])
             # rerank之后删除headers，只保留文本内容，用于后续处理
-            doc.page_content = re.sub(r'^\[headers]\(.*?\)\n', '', doc.page_content)
+            doc.page_content = strip_headers(doc.page_content)
             # if filter_figures:
             #     doc.page_content = re.sub(r'!\[figure]\(.*?\)', '', doc.page_content)  # 删除图片
             if doc_json['kwargs']['metadata']['file_name'].endswith('.faq'):
                 faq_dict = doc_json['kwargs']['metadata']['faq_dict']
                 doc.page_content = f"{faq_dict['question']}：{faq_dict['answer']}"
-            completed_content_with_figure += doc.page_content + '\n\n'
-            completed_content += re.sub(r'!\[figure]\(.*?\)', '', doc.page_content) + '\n\n' # 删除图片
+            contents_with_figure.extend([doc.page_content, '\n\n'])
+            contents.extend([strip_figures(doc.page_content), '\n\n'])  # 删除图片
+        completed_content_with_figure = ''.join(contents_with_figure)
+        completed_content = ''.join(contents)
         completed_doc_with_figure = Document(page_content=completed_content_with_figure, metadata=sorted_json_datas[0]['kwargs']['metadata'])
         completed_doc = Document(page_content=completed_content, metadata=sorted_json_datas[0]['kwargs']['metadata'])
         # FIX metadata
@@ -14,7 +14,8 @@ from qanything_kernel.utils.loader import UnstructuredPaddlePDFLoader
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from qanything_kernel.utils.loader.csv_loader import CSVLoader
 from qanything_kernel.utils.loader.json_loader import JSONLoader
-from qanything_kernel.utils.loader.markdown_parser import convert_markdown_to_langchaindoc
+from qanything_kernel.utils.loader.excel_loader import ExcelLoader
+from qanything_kernel.utils.loader.markdown_parser import convert_markdown_to_langchaindoc, iter_markdown_documents
 import asyncio
 import aiohttp
 import docx2txt
@@ -28,6 +29,7 @@ import re
 import newspaper
 import uuid
 import traceback
+import itertools
 import openpyxl
 import shutil
 import time
@@ -213,6 +215,29 @@ class LocalFileForInsert:
             new_docs.extend(slices)
         return new_docs
 
+    def excel_table_process(self, docs):
+        """
+        为ExcelLoader产出的行窗口登记整表文档
+
+        每个sheet拼出一份完整表格存入mysql，sheet内所有行窗口带上同一个table_doc_id，
+        检索命中部分行时仍可扩展为整张表（与原先经markdown_process处理的效果一致）
+        """
+        new_docs = []
+        for _, sheet_docs in itertools.groupby(docs, key=lambda doc: doc.metadata['page_id']):
+            sheet_docs = list(sheet_docs)
+            title_lst = sheet_docs[0].metadata['title_lst']
+            # 每个窗口都是：标题行 + 表头 + 分隔行 + 数据行；整表只保留一份表头，不含标题行
+            lines = sheet_docs[0].page_content.split('\n')[len(title_lst):]
+            for doc in sheet_docs[1:]:
+                lines.extend(doc.page_content.split('\n')[len(title_lst) + 2:])
+            table_doc = Document(page_content='\n'.join(lines), metadata=dict(sheet_docs[0].metadata))
+            table_doc_id = str(uuid.uuid4())
+            self.mysql_client.add_document(table_doc_id, table_doc.to_json())
+            for doc in sheet_docs:
+                doc.metadata['table_doc_id'] = table_doc_id
+            new_docs.extend(sheet_docs)
+        return new_docs
+
     @get_time_async
     async def url_to_documents_async(self, file_path, file_name, file_url, dir_path="tmp_files", max_retries=3):
         full_dir_path = os.path.join(os.path.dirname(file_path), dir_path)
@@ -290,51 +315,6 @@ class LocalFileForInsert:
 
         return None
 
-    @staticmethod
-    def excel_to_markdown(file_path, markdown_path):
-        def clean_cell_content(cell):
-            if cell is None:
-                return ''
-            # 将单元格内容转换为字符串，并替换换行符为空格
-            return re.sub(r'\s+', ' ', str(cell)).strip()
-        basename = os.path.splitext(os.path.basename(file_path))[0]
-        markdown_file = os.path.join(markdown_path, f"{basename}.md")
-
-        workbook = openpyxl.load_workbook(file_path, read_only=True, data_only=True)
-
-        with open(markdown_file, 'w', encoding='utf-8') as md_file:
-            for sheet_name in workbook.sheetnames:
-                sheet = workbook[sheet_name]
-                md_file.write(f"# {sheet_name}\n\n")
-
-                # 获取非空行和列
-                rows = [[clean_cell_content(cell) for cell in row] for row in sheet.iter_rows(values_only=True)]
-                non_empty_rows = [row for row in rows if any(cell != '' for cell in row)]
-
-                if not non_empty_rows:
-                    continue  # 跳过空表格
-
-                max_cols = max(len(row) for row in non_empty_rows)
-
-                # 处理每一行
-                for row_index, row in enumerate(non_empty_rows):
-                    # 补齐空单元格
-                    padded_row = row + [''] * (max_cols - len(row))
-
-                    # 转换为Markdown表格行，使用竖线作为分隔符
-                    markdown_row = '| ' + ' | '.join(padded_row) + ' |'
-                    md_file.write(markdown_row + '\n')
-
-                    # 在第一行后添加分隔符
-                    if row_index == 0:
-                        separator = '|' + '|'.join(['---' for _ in range(max_cols)]) + '|'
-                        md_file.write(separator + '\n')
-
-                md_file.write('\n\n')  # 在每个表格后添加空行
-
-        insert_logger.info(f"转换完成。Markdown 文件已保存为 {markdown_file}")
-        return markdown_file
-
     @staticmethod
     def load_text(file_path):
         encodings = ['utf-8', 'iso-8859-1', 'windows-1252']
@@ -382,8 +362,7 @@ class LocalFileForInsert:
                     docs = loader.load()
         elif self.file_path.lower().endswith(".md"):
             try:
-                docs = convert_markdown_to_langchaindoc(self.file_path)
-                docs = self.markdown_process(docs)
+                docs = self.markdown_process(iter_markdown_documents(self.file_path))
             except Exception as e:
                 insert_logger.error(
                     f"convert_markdown_to_langchaindoc error: {self.file_path}, {traceback.format_exc()}")
@@ -394,8 +373,7 @@ class LocalFileForInsert:
         elif self.file_path.lower().endswith(".pdf"):
             markdown_file = get_pdf_result_sync(self.file_path)
             if markdown_file:
-                docs = convert_markdown_to_langchaindoc(markdown_file)
-                docs = self.markdown_process(docs)
+                docs = self.markdown_process(iter_markdown_documents(markdown_file))
                 images_dir = os.path.join(IMAGES_ROOT_PATH, self.file_id)
                 self.copy_images(os.path.dirname(markdown_file), images_dir)
             else:
@@ -418,9 +396,9 @@ class LocalFileForInsert:
                 docs = [Document(page_content=text)]
         elif self.file_path.lower().endswith(".xlsx"):
             try:
-                markdown_file = self.excel_to_markdown(self.file_path, os.path.dirname(self.file_path))
-                docs = convert_markdown_to_langchaindoc(markdown_file)
-                docs = self.markdown_process(docs)
+                # 只读模式逐行流式读取，按chunk_size切成带表头的行窗口，不再生成中间markdown文件
+                loader = ExcelLoader(self.file_path, chunk_size=self.chunk_size, length_function=num_tokens_embed)
+                docs = self.excel_table_process(loader.lazy_load())
             except Exception as e:
                 insert_logger.warning('Error in Powerful Excel parsing, use openpyxl instead.')
                 docs = []
@@ -451,6 +429,10 @@ class LocalFileForInsert:
         else:
             raise TypeError("文件类型不支持，目前仅支持：[md,txt,pdf,jpg,png,jpeg,docx,xlsx,pptx,eml,csv]")
         self.inject_metadata(docs)
+        if self.file_path.lower().endswith(".xlsx"):
+            missing = [doc for doc in self.docs if doc.metadata.get('has_table') and 'table_doc_id' not in doc.metadata]
+            if missing:
+                insert_logger.error(f"{len(missing)} xlsx table chunks have no table_doc_id: {self.file_name}")
 
     def inject_metadata(self, docs: List[Document]):
         # 这里给每个docs片段的metadata里注入file_id
@@ -471,6 +453,9 @@ class LocalFileForInsert:
             # 从文本中提取图片数量：![figure]（x-figure-x.jpg）
             new_doc.metadata["images"] = re.findall(r'!\[figure]\(\d+-figure-\d+.jpg.*?\)', page_content)
             new_doc.metadata["page_id"] = doc.metadata.get("page_id", 0)
+            if doc.metadata.get("table_doc_id"):
+                # 保留整表文档id，检索时用于把部分表格扩展为整表
+                new_doc.metadata["table_doc_id"] = doc.metadata["table_doc_id"]
             kb_name = self.mysql_client.get_knowledge_base_name([self.kb_id])[0][2]
             metadata_infos = {"知识库名": kb_name, '文件名': self.file_name}
             new_doc.metadata['headers'] = metadata_infos
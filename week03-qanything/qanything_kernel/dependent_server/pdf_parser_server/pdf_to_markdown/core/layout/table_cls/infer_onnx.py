@@ -23,12 +23,30 @@ class TableCls():
             self.table_cls = InferenceSession(cls_model, sess_options, providers=['CUDAExecutionProvider'])
         else:
             self.table_cls = InferenceSession(cls_model, sess_options, providers=['CPUExecutionProvider'])
+        batch_dim = self.table_cls.get_inputs()[0].shape[0]
+        self.dynamic_batch = not isinstance(batch_dim, int) or batch_dim <= 0
+        self._input_buffer = None
+
+    def _get_input_buffer(self, batch_size):
+        if self._input_buffer is None or self._input_buffer.shape[0] < batch_size:
+            self._input_buffer = np.empty((batch_size, 3, 224, 224), dtype=np.float32)
+        return self._input_buffer[:batch_size]
 
     def process(self, image):
-        img = Image.fromarray(np.uint8(image))
-        img = data_transform(img)
-        img = torch.unsqueeze(img, dim=0)
-        output = self.table_cls.run(None, {'input': img.numpy()})
-        predict = torch.softmax(torch.from_numpy(output[0]), dim=1)
-        predict_cla = torch.argmax(predict, dim=1).numpy()[0]
-        return cls[predict_cla]
+        return self.process_batch([image])[0]
+
+    def process_batch(self, images, batch_size=16):
+        # 所有表格都resize到224x224，可以拼成一个batch一次推理
+        if not images:
+            return []
+        step = batch_size if self.dynamic_batch else 1
+        table_types = []
+        for start in range(0, len(images), step):
+            batch_images = images[start:start + step]
+            buffer = self._get_input_buffer(len(batch_images))
+            for i, image in enumerate(batch_images):
+                buffer[i] = data_transform(Image.fromarray(np.uint8(image))).numpy()
+            output = self.table_cls.run(None, {'input': buffer})
+            predict_cla = np.argmax(output[0], axis=1)
+            table_types.extend(cls[int(c)] for c in predict_cla)
+        return table_types
@@ -9,8 +9,12 @@ class TableRecognizer():
         self.table_parse = TableParser(device)
         print('table model inited...')
 
-    def extract_table(self, table_image, ocr_result):
-        table_type = self.table_cls.process(table_image.copy())
+    def classify_tables(self, table_images):
+        return self.table_cls.process_batch([table_image.copy() for table_image in table_images])
+
+    def extract_table(self, table_image, ocr_result, table_type=None):
+        if table_type is None:
+            table_type = self.table_cls.process(table_image.copy())
         table_html, table_markdown = self.table_parse.process(table_image.copy(), table_type, ocr_result=ocr_result,
                                                               convert2markdown=True)
         return table_html, table_markdown
@@ -748,6 +748,8 @@ class HuParser:
             positions.append(poss)
         merge_header = False
         table_header = ''
+        # 先裁出所有表格图片，一次性批量做表格分类，避免逐个表格调用session
+        table_crops = []
         for k, bxs in tables.items():
             if not bxs:
                 continue
@@ -755,16 +757,32 @@ class HuParser:
                 [(b["bottom"] - b["top"]) / 2 for b in bxs]))
             poss = []
             img = cropout(bxs, "table", poss)
+            table_crops.append((k, bxs, poss, img))
+        try:
+            table_types = self.tbl_det.classify_tables([img for _, _, _, img in table_crops])
+        except Exception as e:
+            # 整批分类失败时逐个表格分类，单个失败的表格留给construct_table自行分类
+            print(f"batch table classification failed, fallback to per table: {e}")
+            table_types = []
+            for _, _, _, img in table_crops:
+                try:
+                    table_types.append(self.tbl_det.classify_tables([img])[0])
+                except Exception as e:
+                    print(e.args)
+                    table_types.append(None)
+        for (k, bxs, poss, img), table_type in zip(table_crops, table_types):
             pn = list(set([b["page_number"] - 1 for b in bxs]))[0]
             try:
                 if merge_header:
                     res_dict = self.tbl_det.construct_table(bxs, img, poss[0][1:], self.page_cum_height[pn],
-                                                            html=return_html, is_english=self.is_english)
+                                                            html=return_html, is_english=self.is_english,
+                                                            table_type=table_type)
                     res_dict['table_markdown'] = self.merge_header_markdown(table_header, res_dict['table_markdown'])
                     res.append((res_dict, k))
                 else:
                     res_dict = self.tbl_det.construct_table(bxs, img, poss[0][1:], self.page_cum_height[pn],
-                                                            html=return_html, is_english=self.is_english)
+                                                            html=return_html, is_english=self.is_english,
+                                                            table_type=table_type)
                     res.append((res_dict, k))
                 if k in table_merge_header.keys():  #下一个表格需要添加当前表头
                     merge_header = True
@@ -777,7 +795,7 @@ class HuParser:
                 res.append((
                     # img, self.tbl_det.construct_table(bxs, img, html=return_html, is_english=self.is_english)))
                     self.tbl_det.construct_table(bxs, img, poss[0][1:], self.page_cum_height[pn], html=return_html,
-                                                 is_english=self.is_english),
+                                                 is_english=self.is_english, table_type=table_type),
                     k))
             # img.save('{}.jpg'.format(k))
             positions.append(poss)
@@ -1,7 +1,9 @@
 import os
+import time
 from copy import deepcopy
 import onnxruntime as ort
 import torch
+from qanything_kernel.utils.custom_log import debug_logger
 from qanything_kernel.dependent_server.pdf_parser_server.pdf_to_markdown.core.vision.operators import *
 
 
@@ -36,6 +38,12 @@ class Recognizer(object):
         self.output_names = [node.name for node in self.ort_sess.get_outputs()]
         self.input_shape = self.ort_sess.get_inputs()[0].shape[2:4]
         self.label_list = label_list
+        # pages can only be stacked into one session call if the batch dim was exported as dynamic
+        batch_dim = self.ort_sess.get_inputs()[0].shape[0]
+        self.dynamic_batch = not isinstance(batch_dim, int) or batch_dim <= 0
+        # input buffer reused across pages and files, grown on demand
+        self._input_buffer = None
+        self.pages_per_second = 0.0
 
     @staticmethod
     def sort_Y_firstly(arr, threashold):
@@ -284,10 +292,20 @@ class Recognizer(object):
 
         return max_overlapped_i
 
+    def _get_input_buffer(self, batch_size):
+        hh, ww = self.input_shape
+        if self._input_buffer is None or self._input_buffer.shape[0] < batch_size:
+            self._input_buffer = np.empty((batch_size, 3, hh, ww), dtype=np.float32)
+        return self._input_buffer[:batch_size]
+
     def preprocess(self, image_list):
+        """letterbox every page into the preallocated input buffer;
+        the image in each returned input is a view of its slot in the buffer
+        """
         inputs = []
         hh, ww = self.input_shape
-        for img in image_list:
+        buffer = self._get_input_buffer(len(image_list))
+        for i, img in enumerate(image_list):
             h, w = img.shape[:2]
             img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
             scale = min(hh / h, ww / w)
@@ -304,9 +322,8 @@ class Recognizer(object):
             input_img = img
             r_h, r_w = input_img.shape[:2]
             img /= 255.0
-            img = img.transpose(2, 0, 1)
-            img = img[np.newaxis, :, :, :].astype(np.float32)
-            inputs.append({self.input_names[0]: img, "scale_factor": [r_h, r_w, h, w]})
+            buffer[i] = img.transpose(2, 0, 1)
+            inputs.append({self.input_names[0]: buffer[i:i + 1], "scale_factor": [r_h, r_w, h, w]})
         return inputs
 
     def postprocess(self, boxes, inputs, thr):
@@ -423,17 +440,29 @@ class Recognizer(object):
             else:
                 imgs.append(image_list[i])
 
+        # run the whole batch at once only for single-input models with a dynamic batch dim
+        run_batched = self.dynamic_batch and len(self.input_names) == 1
+        start = time.perf_counter()
         batch_loop_cnt = math.ceil(float(len(imgs)) / batch_size)
         for i in range(batch_loop_cnt):
             start_index = i * batch_size
             end_index = min((i + 1) * batch_size, len(imgs))
             batch_image_list = imgs[start_index:end_index]
             inputs = self.preprocess(batch_image_list)
-            print("preprocess")
-            for ins in inputs:
-                bb = self.postprocess(
-                    self.ort_sess.run(None, {k: v for k, v in ins.items() if k in self.input_names})[0], ins, thr)
-                # print(f"page_rec_res: {bb}")
-                res.append(bb)
-
+            if run_batched:
+                outputs = self.ort_sess.run(None, {self.input_names[0]: self._input_buffer[:len(inputs)]})[0]
+                for j, ins in enumerate(inputs):
+                    res.append(self.postprocess(outputs[j:j + 1], ins, thr))
+            else:
+                for ins in inputs:
+                    bb = self.postprocess(
+                        self.ort_sess.run(None, {k: v for k, v in ins.items() if k in self.input_names})[0], ins, thr)
+                    # print(f"page_rec_res: {bb}")
+                    res.append(bb)
+
+        cost = time.perf_counter() - start
+        if imgs:
+            self.pages_per_second = len(imgs) / max(cost, 1e-6)
+            debug_logger.info(f"{self.__class__.__name__}: {len(imgs)} pages in {cost:.2f}s, "
+                              f"{self.pages_per_second:.2f} pages/s, batched={run_batched}, batch_size={batch_size}")
         return res
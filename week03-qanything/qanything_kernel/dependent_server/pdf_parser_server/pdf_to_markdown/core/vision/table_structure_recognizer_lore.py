@@ -4,6 +4,7 @@ from qanything_kernel.utils.custom_log import insert_logger
 import numpy as np
 import cv2
 import traceback
+import time
 import torch
 
 
@@ -21,7 +22,20 @@ class TableStructureRecognizer_LORE():
             return True
         return False
 
-    def construct_table(self, boxes, image, table_box, height, is_english=False, html=False):
+    def classify_tables(self, images):
+        """
+        一次性对多个表格图片做有线/无线分类，结果可以传给construct_table的table_type
+        """
+        start = time.perf_counter()
+        table_images = [cv2.cvtColor(np.array(image), cv2.COLOR_RGB2BGR) for image in images]
+        table_types = self.table_rec.classify_tables(table_images)
+        if images:
+            cost = time.perf_counter() - start
+            insert_logger.info(f"classify_tables: {len(images)} tables in {cost:.2f}s, "
+                               f"{len(images) / max(cost, 1e-6):.2f} tables/s")
+        return table_types
+
+    def construct_table(self, boxes, image, table_box, height, is_english=False, html=False, table_type=None):
         """
         接收一个表格的ocr结果，同时接收一个表格的图片，最终需要返回该表格的html结果
         """
@@ -44,7 +58,7 @@ class TableStructureRecognizer_LORE():
                 new_item.append(1.0)
                 ocr_result.append(new_item)
         try:
-            table_html, table_markdown = self.table_rec.extract_table(table_image, ocr_result)
+            table_html, table_markdown = self.table_rec.extract_table(table_image, ocr_result, table_type)
         except Exception as e:
             insert_logger.warning(f"construct_table error: {traceback.format_exc()}")
             ocr_str = '\n'.join([item[1] for item in ocr_result])
@@ -54,7 +54,15 @@ async def init_local_doc_qa(app, loop):
     end = time.time()
     print(f'init local_doc_qa cost {end - start}s', flush=True)
     app.ctx.local_doc_qa = local_doc_qa
-    
+
+
+@app.after_server_stop
+async def flush_qalogs(app, loop):
+    # 等待后台线程把队列中的 QaLogs 全部写入 MySQL 后再退出
+    await loop.run_in_executor(None, app.ctx.local_doc_qa.milvus_summary.close)
+    print('qalog writer flushed', flush=True)
+
+
 @app.after_server_start
 async def notify_server_started(app, loop):
     print(f"Server Start Cost {time.time() - start_time} seconds", flush=True)
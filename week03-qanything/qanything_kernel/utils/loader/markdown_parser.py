@@ -1,8 +1,8 @@
-import random
 from langchain.schema.document import Document
 import re
-# import json
-RANDOM_NUMBER_SET = set()
+
+HEADING_PATTERN = re.compile(r'^ {0,3}(#{1,6})(?:[ \t]+|$)')
+FENCE_PATTERN = re.compile(r'^ {0,3}(```|~~~)')
 
 
 def remove_escapes(markdown_text):
@@ -27,40 +27,6 @@ def contains_table(text):
     return has_separator
 
 
-def _get_heading_level_offset(document):
-    total_levels = []
-    for block in document:
-        if not isinstance(block, list): continue
-        total_levels += [item['attrs']['level'] for item in block if item['type'] == 'heading']
-
-    offset = min(total_levels) - 1 if len(total_levels) > 0 else 0
-    max_depth = max(total_levels) - min(total_levels) + 1 if len(total_levels) > 0 else 0
-
-    for i, block in enumerate(document):
-        if not isinstance(block, list): continue
-        for j, item in enumerate(block):
-            if item['type'] != 'heading': continue
-            document[i][j]['attrs']['level'] -= offset
-
-    return document, offset, max_depth
-
-
-def _init_node(node_type, title, id_len=4):
-    while True:
-        random_number = random.randint(0, 16 ** id_len - 1)
-        if random_number in RANDOM_NUMBER_SET: continue
-        RANDOM_NUMBER_SET.add(random_number)
-        node_id = format(random_number, 'x').zfill(id_len)
-        break
-
-    return {
-        'node_id': node_id,
-        'node_type': node_type,
-        'title': title,
-        'blocks': []
-    }
-
-
 def _get_content_dfs(item):
     def dfs_child(child, lines):
         if child['type'] == 'image':
@@ -82,36 +48,6 @@ def _get_content_dfs(item):
     return content
 
 
-def _add_content_to_block(content, block):
-    while content.endswith('\n'):
-        content = content[:-1]
-
-    if len(content) > 0:
-        content_node = _init_node('ContentNode', '文字内容')
-        content_node['content'] = content
-        del content_node['blocks']
-        block['blocks'].append(content_node)
-
-    return block
-
-
-def _update_heading_recursive(hierarchy_blocks, heading_depth, content):
-    upper_level = max([heading_depth - i for i in range(1, heading_depth + 1) \
-                       if hierarchy_blocks[heading_depth - i] is not None])
-
-    # add content
-    if heading_depth == len(hierarchy_blocks) or hierarchy_blocks[heading_depth] is None:
-        hierarchy_blocks[upper_level] = _add_content_to_block(
-            content, hierarchy_blocks[upper_level])
-    # update heading tree
-    else:
-        _update_heading_recursive(hierarchy_blocks, heading_depth + 1, content)
-        hierarchy_blocks[upper_level]['blocks'].append(hierarchy_blocks[heading_depth])
-        hierarchy_blocks[heading_depth] = None
-
-    return hierarchy_blocks
-
-
 def get_raw(item):
     if 'raw' in item['children'][0].keys():
         return item['children'][0]['raw']
@@ -119,173 +55,149 @@ def get_raw(item):
         return get_raw(item['children'][0])
 
 
-def _process_heading(item, hierarchy_blocks, content):
-    # print(item)
-    heading_depth = item['attrs']['level']
-    # heading_text = item['children'][0]['raw']
-    heading_text = get_raw(item)
-
-    if heading_depth < len(hierarchy_blocks):
-        hierarchy_blocks = _update_heading_recursive(hierarchy_blocks, heading_depth, content)
-        hierarchy_blocks[heading_depth] = _init_node('Level#%dHeadingNode' % heading_depth, heading_text)
-        content = ''
-    else:
-        content += '#' * heading_depth + ' ' + heading_text + '\n'
-
-    return hierarchy_blocks, content
-
-
-def _process_block(block, doc_json, max_heading_depth):
-    content = ''
-    hierarchy_blocks = [doc_json] + [None] * max_heading_depth
-
-    for item in block:
+def _render_section(section_lines, level_offset, mistune_parser):
+    # 只解析当前章节的正文，内存占用与章节大小相关而不是整个文件
+    if not section_lines:
+        return ''
+    tokens, _ = mistune_parser.parse(''.join(section_lines))
+    content = []
+    for item in tokens:
         if item['type'] == 'heading':
-            hierarchy_blocks, content = _process_heading(item, hierarchy_blocks, content)
+            # 超过max_heading_depth的标题保留在正文中
+            level = max(item['attrs']['level'] - level_offset, 1)
+            content.append('#' * level + ' ' + (get_raw(item) if item.get('children') else '') + '\n')
         elif item['type'] in ['blank_line', 'thematic_break']:
             continue
         elif item['type'] in ['paragraph', 'list', 'block_quote']:
-            content += _get_content_dfs(item)
+            content.append(_get_content_dfs(item))
         elif item['type'] in ['block_code', 'block_html']:
-            content += item['raw'] + '\n'
+            content.append(item['raw'] + '\n')
         else:
             raise ValueError('Unknown Type %s !!!' % item['type'])
+    return ''.join(content).rstrip('\n')
 
-    hierarchy_blocks = _update_heading_recursive(hierarchy_blocks, 1, content)
-
-    return hierarchy_blocks[0]
 
+def _iter_markdown_lines(file_path):
+    # 逐行读取，标记每一行是否是代码块外的ATX标题
+    in_fence = False
+    with open(file_path, 'r', encoding='utf-8') as file:
+        for line in file:
+            if FENCE_PATTERN.match(line):
+                in_fence = not in_fence
+                yield line, None
+                continue
+            match = None if in_fence else HEADING_PATTERN.match(line)
+            yield line, match
+
+
+def _scan_heading_levels(file_path):
+    # 第一遍只扫描标题层级，用于和原先一样把最小的标题层级归一化为1
+    levels = [len(match.group(1)) for _, match in _iter_markdown_lines(file_path) if match]
+    if not levels:
+        return 0, 0
+    return min(levels) - 1, max(levels) - min(levels) + 1
+
+
+def _heading_text(line, mistune_parser):
+    tokens, _ = mistune_parser.parse(remove_escapes(line))
+    for item in tokens:
+        if item['type'] == 'heading':
+            return get_raw(item) if item.get('children') else ''
+    return line.strip().lstrip('#').strip()
 
-def _update_node_id_title_dfs(doc_json):
-    def dfs_recursive(node, node_id_list=[], title_list=[]):
-
-        node_id_list.append(node['node_id'])
-        node['node_id'] = '-'.join(node_id_list)
-
-        title_list.append(node['title'])
-        # node['title'] = '-'.join(title_list)
-        node['title'] = title_list.copy()
-
-        if 'blocks' in node:
-            for block in node['blocks']:
-                node_id_list, title_list = dfs_recursive(
-                    block, node_id_list, title_list)
-
-        node_id_list = node_id_list[:-1]
-        title_list = title_list[:-1]
 
-        return node_id_list, title_list
+def _title_lst(titles):
+    return ['#' * (index + 1) + ' ' + title for index, title in enumerate(titles)]
 
-    dfs_recursive(doc_json)
 
+def iter_markdown_documents(file_path, doc_title=None, max_heading_depth=2):
+    """
+    按章节流式地把markdown文件转换为Document
 
-def parse_markdown_mistune(file_path, doc_title=None, max_heading_depth=2):
+    标题层级不超过max_heading_depth的标题会切分章节，每个章节的正文单独用mistune解析后立即产出，
+    metadata中的title_lst/has_table/page_id与原先基于整棵树的转换保持一致，page_id仍为节点在原树中的深度。
+    一个标题下既没有正文也没有子标题时，会作为下一个同级标题的父标题（与原先的修复逻辑一致），
+    被收养的空标题只出现在title_lst中，不增加page_id；其路径会一并带给下一个同级标题的子章节。
+    若没有后续同级标题，则把标题路径本身作为一个Document产出。
+    """
     import mistune
 
     if not file_path.endswith('.md'):
         raise ValueError('Not a markdown file !!!')
 
-    with open(file_path, 'r', encoding='utf-8') as file:
-        markdown_content = file.read()
-    markdown_content = remove_escapes(markdown_content)
-    mistune_parser = mistune.Markdown()
-    document = mistune_parser.parse(markdown_content)
-    print('Markdown parsing done.')
-
-    document, level_offset, max_depth = _get_heading_level_offset(document)
+    level_offset, max_depth = _scan_heading_levels(file_path)
     if max_heading_depth is None or max_heading_depth <= 0:
         max_heading_depth = max_depth
+    mistune_parser = mistune.Markdown()
 
     file_tile = file_path.split('/')[-1].replace('.md', '')
     doc_title = file_tile if doc_title is None else '-'.join([doc_title, file_tile])
-    doc_json = _init_node('DocumentNode', doc_title, id_len=8)
-
-    for block in document:
-        if not isinstance(block, list): continue
-        doc_json = _process_block(block, doc_json, max_heading_depth)
-    # print(doc_json)
-    _update_node_id_title_dfs(doc_json)
-    # print(doc_json)
-    # with open('markdown_test.json','w',encoding='utf-8') as f_w:
-    #     json.dump(doc_json,f_w,ensure_ascii=False)
-    print('Tree building done.')
-    return doc_json
-
-
-def _convert_to_node_lists_dfs(parsing_json):
-    node_lists = {}
-
-    def traverse_and_group_by_depth(node, depth, group):
-        node_info = node.copy()
-        if 'blocks' in node_info:
-            node_info['child_id_list'] = [block['node_id'] for block in node_info['blocks']]
-            del node_info['blocks']
-        if depth not in node_lists.keys():
-            node_lists[depth] = [node_info]
-        else:
-            node_lists[depth].append(node_info)
-        if 'blocks' not in node.keys():
-            return
-        for child in node['blocks']:
-            traverse_and_group_by_depth(child, depth + 1, node_lists)
-
-    for doc_json in parsing_json:
-        traverse_and_group_by_depth(doc_json, 0, node_lists)
-
-    return node_lists
-
-
-def convert_node_to_document(node_lists):
-    def update_child_titles(child_id_list, title):
-        for k, v in node_lists.items():
-            for idx, item in enumerate(v):
-                if item['node_id'] in child_id_list:
-                    item['title'] = title + ['文字内容']
-
-    # 处理没有子节点的node，把下一个节点当成子节点给它
-    for k, v in node_lists.items():
-        for idx, item in enumerate(v):
-            if item['node_type'].startswith('Level'):
-                if len(item['child_id_list']) == 0:  # 是一个单独的标题，并且没有子节点，可能是markdown解析出现了问题
-                    if idx + 1 < len(v) and v[idx + 1]['node_type'] == item['node_type']:
-                        item['child_id_list'].append(v[idx + 1]['node_id'])
-                        tail = v[idx + 1]['title'].pop(-1)
-                        for title in item['title']:
-                            if title not in v[idx + 1]['title']:
-                                v[idx + 1]['title'].append(title)
-                        v[idx + 1]['title'].append(tail)
-                        update_child_titles(v[idx + 1]['child_id_list'], v[idx + 1]['title'])
-    # print("node_lists:", node_lists)
-    doc_lst = []
-    for k, v in node_lists.items():
-        for idx, item in enumerate(v):
-            if item['node_type'].startswith('Level'):
-                if len(item['child_id_list']) == 0:  #是一个单独的标题，并且没有子节点，可能是markdown解析出现了问题
-                    # title_lst = []
-                    # for index, title in enumerate(item['title']):
-                    #     title_lst.append('#' * (index + 1) + ' ' + title)
-                    # doc = Document(page_content='', metadata={'title_lst': title_lst, 'has_table': False})
-                    tmp_content = ''
-                    for index, title in enumerate(item['title']):
-                        tmp_content += '#' * (index + 1) + ' ' + title + '\n'
-                    doc = Document(page_content=tmp_content, metadata={'title_lst': [], 'has_table': False, 'page_id': k})
-                    doc_lst.append(doc)
-            if item['node_type'] == 'ContentNode':
-                title_lst = []
-                for index, title in enumerate(item['title'][:-1]):
-                    title_lst.append('#' * (index + 1) + ' ' + title)
-                has_table = contains_table(item['content'])
-                doc = Document(page_content=item['content'], metadata={'title_lst': title_lst, 'has_table': has_table, 'page_id': k})
-                doc_lst.append(doc)
-    return doc_lst
+
+    # headings[level] 为该层级当前打开的标题（列表形式，被收养的空标题会排在前面），has_children记录其下是否已有内容
+    headings = [[doc_title]] + [None] * max_heading_depth
+    has_children = [False] * (max_heading_depth + 1)
+    section_lines = []
+
+    def current_titles(depth=max_heading_depth):
+        return [title for titles in headings[:depth + 1] if titles for title in titles]
+
+    def tree_depth(depth=max_heading_depth):
+        # 原先树结构中的节点深度：只计实际打开的标题节点，被收养的空标题不增加深度
+        return sum(1 for titles in headings[:depth + 1] if titles is not None)
+
+    def flush_section():
+        content = _render_section(section_lines, level_offset, mistune_parser)
+        section_lines.clear()
+        if not content:
+            return None
+        for level in range(max_heading_depth + 1):
+            if headings[level] is not None:
+                has_children[level] = True
+        title_lst = _title_lst(current_titles())
+        return Document(page_content=content, metadata={'title_lst': title_lst, 'has_table': contains_table(content),
+                                                        'page_id': tree_depth()})
+
+    def empty_heading_document(level):
+        titles = current_titles(level)
+        page_content = ''.join(title + '\n' for title in _title_lst(titles))
+        return Document(page_content=page_content, metadata={'title_lst': [], 'has_table': False,
+                                                             'page_id': tree_depth(level) - 1})
+
+    for line, match in _iter_markdown_lines(file_path):
+        level = len(match.group(1)) - level_offset if match else None
+        if level is None or level > max_heading_depth:
+            section_lines.append(remove_escapes(line))
+            continue
+
+        doc = flush_section()
+        if doc is not None:
+            yield doc
+        adopted = []
+        for closing in range(max_heading_depth, level - 1, -1):
+            if headings[closing] is None:
+                continue
+            if not has_children[closing]:
+                if closing == level:
+                    adopted = headings[closing]
+                else:
+                    yield empty_heading_document(closing)
+            headings[closing] = None
+            has_children[closing] = False
+        for parent in range(level):
+            if headings[parent] is not None:
+                has_children[parent] = True
+        headings[level] = adopted + [_heading_text(line, mistune_parser)]
+
+    doc = flush_section()
+    if doc is not None:
+        yield doc
+    for level in range(max_heading_depth, 0, -1):
+        if headings[level] is not None and not has_children[level]:
+            yield empty_heading_document(level)
 
 
 def convert_markdown_to_langchaindoc(md_file):
-    doc_json = parse_markdown_mistune(md_file)
-    node_lists = _convert_to_node_lists_dfs([doc_json])
-    # print("node_lists:", node_lists)
-    doc_lst = convert_node_to_document(node_lists)
-    return doc_lst
+    return list(iter_markdown_documents(md_file))
 
 
 if __name__ == '__main__':
@@ -0,0 +1,104 @@
+import re
+
+# 预编译的正则，避免每个文档、每个环节重复解析
+FIGURE_PATTERN = re.compile(r'!\[figure]\(.*?\)')
+HEADERS_PATTERN = re.compile(r'^\[headers]\(.*?\)\n')
+
+
+def strip_figures(text):
+    # 去掉正文中的图片引用，生成prompt或统计token时使用
+    return FIGURE_PATTERN.sub('', text)
+
+
+def strip_headers(text):
+    return HEADERS_PATTERN.sub('', text)
+
+
+class ReferenceContextBuilder:
+    """
+    构建带 <reference> 标签的 prompt 上下文
+
+    同一个请求内 reprocess_source_documents 与 generate_prompt 共用一个实例：
+    - 每个文档只去一次图片（page_content 未变化时复用缓存）
+    - 按 file_id 分组、生成引用标签、统计 token 在同一遍中完成，结果用 join 拼接
+    - 文档及其内容都没有变化时，generate_prompt 直接复用 fit 阶段生成的上下文
+    """
+
+    def __init__(self):
+        # id(doc) -> (doc, page_content, 去图片后的内容)，保留 doc 引用防止 id 被复用
+        self._valid_contents = {}
+        self._last_key = None
+        self._last_context = None
+
+    def valid_content(self, doc):
+        page_content = doc.page_content
+        cached = self._valid_contents.get(id(doc))
+        if cached is not None and cached[1] is page_content:
+            return cached[2]
+        valid_content = strip_figures(page_content)
+        self._valid_contents[id(doc)] = (doc, page_content, valid_content)
+        return valid_content
+
+    def fit(self, docs, limited_token_nums, count_tokens):
+        """
+        从前往后装入文档，直到 token 超出 limited_token_nums
+
+        Returns:
+            (装入的文档列表, 对应的上下文字符串, 装入文档的 token 总数)
+        """
+        parts = []
+        kept_docs = []
+        seen_file_ids = set()
+        total_token_num = 0
+        for doc in docs:
+            file_id = doc.metadata['file_id']
+            is_new_file = file_id not in seen_file_ids
+            doc_parts = self._reference_parts(doc, is_new_file, len(seen_file_ids) + 1, bool(seen_file_ids))
+            doc_token_num = count_tokens([doc_parts[-2]])
+            if is_new_file and 'headers' in doc.metadata:
+                doc_token_num += count_tokens([f"headers={doc.metadata['headers']}"])
+            if total_token_num + doc_token_num > limited_token_nums:
+                break
+            seen_file_ids.add(file_id)
+            parts.extend(doc_parts)
+            kept_docs.append(doc)
+            total_token_num += doc_token_num
+        context = self._finish(kept_docs, parts)
+        return kept_docs, context, total_token_num
+
+    def build(self, docs):
+        key = self._make_key(docs)
+        if key == self._last_key:
+            return self._last_context
+        parts = []
+        seen_file_ids = set()
+        for doc in docs:
+            file_id = doc.metadata['file_id']
+            is_new_file = file_id not in seen_file_ids
+            parts.extend(self._reference_parts(doc, is_new_file, len(seen_file_ids) + 1, bool(seen_file_ids)))
+            seen_file_ids.add(file_id)
+        return self._finish(docs, parts)
+
+    def _reference_parts(self, doc, is_new_file, reference_idx, close_previous):
+        valid_content = self.valid_content(doc)
+        if not is_new_file:
+            return [valid_content, '\n']
+        parts = ['</reference>\n'] if close_previous else []
+        if 'headers' in doc.metadata:
+            parts.append(f"<reference headers={doc.metadata['headers']}>[{reference_idx}]\n")
+        else:
+            parts.append(f"<reference>[{reference_idx}]\n")
+        parts.extend([valid_content, '\n'])
+        return parts
+
+    def _finish(self, docs, parts):
+        if parts:
+            parts.append('</reference>\n')
+        context = ''.join(parts)
+        self._last_key = self._make_key(docs)
+        self._last_context = context
+        return context
+
+    @staticmethod
+    def _make_key(docs):
+        return tuple((id(doc), id(doc.page_content)) for doc in docs)
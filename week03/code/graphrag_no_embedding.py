@@ -1,9 +1,14 @@
 import asyncio
+import hashlib
 import json
 import logging
-from typing import List, Dict, Any, Tuple
-from dataclasses import dataclass
-from neo4j import GraphDatabase
+import os
+import re
+import unicodedata
+from collections import Counter, OrderedDict
+from typing import List, Dict, Any, Callable, Optional, Tuple
+from dataclasses import asdict, dataclass
+from neo4j import AsyncGraphDatabase
 from neo4j_graphrag.llm import OpenAILLM
 
 # ============================================================================
@@ -54,6 +59,208 @@ class Relationship:
         if self.properties is None:
             self.properties = {}
 
+# 所有实体节点额外带上的公共标签，用于全文索引和按名称查找
+ENTITY_LABEL = "__Entity__"
+# 实体名称全文索引
+ENTITY_FULLTEXT_INDEX = "entity_name_fulltext"
+
+# ============================================================================
+# 分块提取工具
+# ============================================================================
+
+# 句子结束符，分块时优先在这些位置切分
+SENTENCE_PATTERN = re.compile(r'[^。！？!?\n]*(?:[。！？!?]+|\n+|$)')
+
+def split_text(text: str, chunk_size: int = 1500, overlap: int = 200) -> List[str]:
+    """
+    将长文本切分为带重叠的文本块
+    
+    参数：
+    - text: 原始文本
+    - chunk_size: 每块的目标最大字符数（不含重叠部分）
+    - overlap: 相邻块之间重叠的字符数（取上一块末尾的完整句子）
+    
+    返回：
+    - List[str]: 文本块列表
+    
+    切分策略：
+    1. 先按句子切分，超长句子再按 chunk_size 硬切
+    2. 按句子累积成块，超过 chunk_size 时切分
+    3. 块长度超过一半后，遇到"锚点句"（由句子内容的哈希决定）也切分。
+       切分点取决于内容而不是位置，文档中间插入或删除内容时，
+       后面的块边界很快重新对齐，缓存仍然有效
+    """
+    sentences = []
+    for sentence in SENTENCE_PATTERN.findall(text):
+        if not sentence.strip():
+            continue
+        for start in range(0, len(sentence), chunk_size):
+            sentences.append(sentence[start:start + chunk_size])
+    
+    def is_anchor(sentence: str) -> bool:
+        return hashlib.md5(sentence.encode('utf-8')).digest()[0] % 4 == 0
+    
+    groups = []
+    current, size = [], 0
+    for sentence in sentences:
+        if current and size + len(sentence) > chunk_size:
+            groups.append(current)
+            current, size = [], 0
+        current.append(sentence)
+        size += len(sentence)
+        if size >= chunk_size // 2 and is_anchor(sentence):
+            groups.append(current)
+            current, size = [], 0
+    if current:
+        groups.append(current)
+    
+    # 每块前面拼接上一块末尾不超过 overlap 字符的完整句子
+    chunks = []
+    for i, group in enumerate(groups):
+        prefix = []
+        if i > 0 and overlap > 0:
+            tail_size = 0
+            for sentence in reversed(groups[i - 1]):
+                if tail_size + len(sentence) > overlap:
+                    break
+                prefix.insert(0, sentence)
+                tail_size += len(sentence)
+        chunks.append("".join(prefix + group).strip())
+    return [chunk for chunk in chunks if chunk]
+
+class ChunkCache:
+    """
+    文本块提取结果的磁盘缓存
+    
+    以"提取配置 + 文本块内容"的哈希为键，每个块一个 JSON 文件。
+    文档修改后重新构建图谱，只有内容变化的块需要重新调用 LLM。
+    """
+    
+    def __init__(self, cache_dir: str, fingerprint: str):
+        """
+        参数：
+        - cache_dir: 缓存目录
+        - fingerprint: 提取配置指纹，实体类型、关系模式变化后旧缓存自动失效
+        """
+        self.cache_dir = cache_dir
+        self.fingerprint = fingerprint
+        os.makedirs(cache_dir, exist_ok=True)
+    
+    def key(self, chunk: str) -> str:
+        return hashlib.sha256(f"{self.fingerprint}\n{chunk}".encode('utf-8')).hexdigest()
+    
+    def get(self, key: str) -> Optional[Tuple[List[Entity], List[Relationship]]]:
+        path = os.path.join(self.cache_dir, f"{key}.json")
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            entities = [Entity(**item) for item in data["entities"]]
+            relationships = [Relationship(**item) for item in data["relationships"]]
+            return entities, relationships
+        except Exception as e:
+            logger.warning(f"读取缓存失败，重新提取: {e}")
+            return None
+    
+    def put(self, key: str, entities: List[Entity], relationships: List[Relationship]):
+        path = os.path.join(self.cache_dir, f"{key}.json")
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({
+                "entities": [asdict(entity) for entity in entities],
+                "relationships": [asdict(rel) for rel in relationships]
+            }, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+class RateLimitedLLM:
+    """
+    带限流的 LLM 包装器
+    
+    所有 ainvoke 调用共享一个限流器，相邻两次请求的发起间隔不小于 1 / requests_per_second，
+    并发的分块提取不会超过 LLM 服务的 QPS 限制
+    """
+    
+    def __init__(self, llm: OpenAILLM, requests_per_second: float):
+        self.llm = llm
+        self.interval = 1.0 / requests_per_second if requests_per_second > 0 else 0.0
+        self._next_time = 0.0
+        self._lock = asyncio.Lock()
+    
+    async def ainvoke(self, *args, **kwargs):
+        if self.interval:
+            async with self._lock:
+                now = asyncio.get_running_loop().time()
+                wait = self._next_time - now
+                self._next_time = max(now, self._next_time) + self.interval
+            if wait > 0:
+                await asyncio.sleep(wait)
+        return await self.llm.ainvoke(*args, **kwargs)
+
+class EntityResolver:
+    """
+    跨文本块的实体消歧与合并
+    
+    同一实体在不同块中可能写法略有差异（如 "保罗·厄崔迪" 和 "保罗 厄崔迪"），
+    按规范化名称归并：
+    - 名称取出现次数最多的写法，类型取出现次数最多的类型
+    - 属性按块的顺序合并，先出现的值优先
+    - 关系两端替换为归并后的名称，去掉重复关系和归并后产生的自环
+    """
+    
+    # 规范化时去掉的空白和分隔符
+    SEPARATOR_PATTERN = re.compile(r"[\s·•・\-_.'\"“”‘’]+")
+    
+    @classmethod
+    def normalize(cls, name: str) -> str:
+        normalized = unicodedata.normalize("NFKC", name).casefold()
+        return cls.SEPARATOR_PATTERN.sub("", normalized) or name.strip()
+    
+    def resolve(self, chunk_results: List[Tuple[List[Entity], List[Relationship]]]
+                ) -> Tuple[List[Entity], List[Relationship]]:
+        """
+        参数：
+        - chunk_results: 每个文本块的 (实体列表, 关系列表)，按文本顺序排列
+        
+        返回：
+        - (合并后的实体列表, 合并后的关系列表)
+        """
+        mentions = {}   # 规范化名称 -> 名称计数、类型计数、属性
+        mention_count = 0
+        for chunk_entities, _ in chunk_results:
+            mention_count += len(chunk_entities)
+            for entity in chunk_entities:
+                key = self.normalize(entity.name)
+                mention = mentions.setdefault(key, {"names": Counter(), "types": Counter(), "properties": {}})
+                mention["names"][entity.name] += 1
+                mention["types"][entity.type] += 1
+                for prop, value in entity.properties.items():
+                    mention["properties"].setdefault(prop, value)
+        
+        canonical = {key: mention["names"].most_common(1)[0][0] for key, mention in mentions.items()}
+        entities = [
+            Entity(name=canonical[key], type=mention["types"].most_common(1)[0][0],
+                   properties=mention["properties"])
+            for key, mention in mentions.items()
+        ]
+        
+        relationships = {}
+        for _, chunk_relationships in chunk_results:
+            for rel in chunk_relationships:
+                source = canonical.get(self.normalize(rel.source))
+                target = canonical.get(self.normalize(rel.target))
+                if source is None or target is None or source == target:
+                    continue
+                merged = relationships.setdefault(
+                    (source, rel.type, target), Relationship(source=source, target=target, type=rel.type)
+                )
+                for prop, value in rel.properties.items():
+                    merged.properties.setdefault(prop, value)
+        
+        logger.info(f"实体归并: {mention_count} 个实体提及 -> {len(entities)} 个实体，"
+                    f"{len(relationships)} 个关系")
+        return entities, list(relationships.values())
+
 # ============================================================================
 # 核心组件类
 # ============================================================================
@@ -81,12 +288,13 @@ class SimpleEntityExtractor:
         self.node_types = node_types
         logger.info(f"实体提取器初始化完成，支持类型: {node_types}")
     
-    async def extract_entities(self, text: str) -> List[Entity]:
+    async def extract_entities(self, text: str, raise_on_error: bool = False) -> List[Entity]:
         """
         从文本中提取实体
         
         参数：
         - text: 待分析的文本内容
+        - raise_on_error: 为 True 时 LLM 调用或解析失败直接抛出异常，而不是返回空列表
         
         返回：
         - List[Entity]: 提取到的实体列表
@@ -158,9 +366,13 @@ class SimpleEntityExtractor:
             
         except json.JSONDecodeError as e:
             logger.error(f"JSON解析失败: {e}")
+            if raise_on_error:
+                raise
             return []
         except Exception as e:
             logger.error(f"实体提取过程中发生错误: {e}")
+            if raise_on_error:
+                raise
             return []
 
 class SimpleRelationshipExtractor:
@@ -188,13 +400,15 @@ class SimpleRelationshipExtractor:
         self.patterns = patterns
         logger.info(f"关系提取器初始化完成，支持 {len(patterns)} 种关系模式")
     
-    async def extract_relationships(self, text: str, entities: List[Entity]) -> List[Relationship]:
+    async def extract_relationships(self, text: str, entities: List[Entity],
+                                    raise_on_error: bool = False) -> List[Relationship]:
         """
         提取实体间的关系
         
         参数：
         - text: 原始文本内容
         - entities: 已提取的实体列表
+        - raise_on_error: 为 True 时 LLM 调用或解析失败直接抛出异常，而不是返回空列表
         
         返回：
         - List[Relationship]: 提取到的关系列表
@@ -294,9 +508,13 @@ class SimpleRelationshipExtractor:
             
         except json.JSONDecodeError as e:
             logger.error(f"JSON解析失败: {e}")
+            if raise_on_error:
+                raise
             return []
         except Exception as e:
             logger.error(f"关系提取过程中发生错误: {e}")
+            if raise_on_error:
+                raise
             return []
 
 class SimpleGraphWriter:
@@ -311,16 +529,19 @@ class SimpleGraphWriter:
     - 按类型分组批量写入，减少数据库交互次数
     - 使用 MERGE 而不是 CREATE，避免重复数据
     - 完善的错误处理和日志记录
+    - 写入成功后通知查询引擎清除受影响实体的上下文缓存
     """
     
-    def __init__(self, driver):
+    def __init__(self, driver, on_write: Optional[Callable[[List[str]], None]] = None):
         """
         初始化图数据写入器
         
         参数：
-        - driver: Neo4j 数据库驱动实例
+        - driver: Neo4j 异步数据库驱动实例（AsyncGraphDatabase.driver）
+        - on_write: 写入成功后的回调，参数为受影响的实体名称列表
         """
         self.driver = driver
+        self.on_write = on_write
         logger.info("图数据写入器初始化完成")
     
     async def write_entities(self, entities: List[Entity]):
@@ -364,10 +585,11 @@ class SimpleGraphWriter:
         - MERGE: 如果实体不存在则创建，存在则更新
         """
         # 构建批量写入的 Cypher 查询
-        # 使用动态标签，支持不同的实体类型
+        # 使用动态标签，支持不同的实体类型；同时打上公共实体标签，供全文索引使用
         query = f"""
         UNWIND $entities AS entity
         MERGE (n:{entity_type} {{name: entity.name}})
+        SET n:{ENTITY_LABEL}
         SET n += entity.properties
         RETURN count(n) as created
         """
@@ -383,10 +605,11 @@ class SimpleGraphWriter:
         
         try:
             # 执行批量写入操作
-            with self.driver.session() as session:
-                result = session.run(query, entities=entities_data)
-                count = result.single()["created"]
-                logger.info(f"成功写入 {count} 个 {entity_type} 类型的实体")
+            async with self.driver.session() as session:
+                result = await session.run(query, entities=entities_data)
+                record = await result.single()
+                logger.info(f"成功写入 {record['created']} 个 {entity_type} 类型的实体")
+            self._notify([entity.name for entity in entities])
                 
         except Exception as e:
             logger.error(f"写入 {entity_type} 实体时发生错误: {e}")
@@ -435,8 +658,8 @@ class SimpleGraphWriter:
         # 构建批量写入关系的 Cypher 查询
         query = f"""
         UNWIND $relationships AS rel
-        MATCH (source {{name: rel.source}})
-        MATCH (target {{name: rel.target}})
+        MATCH (source:{ENTITY_LABEL} {{name: rel.source}})
+        MATCH (target:{ENTITY_LABEL} {{name: rel.target}})
         MERGE (source)-[r:{rel_type}]->(target)
         SET r += rel.properties
         RETURN count(r) as created
@@ -454,13 +677,19 @@ class SimpleGraphWriter:
         
         try:
             # 执行批量写入操作
-            with self.driver.session() as session:
-                result = session.run(query, relationships=rels_data)
-                count = result.single()["created"]
-                logger.info(f"成功写入 {count} 个 {rel_type} 类型的关系")
+            async with self.driver.session() as session:
+                result = await session.run(query, relationships=rels_data)
+                record = await result.single()
+                logger.info(f"成功写入 {record['created']} 个 {rel_type} 类型的关系")
+            self._notify([name for rel in relationships for name in (rel.source, rel.target)])
                 
         except Exception as e:
             logger.error(f"写入 {rel_type} 关系时发生错误: {e}")
+    
+    def _notify(self, entity_names: List[str]):
+        """通知写入回调哪些实体发生了变化"""
+        if self.on_write is not None:
+            self.on_write(entity_names)
 
 class SimpleQueryEngine:
     """
@@ -472,16 +701,24 @@ class SimpleQueryEngine:
     
     查询流程：
     用户问题 → 关键词提取 → 实体搜索 → 图遍历 → 上下文构建 → 答案生成
+    
+    数据库访问：
+    - 使用异步驱动，查询期间不阻塞事件循环
+    - 实体搜索走实体名称全文索引，关键词作为参数传入
+    - 所有匹配实体的上下文由一次 UNWIND 查询批量获取，并按实体缓存
     """
     
-    def __init__(self, driver, llm_json: OpenAILLM, llm_text: OpenAILLM):
+    def __init__(self, driver, llm_json: OpenAILLM, llm_text: OpenAILLM,
+                 search_limit: int = 10, context_cache_size: int = 1024):
         """
         初始化查询引擎
         
         参数：
-        - driver: Neo4j 数据库驱动
+        - driver: Neo4j 异步数据库驱动（AsyncGraphDatabase.driver）
         - llm_json: 用于结构化输出的 LLM（如关键词提取）
         - llm_text: 用于文本生成的 LLM（如答案生成）
+        - search_limit: 实体搜索返回的最大实体数
+        - context_cache_size: 实体上下文缓存的最大实体数
         
         设计说明：
         使用两个不同配置的 LLM 实例：
@@ -491,8 +728,72 @@ class SimpleQueryEngine:
         self.driver = driver
         self.llm_json = llm_json    # 用于结构化输出（JSON格式）
         self.llm_text = llm_text    # 用于文本生成
+        self.search_limit = search_limit
+        self.context_cache_size = context_cache_size
+        # 实体名称 -> (上下文行列表, 相邻实体名称集合)，按最近使用排序
+        self._context_cache: "OrderedDict[str, Tuple[List[str], set]]" = OrderedDict()
+        self._indexes_ready = False
         logger.info("查询引擎初始化完成")
     
+    async def ensure_indexes(self):
+        """
+        创建实体名称的范围索引和全文索引（已存在时跳过）
+        
+        - 范围索引：加速按名称精确查找实体（写入关系、获取上下文）
+        - 全文索引：关键词搜索实体，替代逐节点 CONTAINS 扫描
+        
+        索引只覆盖带 __Entity__ 标签的节点，旧版本写入的实体没有这个标签，
+        先分批补上标签，否则搜索查不到它们，写入关系时也匹配不到
+        """
+        if self._indexes_ready:
+            return
+        backfill_query = f"""
+        MATCH (n) WHERE n.name IS NOT NULL AND NOT n:{ENTITY_LABEL}
+        WITH n LIMIT $batch_size
+        SET n:{ENTITY_LABEL}
+        RETURN count(n) AS updated
+        """
+        backfilled = 0
+        async with self.driver.session() as session:
+            while True:
+                result = await session.run(backfill_query, batch_size=10000)
+                record = await result.single()
+                updated = record["updated"] if record else 0
+                backfilled += updated
+                if updated == 0:
+                    break
+        if backfilled:
+            logger.info(f"已为 {backfilled} 个旧实体补充 {ENTITY_LABEL} 标签")
+        
+        queries = [
+            f"CREATE INDEX entity_name IF NOT EXISTS FOR (n:{ENTITY_LABEL}) ON (n.name)",
+            f"CREATE FULLTEXT INDEX {ENTITY_FULLTEXT_INDEX} IF NOT EXISTS "
+            f"FOR (n:{ENTITY_LABEL}) ON EACH [n.name]",
+        ]
+        async with self.driver.session() as session:
+            for query in queries:
+                await session.run(query)
+            # 等待新建的索引上线后再查询
+            await session.run("CALL db.awaitIndexes(300)")
+        self._indexes_ready = True
+        logger.info("实体名称索引已就绪")
+    
+    def invalidate(self, entity_names: List[str]):
+        """
+        清除受写入影响的实体上下文缓存
+        
+        实体自身以及上下文中引用了这些实体的缓存项都会被清除
+        """
+        changed = set(entity_names)
+        stale = [
+            name for name, (_, neighbors) in self._context_cache.items()
+            if name in changed or neighbors & changed
+        ]
+        for name in stale:
+            del self._context_cache[name]
+        if stale:
+            logger.info(f"清除 {len(stale)} 个实体的上下文缓存")
+    
     async def query(self, question: str) -> str:
         """
         执行完整的 RAG 查询流程
@@ -591,6 +892,21 @@ class SimpleQueryEngine:
             logger.info(f"使用备用方案提取关键词: {fallback_keywords}")
             return fallback_keywords
     
+    @staticmethod
+    def _build_fulltext_query(keywords: List[str]) -> str:
+        """
+        将关键词列表转换为 Lucene 查询字符串
+        
+        每个关键词作为短语查询（转义引号和反斜杠），多个关键词之间为 OR 关系
+        """
+        phrases = []
+        for keyword in keywords:
+            keyword = keyword.strip()
+            if keyword:
+                escaped = keyword.replace("\\", "\\\\").replace('"', '\\"')
+                phrases.append(f'"{escaped}"')
+        return " OR ".join(phrases)
+    
     async def _search_entities_by_keywords(self, keywords: List[str]) -> List[str]:
         """
         基于关键词搜索数据库中的相关实体
@@ -599,34 +915,34 @@ class SimpleQueryEngine:
         - keywords: 关键词列表
         
         返回：
-        - List[str]: 匹配的实体名称列表
+        - List[str]: 匹配的实体名称列表，按相关度排序
         
         搜索策略：
-        1. 使用 CONTAINS 进行模糊匹配
-        2. 支持多关键词的 OR 查询
-        3. 限制结果数量，避免返回过多无关实体
+        1. 使用实体名称全文索引进行匹配，而不是逐节点 CONTAINS 扫描
+        2. 多个关键词之间为 OR 关系
+        3. 查询字符串作为参数传入，查询计划可以复用，也不会被关键词内容注入
+        4. 限制结果数量，避免返回过多无关实体
         """
-        if not keywords:
+        search_query = self._build_fulltext_query(keywords)
+        if not search_query:
             return []
         
-        # 构建多关键词的搜索条件
-        # 使用 OR 连接，只要实体名称包含任一关键词就匹配
-        keyword_conditions = " OR ".join([
-            f"n.name CONTAINS '{keyword}'" for keyword in keywords
-        ])
-        
-        # 构建 Cypher 查询
-        query = f"""
-        MATCH (n)
-        WHERE {keyword_conditions}
-        RETURN DISTINCT n.name as name
-        LIMIT 10
+        query = """
+        CALL db.index.fulltext.queryNodes($index_name, $search_query, {limit: $limit})
+        YIELD node, score
+        RETURN DISTINCT node.name as name
         """
         
         try:
-            with self.driver.session() as session:
-                result = session.run(query)
-                entity_names = [record["name"] for record in result]
+            await self.ensure_indexes()
+            async with self.driver.session() as session:
+                result = await session.run(
+                    query,
+                    index_name=ENTITY_FULLTEXT_INDEX,
+                    search_query=search_query,
+                    limit=self.search_limit
+                )
+                entity_names = [record["name"] async for record in result]
                 
                 logger.info(f"找到 {len(entity_names)} 个相关实体: {entity_names}")
                 return entity_names
@@ -650,6 +966,11 @@ class SimpleQueryEngine:
         2. 实体的所有关系信息
         3. 关系连接的其他实体信息
         
+        缓存策略：
+        - 已缓存的实体直接使用缓存
+        - 未缓存的实体通过一次 UNWIND 查询批量获取
+        - SimpleGraphWriter 写入实体或关系后，相关实体的缓存自动失效
+        
         输出格式示例：
         Paul Atreides(Person) HEIR_OF House Atreides(House)
         Duke Leto(Person) PARENT_OF Paul Atreides(Person)
@@ -657,56 +978,72 @@ class SimpleQueryEngine:
         if not entity_names:
             return ""
         
-        # 构建图遍历查询
-        # 查找指定实体及其所有关系和连接的实体
-        query = """
-        MATCH (n)
-        WHERE n.name IN $entity_names
+        missing = [name for name in dict.fromkeys(entity_names) if name not in self._context_cache]
+        if missing:
+            try:
+                fetched = await self._fetch_entity_contexts(missing)
+            except Exception as e:
+                logger.error(f"获取图上下文失败: {e}")
+                return ""
+            for name in missing:
+                self._context_cache[name] = fetched.get(name, ([], set()))
+        
+        context_parts = []
+        for name in dict.fromkeys(entity_names):
+            self._context_cache.move_to_end(name)
+            context_parts.extend(self._context_cache[name][0])
+        while len(self._context_cache) > self.context_cache_size:
+            self._context_cache.popitem(last=False)
+        
+        context = "\n".join(context_parts)
+        logger.info(f"构建图上下文，包含 {len(context_parts)} 条信息（缓存命中 "
+                    f"{len(set(entity_names)) - len(missing)}/{len(set(entity_names))} 个实体）")
+        return context
+    
+    async def _fetch_entity_contexts(self, entity_names: List[str]) -> Dict[str, Tuple[List[str], set]]:
+        """
+        批量查询多个实体的上下文
+        
+        返回：
+        - Dict[str, Tuple[List[str], set]]: 实体名称 -> (上下文行列表, 相邻实体名称集合)
+        """
+        # 一次查询展开所有实体，每个实体节点的关系聚合为一行
+        query = f"""
+        UNWIND $entity_names AS entity_name
+        MATCH (n:{ENTITY_LABEL} {{name: entity_name}})
         OPTIONAL MATCH (n)-[r]-(connected)
-        RETURN n.name as entity, 
-               labels(n) as entity_labels,
-               type(r) as relationship, 
-               connected.name as connected_entity,
-               labels(connected) as connected_labels
+        WITH entity_name, n, collect(CASE WHEN r IS NULL THEN NULL ELSE {{
+            relationship: type(r),
+            connected_entity: connected.name,
+            connected_labels: [label IN labels(connected) WHERE label <> '{ENTITY_LABEL}']
+        }} END) as relations
+        RETURN entity_name as entity,
+               [label IN labels(n) WHERE label <> '{ENTITY_LABEL}'] as entity_labels,
+               relations
         """
         
-        try:
-            with self.driver.session() as session:
-                result = session.run(query, entity_names=entity_names)
-                
-                # 构建上下文信息
-                context_parts = []
-                processed_entities = set()  # 避免重复处理同一实体
-                
-                for record in result:
-                    entity = record["entity"]
-                    entity_labels = record["entity_labels"]
-                    entity_type = entity_labels[0] if entity_labels else "Unknown"
-                    
-                    # 如果有关系信息，构建关系描述
-                    if record["relationship"]:
-                        rel_type = record["relationship"]
-                        connected_entity = record["connected_entity"]
-                        connected_labels = record["connected_labels"]
-                        connected_type = connected_labels[0] if connected_labels else "Unknown"
-                        
-                        # 格式：实体(类型) 关系类型 连接实体(类型)
-                        relation_desc = f"{entity}({entity_type}) {rel_type} {connected_entity}({connected_type})"
-                        context_parts.append(relation_desc)
-                    else:
-                        # 如果没有关系，只记录实体本身
-                        if entity not in processed_entities:
-                            entity_desc = f"{entity}({entity_type})"
-                            context_parts.append(entity_desc)
-                            processed_entities.add(entity)
+        contexts = {}
+        async with self.driver.session() as session:
+            result = await session.run(query, entity_names=entity_names)
+            async for record in result:
+                entity = record["entity"]
+                entity_labels = record["entity_labels"]
+                entity_type = entity_labels[0] if entity_labels else "Unknown"
+                lines, neighbors = contexts.setdefault(entity, ([], set()))
                 
-                context = "\n".join(context_parts)
-                logger.info(f"构建图上下文，包含 {len(context_parts)} 条信息")
-                return context
+                if not record["relations"]:
+                    # 如果没有关系，只记录实体本身
+                    lines.append(f"{entity}({entity_type})")
+                    continue
                 
-        except Exception as e:
-            logger.error(f"获取图上下文失败: {e}")
-            return ""
+                for relation in record["relations"]:
+                    connected_labels = relation["connected_labels"]
+                    connected_type = connected_labels[0] if connected_labels else "Unknown"
+                    # 格式：实体(类型) 关系类型 连接实体(类型)
+                    lines.append(f"{entity}({entity_type}) {relation['relationship']} "
+                                 f"{relation['connected_entity']}({connected_type})")
+                    neighbors.add(relation["connected_entity"])
+        return contexts
     
     async def _generate_answer(self, question: str, context: str) -> str:
         """
@@ -777,31 +1114,61 @@ class SimpleGraphRAG:
     - 完全不依赖 APOC 插件
     - 不使用向量嵌入，降低部署复杂度
     - 完善的错误处理和日志记录
+    - 长文本分块并发提取，按块缓存提取结果，跨块实体归并
     """
     
+    # 提取提示词或结果格式变化时递增，使旧的分块缓存失效
+    EXTRACTION_VERSION = 1
+    
     def __init__(self, driver, llm_json: OpenAILLM, llm_text: OpenAILLM,
                  node_types: List[str], relationship_types: List[str], 
-                 patterns: List[Tuple[str, str, str]]):
+                 patterns: List[Tuple[str, str, str]],
+                 chunk_size: int = 1500, chunk_overlap: int = 200,
+                 max_concurrency: int = 4, requests_per_second: float = 2.0,
+                 cache_dir: Optional[str] = ".graphrag_cache"):
         """
         初始化 GraphRAG 系统
         
         参数：
-        - driver: Neo4j 数据库驱动
+        - driver: Neo4j 异步数据库驱动（AsyncGraphDatabase.driver）
         - llm_json: 用于结构化输出的 LLM 实例
         - llm_text: 用于文本生成的 LLM 实例
         - node_types: 支持的实体类型列表
         - relationship_types: 支持的关系类型列表
         - patterns: 关系模式列表，定义哪些实体类型间可以有哪些关系
+        - chunk_size: 提取时每个文本块的最大字符数
+        - chunk_overlap: 相邻文本块重叠的字符数，避免跨块的关系丢失
+        - max_concurrency: 同时进行提取的文本块数量
+        - requests_per_second: 提取阶段 LLM 请求的速率上限，0 表示不限制
+        - cache_dir: 分块提取结果缓存目录，None 表示不缓存
         """
         self.driver = driver
         self.llm_json = llm_json
         self.llm_text = llm_text
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.max_concurrency = max_concurrency
+        
+        # 提取阶段的 LLM 调用共享一个限流器
+        extraction_llm = RateLimitedLLM(llm_json, requests_per_second)
         
         # 初始化各个组件
-        self.entity_extractor = SimpleEntityExtractor(llm_json, node_types)
-        self.relationship_extractor = SimpleRelationshipExtractor(llm_json, relationship_types, patterns)
-        self.graph_writer = SimpleGraphWriter(driver)
+        self.entity_extractor = SimpleEntityExtractor(extraction_llm, node_types)
+        self.relationship_extractor = SimpleRelationshipExtractor(extraction_llm, relationship_types, patterns)
+        self.entity_resolver = EntityResolver()
         self.query_engine = SimpleQueryEngine(driver, llm_json, llm_text)
+        # 写入图数据后清除查询引擎中受影响实体的上下文缓存
+        self.graph_writer = SimpleGraphWriter(driver, on_write=self.query_engine.invalidate)
+        
+        self.chunk_cache = None
+        if cache_dir:
+            fingerprint = json.dumps({
+                "version": self.EXTRACTION_VERSION,
+                "node_types": node_types,
+                "relationship_types": relationship_types,
+                "patterns": [list(pattern) for pattern in patterns]
+            }, ensure_ascii=False, sort_keys=True)
+            self.chunk_cache = ChunkCache(cache_dir, fingerprint)
         
         logger.info("SimpleGraphRAG 系统初始化完成")
         logger.info(f"支持的实体类型: {node_types}")
@@ -816,9 +1183,10 @@ class SimpleGraphRAG:
         - text: 要分析的文本内容
         
         构建流程：
-        1. 使用实体提取器从文本中提取实体
-        2. 使用关系提取器识别实体间的关系
-        3. 使用图写入器将实体和关系保存到 Neo4j
+        1. 将文本切分为带重叠的文本块
+        2. 并发地对每个文本块提取实体和关系（命中缓存的块不调用 LLM）
+        3. 跨块归并实体和关系
+        4. 使用图写入器将实体和关系保存到 Neo4j
         
         这个方法是知识图谱构建的核心入口点
         """
@@ -827,19 +1195,32 @@ class SimpleGraphRAG:
         logger.info(f"输入文本长度: {len(text)} 字符")
         logger.info("=" * 50)
         
-        # 步骤1: 提取实体
-        logger.info("步骤1: 提取实体")
-        entities = await self.entity_extractor.extract_entities(text)
+        # 步骤1: 文本分块
+        chunks = split_text(text, self.chunk_size, self.chunk_overlap)
+        logger.info(f"步骤1: 文本切分为 {len(chunks)} 块")
+        
+        # 步骤2: 并发提取
+        logger.info("步骤2: 分块提取实体和关系")
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        results = await asyncio.gather(*(self._extract_chunk(chunk, semaphore) for chunk in chunks))
+        cache_hits = sum(1 for _, cached in results if cached)
+        chunk_results = [result for result, _ in results if result is not None]
+        logger.info(f"提取完成: {len(chunks)} 块，缓存命中 {cache_hits} 块，"
+                    f"失败 {len(chunks) - len(chunk_results)} 块")
+        
+        # 步骤3: 实体归并
+        logger.info("步骤3: 跨块归并实体和关系")
+        entities, relationships = self.entity_resolver.resolve(chunk_results)
         if not entities:
             logger.warning("未提取到任何实体，知识图谱构建终止")
             return
         
-        # 步骤2: 提取关系
-        logger.info("步骤2: 提取关系")
-        relationships = await self.relationship_extractor.extract_relationships(text, entities)
-        
-        # 步骤3: 写入图数据
-        logger.info("步骤3: 写入图数据")
+        # 步骤4: 写入图数据
+        logger.info("步骤4: 写入图数据")
+        try:
+            await self.query_engine.ensure_indexes()
+        except Exception as e:
+            logger.warning(f"创建实体名称索引失败: {e}")
         await self.graph_writer.write_entities(entities)
         await self.graph_writer.write_relationships(relationships)
         
@@ -848,6 +1229,36 @@ class SimpleGraphRAG:
         logger.info(f"共处理 {len(entities)} 个实体，{len(relationships)} 个关系")
         logger.info("=" * 50)
     
+    async def _extract_chunk(self, chunk: str, semaphore: asyncio.Semaphore
+                             ) -> Tuple[Optional[Tuple[List[Entity], List[Relationship]]], bool]:
+        """
+        提取单个文本块的实体和关系
+        
+        返回：
+        - ((实体列表, 关系列表), 是否命中缓存)；提取失败时结果为 None，失败的块不写入缓存
+        """
+        key = self.chunk_cache.key(chunk) if self.chunk_cache else None
+        if key:
+            cached = self.chunk_cache.get(key)
+            if cached is not None:
+                return cached, True
+        
+        async with semaphore:
+            try:
+                entities = await self.entity_extractor.extract_entities(chunk, raise_on_error=True)
+                relationships = []
+                if entities:
+                    relationships = await self.relationship_extractor.extract_relationships(
+                        chunk, entities, raise_on_error=True
+                    )
+            except Exception as e:
+                logger.error(f"文本块提取失败（{len(chunk)} 字符），已跳过: {e}")
+                return None, False
+        
+        if key:
+            self.chunk_cache.put(key, entities, relationships)
+        return (entities, relationships), False
+    
     async def query(self, question: str) -> str:
         """
         基于知识图谱回答问题
@@ -875,14 +1286,14 @@ class SimpleGraphRAG:
         
         return answer
     
-    def close(self):
+    async def close(self):
         """
         关闭数据库连接
         
         在使用完毕后调用此方法释放资源
         """
         logger.info("关闭数据库连接")
-        self.driver.close()
+        await self.driver.close()
 
 # ============================================================================
 # 演示代码
@@ -910,7 +1321,7 @@ if __name__ == "__main__":
         try:
             # 步骤1: 连接 Neo4j 数据库
             print(" 连接 Neo4j 数据库...")
-            driver = GraphDatabase.driver(
+            driver = AsyncGraphDatabase.driver(
                 "neo4j://localhost:7687", 
                 auth=("neo4j", "password")
             )
@@ -980,7 +1391,7 @@ if __name__ == "__main__":
             
             # 步骤6: 清理资源
             print("\n 清理资源...")
-            graph_rag.close()
+            await graph_rag.close()
             
             print("=" * 60)
             print(" SimpleGraphRAG 演示完成")
@@ -14,6 +14,7 @@
 - RegexIntentParser: 正则表达式意图解析器
 - KeywordIntentParser: 关键词权重意图解析器  
 - SlotExtractor: 槽位信息提取器
+- RuleCompiler: 规则编译器，把上面三类规则编译成单次扫描的 CompiledRules
 - RuleBasedIntentChain: 主要的意图识别链
 
 作者: AI工程化训练营
@@ -21,10 +22,20 @@
 日期: 2025年
 """
 
+import os
 import re
+import json
+import pickle
+import hashlib
+from collections import deque
 from typing import Dict, List, Any, Optional
 from dataclasses import dataclass
 
+try:
+    from re import _parser as sre_parse  # Python 3.11+
+except ImportError:
+    import sre_parse
+
 @dataclass
 class IntentResult:
     """
@@ -338,6 +349,316 @@ class SlotExtractor:
         
         return slots  # 返回提取到的槽位信息字典
 
+class KeywordAutomaton:
+    """
+    Aho-Corasick 关键词自动机
+    =======================
+    
+    功能说明:
+    - 把所有意图关键词和正则规则中的必需字面量编译成一个自动机
+    - 一次扫描输入文本即可找出全部命中(包括重叠命中)
+    - 匹配耗时只与文本长度和命中数有关，与关键词总数无关
+    
+    数据结构:
+    - goto: 状态转移表，goto[状态][字符] = 下一状态
+    - fail: 失败指针，匹配失败时回退到的状态
+    - output: 每个状态命中的标签编号(已合并失败链上的输出)
+    - labels: 标签列表，由调用方定义含义
+    """
+    
+    def __init__(self):
+        self.goto: List[Dict[str, int]] = [{}]
+        self.fail: List[int] = [0]
+        self.output: List[List[int]] = [[]]
+        self.labels: List[Any] = []
+    
+    def add(self, keyword: str, label: Any):
+        """添加一个关键词，命中时输出 label"""
+        state = 0
+        for ch in keyword:
+            nxt = self.goto[state].get(ch)
+            if nxt is None:
+                nxt = len(self.goto)
+                self.goto[state][ch] = nxt
+                self.goto.append({})
+                self.fail.append(0)
+                self.output.append([])
+            state = nxt
+        self.output[state].append(len(self.labels))
+        self.labels.append(label)
+    
+    def build(self):
+        """广度优先构建失败指针，并把失败状态的输出合并到当前状态"""
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in self.goto[state].items():
+                queue.append(nxt)
+                f = self.fail[state]
+                while f and ch not in self.goto[f]:
+                    f = self.fail[f]
+                self.fail[nxt] = self.goto[f].get(ch, 0)
+                self.output[nxt].extend(self.output[self.fail[nxt]])
+        return self
+    
+    def search(self, text: str) -> set:
+        """扫描一遍文本，返回命中的标签编号集合(同一关键词出现多次只计一次)"""
+        goto, fail, output = self.goto, self.fail, self.output
+        hits = set()
+        state = 0
+        for ch in text:
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            if output[state]:
+                hits.update(output[state])
+        return hits
+
+def required_literals(pattern: str) -> frozenset:
+    """
+    提取正则中任何匹配都必须包含的字面量片段
+    
+    只看顶层和普通分组中连续的字面字符，分支、字符集、可选重复都视为断开；
+    含大小写字母的片段在忽略大小写时不可靠，直接丢弃。
+    提取失败时返回空集合，表示该规则总是需要执行正则验证。
+    """
+    try:
+        tree = sre_parse.parse(pattern)
+    except Exception:
+        return frozenset()
+    
+    runs = []
+    
+    def walk(items):
+        run = []
+        for op, av in items:
+            if op is sre_parse.LITERAL:
+                run.append(chr(av))
+                continue
+            runs.append("".join(run))
+            run = []
+            # 不带额外标志的普通分组，其内部字面量同样必需
+            if op is sre_parse.SUBPATTERN and not av[1] and not av[2]:
+                walk(av[-1])
+        runs.append("".join(run))
+    
+    walk(tree)
+    return frozenset(run for run in runs if run and run.lower() == run.upper())
+
+class CompiledRules:
+    """
+    编译后的规则集
+    =============
+    
+    功能说明:
+    - 一次自动机扫描同时得到: 关键词意图得分、所有正则规则(意图+槽位)的必需字面量命中
+    - 只有必需字面量全部出现的正则规则才执行预编译的正则验证，其余规则直接跳过
+    - 结果与 RegexIntentParser / KeywordIntentParser / SlotExtractor 逐个执行完全一致
+    - 可以序列化为纯数据保存到磁盘，下次启动直接加载
+    
+    组成部分:
+    - automaton: 自动机，标签为 ("keyword", 意图, 级别序号, 关键词序号, 关键词, 权重) 或 ("literal", 字面量)
+    - regex_rules: [(意图, 规则序号, 预编译正则, 必需字面量)]，按原优先级排列
+    - slot_rules: 意图 -> [(槽位名, 预编译正则, 必需字面量)]
+    - keyword_intents: 关键词配置中的意图顺序，得分相同时取靠前的意图
+    """
+    
+    def __init__(self, automaton, regex_rules, slot_rules, keyword_intents, fingerprint):
+        self.automaton = automaton
+        self.regex_rules = regex_rules
+        self.slot_rules = slot_rules
+        self.keyword_intents = keyword_intents
+        self.fingerprint = fingerprint
+    
+    def scan(self, text: str):
+        """
+        单次扫描文本
+        
+        Returns:
+            tuple: (正则解析结果, 关键词解析结果, 命中的字面量集合)
+            命中的字面量集合传给 extract_slots，槽位提取不需要再扫描文本
+        """
+        # 步骤1: 自动机扫描一遍，拆分关键词命中和字面量命中
+        labels = self.automaton.labels
+        keyword_hits = []
+        literals = set()
+        for h in self.automaton.search(text):
+            label = labels[h]
+            if label[0] == "keyword":
+                keyword_hits.append(label)
+            else:
+                literals.add(label[1])
+        
+        # 步骤2: 正则意图，按原优先级验证候选规则，取第一个命中的规则
+        regex_result = IntentResult()
+        for intent, i, regex, required in self.regex_rules:
+            if required <= literals:
+                match = regex.search(text)
+                if match:
+                    regex_result = IntentResult(
+                        intent=intent,
+                        confidence=0.9,
+                        matched_rules=[f"regex_{intent}_{i}"],
+                        extracted_entities=match.groups() if match.groups() else None
+                    )
+                    break
+        
+        # 步骤3: 关键词意图，同一意图按 (级别, 关键词序号) 的原配置顺序累加权重
+        scores = {}
+        for _, intent, _, _, word, weight in sorted(keyword_hits):
+            score, words = scores.get(intent, (0, []))
+            words.append(word)
+            scores[intent] = (score + weight, words)
+        
+        keyword_result = IntentResult()
+        ranked = [(intent, min(scores[intent][0], 1.0)) for intent in self.keyword_intents
+                  if intent in scores and scores[intent][0] > 0]
+        if ranked:
+            best_intent, best_score = max(ranked, key=lambda x: x[1])
+            keyword_result = IntentResult(
+                intent=best_intent,
+                confidence=best_score,
+                matched_rules=[f"keyword_{best_intent}"],
+                extracted_entities=tuple(scores[best_intent][1])
+            )
+        
+        return regex_result, keyword_result, literals
+    
+    def extract_slots(self, text: str, intent: str, literals: set) -> Dict[str, str]:
+        """提取意图对应的槽位，literals 为 scan 返回的字面量命中"""
+        slots = {}
+        for slot_name, regex, required in self.slot_rules.get(intent, []):
+            if required <= literals:
+                match = regex.search(text)
+                if match:
+                    slots[slot_name] = match.group(1)
+        return slots
+    
+    def to_state(self) -> Dict[str, Any]:
+        """转换为只包含内置类型的数据，缓存文件不依赖本模块的导入路径"""
+        return {
+            "fingerprint": self.fingerprint,
+            "goto": self.automaton.goto,
+            "fail": self.automaton.fail,
+            "output": self.automaton.output,
+            "labels": self.automaton.labels,
+            "regex_rules": [(intent, i, regex.pattern, regex.flags, sorted(required))
+                            for intent, i, regex, required in self.regex_rules],
+            "slot_rules": {intent: [(slot_name, regex.pattern, regex.flags, sorted(required))
+                                    for slot_name, regex, required in rules]
+                           for intent, rules in self.slot_rules.items()},
+            "keyword_intents": self.keyword_intents
+        }
+    
+    @classmethod
+    def from_state(cls, state: Dict[str, Any]) -> "CompiledRules":
+        automaton = KeywordAutomaton()
+        automaton.goto = state["goto"]
+        automaton.fail = state["fail"]
+        automaton.output = state["output"]
+        automaton.labels = state["labels"]
+        regex_rules = [(intent, i, re.compile(pattern, flags), frozenset(required))
+                       for intent, i, pattern, flags, required in state["regex_rules"]]
+        slot_rules = {intent: [(slot_name, re.compile(pattern, flags), frozenset(required))
+                               for slot_name, pattern, flags, required in rules]
+                      for intent, rules in state["slot_rules"].items()}
+        return cls(automaton, regex_rules, slot_rules, state["keyword_intents"], state["fingerprint"])
+
+class RuleCompiler:
+    """
+    规则编译器
+    =========
+    
+    功能说明:
+    - 把正则规则、关键词规则和槽位规则编译成 CompiledRules
+    - 关键词和所有正则规则的必需字面量放进同一个自动机，一次扫描完成预筛选
+    - 规则内容的哈希作为指纹，磁盘缓存的指纹不一致时自动重新编译
+    
+    设计说明:
+    - 把全部正则合并成一个带命名分组的大正则无法保持"按优先级取第一个命中规则"的语义，
+      用前瞻分组模拟后又会失去 re 模块的字面前缀加速，实测比逐条匹配更慢；
+      因此正则只作为候选规则的验证步骤，候选由自动机扫描一次确定
+    """
+    
+    VERSION = 1
+    
+    @classmethod
+    def compile(cls, regex_patterns: Dict[str, List[str]], keywords: Dict[str, Dict],
+                slot_patterns: Dict[str, Dict[str, str]], cache_path: Optional[str] = None) -> CompiledRules:
+        """
+        编译规则，cache_path 不为空时优先从磁盘缓存加载
+        
+        Args:
+            regex_patterns: RegexIntentParser.patterns
+            keywords: KeywordIntentParser.keywords
+            slot_patterns: SlotExtractor.slot_patterns
+            cache_path: 编译结果缓存文件路径
+        """
+        fingerprint = hashlib.sha256(json.dumps(
+            [cls.VERSION, regex_patterns, keywords, slot_patterns], ensure_ascii=False, sort_keys=True
+        ).encode('utf-8')).hexdigest()
+        
+        # 尝试加载缓存，指纹不一致或文件损坏时重新编译
+        if cache_path and os.path.exists(cache_path):
+            try:
+                with open(cache_path, 'rb') as f:
+                    state = pickle.load(f)
+                if state.get("fingerprint") == fingerprint:
+                    return CompiledRules.from_state(state)
+            except Exception:
+                pass
+        
+        compiled = cls._build(regex_patterns, keywords, slot_patterns, fingerprint)
+        
+        if cache_path:
+            cache_dir = os.path.dirname(cache_path)
+            if cache_dir:
+                os.makedirs(cache_dir, exist_ok=True)
+            tmp_path = cache_path + ".tmp"
+            with open(tmp_path, 'wb') as f:
+                pickle.dump(compiled.to_state(), f)
+            os.replace(tmp_path, cache_path)
+        return compiled
+    
+    @staticmethod
+    def _build(regex_patterns, keywords, slot_patterns, fingerprint) -> CompiledRules:
+        automaton = KeywordAutomaton()
+        
+        # 关键词: 每个(意图, 级别, 序号)一个标签，同一关键词出现在多处时分别计分
+        for intent, config in keywords.items():
+            for level_index, level in enumerate(('primary', 'secondary')):
+                for word_index, word in enumerate(config[level]):
+                    if word:
+                        automaton.add(word, ("keyword", intent, level_index, word_index, word,
+                                             config['weights'][level]))
+        
+        # 正则规则: 预编译，并把必需字面量加入自动机
+        literals = set()
+        
+        def compile_rule(pattern: str, flags: int):
+            required = required_literals(pattern)
+            literals.update(required)
+            return re.compile(pattern, flags), required
+        
+        regex_rules = []
+        for intent, patterns in regex_patterns.items():
+            for i, pattern in enumerate(patterns):
+                regex, required = compile_rule(pattern, re.IGNORECASE)
+                regex_rules.append((intent, i, regex, required))
+        
+        slot_rules = {}
+        for intent, patterns in slot_patterns.items():
+            slot_rules[intent] = []
+            for slot_name, pattern in patterns.items():
+                regex, required = compile_rule(pattern, 0)
+                slot_rules[intent].append((slot_name, regex, required))
+        
+        for literal in sorted(literals):
+            automaton.add(literal, ("literal", literal))
+        automaton.build()
+        
+        return CompiledRules(automaton, regex_rules, slot_rules, list(keywords), fingerprint)
+
 class RuleBasedIntentChain:
     """
     LangChain 风格的意图识别主链
@@ -359,14 +680,18 @@ class RuleBasedIntentChain:
     输入文本 → 并行解析 → 结果融合 → 槽位提取 → 推理解释 → 输出结果
     """
     
-    def __init__(self):
+    def __init__(self, cache_path: Optional[str] = None):
         """
         初始化意图识别链的各个组件
         
+        Args:
+            cache_path: 编译规则的磁盘缓存路径，为空时每次启动重新编译
+        
         组件说明:
         - regex_parser: 正则表达式解析器，处理结构化输入
         - keyword_parser: 关键词解析器，处理自然语言输入  
         - slot_extractor: 槽位提取器，提取业务参数
+        - compiled_rules: 三者规则编译后的结果，invoke 实际使用它完成单次扫描
         
         设计优势:
         - 组件解耦: 各解析器独立工作，便于维护和扩展
@@ -376,6 +701,17 @@ class RuleBasedIntentChain:
         self.regex_parser = RegexIntentParser()      # 正则表达式意图解析器
         self.keyword_parser = KeywordIntentParser()  # 关键词权重意图解析器
         self.slot_extractor = SlotExtractor()        # 槽位信息提取器
+        self.cache_path = cache_path
+        self.recompile()
+    
+    def recompile(self):
+        """编译各解析器的规则；运行时修改了规则配置后需要调用"""
+        self.compiled_rules = RuleCompiler.compile(
+            self.regex_parser.patterns,
+            self.keyword_parser.keywords,
+            self.slot_extractor.slot_patterns,
+            cache_path=self.cache_path
+        )
     
     def invoke(self, input_dict: Dict[str, Any]) -> Dict[str, Any]:
         """
@@ -406,17 +742,16 @@ class RuleBasedIntentChain:
         # 步骤1: 提取输入文本，提供默认值避免KeyError
         text = input_dict.get("text", "")
         
-        # 步骤2: 并行执行多个解析器
-        # 注意: 这里是"并行"的概念，实际是顺序执行，但逻辑上独立
-        regex_result = self.regex_parser.parse(text)      # 正则匹配解析
-        keyword_result = self.keyword_parser.parse(text)  # 关键词匹配解析
+        # 步骤2: 单次扫描同时得到正则结果、关键词结果和槽位正则的预筛选信息
+        # 结果与分别调用 regex_parser.parse / keyword_parser.parse / slot_extractor 相同
+        regex_result, keyword_result, literals = self.compiled_rules.scan(text)
         
         # 步骤3: 融合多个解析器的结果
         # 使用智能策略选择最佳结果
         final_result = self._merge_results([regex_result, keyword_result])
         
-        # 步骤4: 基于最终意图提取槽位信息
-        slots = self.slot_extractor.extract_slots(text, final_result.intent)
+        # 步骤4: 基于最终意图提取槽位信息，复用扫描得到的字面量命中
+        slots = self.compiled_rules.extract_slots(text, final_result.intent, literals)
         
         # 步骤5: 生成人类可读的推理解释
         reasoning = self._generate_reasoning(final_result)
@@ -431,6 +766,31 @@ class RuleBasedIntentChain:
             "reasoning": reasoning                            # 推理过程说明
         }
     
+    def batch(self, inputs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        批量执行意图识别，用于离线日志重新标注
+        
+        Args:
+            inputs: 输入字典列表，每个包含 'text' 键
+            
+        Returns:
+            List[Dict[str, Any]]: 与输入一一对应的识别结果
+        
+        说明:
+        - 日志中重复的文本只识别一次
+        - 每个结果都是独立的字典，修改其中一个不影响其他结果
+        """
+        cache = {}
+        results = []
+        for input_dict in inputs:
+            text = input_dict.get("text", "")
+            if text not in cache:
+                cache[text] = self.invoke({"text": text})
+            result = cache[text]
+            results.append(dict(result, slots=dict(result["slots"]),
+                                matched_rules=list(result["matched_rules"])))
+        return results
+    
     def _merge_results(self, results: List[IntentResult]) -> IntentResult:
         """
         融合多个解析器的识别结果
@@ -676,7 +1036,7 @@ def main():
     ]
     
     # 批量执行意图识别
-    batch_results = [intent_chain.invoke({"text": text}) for text in batch_texts]
+    batch_results = intent_chain.batch([{"text": text} for text in batch_texts])
     
     # 输出批量处理结果的摘要
     for text, result in zip(batch_texts, batch_results):
@@ -692,4 +1052,4 @@ def main():
     print("6. 模块化设计: LangChain 风格的组件架构")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
\ No newline at end of file